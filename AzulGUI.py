@@ -2,25 +2,57 @@
 ## Date: 2024-02-27
 
 # This is GUI frontend for the AZUL game.
-# Run the file to run the game
-
+# Run the file to run the game. Two people play on one screen, unless a seat is given to the computer:
+#   python AzulGUI.py                   two players
+#   python AzulGUI.py --ai-player 2     player 2 is played by the computer [--iterations 2000]
+
+# One seat can be played by the computer (ai_player), and the Hint button suggests a move to the
+# human player. Searches run in the background (azul_backend/background.py), never on the GUI thread:
+# the GUI checks for finished searches every POLL_MS from an after() callback.
+# While the human is thinking, the hint and the computer's replies to the human's likely moves are
+# searched ahead. When the human moves, every search but the reply to the move made is cancelled,
+# so a move that was foreseen is answered straight away.
+
+import argparse
 import tkinter as tk
 from typing import Any
+from azul_backend.background import BackgroundSearch, likely_moves
 from azul_backend.game import Game
+from azul_backend.ismcts import Move
 from tkinter import PanedWindow
 from tkinter import *
 
 from collections import deque
 
+POLL_MS = 50  # How often finished searches are collected
+AI_DELAY_MS = 400  # Pause before the computer moves, so its move can be followed
+SPECULATIVE_REPLIES = 3  # Human moves whose replies are searched ahead
+
 
 class AzulApp(tk.Tk):
 
     __game: Game
     __windows: dict[str, tk.PanedWindow]
     __guirounds: int
-
-    def __init__(self, *args: Any, **kwargs: Any) -> None:
+    __ai_player: int | None
+    __search: BackgroundSearch
+    __hint: Move | None
+    __hint_key: bytes
+    __hint_wanted: bool
+    __hint_label: tk.Label
+    __search_keys: list[bytes]
+    __ai_pending: bool
+
+    def __init__(
+        self,
+        *args: Any,
+        ai_player: int | None = None,
+        iterations: int = 2000,
+        **kwargs: Any,
+    ) -> None:
         tk.Tk.__init__(self, *args, **kwargs)
+        if ai_player not in (None, 1, 2):
+            raise ValueError(f"{ai_player} - ai_player must be 1, 2 or None")
 
         container = tk.Frame(self)
         container.pack(side="top", fill="both", expand=True)
@@ -30,8 +62,19 @@ class AzulApp(tk.Tk):
         self.__game = Game()
         self.__windows = {}
         self.__guirounds = 0
+        self.__ai_player = ai_player
+        self.__search = BackgroundSearch(iterations=iterations)
+        self.__hint = None
+        self.__hint_key = b""
+        self.__hint_wanted = False
+        self.__search_keys = []
+        self.__ai_pending = False
         self.create_windows(container)
 
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        self.start_searches()
+        self.after(POLL_MS, self.poll_searches)
+
     def create_windows(self, container: tk.Frame) -> None:
 
         paneldisplaykwargs = {"bd": "4", "relief": "raised", "bg": "lightblue"}
@@ -170,6 +213,24 @@ class AzulApp(tk.Tk):
         )
         self.__windows["mainpanel"].add(self.__windows["cotpanel"])
 
+        # Create Hint Panel
+        self.__windows["hintpanel"] = PanedWindow(
+            self.__windows["mainpanel"], paneldisplaykwargs
+        )
+        self.__windows["mainpanel"].add(self.__windows["hintpanel"])
+        self.__windows["hintpanel"].add(
+            tk.Button(
+                self.__windows["hintpanel"],
+                text="Hint",
+                font=("Arial, 14"),
+                command=self.request_hint,
+            )
+        )
+        self.__hint_label = tk.Label(
+            self.__windows["hintpanel"], text="", font=("Arial", 14)
+        )
+        self.__windows["hintpanel"].add(self.__hint_label)
+
         # Create Pattern Lines Player 1 and
         for i in range(5):
             self.__windows["patternlpanelp1"].columnconfigure(i, weight=1)
@@ -223,11 +284,18 @@ class AzulApp(tk.Tk):
         buttons: dict[str, tk.Button] = {}
 
         for i, item in enumerate(tiles):
+            # The hint overlay sinks the tiles of the suggested offer
+            hinted = self.__hint is not None and self.__hint[:2] == (
+                factory,
+                item.get_tile_type(),
+            )
             buttons[item.get_display_text() + str(i)] = tk.Button(
                 self.__windows[window],
                 text=item.get_display_text(),
                 bg=item.get_display_colour(),
                 font=("Arial, 14"),
+                relief=tk.SUNKEN if hinted else tk.RAISED,
+                bd=6 if hinted else 2,
                 # Used type ignore, as the GUI is out of scope for the assignment
                 command=lambda tile_type=item.get_tile_type(): self.make_factory_offer(  # type: ignore
                     factory, tile_type, window
@@ -348,6 +416,9 @@ class AzulApp(tk.Tk):
     def place_on_patternlines(
         self, window: str, line: str, player: int
     ) -> None:
+        if player == self.__ai_player:
+            self.show_computer_turn()
+            return
         if self.__game.show_current_player() == player:
             self.__game.place_on_patternlines(line)
             self.create_pattern_line_buttons(window, player)
@@ -363,23 +434,138 @@ class AzulApp(tk.Tk):
                 self.refresh()
             else:
                 self.update_player_display()
+            self.move_made()
         else:
             raise RuntimeError(f"Player {player} is not the current player")
 
     def make_factory_offer(
         self, factory: int, tile_type: str, window: str
     ) -> None:
+        if self.__game.show_current_player() == self.__ai_player:
+            self.show_computer_turn()
+            return
         self.__game.make_factory_offer(factory, tile_type)
+        # Half way through a move the hint is spent, the replies being searched are still wanted
+        self.clear_hint()
+        self.__search.cancel(keep=self.__search_keys)
 
         if (
             not self.__game.show_hand()
         ):  # hand is empty, forced moved made. we must refresh
+            if self.__game.rounds_played > self.__guirounds:
+                self.__guirounds = self.__game.rounds_played
             self.refresh()
+            self.move_made()
 
         self.Create_Factory_Buttons(factory, window)
         self.Create_Factory_Buttons(0, "cotpanel")
         self.create_hand_buttons()
 
+    def start_searches(self) -> None:
+        """
+        Starts the searches wanted in the current position: the computer's move on its turn,
+        otherwise the hint, and the computer's replies to the human's likely moves
+        """
+        self.__search_keys = []
+        if self.__game.is_game_over:
+            return
+
+        if self.__game.show_current_player() == self.__ai_player:
+            self.__search_keys.append(self.__search.start(self.__game, priority=2))
+            self.check_searches()
+            return
+
+        self.__hint_key = self.__search.start(self.__game, priority=1)
+        self.__search_keys.append(self.__hint_key)
+        if self.__ai_player is None:
+            return
+
+        for move in likely_moves(self.__game, SPECULATIVE_REPLIES):
+            # An exact copy, so the tiles drawn at the end of a round are the ones the game will draw
+            position = Game.unpack_state(self.__game.pack_state())
+            position.play_move(move)
+            if position.show_current_player() == self.__ai_player:
+                self.__search_keys.append(self.__search.start(position))
+
+    def move_made(self) -> None:
+        """
+        Called once a move has been played. Keeps the search of the new position, if it was
+        searched ahead, cancels the others and starts the searches of the new position
+        """
+        self.clear_hint()
+        position = [self.__game.pack_state()]
+        self.__search.cancel(keep=position)
+        self.__search.clear(keep=position)
+        self.start_searches()
+
+    def poll_searches(self) -> None:
+        """
+        Collects finished searches, then polls again in POLL_MS. Never blocks
+        """
+        if self.__search.poll():
+            self.check_searches()
+        self.after(POLL_MS, self.poll_searches)
+
+    def check_searches(self) -> None:
+        """
+        Acts on the searches of the current position: plays the computer's move, or shows the hint
+        """
+        if self.__game.show_current_player() == self.__ai_player:
+            if not self.__ai_pending and not self.__game.is_game_over:
+                move = self.__search.result(self.__game.pack_state())
+                if move is not None:
+                    self.__ai_pending = True
+                    self.after(AI_DELAY_MS, lambda: self.play_ai_move(move))  # type: ignore
+        elif self.__hint_wanted and self.__hint is None:
+            self.__hint = self.__search.result(self.__hint_key)
+            if self.__hint is not None:
+                self.show_hint()
+
+    def play_ai_move(self, move: Move) -> None:
+        self.__ai_pending = False
+        self.__game.play_move(move)
+        if self.__game.rounds_played > self.__guirounds:
+            self.__guirounds = self.__game.rounds_played
+        self.refresh()
+        self.move_made()
+
+    def request_hint(self) -> None:
+        if self.__game.is_game_over or self.__game.show_hand():
+            return
+        if self.__game.show_current_player() == self.__ai_player:
+            return
+        self.__hint_wanted = True
+        self.__hint_label.config(text="Thinking...")
+        self.check_searches()
+
+    def show_hint(self) -> None:
+        assert self.__hint is not None
+        factory, tile_type, line = self.__hint
+        source = f"F{factory}" if factory else "the centre"
+        target = line if line is not None else "the floor"
+        self.__hint_label.config(text=f"Hint: take {tile_type} from {source}, place on {target}")
+        self.refresh()
+
+    def show_computer_turn(self) -> None:
+        """
+        Tells the human, in the hint label, that the board they clicked is the computer's
+        """
+        self.__hint_label.config(text=f"Player {self.__ai_player} is played by the computer")
+
+    def clear_hint(self) -> None:
+        self.__hint_wanted = False
+        if self.__hint is not None:
+            self.__hint = None
+            self.refresh()
+        self.__hint_label.config(text="")
+
+    def close(self) -> None:
+        """
+        Stops the background searches and closes the window
+        """
+        self.__search.close()
+        self.destroy()
+
     def get_default_wall_colours(self, line: str, column: int) -> str:
         """
         Returns an appropriate colour for the wall
@@ -453,5 +639,11 @@ class AzulApp(tk.Tk):
 
 
 if __name__ == "__main__":
-    app = AzulApp()
+    parser = argparse.ArgumentParser(description="Play Azul")
+    parser.add_argument(
+        "--ai-player", type=int, choices=(1, 2), help="The seat played by the computer"
+    )
+    parser.add_argument("--iterations", type=int, default=2000, help="Search iterations per move")
+    options = parser.parse_args()
+    app = AzulApp(ai_player=options.ai_player, iterations=options.iterations)
     app.mainloop()
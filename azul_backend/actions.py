@@ -0,0 +1,91 @@
+## File: actions.py
+## Date: 2024-03-11
+## This module encodes moves as small integers
+
+# A move is a factory offer followed by a pattern line placement, written as a
+# (factory_number, tile_type, line) tuple by Game.legal_moves. Strings are convenient for people,
+# but every string costs hashing and comparisons throughout the engine.
+# Here every possible move gets a dense integer id, from 0 to ACTION_COUNT - 1:
+
+#     action_id = (factory_number * 5 + colour_number) * 6 + line_number
+
+# factory_number: 0 is the centre of the table, 1-9 the factories (5 with 2 players, 7 with 3, 9 with 4)
+# colour_number: 0-4 in the TILE_COLOURS order ("blue", "yellow", "red", "black", "white")
+# line_number: 0-4 for line1-line5, 5 for a move whose tiles can only drop to the floor (line is None)
+
+# Both directions are precomputed tables, so encoding and decoding is a single lookup.
+# The factory is the most significant part of the id, so the ids of a 2 player game (factories 0-5)
+# are 0-179 whatever the number of players the tables cover. Every id fits in two bytes, which
+# gives a compact wire format for a list of moves of a game of any number of players (encode_moves).
+
+import struct
+
+from azul_backend.tiles import TILE_COLOURS
+
+Move = tuple[int, str, str | None]
+
+NUMBER_OF_FACTORIES: int = 9  # The most factories of any game, with 4 players
+TWO_PLAYER_ACTION_COUNT: int = 6 * 5 * 6  # The ids of the moves of a 2 player game
+LINES: tuple[str | None, ...] = ("line1", "line2", "line3", "line4", "line5", None)
+FLOOR_LINE_NUMBER: int = 5  # The line number of a move whose tiles drop to the floor
+
+ACTION_COUNT: int = (NUMBER_OF_FACTORIES + 1) * len(TILE_COLOURS) * len(LINES)
+_PACKED_ID = struct.Struct("<H")  # An action id in encode_moves, little endian
+
+# Decoding table: action id -> move
+ACTION_TABLE: tuple[Move, ...] = tuple(
+    (factory_number, colour, line)
+    for factory_number in range(NUMBER_OF_FACTORIES + 1)
+    for colour in TILE_COLOURS
+    for line in LINES
+)
+
+# Encoding table: move -> action id
+_ACTION_IDS: dict[Move, int] = {
+    move: action_id for action_id, move in enumerate(ACTION_TABLE)
+}
+
+
+def encode_move(move: Move) -> int:
+    """
+    This function returns the action id of a (factory_number, tile_type, line) move
+    """
+    try:
+        return _ACTION_IDS[move]
+    except (KeyError, TypeError):
+        raise ValueError(
+            f"{move} - Invalid move, must be (factory_number 0-{NUMBER_OF_FACTORIES}, tile_type, line1-line5 or None)"
+        ) from None
+
+
+def decode_action(action_id: int) -> Move:
+    """
+    This function returns the (factory_number, tile_type, line) move of an action id
+    """
+    if type(action_id) is not int or not 0 <= action_id < ACTION_COUNT:
+        raise ValueError(
+            f"{action_id} - Invalid action id, must be an int from 0 to {ACTION_COUNT - 1}"
+        )
+    return ACTION_TABLE[action_id]
+
+
+def encode_moves(action_ids: list[int] | tuple[int, ...]) -> bytes:
+    """
+    This function packs a sequence of action ids into bytes, two bytes per move
+    """
+    for action_id in action_ids:
+        decode_action(action_id)  # Checks the id
+    return struct.pack(f"<{len(action_ids)}H", *action_ids)
+
+
+def decode_moves(data: bytes) -> tuple[int, ...]:
+    """
+    This function unpacks bytes from encode_moves into a tuple of action ids
+    """
+    if len(data) % _PACKED_ID.size:
+        raise ValueError(f"{len(data)} bytes - Moves are packed {_PACKED_ID.size} bytes each")
+    action_ids = tuple(action_id for (action_id,) in _PACKED_ID.iter_unpack(data))
+    for action_id in action_ids:
+        if action_id >= ACTION_COUNT:
+            raise ValueError(f"{action_id} - Invalid action id")
+    return action_ids
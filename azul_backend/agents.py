@@ -0,0 +1,438 @@
+## File: agents.py
+## Date: 2024-03-26
+## This module creates the Agent protocol: players that choose moves on an asyncio event loop
+
+# An Agent is anything that chooses moves: a bot in this process, a bot in another process,
+# a human at a GUI or on the other end of a socket. Agent.choose_move is a coroutine, so a tournament
+# or a server can run many games, with any mix of agents, on one event loop.
+
+# Every move has a time budget. choose_move gives the agent a view of the game, a determinized copy
+# (Game.determinize) in which the hidden order of the tile bag is resampled, so no agent can see
+# which tiles are coming. If the agent has not answered when the budget runs out, or answers with
+# an illegal move, or fails, the fallback move (the greedy move, background.likely_moves) is played
+# instead, and counted against the agent.
+
+# Out-of-process agents talk JSON lines over a pipe (PipeAgent) or a socket (SocketAgent):
+#   request: {"id": 7, "player": 2, "time_limit": 1.5, "state": "<hex of Game.pack_state>"}
+#   reply:   {"id": 7, "move": [3, "red", "line2"]}
+# A reply to an earlier request (one that timed out) is ignored. An agent that times out is still
+# working on the old request, and would not read the next one until it had finished, so every
+# later move could time out too. So after a timeout a PipeAgent kills its subprocess and starts it
+# again, and a SocketAgent made with connect connects again. A SocketAgent made from an accepted
+# connection can not be restarted: its client must answer the latest request (e.g a human),
+# late replies are skipped. serve_stdio is the other side of the protocol, for agents written in
+# Python:  python -m azul_backend.agents [iterations]  runs an ISMCTS bot as a PipeAgent.
+
+import asyncio
+import json
+import random
+import sys
+from concurrent.futures import Executor
+from typing import Any, Callable, TextIO
+
+from azul_backend.background import likely_moves
+from azul_backend.game import Game
+from azul_backend.ismcts import InformationSetMCTS, Move
+from azul_backend.tiles import TILE_COLOURS
+
+# The errors of an agent that lead to its fallback move being played
+_AGENT_ERRORS = (OSError, EOFError, ValueError, RuntimeError)
+
+
+def encode_request(request_id: int, game: Game, time_limit: float) -> bytes:
+    """
+    This function encodes a move request for an out-of-process agent, as one JSON line
+    """
+    message = {
+        "id": request_id,
+        "player": game.show_current_player(),
+        "time_limit": time_limit,
+        "state": game.pack_state().hex(),
+    }
+    return (json.dumps(message) + "\n").encode()
+
+
+def decode_move(move: Any) -> Move:
+    """
+    This function checks and converts the JSON form of a move, [factory, colour, line or null]
+    """
+    if not isinstance(move, list) or len(move) != 3:
+        raise ValueError(f"{move} - A move must be [factory, colour, line]")
+    factory_number, tile_type, line = move
+    if type(factory_number) is not int or tile_type not in TILE_COLOURS:
+        raise ValueError(f"{move} - Invalid factory or colour")
+    if line is not None and not isinstance(line, str):
+        raise ValueError(f"{move} - Invalid line")
+    return factory_number, tile_type, line
+
+
+class Agent:
+    """
+    This class is the base of every agent. Subclasses implement _choose_move
+
+    Args:
+        time_limit (float): The seconds an agent has for a move
+
+    Methods:
+        choose_move: Coroutine that returns the agent's move, or the fallback move
+        fallback_move: The move played when the agent does not answer in time, or answers wrongly
+        close: Coroutine that releases the agent's resources
+        timeouts: The number of moves the agent did not answer in time
+        failures: The number of moves the agent answered with an illegal move or an error
+    """
+
+    _time_limit: float
+    __timeouts: int
+    __failures: int
+
+    def __init__(self, time_limit: float = 5.0) -> None:
+        """Set the time budget"""
+        if time_limit <= 0:
+            raise ValueError(f"{time_limit} - time_limit must be positive")
+        self._time_limit = time_limit
+        self.__timeouts = 0
+        self.__failures = 0
+
+    @property
+    def timeouts(self) -> int:
+        """The number of moves the agent did not answer in time"""
+        return self.__timeouts
+
+    @property
+    def failures(self) -> int:
+        """The number of moves answered with an illegal move or an error"""
+        return self.__failures
+
+    async def choose_move(self, game: Game, time_limit: float | None = None) -> Move:
+        """
+        This method returns the agent's move for the current player of the game, within the
+        time limit (the agent's own, unless one is supplied). The game is not changed
+        """
+        legal_moves = game.legal_moves()
+        if not legal_moves:
+            raise ValueError("There are no legal moves, the game is over")
+
+        time_limit = self._time_limit if time_limit is None else time_limit
+        try:
+            move = await asyncio.wait_for(
+                self._choose_move(game.determinize(), time_limit), time_limit
+            )
+        except asyncio.TimeoutError:
+            self.__timeouts += 1
+            try:
+                await self._restart()
+            except _AGENT_ERRORS:  # Counted as a failure on the next move, if it is still broken
+                pass
+            return self.fallback_move(game)
+        except _AGENT_ERRORS:
+            self.__failures += 1
+            return self.fallback_move(game)
+
+        if move not in legal_moves:
+            self.__failures += 1
+            return self.fallback_move(game)
+        return move
+
+    def fallback_move(self, game: Game) -> Move:
+        """
+        This method returns the move played for the agent when it does not answer in time
+        """
+        return likely_moves(game, 1)[0]
+
+    async def _choose_move(self, game: Game, time_limit: float) -> Move:
+        """
+        Returns the move for the current player of a determinized copy of the game,
+        which the agent may change
+        """
+        raise NotImplementedError
+
+    async def _restart(self) -> None:
+        """
+        Called after a move has timed out. Agents that go on working on a move after its timeout
+        start again here, so they are ready for the next move. Nothing by default
+        """
+
+    async def close(self) -> None:
+        """
+        This method releases the agent's resources (processes, connections)
+        """
+
+
+class RandomAgent(Agent):
+    """
+    This agent plays a random legal move
+
+    Args:
+        time_limit (float): The seconds an agent has for a move
+        seed (int): OPTIONAL: Seed for reproducible moves
+    """
+
+    __rng: random.Random
+
+    def __init__(self, time_limit: float = 5.0, seed: int | None = None) -> None:
+        super().__init__(time_limit)
+        self.__rng = random.Random(seed)
+
+    async def _choose_move(self, game: Game, time_limit: float) -> Move:
+        return self.__rng.choice(game.legal_moves())
+
+
+class GreedyAgent(Agent):
+    """
+    This agent plays the greedy move (background.likely_moves), which is also the fallback move
+    """
+
+    async def _choose_move(self, game: Game, time_limit: float) -> Move:
+        return likely_moves(game, 1)[0]
+
+
+class BotAgent(Agent):
+    """
+    This agent runs an in-process bot (anything with a choose_move(game) method, e.g
+    InformationSetMCTS) in an executor, so the event loop is not blocked.
+    A thread can not be stopped: when a move times out, the search runs on until it finishes,
+    and its move is thrown away
+
+    Args:
+        bot: The bot
+        time_limit (float): The seconds an agent has for a move
+        executor (Executor): OPTIONAL: The executor to search in, the loop's default otherwise
+    """
+
+    _bot: Any
+    __executor: Executor | None
+
+    def __init__(
+        self, bot: Any, time_limit: float = 5.0, executor: Executor | None = None
+    ) -> None:
+        super().__init__(time_limit)
+        self._bot = bot
+        self.__executor = executor
+
+    async def _choose_move(self, game: Game, time_limit: float) -> Move:
+        loop = asyncio.get_running_loop()
+        move: Move = await loop.run_in_executor(
+            self.__executor, self._bot.choose_move, game
+        )
+        return move
+
+
+class QueueAgent(Agent):
+    """
+    This agent waits for moves put to it, e.g by a GUI or by a server handling a human's messages.
+    Moves put before the agent's turn are thrown away
+
+    Methods:
+        put: Hands the agent the move of its player
+    """
+
+    __moves: "asyncio.Queue[Move]"
+
+    def __init__(self, time_limit: float = 60.0) -> None:
+        super().__init__(time_limit)
+        self.__moves = asyncio.Queue()
+
+    def put(self, move: Move) -> None:
+        """
+        This method hands the agent a move, for the turn it is waiting for
+        """
+        self.__moves.put_nowait(move)
+
+    async def _choose_move(self, game: Game, time_limit: float) -> Move:
+        while not self.__moves.empty():  # Left over from an earlier turn
+            self.__moves.get_nowait()
+        return await self.__moves.get()
+
+
+class _StreamAgent(Agent):
+    """
+    An agent on the other end of a pair of streams, speaking the JSON lines protocol.
+    Internal use only, see PipeAgent and SocketAgent
+    """
+
+    _reader: asyncio.StreamReader
+    _writer: asyncio.StreamWriter
+    __request_id: int
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        time_limit: float,
+    ) -> None:
+        super().__init__(time_limit)
+        self._reader = reader
+        self._writer = writer
+        self.__request_id = 0
+
+    async def _choose_move(self, game: Game, time_limit: float) -> Move:
+        self.__request_id += 1
+        self._writer.write(encode_request(self.__request_id, game, time_limit))
+        await self._writer.drain()
+
+        while True:
+            line = await self._reader.readline()
+            if not line:
+                raise EOFError("The agent closed the connection")
+            reply = json.loads(line)
+            if not isinstance(reply, dict):
+                raise ValueError(f"{reply} - A reply must be a JSON object")
+            if reply.get("id") == self.__request_id:
+                return decode_move(reply.get("move"))
+            # Otherwise the reply to a request that timed out
+
+
+class PipeAgent(_StreamAgent):
+    """
+    This agent runs in a subprocess, and speaks the JSON lines protocol on its stdin and stdout.
+    Create it with the start coroutine. When a move times out the subprocess is killed
+    and started again
+
+    Methods:
+        start: Coroutine that starts the subprocess
+    """
+
+    _command: tuple[str, ...]
+    _process: asyncio.subprocess.Process
+
+    @classmethod
+    async def start(cls, *command: str, time_limit: float = 5.0) -> "PipeAgent":
+        """
+        This method starts the command as a subprocess and returns its agent, e.g
+        await PipeAgent.start(sys.executable, "-m", "azul_backend.agents")
+        """
+        process = await cls.__spawn(command)
+        assert process.stdin is not None and process.stdout is not None
+        agent = cls(process.stdout, process.stdin, time_limit)
+        agent._command = command
+        agent._process = process
+        return agent
+
+    @staticmethod
+    async def __spawn(command: tuple[str, ...]) -> asyncio.subprocess.Process:
+        return await asyncio.create_subprocess_exec(
+            *command, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE
+        )
+
+    async def _restart(self) -> None:
+        """
+        Kills the subprocess, which is still working on the move that timed out, and starts it again
+        """
+        if self._process.returncode is None:
+            self._process.kill()
+        await self._process.wait()
+        process = await self.__spawn(self._command)
+        assert process.stdin is not None and process.stdout is not None
+        self._reader, self._writer = process.stdout, process.stdin
+        self._process = process
+
+    async def close(self) -> None:
+        """
+        Closes the subprocess's stdin, which ends serve_stdio, and waits for it to exit
+        """
+        self._writer.close()
+        try:
+            await asyncio.wait_for(self._process.wait(), 1.0)
+        except asyncio.TimeoutError:
+            self._process.kill()
+            await self._process.wait()
+
+
+class SocketAgent(_StreamAgent):
+    """
+    This agent is on the other end of a TCP or Unix socket, e.g a remote human's client.
+    Create it with the connect coroutine, or from the streams of an accepted connection.
+    When a move times out, an agent made with connect connects again
+
+    Methods:
+        connect: Coroutine that connects to an agent listening on a socket
+    """
+
+    _address: tuple[str | None, int | None, str | None] | None = None  # Set by connect
+
+    @classmethod
+    async def connect(
+        cls,
+        host: str | None = None,
+        port: int | None = None,
+        path: str | None = None,
+        time_limit: float = 5.0,
+    ) -> "SocketAgent":
+        """
+        This method connects to host and port, or to the Unix socket at path
+        """
+        reader, writer = await cls.__open(host, port, path)
+        agent = cls(reader, writer, time_limit)
+        agent._address = (host, port, path)
+        return agent
+
+    @staticmethod
+    async def __open(
+        host: str | None, port: int | None, path: str | None
+    ) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        if path is not None:
+            return await asyncio.open_unix_connection(path)
+        if host is not None and port is not None:
+            return await asyncio.open_connection(host, port)
+        raise ValueError("Either host and port, or path, must be supplied")
+
+    async def _restart(self) -> None:
+        """
+        Connects again, if the agent was made with connect, so the other end can drop
+        the move that timed out
+        """
+        if self._address is None:
+            return
+        await self.close()
+        self._reader, self._writer = await self.__open(*self._address)
+
+    async def close(self) -> None:
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except OSError:  # The other end has gone already
+            pass
+
+
+async def play_game(
+    agents: tuple[Agent, ...], game: Game | None = None, seed: int | None = None
+) -> Game:
+    """
+    This coroutine plays a game to the end, agents[0] as player 1, agents[1] as player 2 and so on,
+    and returns the finished game. A game in progress can be supplied, otherwise a new one is
+    started for as many players as there are agents
+    """
+    game = Game(seed, players=len(agents)) if game is None else game
+    if len(agents) != game.show_number_of_players():
+        raise ValueError(
+            f"{len(agents)} - A {game.show_number_of_players()} player game needs {game.show_number_of_players()} agents"
+        )
+
+    while not game.is_game_over:
+        agent = agents[game.show_current_player() - 1]
+        game.play_move(await agent.choose_move(game))
+    return game
+
+
+def serve_stdio(
+    choose_move: Callable[[Game], Move],
+    stdin: TextIO = sys.stdin,
+    stdout: TextIO = sys.stdout,
+) -> None:
+    """
+    This function answers move requests on stdin with moves on stdout until stdin is closed:
+    the subprocess side of PipeAgent
+    """
+    for line in stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        game = Game.unpack_state(bytes.fromhex(request["state"]))
+        move = choose_move(game)
+        stdout.write(json.dumps({"id": request["id"], "move": list(move)}) + "\n")
+        stdout.flush()
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    serve_stdio(InformationSetMCTS(iterations).choose_move)
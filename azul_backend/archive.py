@@ -0,0 +1,394 @@
+## File: archive.py
+## Date: 2024-03-16
+## This module creates an indexed archive of game records, with a query engine
+
+# An archive is a directory. Every game added gets the next game id (0, 1, 2 ...) and its
+# GameRecord (see replay.py) is appended to records.bin. The offset of each record is kept in
+# records.off, so a record can be read back without reading any other.
+
+# Each game is also summarised into a handful of int columns, one file per column:
+#   players: the number of players, 2, 3 or 4
+#   player1_score ... player4_score: the final scores
+#   winner: the player with the top score, 0 for a draw (more than one player with the top score)
+#   rounds_played, moves_this_game
+#   player1_floor_penalty ... player4_floor_penalty: the total floor penalty over the game
+#       (0 or negative)
+#   player1_worst_round_penalty ... player4_worst_round_penalty: the largest floor penalty in one round
+# Every game has the columns of 4 players, those of players it does not have are 0.
+# Row n of every column belongs to game n.
+
+# build_indexes writes a sorted index for each column: the values in order (<column>.sorted),
+# and the game id of each value (<column>.ids). A filter on a column is then two binary searches
+# over a memory map of the index, and never reads the games that do not match.
+# Games added since the indexes were last built are checked by scanning their rows of the column.
+
+# All files are arrays of fixed width ints in the native byte order, written with the array module
+# and read back through memory maps. An archive has one writer at a time.
+
+# e.g. games where player 2 won after losing 14 points to the floor in one round:
+#     archive.query(winner=2, player2_worst_round_penalty=(None, -14))
+
+import bisect
+import mmap
+import os
+from array import array
+from types import MappingProxyType
+from typing import Iterator
+
+from azul_backend.actions import decode_action
+from azul_backend.floor import Floor
+from azul_backend.game import Game
+from azul_backend.replay import GameRecord, Replay
+
+MAX_PLAYERS: int = 4
+_PLAYERS = range(1, MAX_PLAYERS + 1)
+
+COLUMNS: tuple[str, ...] = (
+    "players",
+    *(f"player{player}_score" for player in _PLAYERS),
+    "winner",
+    "rounds_played",
+    "moves_this_game",
+    *(f"player{player}_floor_penalty" for player in _PLAYERS),
+    *(f"player{player}_worst_round_penalty" for player in _PLAYERS),
+)
+
+_VALUE_TYPE = "i"  # Column values and sorted index values, 32 bit signed
+_ID_TYPE = "I"  # Game ids in the sorted indexes, 32 bit unsigned
+_OFFSET_TYPE = "Q"  # Offsets into records.bin, 64 bit unsigned
+_INDEXED_FILE = "indexed"  # The number of games covered by the sorted indexes
+
+Filter = int | tuple[int | None, int | None]
+
+
+def summarise(record: GameRecord) -> MappingProxyType[str, int]:
+    """
+    This function replays a record and returns its summary columns, as an immutable dictionary
+    """
+    game = Game(record.seed, players=record.players)
+    players = range(Game.PLAYER_1, record.players + 1)
+    floor_penalty = [0] * MAX_PLAYERS
+    worst_round_penalty = [0] * MAX_PLAYERS
+
+    for action_id in record.moves:
+        move = decode_action(action_id)
+        # The floors are cleaned as soon as a round ends, so the penalty each player takes
+        # is worked out before the last move of the round is played
+        mover = game.show_current_player()
+        penalties = [
+            Floor.CUMULATIVE_PENALTY[
+                sum(tile is not None for tile in game.show_floor(player))
+            ]
+            for player in players
+        ]
+        penalties[mover - 1] += game.preview(move)["floor_penalty"]
+        rounds_played = game.rounds_played
+
+        game.play_move(move)
+
+        if game.rounds_played != rounds_played or game.is_game_over:
+            for i, penalty in enumerate(penalties):
+                floor_penalty[i] += penalty
+                worst_round_penalty[i] = min(worst_round_penalty[i], penalty)
+
+    scores = [game.show_score(player) for player in players]
+    winners = [player for player, score in zip(players, scores) if score == max(scores)]
+    scores += [0] * (MAX_PLAYERS - len(scores))
+    return MappingProxyType(
+        {
+            "players": record.players,
+            **{f"player{player}_score": scores[player - 1] for player in _PLAYERS},
+            "winner": winners[0] if len(winners) == 1 else 0,
+            "rounds_played": game.rounds_played,
+            "moves_this_game": game.moves_this_game,
+            **{
+                f"player{player}_floor_penalty": floor_penalty[player - 1]
+                for player in _PLAYERS
+            },
+            **{
+                f"player{player}_worst_round_penalty": worst_round_penalty[player - 1]
+                for player in _PLAYERS
+            },
+        }
+    )
+
+
+class _MappedArray:
+    """
+    A read only memory map of a file of fixed width ints, used as a sequence.
+    The map is remade if the file has grown since it was made
+    """
+
+    _path: str
+    _typecode: str
+    __map: mmap.mmap | None
+    __view: memoryview | None
+
+    def __init__(self, path: str, typecode: str) -> None:
+        self._path = path
+        self._typecode = typecode
+        self.__map = None
+        self.__view = None
+
+    def view(self) -> memoryview:
+        """
+        Returns the contents of the file as a memoryview of ints
+        """
+        size = os.path.getsize(self._path) if os.path.exists(self._path) else 0
+        if self.__view is not None and self.__view.nbytes == size:
+            return self.__view
+
+        self.close()
+        if size == 0:  # An empty file can not be mapped
+            return memoryview(array(self._typecode))
+        with open(self._path, "rb") as file:
+            self.__map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.__view = memoryview(self.__map).cast(self._typecode)
+        return self.__view
+
+    def close(self) -> None:
+        if self.__view is not None:
+            self.__view.release()
+            self.__view = None
+        if self.__map is not None:
+            self.__map.close()
+            self.__map = None
+
+
+class GameArchive:
+    """
+    This class stores game records with summary columns, and finds games by their summaries
+
+    Args:
+        directory (str): The directory of the archive. It is created if it does not exist
+
+    Methods:
+        add: Adds a game record, returns its game id
+        build_indexes: Writes the sorted indexes of every column
+        query: Returns the ids of the games that match every filter
+        summary: Returns the summary columns of a game
+        record: Reads the record of a game
+        replay: Returns a Replay of a game
+        records: Reads the records of many games, one at a time
+        close: Releases the memory maps
+        __len__: The number of games in the archive
+    """
+
+    _directory: str
+    __count: int
+    __indexed: int
+    __maps: dict[str, _MappedArray]
+
+    def __init__(self, directory: str) -> None:
+        """Open an archive, creating it if needed"""
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self.__maps = {}
+
+        offsets = self.__path("records.off")
+        self.__count = (
+            os.path.getsize(offsets) // array(_OFFSET_TYPE).itemsize
+            if os.path.exists(offsets)
+            else 0
+        )
+        indexed = self.__path(_INDEXED_FILE)
+        self.__indexed = 0
+        if os.path.exists(indexed):
+            with open(indexed) as file:
+                self.__indexed = int(file.read())
+
+    def add(self, record: GameRecord | Game) -> int:
+        """
+        This method adds a game to the archive and returns its game id.
+        A finished Game can be passed, and is recorded with GameRecord.from_game
+        """
+        if isinstance(record, Game):
+            record = GameRecord.from_game(record)
+        elif not isinstance(record, GameRecord):
+            raise ValueError(f"{record} - Only GameRecord or Game objects can be archived")
+
+        summary = summarise(record)
+        with open(self.__path("records.bin"), "ab") as file:
+            offset = file.tell()
+            file.write(record.to_bytes())
+        with open(self.__path("records.off"), "ab") as file:
+            array(_OFFSET_TYPE, [offset]).tofile(file)
+        for column in COLUMNS:
+            with open(self.__path(f"{column}.col"), "ab") as file:
+                array(_VALUE_TYPE, [summary[column]]).tofile(file)
+
+        self.__count += 1
+        return self.__count - 1
+
+    def build_indexes(self) -> None:
+        """
+        This method writes the sorted index of every column, covering every game added so far
+        """
+        for column in COLUMNS:
+            values = self.__map(f"{column}.col", _VALUE_TYPE).view()
+            order = sorted(range(self.__count), key=values.__getitem__)
+            sorted_values = array(_VALUE_TYPE, (values[i] for i in order))
+            ids = array(_ID_TYPE, order)
+
+            # Written aside and renamed, so that an open archive never sees half an index
+            for name, data in ((f"{column}.sorted", sorted_values), (f"{column}.ids", ids)):
+                mapped = self.__maps.pop(name, None)
+                if mapped is not None:
+                    mapped.close()
+                with open(self.__path(name + ".tmp"), "wb") as file:
+                    data.tofile(file)
+                os.replace(self.__path(name + ".tmp"), self.__path(name))
+
+        with open(self.__path(_INDEXED_FILE + ".tmp"), "w") as file:
+            file.write(str(self.__count))
+        os.replace(self.__path(_INDEXED_FILE + ".tmp"), self.__path(_INDEXED_FILE))
+        self.__indexed = self.__count
+
+    def query(self, **filters: Filter) -> tuple[int, ...]:
+        """
+        This method returns the ids of the games that match every filter, in increasing order.
+        Each filter is a column name with either a value, or an inclusive (low, high) range
+        where None leaves that end open. With no filters every game id is returned
+
+        e.g archive.query(winner=2, rounds_played=(7, None))
+        """
+        matches: set[int] | None = None
+        # The narrowest filters first, so later filters only check the survivors
+        for column, low, high in sorted(
+            (self.__check_filter(column, value) for column, value in filters.items()),
+            key=lambda f: self.__estimate(*f),
+        ):
+            found = self.__match(column, low, high)
+            matches = found if matches is None else matches & found
+            if not matches:
+                return ()
+
+        if matches is None:
+            return tuple(range(self.__count))
+        return tuple(sorted(matches))
+
+    def summary(self, game_id: int) -> MappingProxyType[str, int]:
+        """
+        This method returns the summary columns of a game, as an immutable dictionary
+        """
+        self.__check_game_id(game_id)
+        return MappingProxyType(
+            {
+                column: self.__map(f"{column}.col", _VALUE_TYPE).view()[game_id]
+                for column in COLUMNS
+            }
+        )
+
+    def record(self, game_id: int) -> GameRecord:
+        """
+        This method reads the record of a game
+        """
+        self.__check_game_id(game_id)
+        offsets = self.__map("records.off", _OFFSET_TYPE).view()
+        data = self.__map("records.bin", "B").view()
+        end = offsets[game_id + 1] if game_id + 1 < self.__count else len(data)
+        return GameRecord.from_bytes(bytes(data[offsets[game_id] : end]))
+
+    def replay(self, game_id: int) -> Replay:
+        """
+        This method returns a Replay of a game, see replay.py
+        """
+        return Replay(self.record(game_id))
+
+    def records(self, game_ids: tuple[int, ...]) -> Iterator[GameRecord]:
+        """
+        This method reads the records of many games, e.g the result of a query.
+        Each record is only read when it is reached
+        """
+        for game_id in game_ids:
+            yield self.record(game_id)
+
+    def close(self) -> None:
+        """
+        This method releases the memory maps of the archive. It can still be used afterwards
+        """
+        for mapped in self.__maps.values():
+            mapped.close()
+        self.__maps.clear()
+
+    def __enter__(self) -> "GameArchive":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        """The number of games in the archive"""
+        return self.__count
+
+    def __path(self, name: str) -> str:
+        return os.path.join(self._directory, name)
+
+    def __map(self, name: str, typecode: str) -> _MappedArray:
+        """
+        Returns the memory map of a file of the archive, made on first use
+        """
+        if name not in self.__maps:
+            self.__maps[name] = _MappedArray(self.__path(name), typecode)
+        return self.__maps[name]
+
+    def __check_game_id(self, game_id: int) -> None:
+        if type(game_id) is not int or not 0 <= game_id < self.__count:
+            raise ValueError(
+                f"{game_id} - Invalid game id, must be from 0 to {self.__count - 1}"
+            )
+
+    def __check_filter(
+        self, column: str, value: Filter
+    ) -> tuple[str, int | None, int | None]:
+        """
+        Returns a filter as (column, low, high), raising an error if it is not valid
+        """
+        if column not in COLUMNS:
+            raise ValueError(f"{column} - Unknown column, must be one of {COLUMNS}")
+        if isinstance(value, int):
+            return column, value, value
+        if isinstance(value, tuple) and len(value) == 2:
+            low, high = value
+            if all(bound is None or isinstance(bound, int) for bound in value):
+                return column, low, high
+        raise ValueError(
+            f"{value} - Invalid filter, use a value or a (low, high) range with None for an open end"
+        )
+
+    def __index_range(
+        self, column: str, low: int | None, high: int | None
+    ) -> tuple[int, int]:
+        """
+        Returns the start and end of the values between low and high in the sorted index of a column
+        """
+        values = self.__map(f"{column}.sorted", _VALUE_TYPE).view()
+        start = 0 if low is None else bisect.bisect_left(values, low)
+        end = len(values) if high is None else bisect.bisect_right(values, high)
+        return start, max(start, end)
+
+    def __estimate(self, column: str, low: int | None, high: int | None) -> int:
+        """
+        Returns the number of indexed games that match a filter
+        """
+        if not self.__indexed:
+            return 0
+        start, end = self.__index_range(column, low, high)
+        return end - start
+
+    def __match(self, column: str, low: int | None, high: int | None) -> set[int]:
+        """
+        Returns the ids of the games that match a filter. Indexed games are found with the
+        sorted index, any games added since are scanned
+        """
+        matches: set[int] = set()
+        if self.__indexed:
+            start, end = self.__index_range(column, low, high)
+            matches.update(self.__map(f"{column}.ids", _ID_TYPE).view()[start:end])
+
+        values = self.__map(f"{column}.col", _VALUE_TYPE).view()
+        for game_id in range(self.__indexed, self.__count):
+            value = values[game_id]
+            if (low is None or value >= low) and (high is None or value <= high):
+                matches.add(game_id)
+        return matches
@@ -0,0 +1,263 @@
+## File: arena.py
+## Date: 2024-03-22
+## This module creates an arena of packed game states in shared memory
+
+# Handing a Game to a worker process pickles every object of the game, and unpickles them again
+# on the other side. A StateArena is a block of shared memory divided into slots, each holding
+# one packed game state (Game.pack_state). A coordinator stores a game in a slot, and hands workers
+# the slot number. A worker restores the game straight from the shared memory (load) and can write
+# a game back (store); a state is never pickled.
+
+# An arena pickles as its name only, so it can be passed to worker processes (e.g in the arguments
+# of a ProcessPoolExecutor task), which attach to the same shared memory. The lock is not pickled
+# (a multiprocessing lock can only be inherited), so an unpickled arena can read and write slots
+# but not allocate or free them.
+
+# Slots are handed out by a free-list allocator kept in the shared memory itself: each free slot
+# holds the number of the next free slot, an allocated slot holds _ALLOCATED, and the header holds
+# the first free slot. allocate and free change the list, so they must only be called by one
+# process at a time: either only by the process that created the arena, or by processes that share
+# the lock passed to the constructor (and to attach). An arena attached without a lock refuses to.
+# Freeing a slot that is not allocated (e.g twice) is refused, as it would put the slot on the list
+# twice and hand it out to two callers.
+# Reading and writing slots needs no lock, as long as no two processes write the same slot at once.
+
+# Packed states are longer with more players (Game.STATE_SIZES), so an arena is made for games of
+# one number of players, and every slot is the size of their states.
+
+import contextlib
+import struct
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, ContextManager
+
+from azul_backend.game import Game
+
+_MAGIC = b"AZARENA2"  # 2: allocated slots are marked, see free
+# magic, number of slots, slot size, first free slot (-1 if none), number of slots in use
+_HEADER = struct.Struct("<8sIIiI")
+_LINK = struct.Struct("<i")  # The next free slot, one per slot
+_NONE = -1
+_ALLOCATED = -2  # The link of a slot that is in use
+
+
+class StateArena:
+    """
+    This class is a fixed number of game state slots in shared memory, with an allocator
+
+    Args:
+        slots (int): The number of slots
+        lock: OPTIONAL: A lock (e.g multiprocessing.Lock) taken by allocate and free,
+            for arenas whose slots are allocated by more than one process.
+            Other processes must attach with the same lock to allocate and free
+        players (int): OPTIONAL: The number of players of the games stored, 2 by default
+
+    Methods:
+        attach: Opens an arena created by another process, by name
+        allocate: Returns the number of a free slot
+        free: Returns a slot to the free list
+        store: Packs a game into a slot
+        load: Restores the game in a slot
+        view: Returns the bytes of a slot, without copying them
+        close: Detaches this process from the arena
+        unlink: Destroys the arena, once every process has closed it
+        __len__: The number of slots in use
+    """
+
+    _shared: SharedMemory
+    _owner: bool
+    __lock: Any
+    __capacity: int
+    __slot_size: int
+    __slots_start: int
+
+    def __init__(self, slots: int, lock: Any = None, players: int = 2) -> None:
+        """Create a new arena, with every slot free"""
+        if not isinstance(slots, int) or slots < 1:
+            raise ValueError(f"{slots} - slots must be a positive int")
+        if players not in Game.STATE_SIZES:
+            raise ValueError(
+                f"{players} - Invalid number of players, must be from "
+                f"{min(Game.STATE_SIZES)} to {max(Game.STATE_SIZES)}"
+            )
+
+        slot_size = Game.STATE_SIZES[players]
+        self._shared = SharedMemory(
+            create=True,
+            size=_HEADER.size + slots * (_LINK.size + slot_size),
+        )
+        self._owner = True
+        self.__lock = lock
+        self.__layout(slots, slot_size)
+
+        # Every slot starts on the free list, in order
+        buffer = self._shared.buf
+        for slot in range(slots):
+            _LINK.pack_into(
+                buffer,
+                _HEADER.size + slot * _LINK.size,
+                slot + 1 if slot + 1 < slots else _NONE,
+            )
+        _HEADER.pack_into(buffer, 0, _MAGIC, slots, slot_size, 0, 0)
+
+    @classmethod
+    def attach(cls, name: str, lock: Any = None) -> "StateArena":
+        """
+        This method opens an arena created by another process, by its name.
+        Without the lock of the arena, the slots can be read and written but not allocated or freed
+        """
+        arena = cls.__new__(cls)
+        arena._shared = SharedMemory(name=name)
+        arena._owner = False
+        arena.__lock = lock
+
+        magic, slots, slot_size, _, _ = _HEADER.unpack_from(arena._shared.buf)
+        if magic != _MAGIC:
+            arena._shared.close()
+            raise ValueError(f"{name} - Not a state arena")
+        if slot_size not in Game.STATE_SIZES.values():
+            arena._shared.close()
+            raise ValueError(
+                f"{name} - The arena holds {slot_size} byte states, this version does not pack those"
+            )
+        arena.__layout(slots, slot_size)
+        return arena
+
+    def __layout(self, slots: int, slot_size: int) -> None:
+        self.__capacity = slots
+        self.__slot_size = slot_size
+        self.__slots_start = _HEADER.size + slots * _LINK.size
+
+    @property
+    def name(self) -> str:
+        """The name of the shared memory, for attach"""
+        return self._shared.name
+
+    @property
+    def capacity(self) -> int:
+        """The number of slots"""
+        return self.__capacity
+
+    @property
+    def players(self) -> int:
+        """The number of players of the games the slots hold"""
+        return next(
+            players for players, size in Game.STATE_SIZES.items() if size == self.__slot_size
+        )
+
+    def allocate(self) -> int:
+        """
+        This method takes a slot off the free list and returns its number
+        """
+        with self.__locked():
+            buffer = self._shared.buf
+            magic, slots, slot_size, free, used = _HEADER.unpack_from(buffer)
+            if free == _NONE:
+                raise RuntimeError(f"The arena is full, all {slots} slots are in use")
+            link = _HEADER.size + free * _LINK.size
+            (next_free,) = _LINK.unpack_from(buffer, link)
+            _LINK.pack_into(buffer, link, _ALLOCATED)
+            _HEADER.pack_into(buffer, 0, magic, slots, slot_size, next_free, used + 1)
+            return free
+
+    def free(self, slot: int) -> None:
+        """
+        This method returns an allocated slot to the free list. The slot must not be used afterwards
+        """
+        self.__check_slot(slot)
+        with self.__locked():
+            buffer = self._shared.buf
+            magic, slots, slot_size, free, used = _HEADER.unpack_from(buffer)
+            link = _HEADER.size + slot * _LINK.size
+            if _LINK.unpack_from(buffer, link)[0] != _ALLOCATED:
+                raise ValueError(f"{slot} - The slot is not allocated")
+            _LINK.pack_into(buffer, link, free)
+            _HEADER.pack_into(buffer, 0, magic, slots, slot_size, slot, used - 1)
+
+    def store(self, slot: int, game: Game) -> None:
+        """
+        This method packs a game into a slot. The game must have the number of players
+        the arena was made for
+        """
+        state = game.pack_state()
+        if len(state) != self.__slot_size:
+            raise ValueError(
+                f"The arena holds {self.players} player games, "
+                f"this game has {game.show_number_of_players()} players"
+            )
+        self.view(slot)[:] = state
+
+    def load(self, slot: int, game: Game | None = None, validate: bool = True) -> Game:
+        """
+        This method restores the game in a slot, straight from the shared memory.
+        A game can be supplied to restore into, in place (see Game.load_state),
+        otherwise a new game is created, checking its moves unless validate is False
+        (see the Game constructor). Searches, which only play legal moves, can skip the checks
+        """
+        state = self.view(slot)
+        if game is None:
+            return Game.unpack_state(state, validate=validate)  # type: ignore[arg-type]
+        game.load_state(state)  # type: ignore[arg-type]
+        return game
+
+    def view(self, slot: int) -> memoryview:
+        """
+        This method returns the bytes of a slot as a memoryview of the shared memory.
+        Nothing is copied, writing to the view writes to the slot.
+        Views must be released (or deleted) before the arena is closed
+        """
+        self.__check_slot(slot)
+        start = self.__slots_start + slot * self.__slot_size
+        return self._shared.buf[start : start + self.__slot_size]
+
+    def close(self) -> None:
+        """
+        This method detaches this process from the arena
+        """
+        self._shared.close()
+
+    def unlink(self) -> None:
+        """
+        This method destroys the arena. Processes that are still attached can go on using it
+        until they close it
+        """
+        self._shared.unlink()
+
+    def __enter__(self) -> "StateArena":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        """
+        Closes the arena, and destroys it if this process created it
+        """
+        self.close()
+        if self._owner:
+            self.unlink()
+
+    def __reduce__(self) -> tuple[Any, tuple[str]]:
+        """
+        An arena is pickled as its name. It is attached again when unpickled, without a lock,
+        so the copy can not allocate or free slots
+        """
+        return StateArena.attach, (self.name,)
+
+    def __len__(self) -> int:
+        """The number of slots in use"""
+        return _HEADER.unpack_from(self._shared.buf)[4]
+
+    def __check_slot(self, slot: int) -> None:
+        if type(slot) is not int or not 0 <= slot < self.__capacity:
+            raise ValueError(
+                f"{slot} - Invalid slot, must be from 0 to {self.__capacity - 1}"
+            )
+
+    def __locked(self) -> ContextManager[Any]:
+        """
+        The lock of the allocator. Only the creator of an arena may allocate and free without one
+        """
+        if self.__lock is not None:
+            return self.__lock
+        if not self._owner:
+            raise RuntimeError(
+                "This arena was attached without its lock, so it can not allocate or free slots"
+            )
+        return contextlib.nullcontext()
@@ -0,0 +1,309 @@
+## File: background.py
+## Date: 2024-03-24
+## This module runs ISMCTS searches in the background, for interactive frontends
+
+# A search takes seconds, far too long to run on the thread of a GUI. BackgroundSearch runs
+# searches in a worker process (or thread), and the frontend collects the results when it is ready,
+# e.g from a tkinter after() callback (poll).
+
+# Each search is split into chunks of iterations, and can be cancelled between chunks. The worker
+# keeps the tree of each search (ismcts.SearchTree) from one chunk to the next, so every chunk goes
+# on growing the same tree, and the search keeps improving for as long as the human thinks.
+# The trees of finished and cancelled searches are dropped by the worker.
+# A search is keyed by the packed state of its position (Game.pack_state), so the frontend can start
+# searches for positions that may never happen (speculation), e.g for the reply to each of the
+# likely moves of a human player, keep the one that does happen and cancel the rest.
+# Higher priority searches get the next chunk, searches of equal priority take turns.
+
+import itertools
+import queue
+import random
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Iterable
+
+from azul_backend.game import Game
+from azul_backend.ismcts import Move, SearchTree
+
+
+def likely_moves(game: Game, count: int = 3) -> tuple[Move, ...]:
+    """
+    This function returns up to count moves the current player is likely to play,
+    ranked cheaply by Game.preview: wall score, less floor penalty, then tiles placed
+    """
+
+    def value(move: Move) -> tuple[int, int]:
+        preview = game.preview(move)
+        return (
+            preview["wall_score"] + preview["floor_penalty"],
+            preview["tiles_to_line"],
+        )
+
+    return tuple(sorted(game.legal_moves(), key=value, reverse=True)[:count])
+
+
+# The trees of the searches in progress, kept by the worker between chunks.
+# Keyed by the BackgroundSearch they belong to (a worker thread is shared by the process) and the
+# packed position searched
+_trees: dict[tuple[int, bytes], SearchTree] = {}
+_owners = itertools.count()
+
+
+def _search_chunk(
+    owner: int,
+    state: bytes,
+    iterations: int,
+    seed: int,
+    exploration: float,
+    last: bool,
+    forget: tuple[bytes, ...],
+) -> dict[Move, tuple[int, float]]:
+    """
+    Grows the tree of a packed position, planting it on the first chunk, and returns the statistics
+    of the whole search so far as move: (visits, total reward). The tree is dropped after its last
+    chunk, the trees of the positions in forget (cancelled searches) before the chunk is searched.
+    Module level, so that it can be sent to a worker process
+    """
+    for key in forget:
+        _trees.pop((owner, key), None)
+
+    tree = _trees.get((owner, state))
+    if tree is None:
+        tree = SearchTree(Game.unpack_state(state), exploration, seed)
+        _trees[(owner, state)] = tree
+    tree.grow(iterations)
+
+    if last:
+        del _trees[(owner, state)]
+    return tree.statistics()
+
+
+def _drop_trees(owner: int) -> None:
+    """
+    Drops every tree of a BackgroundSearch, for one that searched in a thread of this process
+    """
+    for key in [key for key in _trees if key[0] == owner]:
+        del _trees[key]
+
+
+class _Search:
+    """
+    A search in progress. Internal use only
+    """
+
+    __slots__ = ("state", "remaining", "priority", "statistics")
+
+    def __init__(self, state: bytes, iterations: int, priority: int) -> None:
+        self.state = state
+        self.remaining = iterations
+        self.priority = priority
+        self.statistics: dict[Move, tuple[int, float]] = {}
+
+
+class BackgroundSearch:
+    """
+    This class runs searches in a worker, one chunk at a time, and keeps their results
+
+    Args:
+        iterations (int): The iterations of each search
+        chunk (int): The iterations searched between chances to cancel or switch search
+        exploration (float): The UCB exploration constant
+        processes (bool): OPTIONAL: Search in a worker process (True), or a worker thread (False).
+            A thread shares the interpreter lock with the frontend, a process does not
+        seed (int): OPTIONAL: Seed for reproducible searches
+
+    Methods:
+        start: Starts a search of a position, unless it has been searched already
+        result: Returns the best move of a finished search, or None
+        cancel: Stops every search except the ones supplied
+        clear: Forgets finished searches except the ones supplied
+        poll: Returns the searches finished since the last poll
+        close: Stops the worker
+    """
+
+    _iterations: int
+    _chunk: int
+    _exploration: float
+    __owner: int
+    __rng: random.Random
+    __executor: Executor
+    __searches: dict[bytes, _Search]
+    __results: dict[bytes, Move]
+    __forget: set[bytes]  # Cancelled searches, whose trees the worker is yet to drop
+    __finished: "queue.SimpleQueue[tuple[bytes, Move]]"
+    __condition: threading.Condition
+    __closed: bool
+    __thread: threading.Thread
+
+    def __init__(
+        self,
+        iterations: int = 2000,
+        chunk: int = 100,
+        exploration: float = 0.7,
+        processes: bool = True,
+        seed: int | None = None,
+    ) -> None:
+        """Start the worker and the thread that hands it chunks"""
+        if not isinstance(iterations, int) or iterations < 1:
+            raise ValueError(f"{iterations} - iterations must be a positive int")
+        if not isinstance(chunk, int) or chunk < 1:
+            raise ValueError(f"{chunk} - chunk must be a positive int")
+
+        self._iterations = iterations
+        self._chunk = chunk
+        self._exploration = exploration
+        self.__owner = next(_owners)
+        self.__rng = random.Random(seed)
+        self.__executor = (
+            ProcessPoolExecutor(max_workers=1)
+            if processes
+            else ThreadPoolExecutor(max_workers=1)
+        )
+        self.__searches = {}
+        self.__results = {}
+        self.__forget = set()
+        self.__finished = queue.SimpleQueue()
+        self.__condition = threading.Condition()
+        self.__closed = False
+        self.__thread = threading.Thread(
+            target=self.__run, name="BackgroundSearch", daemon=True
+        )
+        self.__thread.start()
+
+    def start(self, game: Game, priority: int = 0) -> bytes:
+        """
+        This method starts a search of the current position of a game, and returns its key.
+        If the position is already being searched its priority is raised to at least priority.
+        The game is packed straight away, and can be changed once this returns
+        """
+        key = game.pack_state()
+        with self.__condition:
+            if self.__closed:
+                raise RuntimeError("The background search has been closed")
+            if key in self.__results:
+                return key
+
+            search = self.__searches.get(key)
+            if search is not None:
+                search.priority = max(search.priority, priority)
+                return key
+
+            legal_moves = game.legal_moves()
+            if len(legal_moves) == 1:  # Nothing to search
+                self.__finish(key, legal_moves[0])
+            elif legal_moves:
+                self.__searches[key] = _Search(key, self._iterations, priority)
+                self.__condition.notify()
+        return key
+
+    def result(self, key: bytes) -> Move | None:
+        """
+        This method returns the best move of the search of a position, None if it has not finished
+        """
+        with self.__condition:
+            return self.__results.get(key)
+
+    def cancel(self, keep: Iterable[bytes] = ()) -> None:
+        """
+        This method stops every search except those whose keys are in keep.
+        A chunk already running finishes, but its result is thrown away
+        """
+        keep = set(keep)
+        with self.__condition:
+            for key in [key for key in self.__searches if key not in keep]:
+                del self.__searches[key]
+                self.__forget.add(key)
+
+    def clear(self, keep: Iterable[bytes] = ()) -> None:
+        """
+        This method forgets the results of finished searches, except those whose keys are in keep
+        """
+        keep = set(keep)
+        with self.__condition:
+            for key in [key for key in self.__results if key not in keep]:
+                del self.__results[key]
+
+    def poll(self) -> list[tuple[bytes, Move]]:
+        """
+        This method returns (key, best move) of every search finished since the last poll.
+        It never blocks, so it can be called from a GUI event loop
+        """
+        finished = []
+        while True:
+            try:
+                finished.append(self.__finished.get_nowait())
+            except queue.Empty:
+                return finished
+
+    def close(self) -> None:
+        """
+        This method stops the searches and the worker
+        """
+        with self.__condition:
+            self.__closed = True
+            self.__searches.clear()
+            self.__condition.notify()
+        self.__thread.join()
+        self.__executor.shutdown(wait=True, cancel_futures=True)
+        _drop_trees(self.__owner)
+
+    def __enter__(self) -> "BackgroundSearch":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def __finish(self, key: bytes, move: Move) -> None:
+        """
+        Records the result of a search. Called with the condition held
+        """
+        self.__results[key] = move
+        self.__finished.put((key, move))
+
+    def __run(self) -> None:
+        """
+        Background thread. Hands the worker one chunk at a time, of the highest priority search
+        """
+        while True:
+            with self.__condition:
+                while not self.__searches and not self.__closed:
+                    self.__condition.wait()
+                if self.__closed:
+                    return
+
+                # Equal priorities take turns, as a search goes to the back once it has had a chunk
+                key = max(self.__searches, key=lambda k: self.__searches[k].priority)
+                search = self.__searches.pop(key)
+                self.__searches[key] = search
+                iterations = min(self._chunk, search.remaining)
+                seed = self.__rng.getrandbits(64)
+                forget = tuple(self.__forget)
+                self.__forget.clear()
+
+            try:
+                statistics = self.__executor.submit(
+                    _search_chunk,
+                    self.__owner,
+                    search.state,
+                    iterations,
+                    seed,
+                    self._exploration,
+                    iterations == search.remaining,
+                    forget,
+                ).result()
+            except RuntimeError:  # The executor was shut down by close
+                return
+
+            with self.__condition:
+                if self.__searches.get(key) is not search:
+                    continue  # Cancelled while the chunk was running
+
+                search.statistics = statistics
+                search.remaining -= iterations
+
+                if search.remaining <= 0:
+                    del self.__searches[key]
+                    best = max(
+                        search.statistics, key=lambda move: search.statistics[move][0]
+                    )
+                    self.__finish(key, best)
@@ -0,0 +1,138 @@
+## File: canonical.py
+## Date: 2024-03-21
+## This module creates canonical forms of positions, so that equivalent positions are treated as one
+
+# Many positions differ only in ways that can not change how the game goes on:
+#   the order of the factories (any factory can be picked on any turn)
+#   the order of the tiles in a factory, in the centre of the table, in the hand and on a floor
+# canonical_position sorts all of these away, starting from Game.pack_position.
+# With perspective=True it also rotates the players so that the player to move is always player 1,
+# the others following in turn order (with 2 players, they are swapped when player 2 is to move).
+# A position and its mirror (the same boards with the players swapped and the other player to move)
+# then share one canonical form.
+
+# Moves name a factory by number, and sorting the factories renumbers them. canonical_move and
+# original_move translate moves between the numbering of a game and the canonical numbering,
+# so a move stored against a canonical position can be played in any equivalent game.
+
+import hashlib
+
+from azul_backend.actions import Move, decode_action
+from azul_backend.factory import Factory
+from azul_backend.floor import Floor
+from azul_backend.game import Game
+from azul_backend.patternlines import PatternLines
+from azul_backend.tiles import TILE_CODES, TILE_COLOURS
+from azul_backend.wall import Wall
+
+# Sections of Game.pack_position. The hand, factories and centre of the table are as wide as the
+# number of factories needs, see canonical_position
+_BOARD_SIZE = Wall.STATE_SIZE + PatternLines.STATE_SIZE + Floor.STATE_SIZE
+_FLOOR = slice(_BOARD_SIZE - Floor.STATE_SIZE, _BOARD_SIZE)  # Within a board
+
+
+def _sorted_codes(codes: bytes) -> bytes:
+    """
+    Sorts the tile codes of a section, keeping the empty spaces (0) at the end
+    """
+    tiles = sorted(code for code in codes if code)
+    return bytes(tiles).ljust(len(codes), b"\0")
+
+
+def factory_order(game: Game) -> tuple[int, ...]:
+    """
+    This function returns the factory numbers of a game in canonical order:
+    canonical factory i + 1 is factory factory_order(game)[i] of the game.
+    Factories with the same tiles keep their order
+    """
+    return tuple(
+        sorted(
+            range(1, game.show_number_of_factories() + 1),
+            key=lambda number: _sorted_codes(
+                bytes(
+                    TILE_CODES[tile.get_tile_type()] for tile in game.show_factory(number)
+                ).ljust(4, b"\0")
+            ),
+        )
+    )
+
+
+def canonical_position(game: Game, perspective: bool = False) -> bytes:
+    """
+    This function returns the canonical form of the position of a game, as Game.POSITION_SIZES bytes.
+    Positions that differ only in the order of the factories, or of the tiles within a factory,
+    the centre of the table, the hand or a floor, have the same canonical form
+
+    Args:
+        game (Game): The game
+        perspective (bool): OPTIONAL: If True, the players are rotated so the player to move
+            is always player 1
+    """
+    players = game.show_number_of_players()
+    number_of_factories = game.show_number_of_factories()
+    header = Game._POSITION_HEADERS[players]
+    hand = slice(header.size, header.size + Factory.centre_size(number_of_factories))
+    centre = slice(
+        hand.stop + 4 * number_of_factories, hand.stop + Factory.tiles_size(number_of_factories)
+    )
+    bag = slice(centre.stop, centre.stop + len(TILE_COLOURS))
+
+    position = game.pack_position()
+    gamestate, current_player, *scores = header.unpack_from(position)
+
+    factories = [
+        _sorted_codes(position[hand.stop + i * 4 : hand.stop + i * 4 + 4])
+        for i in range(number_of_factories)
+    ]
+    boards = [
+        board[: _FLOOR.start] + _sorted_codes(board[_FLOOR])
+        for board in (
+            position[bag.stop + i * _BOARD_SIZE : bag.stop + (i + 1) * _BOARD_SIZE]
+            for i in range(players)
+        )
+    ]
+    if perspective and current_player != Game.PLAYER_1:
+        turn = current_player - 1
+        current_player = Game.PLAYER_1
+        scores = scores[turn:] + scores[:turn]
+        boards = boards[turn:] + boards[:turn]
+
+    return b"".join(
+        (
+            header.pack(gamestate, current_player, *scores),
+            _sorted_codes(position[hand]),
+            b"".join(sorted(factories)),
+            _sorted_codes(position[centre]),
+            position[bag],
+            *boards,
+        )
+    )
+
+
+def canonical_key(game: Game, perspective: bool = False, digest_size: int = 16) -> bytes:
+    """
+    This function returns a hash of the canonical form of the position of a game
+    """
+    return hashlib.blake2b(
+        canonical_position(game, perspective), digest_size=digest_size
+    ).digest()
+
+
+def canonical_move(game: Game, move: Move | int) -> Move:
+    """
+    This function translates a move of a game into the factory numbering of the canonical form
+    """
+    factory_number, tile_type, line = decode_action(move) if isinstance(move, int) else move
+    if factory_number:
+        factory_number = factory_order(game).index(factory_number) + 1
+    return factory_number, tile_type, line
+
+
+def original_move(game: Game, move: Move | int) -> Move:
+    """
+    This function translates a move in the canonical factory numbering into a move of the game
+    """
+    factory_number, tile_type, line = decode_action(move) if isinstance(move, int) else move
+    if factory_number:
+        factory_number = factory_order(game)[factory_number - 1]
+    return factory_number, tile_type, line
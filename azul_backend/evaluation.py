@@ -0,0 +1,341 @@
+## File: evaluation.py
+## Date: 2024-03-08
+## This module creates a batched, vectorised position evaluator for search agents
+
+# Scoring positions one at a time through the Game show methods spends most of its time in the
+# Python interpreter. Here a position is taken as the fixed width bytes of Game.pack_position,
+# a batch of them is unpacked into rows of ints with a handful of NumPy array operations
+# (encode_packed), and the rows are scored together in the same way (evaluate_encoded).
+# Games of 2, 3 and 4 players are encoded and scored alike, each row holds every player.
+
+# BatchEvaluator lets many searches (e.g one per concurrent game on a server) share one evaluator.
+# Each search submits its leaf positions and gets a Future back. A background thread gathers
+# the positions into batches, and encodes and scores each batch (one for each number of players)
+# in a single vectorised call.
+
+# NumPy is only needed by this module, the rest of the backend does not depend on it.
+
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future
+from types import MappingProxyType
+
+import numpy as np
+
+from azul_backend.factory import FACTORIES_BY_PLAYERS
+from azul_backend.floor import Floor
+from azul_backend.game import Game
+from azul_backend.patternlines import PatternLines
+from azul_backend.wall import Wall
+
+# -ENCODING------------------------------------------------------------------------------------
+# Each player is encoded as
+#   wall: 25 cells, row major, 1 if a tile is on the cell
+#   pattern line fill: 5 counts, the number of tiles on line1-line5
+#   pattern line colour: 5 colour numbers, 0 if the line is empty, else 1-5 in TILE_COLOURS order
+#   floor: the number of tiles on the floor
+#   score
+# A position is the current player followed by player 1, player 2 ... for every player.
+# STATE_WIDTHS holds the width of a row for each number of players, STATE_WIDTH for 2 players
+_WALL = slice(0, 25)
+_LINE_FILL = slice(25, 30)
+_LINE_COLOUR = slice(30, 35)
+_FLOOR = 35
+_SCORE = 36
+PLAYER_WIDTH: int = 37
+STATE_WIDTHS: MappingProxyType[int, int] = MappingProxyType(
+    {players: 1 + players * PLAYER_WIDTH for players in FACTORIES_BY_PLAYERS}
+)
+STATE_WIDTH: int = STATE_WIDTHS[2]
+
+# Where each part of a player's board is in the bytes of Game.pack_position. The boards of
+# every player come last, after the header (phase, current player, a 2 byte score per player),
+# the hand, factories and bag counts. A pattern line is a colour code (1-5 in TILE_COLOURS order,
+# as _LINE_COLOUR) and a count, whose top bit flags a complete line already tiled
+_BOARD_SIZE = Wall.STATE_SIZE + PatternLines.STATE_SIZE + Floor.STATE_SIZE
+_PACKED_WALL = slice(0, Wall.STATE_SIZE)
+_PACKED_LINES = slice(Wall.STATE_SIZE, Wall.STATE_SIZE + PatternLines.STATE_SIZE)
+_PACKED_FLOOR = slice(_PACKED_LINES.stop, _BOARD_SIZE)
+_COUNT_MASK = 0x7F
+
+# Look up tables used by the vectorised evaluation
+_LINE_CAPACITY = np.arange(1, 6, dtype=np.float64)
+_FLOOR_PENALTY = np.array([0, -1, -2, -4, -6, -8, -11, -14], dtype=np.float64)
+# The colour of each wall cell, as a one-hot (25, 5) matrix. Blue runs down the diagonal
+_CELL_COLOUR = np.eye(5, dtype=np.float64)[
+    [(column - row) % 5 for row in range(5) for column in range(5)]
+]
+
+# Weights of each feature, added to the score of each player
+DEFAULT_WEIGHTS: MappingProxyType[str, float] = MappingProxyType(
+    {
+        "adjacency": 0.5,  # Pairs of neighbouring tiles on the wall
+        "line_completion": 0.5,  # Fraction of each pattern line filled
+        "complete_lines": 1.0,  # Pattern lines ready to be tiled
+        "floor_penalty": 1.0,  # Multiplies the penalty of the tiles on the floor
+        "bonus_progress": 1.0,  # Progress towards row, column and colour bonuses
+    }
+)
+
+
+def encode_packed(positions: list[bytes] | tuple[bytes, ...], players: int = 2) -> np.ndarray:
+    """
+    This function encodes a batch of positions, given as the bytes of Game.pack_position of games
+    with the same number of players, into an (N, STATE_WIDTHS[players]) array of ints (int16).
+    The bytes are unpacked for the whole batch at once, without a Python loop over the positions
+    """
+    if players not in STATE_WIDTHS:
+        raise ValueError(f"{players} - Invalid number of players, must be 2, 3 or 4")
+    size = Game.POSITION_SIZES[players]
+    packed = np.frombuffer(b"".join(positions), dtype=np.uint8)
+    if len(packed) != len(positions) * size:
+        raise ValueError(f"Every position of a {players} player game must be {size} bytes")
+    packed = packed.reshape(len(positions), size)
+
+    boards = packed[:, size - players * _BOARD_SIZE :].reshape(
+        len(positions), players, _BOARD_SIZE
+    )
+    lines = boards[:, :, _PACKED_LINES].reshape(len(positions), players, 5, 2)
+    line_fill = lines[..., 1] & _COUNT_MASK
+    scores = np.ascontiguousarray(packed[:, 2 : 2 + 2 * players]).view("<u2")
+
+    encoded_players = np.empty((len(positions), players, PLAYER_WIDTH), dtype=np.int16)
+    # The wall is a little endian mask, bit row * 5 + column set for each tile
+    encoded_players[:, :, _WALL] = np.unpackbits(
+        boards[:, :, _PACKED_WALL], axis=2, bitorder="little"
+    )[:, :, :25]
+    encoded_players[:, :, _LINE_FILL] = line_fill
+    encoded_players[:, :, _LINE_COLOUR] = np.where(line_fill > 0, lines[..., 0], 0)
+    encoded_players[:, :, _FLOOR] = (boards[:, :, _PACKED_FLOOR] != 0).sum(axis=2)
+    encoded_players[:, :, _SCORE] = scores
+
+    encoded = np.empty((len(positions), STATE_WIDTHS[players]), dtype=np.int16)
+    encoded[:, 0] = packed[:, 1]
+    encoded[:, 1:] = encoded_players.reshape(len(positions), players * PLAYER_WIDTH)
+    return encoded
+
+
+def encode_position(game: Game) -> np.ndarray:
+    """
+    This function encodes one position into a row of STATE_WIDTHS[players] ints (int16).
+    To encode many positions, pack them and encode them together with encode_packed
+    """
+    return encode_packed((game.pack_position(),), game.show_number_of_players())[0]
+
+
+def evaluate_encoded(
+    states: np.ndarray, weights: MappingProxyType[str, float] = DEFAULT_WEIGHTS
+) -> np.ndarray:
+    """
+    This function scores a batch of encoded positions in one vectorised pass.
+    states is an (N, STATE_WIDTHS[players]) array of rows from encode_packed or encode_position.
+    Returns an (N, players) array with the value of the position for player 1, player 2 ...
+    """
+    states = np.asarray(states)
+    widths = tuple(STATE_WIDTHS.values())
+    if states.ndim != 2 or states.shape[1] not in widths:
+        raise ValueError(
+            f"{states.shape} - Invalid shape, states must be (N, W) with W one of {widths}"
+        )
+
+    number_of_players = (states.shape[1] - 1) // PLAYER_WIDTH
+    players = (
+        states[:, 1:]
+        .reshape(len(states), number_of_players, PLAYER_WIDTH)
+        .astype(np.float64)
+    )
+    wall = players[:, :, _WALL]
+    grid = wall.reshape(len(states), number_of_players, 5, 5)
+
+    adjacency = (grid[..., :, 1:] * grid[..., :, :-1]).sum(axis=(2, 3)) + (
+        grid[..., 1:, :] * grid[..., :-1, :]
+    ).sum(axis=(2, 3))
+
+    line_fill = players[:, :, _LINE_FILL]
+    line_completion = (line_fill / _LINE_CAPACITY).sum(axis=2)
+    complete_lines = (line_fill == _LINE_CAPACITY).sum(axis=2)
+
+    floor_penalty = _FLOOR_PENALTY[players[:, :, _FLOOR].astype(np.intp).clip(0, 7)]
+
+    # Bonuses are 2 per row, 7 per column and 10 per colour. Progress is squared,
+    # as a nearly complete set is worth far more than a started one
+    rows = grid.sum(axis=3) / 5
+    columns = grid.sum(axis=2) / 5
+    colours = (wall @ _CELL_COLOUR) / 5
+    bonus_progress = (
+        2 * (rows**2).sum(axis=2)
+        + 7 * (columns**2).sum(axis=2)
+        + 10 * (colours**2).sum(axis=2)
+    )
+
+    return (
+        players[:, :, _SCORE]
+        + weights["adjacency"] * adjacency
+        + weights["line_completion"] * line_completion
+        + weights["complete_lines"] * complete_lines
+        + weights["floor_penalty"] * floor_penalty
+        + weights["bonus_progress"] * bonus_progress
+    )
+
+
+class BatchEvaluator:
+    """
+    This class scores positions submitted by many searches in shared vectorised batches
+
+    Args:
+        max_batch (int): The largest number of positions scored in one call
+        max_delay (float): Seconds to wait for more positions before scoring a part filled batch
+        weights (MappingProxyType[str, float]): OPTIONAL: Feature weights, see DEFAULT_WEIGHTS
+
+    Methods:
+        submit: Queue a position, returns a Future of (player 1 value, player 2 value ...)
+        evaluate: Score a list of positions straight away in the calling thread
+        close: Score anything still queued and stop the background thread
+    """
+
+    _max_batch: int
+    _max_delay: float
+    _weights: MappingProxyType[str, float]
+    __queue: "queue.SimpleQueue[tuple[bytes, int, Future[tuple[float, ...]]] | None]"
+    __thread: threading.Thread
+    __closed: bool
+
+    def __init__(
+        self,
+        max_batch: int = 1024,
+        max_delay: float = 0.001,
+        weights: MappingProxyType[str, float] = DEFAULT_WEIGHTS,
+    ) -> None:
+        """Start the background thread that scores the batches"""
+        if not isinstance(max_batch, int) or max_batch < 1:
+            raise ValueError(f"{max_batch} - max_batch must be a positive int")
+
+        self._max_batch = max_batch
+        self._max_delay = max_delay
+        self._weights = weights
+        self.__queue = queue.SimpleQueue()
+        self.__closed = False
+        self.__thread = threading.Thread(
+            target=self.__run, name="BatchEvaluator", daemon=True
+        )
+        self.__thread.start()
+
+    def submit(self, game: Game) -> "Future[tuple[float, ...]]":
+        """
+        This method queues a position for evaluation.
+        The position is packed straight away, so the game can be changed once this returns.
+        It is encoded with the rest of its batch in the background thread
+        """
+        if self.__closed:
+            raise RuntimeError("The evaluator has been closed")
+
+        future: Future[tuple[float, ...]] = Future()
+        self.__queue.put((game.pack_position(), game.show_number_of_players(), future))
+        return future
+
+    def evaluate(self, games: list[Game]) -> np.ndarray:
+        """
+        This method scores a list of positions of games with the same number of players
+        in the calling thread, as an (N, players) array
+        """
+        if not games:
+            return np.zeros((0, 2))
+        players = games[0].show_number_of_players()
+        if any(game.show_number_of_players() != players for game in games):
+            raise ValueError("Every game evaluated together must have the same number of players")
+        return evaluate_encoded(
+            encode_packed([game.pack_position() for game in games], players), self._weights
+        )
+
+    def close(self) -> None:
+        """
+        This method scores any positions still queued, then stops the background thread
+        """
+        if not self.__closed:
+            self.__closed = True
+            self.__queue.put(None)
+            self.__thread.join()
+
+    def __enter__(self) -> "BatchEvaluator":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def __run(self) -> None:
+        """
+        Background thread. Gathers queued positions into batches and scores them
+        """
+        stopping = False
+        while not stopping:
+            item = self.__queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = time.perf_counter() + self._max_delay
+            while len(batch) < self._max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    item = (
+                        self.__queue.get(timeout=remaining)
+                        if remaining > 0
+                        else self.__queue.get_nowait()
+                    )
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            # Skip positions whose search has given up on them, and score the
+            # positions of each number of players together
+            by_players: dict[int, list[tuple[bytes, Future[tuple[float, ...]]]]] = {}
+            for position, players, future in batch:
+                if future.set_running_or_notify_cancel():
+                    by_players.setdefault(players, []).append((position, future))
+
+            for players, group in by_players.items():
+                try:
+                    values = evaluate_encoded(
+                        encode_packed([position for position, _ in group], players),
+                        self._weights,
+                    )
+                except Exception as error:  # Hand the error to every waiting search
+                    for _, future in group:
+                        future.set_exception(error)
+                else:
+                    for (_, future), value in zip(group, values.tolist()):
+                        future.set_result(tuple(value))
+
+
+def greedy_move(
+    game: Game, evaluator: BatchEvaluator, rng: random.Random | None = None
+) -> tuple[int, str, str | None]:
+    """
+    This function is a one move lookahead agent built on a BatchEvaluator.
+    Every legal move is played on a determinized copy of the game, all the resulting positions
+    are submitted together, and the move with the best value for the mover
+    (less the best value of the other players) is returned
+    """
+    legal_moves = game.legal_moves()
+    if not legal_moves:
+        raise ValueError("There are no legal moves, the game is over")
+
+    rng = rng or random.Random()
+    player = game.show_current_player()
+    futures = []
+    for move in legal_moves:
+        child = game.determinize(rng)
+        child.play_move(move)
+        futures.append(evaluator.submit(child))
+
+    def advantage(value: tuple[float, ...]) -> float:
+        others = value[: player - 1] + value[player:]
+        return value[player - 1] - max(others)
+
+    best = max(range(len(legal_moves)), key=lambda i: advantage(futures[i].result()))
+    return legal_moves[best]
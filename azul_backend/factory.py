@@ -1,12 +1,12 @@
+import random
 from azul_backend.tilebag import TileBag
-from azul_backend.tiles import ColourTile, P1Tile
+from azul_backend.tiles import ColourTile, P1Tile, TILE_CODES, tile_from_code
+from types import MappingProxyType
 from typing import cast
-from textwrap import dedent
 
-# I strongly considered to make the number of factories an argument,
-# To allow easy extension for non 2 player versions of the game.
-# I decided that a fixed number was cleaner. It is easy to change if needed
-# Perhaps using a list of each factory of configurable length.
+# The number of factories is set by the number of players: 5 for 2 players, 7 for 3 and 9 for 4.
+# The factories are held in a list, factory number n is _factories[n - 1]
+FACTORIES_BY_PLAYERS: MappingProxyType[int, int] = MappingProxyType({2: 5, 3: 7, 4: 9})
 
 
 class Factory:
@@ -16,39 +16,48 @@ class Factory:
     It should not be instantiated directly by users of the library.
     Please use the Game class to create a new game.
 
+    Args:
+        seed (int): OPTIONAL: Seed for the tile bag, for reproducible games
+        factories (int): OPTIONAL: The number of factories, see FACTORIES_BY_PLAYERS
+
     Methods:
         reset_factory: Reset the factories at the start of each factory offer round to have 4 tiles each
+        number_of_factories: The number of factories, not counting the centre of the table
         replace_p1_tile: Return the player1 tile to the centre of the table
         isempty: Returns True if all the factories (and centre of table) are empty
         show_factory: Show the contents of the specified factory or the centre of the table
         take_factory_tiles: Take all tiles of a specified colour from a specified factory
+        show_bag_counts: Show how many tiles of each colour are left in the tile bag
         __str__: Pretty print the class contents
     """
 
     __my_tiles: TileBag
-    _factory1: list[ColourTile]
-    _factory2: list[ColourTile]
-    _factory3: list[ColourTile]
-    _factory4: list[ColourTile]
-    _factory5: list[ColourTile]
+    _factories: list[list[ColourTile]]
     _centretable: list[ColourTile | P1Tile]
+    # Immutable views handed out by show_factory, by factory number. Emptied whenever any factory changes
+    _cached_views: dict[int, tuple[ColourTile | P1Tile, ...]]
 
-    def __init__(self) -> None:
+    def __init__(self, seed: int | None = None, factories: int = 5) -> None:
         """
         This is the constructor for the Factory class
         It creates a new tile bag and sets up the
         factories and the centre of the table
         for the first turn.
+
+        Args:
+            seed (int): OPTIONAL: Seed for the tile bag, for reproducible games
+            factories (int): OPTIONAL: The number of factories, 5, 7 or 9
         """
-        self.__my_tiles = TileBag()  # Create a new tile bag
+        if factories not in FACTORIES_BY_PLAYERS.values():
+            raise ValueError(
+                f"{factories} - Invalid number of factories, must be one of 5, 7 or 9"
+            )
+        self.__my_tiles = TileBag(seed)  # Create a new tile bag
 
         self._centretable = []
-        self._factory1 = []
-        self._factory2 = []
-        self._factory3 = []
-        self._factory4 = []
-        self._factory5 = []
+        self._factories = [[] for _ in range(factories)]
         # I initialise theses as empty, so that the isempty() check in reset_factory works
+        self._cached_views = {}
 
         self.reset_factory()
 
@@ -56,6 +65,23 @@ class Factory:
         # at the start of the game. In later turns the replace_P1Tile method is used
         self._centretable.append(self.__my_tiles.take_p1_tile())
 
+    # Protected, only used by Game when a game is reset
+    def _reinitialise(self, seed: int | None = None) -> None:
+        """
+        This method returns the factories to the start of a new game, in place.
+        The tile bag is refilled, the factories are filled and the
+        player1 tile is placed in the centre of the table
+        """
+        self.__my_tiles._reinitialise(seed)
+
+        self._centretable.clear()
+        for factory in self._factories:
+            factory.clear()
+        self._cached_views.clear()
+
+        self.reset_factory()
+        self._centretable.append(self.__my_tiles.take_p1_tile())
+
     # Private. Exposes mutable factories. Internal use only
     def __get_factory(
         self, factory: int
@@ -63,24 +89,23 @@ class Factory:
         # this type hint is a little messy. In effect. Factories return just ColourTile.
         # CentreTable returns a ColourTile or P1Tile
         """
-        This method returns the specidied (factory=1-5) or the centre of the table (factory=0) as a list
+        This method returns the specidied (factory=1-9) or the centre of the table (factory=0) as a list
         It exposes the mutable factories. It is for internal use only
         """
         if factory == 0:
             return self._centretable
-        elif factory == 1:
-            return self._factory1
-        elif factory == 2:
-            return self._factory2
-        elif factory == 3:
-            return self._factory3
-        elif factory == 4:
-            return self._factory4
-        elif factory == 5:
-            return self._factory5
+        elif type(factory) is int and 0 < factory <= len(self._factories):
+            return self._factories[factory - 1]
         else:
             raise ValueError("Invalid factory number")
 
+    @property
+    def number_of_factories(self) -> int:
+        """
+        This property returns the number of factories, not counting the centre of the table
+        """
+        return len(self._factories)
+
     def reset_factory(self) -> None:
         """
         This method resets the factories.
@@ -92,11 +117,9 @@ class Factory:
                 "The factories are not empty, it is not an appropiate time to reset the factories"
             )
 
-        self._factory1 = self._draw_factory_tiles()
-        self._factory2 = self._draw_factory_tiles()
-        self._factory3 = self._draw_factory_tiles()
-        self._factory4 = self._draw_factory_tiles()
-        self._factory5 = self._draw_factory_tiles()
+        for factory in self._factories:
+            factory[:] = self._draw_factory_tiles()
+        self._cached_views.clear()
 
     def _draw_factory_tiles(self) -> list[ColourTile]:
         """
@@ -119,6 +142,7 @@ class Factory:
             )
 
         self._centretable.append(replaced_p1_tile)
+        self._cached_views.clear()
 
     @property
     def isempty(self) -> bool:
@@ -130,60 +154,81 @@ class Factory:
         if len(self._centretable) == 1 and type(self._centretable[0]) is P1Tile:
             # If there is only one tile in the Centre of the table, and that is the P1Tile
             # We just check if the factories are empty
-            return not (
-                self._factory1
-                or self._factory2
-                or self._factory3
-                or self._factory4
-                or self._factory5
-            )
+            return not any(self._factories)
         else:
             # Else we check everything, including centre of table.
-            return not (
-                self._centretable
-                or self._factory1
-                or self._factory2
-                or self._factory3
-                or self._factory4
-                or self._factory5
-            )
+            return not (self._centretable or any(self._factories))
 
     def show_factory(
         self, factory_number: int
     ) -> tuple[ColourTile | P1Tile, ...]:
         """
         This method returns the tiles in a specified factory as a tuple
-        factory_number: 1-5 corresponds to the factory number
+        factory_number: 1-9 corresponds to the factory number
         factory_number: 0 corresponds to the centre of the table
+        The tuple is built once and reused until the factories next change
+        """
+        view = self._cached_views.get(factory_number)
+        if view is None:
+            view = tuple(self.__get_factory(factory_number))  # Ensures immutability
+            self._cached_views[factory_number] = view
+        return view
+
+    def get_seed(self) -> int:
+        """
+        This method returns the seed of the tile bag
+        """
+        return self.__my_tiles.get_seed()
+
+    def get_refills(self) -> int:
+        """
+        This method returns the number of times the tile bag has been filled
+        """
+        return self.__my_tiles.get_refills()
+
+    def show_bag_counts(self) -> tuple[int, ...]:
+        """
+        This method returns the number of tiles of each colour left in the tile bag
+        In the order ("blue", "yellow", "red", "black", "white")
         """
-        return tuple(self.__get_factory(factory_number))  # Ensures immutability
+        return self.__my_tiles.show_bag_counts()
+
+    def _shuffle_tile_bag(self, rng: random.Random) -> None:
+        """
+        This method reshuffles the hidden order of the tile bag.
+        It is used to create determinized copies of a game for search
+        """
+        self.__my_tiles._shuffle_tile_bag(rng)
 
     def _move_to_centre(self, factory_number: int) -> None:
         """
         This method moves all the remaining tiles from a factory to the centre of the table
         It is played after a player has selected tiles from a factory
         """
-        if factory_number < 0 or factory_number > 5:
+        if factory_number < 0 or factory_number > len(self._factories):
             raise ValueError(
-                "Invalid factory number, please choose a number between 1 and 5"
+                f"Invalid factory number, please choose a number between 1 and {len(self._factories)}"
             )
 
         factory = self.__get_factory(factory_number)
         self._centretable.extend(factory)
         factory.clear()
+        self._cached_views.clear()
 
     def take_factory_tiles(
-        self, factory_number: int, tile_type: str
+        self, factory_number: int, tile_type: str, validate: bool = True
     ) -> list[ColourTile | P1Tile] | list[ColourTile]:
         """
         This method returns any and all tiles from a specified factory of a specified
         colour, removing it from the factory at the same time.
-        1-5 corresponds to the factory number
+        1-9 corresponds to the factory number
         0 corresponds to the centre of the table
 
         If retrieving from the centre of the table, the player1 tile is also returned if available
+        If validate is False the checks on the colour and the tiles taken are skipped,
+        for trusted callers whose moves are known to be legal
         """
-        if tile_type not in ["blue", "yellow", "red", "black", "white"]:
+        if validate and tile_type not in ["blue", "yellow", "red", "black", "white"]:
             raise ValueError(
                 f"{tile_type} Is an Invalid tile type, please choose from blue, yellow, red, black or white"
             )
@@ -199,9 +244,10 @@ class Factory:
                 filtered_tiles.append(tile)
 
         # This helper method checks that valid tiles have been selected
-        self._validate_take_factory_tiles(
-            filtered_tiles, factory_number, tile_type
-        )
+        if validate:
+            self._validate_take_factory_tiles(
+                filtered_tiles, factory_number, tile_type
+            )
 
         # Factory is updated to remove the tiles of the specified colour
         factory = cast(list[ColourTile | P1Tile], factory)
@@ -210,6 +256,7 @@ class Factory:
 
         for tile in filtered_tiles:
             factory.remove(tile)
+        self._cached_views.clear()
 
         if (
             factory_number > 0
@@ -246,24 +293,78 @@ class Factory:
                 f"Not tile(s) of colour {tile_type} exists in the centre of the table"
             )
 
+    # Fixed width layout of _export_state: 4 tile codes for each factory, then 3 for each factory
+    # for the centre of the table (at most 3 tiles left by each factory, plus the player1 tile),
+    # then the tile bag. STATE_SIZE is the size with 5 factories, see state_size for the others
+    @staticmethod
+    def centre_size(factories: int) -> int:
+        """
+        This method returns the most tiles the centre of the table can hold with a number of factories
+        """
+        return 3 * factories + 1
+
+    @classmethod
+    def tiles_size(cls, factories: int) -> int:
+        """
+        This method returns the size of _export_tiles with a number of factories
+        """
+        return 4 * factories + cls.centre_size(factories)
+
+    @classmethod
+    def state_size(cls, factories: int) -> int:
+        """
+        This method returns the size of _export_state with a number of factories
+        """
+        return cls.tiles_size(factories) + TileBag.STATE_SIZE
+
+    STATE_SIZE = 5 * 4 + 16 + TileBag.STATE_SIZE
+
+    # Protected, used by Game to pack the state of a game
+    def _export_state(self) -> bytes:
+        """
+        This method returns the complete state of the factories and tile bag as bytes
+        """
+        return self._export_tiles() + self.__my_tiles._export_state()
+
+    # Protected, used by Game to pack the visible position of a game
+    def _export_tiles(self) -> bytes:
+        """
+        This method returns the tiles on the factories and the centre of the table as bytes,
+        the first tiles_size bytes of _export_state (36 with 5 factories)
+        """
+        factories = b"".join(
+            bytes(TILE_CODES[tile.get_tile_type()] for tile in factory).ljust(4, b"\0")
+            for factory in self._factories
+        )
+        centre = bytes(
+            TILE_CODES[tile.get_tile_type()] for tile in self._centretable
+        ).ljust(self.centre_size(len(self._factories)), b"\0")
+        return factories + centre
+
+    # Protected, used by Game to restore a packed game
+    def _import_state(self, state: bytes) -> None:
+        """
+        This method restores the factories and tile bag from the bytes of _export_state, in place
+        """
+        for i, factory in enumerate(self._factories):
+            factory[:] = [
+                cast(ColourTile, tile_from_code(code))
+                for code in state[i * 4 : i * 4 + 4]
+                if code
+            ]
+        centre = 4 * len(self._factories)
+        tiles = self.tiles_size(len(self._factories))
+        self._centretable[:] = [tile_from_code(code) for code in state[centre:tiles] if code]
+        self.__my_tiles._import_state(state[tiles:])
+        self._cached_views.clear()
+
     def __str__(self) -> str:
         """
         This method returns a string representation of the factory floor
         """
         cot_string = " ".join(map(str, self._centretable))
-        f1_string = " ".join(map(str, self._factory1))
-        f2_string = " ".join(map(str, self._factory2))
-        f3_string = " ".join(map(str, self._factory3))
-        f4_string = " ".join(map(str, self._factory4))
-        f5_string = " ".join(map(str, self._factory5))
-
-        return dedent(
-            f"""\
-        Factory 1: {f1_string}
-        Factory 2: {f2_string}
-        Factory 3: {f3_string}
-        Factory 4: {f4_string}
-        Factory 5: {f5_string}
-        Centre of the table: {cot_string}
-        """
+        factory_strings = "".join(
+            f"Factory {number}: {' '.join(map(str, factory))}\n"
+            for number, factory in enumerate(self._factories, 1)
         )
+        return f"{factory_strings}Centre of the table: {cot_string}\n"
@@ -3,7 +3,8 @@
 ## This module creates the floor class
 
 from collections import deque
-from azul_backend.tiles import P1Tile, ColourTile
+from types import MappingProxyType
+from azul_backend.tiles import P1Tile, ColourTile, TILE_CODES, tile_from_code
 from textwrap import dedent
 
 
@@ -16,6 +17,8 @@ class Floor:
 
     __player_floor: deque[ColourTile | P1Tile | None]
     __floor_size: int
+    # The immutable view handed out by show_floor. None when the floor has changed since it was built
+    _cached_view: tuple[ColourTile | P1Tile | None, ...] | None
 
     def __init__(self) -> None:
         """
@@ -24,13 +27,16 @@ class Floor:
         # Intiialising tile holding data structure.
         self.__player_floor = deque([None] * 7, maxlen=7)
         self.__floor_size = 0
+        self._cached_view = None
 
     def show_floor(self) -> tuple[ColourTile | P1Tile | None, ...]:
         """
         This method returns the floor
         """
-        # Making the deque immutable
-        return tuple(self.__player_floor)
+        # Making the deque immutable. Built once and reused until the floor next changes
+        if self._cached_view is None:
+            self._cached_view = tuple(self.__player_floor)
+        return self._cached_view
 
     def add_to_floor(self, tiles: deque[P1Tile | ColourTile]) -> None:
         """
@@ -50,14 +56,11 @@ class Floor:
                 floor.pop()
                 floor.appendleft(tile)
                 self.__floor_size += 1
+                self._cached_view = None
 
-    @property
-    def floor_penalty(self) -> int:
-        """
-        Returns the penalty for the floor
-        """
-        # The penalty for each tile is cumulative
-        CUMULATIVE_PENALTY = {
+    # The penalty for each tile is cumulative
+    CUMULATIVE_PENALTY = MappingProxyType(
+        {
             0: 0,
             1: -1,
             2: -2,
@@ -67,8 +70,29 @@ class Floor:
             6: -11,
             7: -14,
         }
+    )
 
-        return CUMULATIVE_PENALTY[self.__floor_size]
+    @property
+    def floor_penalty(self) -> int:
+        """
+        Returns the penalty for the floor
+        """
+        return self.CUMULATIVE_PENALTY[self.__floor_size]
+
+    @property
+    def floor_size(self) -> int:
+        """
+        Returns the number of tiles on the floor
+        """
+        return self.__floor_size
+
+    def marginal_penalty(self, number_of_tiles: int) -> int:
+        """
+        Returns the change in the floor penalty if this many more tiles were added to the floor.
+        The floor holds 7 tiles, any more are lost and add no penalty
+        """
+        new_size = min(self.__floor_size + number_of_tiles, 7)
+        return self.CUMULATIVE_PENALTY[new_size] - self.floor_penalty
 
     @property
     def check_player1_tile(self) -> bool:
@@ -92,6 +116,7 @@ class Floor:
                 if tile.get_tile_type() == "player1":
                     self.__player_floor.remove(tile)
                     self.__floor_size -= 1
+                    self._cached_view = None
                     return tile
         raise RuntimeError("No P1 tile found on the floor")
 
@@ -101,6 +126,31 @@ class Floor:
         """
         self.__player_floor = deque([None] * 7, maxlen=7)
         self.__floor_size = 0
+        self._cached_view = None
+
+    STATE_SIZE = 7  # A tile code for each space on the floor, in order
+
+    # Protected, used by Game to pack the state of a game
+    def _export_state(self) -> bytes:
+        """
+        This method returns the state of the floor as bytes
+        """
+        return bytes(
+            TILE_CODES[tile.get_tile_type()] if tile is not None else 0
+            for tile in self.__player_floor
+        ).ljust(self.STATE_SIZE, b"\0")
+
+    # Protected, used by Game to restore a packed game
+    def _import_state(self, state: bytes) -> None:
+        """
+        This method restores the floor from the bytes of _export_state, in place
+        """
+        self.__player_floor = deque(
+            [tile_from_code(code) if code else None for code in state[: self.STATE_SIZE]],
+            maxlen=7,
+        )
+        self.__floor_size = sum(code != 0 for code in state[: self.STATE_SIZE])
+        self._cached_view = None
 
     def __str__(self) -> str:
         """
@@ -6,17 +6,21 @@
 # -ASSUMPTIONS AND SIMPLIFICATIONS------------------------------------------------------------
 # I have made a number of simplifications to the game, and I have also made a number of assumptions.
 
-# 1. There are only 2 players, and thus always five factories
-# 2. The game will always start with player1.
+# 1. There are 2, 3 or 4 players (Game(players=3)), with five, seven or nine factories.
+#    Every player's board and score is held in a list indexed by player, so any number of players
+#    plays through the same code
+# 2. The game will always start with player1, and play passes 1, 2 ... back to 1.
 #    The very first move, of placing the "starting player" marker into the centre of the table is
 #    done automatically
-# 3. At the end of the game, there are NO additional scoring points for having completed a row or column of
-#    or maxed out the tiles of a specific colour
+# 3. At the end of the game, the bonuses are added to each score: 2 points for each completed row,
+#    7 for each completed column and 10 for each colour with all 5 tiles on the wall.
+#    Each Wall keeps its bonus up to date as tiles are placed (show_end_game_bonus, show_projected_bonus)
 # 4. There is no variant play in this implementation
 # 5. There is no "lid of the box". Any tiles that are removed from the game are simply deleted
 # 6. If the tile bag is empty (100 tiles have been drawn), the bag magically reffils itself to 100. There
 #    is no lid of the box for the bag to refill from. Thus it is possibe for more than 100 colour tiles to be in play
-# 7. There is no means to reset a completed game. You need to create a new game object
+# 7. A completed game can be reused with the reset method, which returns it to the start of a new game in place.
+#    See pool.py for a pool of reusable games
 
 # -HOW TO USE----------------------------------------------------------------------------------
 # How to use the game class
@@ -49,6 +53,11 @@
 # 6. show_floor - returns the floor of the specified player
 # 7. show_wall - returns the wall of the specified player
 # 8. show_score - returns the score of the specified player
+# 9. show_bag_counts - returns the number of tiles of each colour left in the tile bag
+#    (see refills.py for the distribution of the next factory refill)
+# 10. show_end_game_bonus - returns the end of game bonus the wall of the specified player has earned so far
+# 11. show_projected_bonus - as above, but including the tiles of the complete pattern lines
+# 12. show_number_of_players and show_number_of_factories - how many of each the game has
 
 # There are also a number of interesting public counters
 # 1. moves_this_round - returns the number of moves made this round
@@ -57,26 +66,124 @@
 
 # These are for display purposes and aren't critical to game function.
 
+# For bots and search there are also
+# 1. legal_moves - returns every legal move for the current player as (factory_number, tile_type, line) tuples
+#    line is None when the tiles can go nowhere but the floor (a forced move)
+# 2. play_move - plays one of the legal moves, i.e a factory offer and a pattern line placement in one call
+# 3. determinize - returns a copy of the game with the hidden order of the tile bag reshuffled,
+#    so a bot can search without peeking at future factories (see ismcts.py)
+# 4. legal_actions and apply_moves - the same moves as integer action ids (see actions.py).
+#    apply_moves plays a whole sequence of moves in one call and returns the score change of each move
+# 5. preview - shows what a move would do (tiles placed, floor penalty, wall score) without playing it
+
+# Every game has a seed, chosen at random if one is not supplied (show_seed), and records the moves
+# played as action ids (show_move_history). The seed and the moves are enough to replay the game
+# exactly, see replay.py. pack_state returns the complete state of a game as fixed width bytes,
+# and unpack_state (or load_state, in place) restores a game from them.
+
+# Listeners can be added to a game to follow it as it is played (add_listener). They are called with a
+# GameEvent and an immutable dictionary of details after every move, wall tile, round end and game over.
+# This lets the simulator stream statistics (see stats.py) without keeping any games. Every event
+# carries the game_id of its game, so a listener following many games at once can tell them apart.
+
+# Span listeners (add_span_listener) are told about the engine calls themselves: how long each
+# factory offer, pattern line placement, forced move, wall tiling, penalty and round preparation
+# took, with its arguments and any error it raised. Calls are only wrapped and timed while a span
+# listener is attached, a game without one makes them directly. See metrics.py and tracing.py.
+
 # -TESTING------------------------------------------------------------------------------
 # I made a jupyter notebook for unit tests - test.ipynb
 
 # -GUI----------------------------------------------------------------------------------
 # I created a tkinter GUI for testing purposes which integrates using the above stated methods. Please see AzulGui.py.
 
-from typing import Any, cast
+import copy
+import functools
+import inspect
+import itertools
+import random
+import struct
+import time
+from typing import Any, Callable, cast
 
 # For making the dictionaries immutable when showing contents to the user
 from types import MappingProxyType
-from textwrap import dedent
 from collections import deque
 
-from azul_backend.factory import Factory
-from azul_backend.tiles import P1Tile, ColourTile
-from azul_backend.states import GameState
+from azul_backend.actions import decode_action, encode_move
+from azul_backend.factory import FACTORIES_BY_PLAYERS, Factory
+from azul_backend.tiles import P1Tile, ColourTile, TILE_COLOURS, TILE_CODES, TILE_TYPES, tile_from_code
+from azul_backend.states import GameEvent, GameState
 from azul_backend.wall import Wall
 from azul_backend.floor import Floor
 from azul_backend.patternlines import PatternLines
 
+# The number of tiles each pattern line holds
+_LINE_CAPACITY: dict[str, int] = {
+    "line1": 1,
+    "line2": 2,
+    "line3": 3,
+    "line4": 4,
+    "line5": 5,
+}
+
+# The packed size of the board of one player: the wall, pattern lines and floor
+_BOARD_SIZE = Wall.STATE_SIZE + PatternLines.STATE_SIZE + Floor.STATE_SIZE
+
+# The game_id of each Game created (or copied) in this process
+_game_ids = itertools.count(1)
+
+SpanListener = Callable[[str, MappingProxyType[str, Any]], None]
+
+# The engine calls reported to span listeners, method name: span name.
+# While a game has span listeners each of these methods is shadowed on the game by a timed
+# wrapper (see Game.add_span_listener), so a game without span listeners calls them directly
+_SPANS: MappingProxyType[str, str] = MappingProxyType(
+    {
+        "make_factory_offer": "make_factory_offer",
+        "place_on_patternlines": "place_on_patternlines",
+        "_forced_move": "forced_move",
+        "_wall_tiling": "wall_tiling",
+        "_apply_score_penalty": "score_penalty",
+        "_prepare_for_next_round": "prepare_next_round",
+    }
+)
+
+
+def _traced(game: "Game", name: str, method: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Wraps a bound engine call of a game, so that the span listeners of the game hear of it.
+    The arguments are reported in order, whether they were passed by position or keyword
+    """
+    signature = inspect.signature(method)
+    listeners: list[SpanListener] = game._Game__span_listeners  # type: ignore[attr-defined]
+
+    @functools.wraps(method)
+    def traced(*args: Any, **kwargs: Any) -> Any:
+        depth = game._Game__span_depth  # type: ignore[attr-defined]
+        game._Game__span_depth = depth + 1  # type: ignore[attr-defined]
+        error: BaseException | None = None
+        start = time.perf_counter_ns()
+        try:
+            return method(*args, **kwargs)
+        except BaseException as raised:
+            error = raised
+            raise
+        finally:
+            duration_ns = time.perf_counter_ns() - start
+            game._Game__span_depth = depth  # type: ignore[attr-defined]
+            try:
+                arguments = signature.bind(*args, **kwargs).args
+            except TypeError:  # The call itself was malformed, report what was passed
+                arguments = (*args, *kwargs.values())
+            details = MappingProxyType(
+                {"args": arguments, "duration_ns": duration_ns, "depth": depth, "error": error}
+            )
+            for listener in tuple(listeners):
+                listener(name, details)
+
+    return traced
+
 
 class Game:
     """
@@ -94,10 +201,38 @@ class Game:
         show_floor: Returns the floor of the specified player
         show_wall: Returns the wall of the specified player
         show_score: Returns the score of the specified player
+        show_bag_counts: Returns the number of tiles of each colour left in the tile bag
+        show_bag_refills: Returns the number of times the tile bag has been filled
+        show_end_game_bonus: Returns the end of game bonus earned so far by the specified player
+        show_projected_bonus: Returns the end of game bonus once the complete pattern lines are tiled
+        show_number_of_players: Returns the number of players
+        show_number_of_factories: Returns the number of factories, not counting the centre of the table
 
         PLAY METHODS
         make_factory_offer: Selects tiles of a particular colour from a factory or centre of the table
         place_on_patternlines: Places the tiles in hand onto the specified pattern line of the current player
+        reset: Returns the game to the start of a new game, in place
+        legal_moves: Returns every legal move for the current player
+        play_move: Plays a move returned by legal_moves
+        legal_actions: Returns every legal move for the current player as an integer action id
+        apply_moves: Plays a sequence of action ids, returning the score changes of each move
+        preview: Shows what a move would do, without playing it
+
+        RECORD METHODS
+        show_seed: Returns the seed of the tile bag
+        show_move_history: Returns the moves played so far as action ids
+        pack_state: Returns the complete state of the game as fixed width bytes
+        pack_position: Returns the position every player can see as fixed width bytes
+        unpack_state: Creates a game from the bytes of pack_state
+        load_state: Restores the game from the bytes of pack_state, in place
+        determinize: Returns a copy of the game with the hidden tile bag order reshuffled
+
+        EVENT METHODS
+        add_listener: Calls a function with every event of the game
+        remove_listener: Stops calling a function added with add_listener
+        add_span_listener: Calls a function with every engine call of the game, and its duration
+        remove_span_listener: Stops calling a function added with add_span_listener
+        game_id: Identifies the game in the events it reports
 
     Public Variables:
         moves_this_round: The number of moves made this round
@@ -108,6 +243,8 @@ class Game:
     # Class Constants to represent the players
     PLAYER_1: int = 1
     PLAYER_2: int = 2
+    PLAYER_3: int = 3
+    PLAYER_4: int = 4
 
     # These public variables aren't used for gameplay,
     # but offer interesting progress stats
@@ -117,20 +254,28 @@ class Game:
 
     # Private Variables
     # There are methods to access necessary information
-    __player1score: int
-    __player2score: int
+    # The scores and boards of the players, player n is at index n - 1
+    __scores: list[int]
     __my_factories: Factory
     __gamestate: GameState
     __current_player: int
     __hand: list[ColourTile | P1Tile] | list[ColourTile]
-    __player1_patternlines: PatternLines
-    __player2_patternlines: PatternLines
-    __player1_floor: Floor
-    __player2_floor: Floor
-    __player1_wall: Wall
-    __player2_wall: Wall
-
-    def __init__(self) -> None:
+    __patternlines: list[PatternLines]
+    __floors: list[Floor]
+    __walls: list[Wall]
+    __validate: bool
+    __offer: tuple[int, str]  # The factory and colour of the last factory offer
+    __move_history: list[int]  # Every completed move, as an action id
+    # Called with every event of the game. Not copied with the game, so search copies stay silent
+    __listeners: list[Callable[[GameEvent, MappingProxyType[str, Any]], None]]
+    # As above, for the engine calls. __span_depth counts the calls in progress
+    __span_listeners: list[SpanListener]
+    __span_depth: int
+    __game_id: int
+
+    def __init__(
+        self, seed: int | None = None, validate: bool = True, players: int = 2
+    ) -> None:
         """
         This is the constructor for the Game class
         It also initializes the game, starting from the Factory Offer phase.
@@ -141,12 +286,23 @@ class Game:
 
         Once initialised, the game is ready to be played. Proceed from player 1
         By making a factory offer.
+
+        Args:
+            seed (int): OPTIONAL: Seed for the tile bag. Games with the same seed and moves play out identically
+            validate (bool): OPTIONAL: If False, the defensive checks on every move are skipped.
+                Only for trusted callers that play moves known to be legal, e.g taken from legal_moves.
+                An illegal move in this mode corrupts the game rather than raising an error.
+                The default (True) should always be used for the GUI and other public callers
+            players (int): OPTIONAL: The number of players, 2, 3 or 4. Sets the number of factories
         """
-        self.__my_factories = Factory()  # Create a new factory floor of 5 tiles
+        if players not in FACTORIES_BY_PLAYERS:
+            raise ValueError(f"{players} - Invalid number of players, must be 2, 3 or 4")
+        self.__validate = validate
+        # Create a new factory floor of 5, 7 or 9 factories
+        self.__my_factories = Factory(seed, FACTORIES_BY_PLAYERS[players])
         self.__gamestate = GameState(1)  # Start with the factory offer phase
         self.__current_player = self.PLAYER_1  # Start with player1
-        self.__player1score = 0
-        self.__player2score = 0
+        self.__scores = [0] * players
         self.moves_this_round = 0
         self.rounds_played = 0
         self.moves_this_game = 0
@@ -156,13 +312,140 @@ class Game:
         # I could have used a list of Any, but I wanted to keep the type hinting as specific as possible
 
         # The hand of the current player starts empty,
-        # it's max possible is 16 (3 tiles from each factory plus P1 tile in Centre of table)
-        self.__player1_patternlines = PatternLines()
-        self.__player2_patternlines = PatternLines()
-        self.__player1_floor = Floor()
-        self.__player2_floor = Floor()
-        self.__player1_wall = Wall()
-        self.__player2_wall = Wall()
+        # it's max possible is 16 with 5 factories (3 tiles from each factory plus P1 tile in Centre of table)
+        self.__patternlines = [PatternLines() for _ in range(players)]
+        self.__floors = [Floor() for _ in range(players)]
+        self.__walls = [Wall() for _ in range(players)]
+        self.__offer = (0, "")
+        self.__move_history = []
+        self.__listeners = []
+        self.__span_listeners = []
+        self.__span_depth = 0
+        self.__game_id = next(_game_ids)
+
+    def reset(self, seed: int | None = None) -> None:
+        """
+        This method returns the game to the start of a new game, in place.
+        Every component is reused rather than created again, which is much cheaper
+        than creating a new Game when many games are played one after another
+
+        Args:
+            seed (int): OPTIONAL: Seed for the tile bag. Games with the same seed and moves play out identically
+        """
+        self.__my_factories._reinitialise(seed)
+        self.__gamestate = GameState.FACTORY_OFFER
+        self.__current_player = self.PLAYER_1
+        self.__scores[:] = [0] * len(self.__scores)
+        self.moves_this_round = 0
+        self.rounds_played = 0
+        self.moves_this_game = 0
+        self.__hand.clear()
+        for player in range(len(self.__scores)):
+            self.__patternlines[player]._reinitialise()
+            self.__floors[player].clean_floor()
+            self.__walls[player]._reinitialise()
+        self.__offer = (0, "")
+        self.__move_history.clear()
+
+    def show_seed(self) -> int:
+        """
+        This method returns the seed of the tile bag, as a 64 bit unsigned int.
+        A new game with this seed, playing the same moves, plays out identically
+        """
+        return self.__my_factories.get_seed()
+
+    def show_move_history(self) -> tuple[int, ...]:
+        """
+        This method returns every move completed so far in this game, as action ids (see actions.py)
+        """
+        return tuple(self.__move_history)
+
+    def add_listener(
+        self, listener: Callable[[GameEvent, MappingProxyType[str, Any]], None]
+    ) -> None:
+        """
+        This method adds a function that is called with every event of the game,
+        as listener(event, details). details is an immutable dictionary of
+            MOVE: player, round, factory_number, tile_type, line (None for a forced move),
+                tiles_to_line, floor_tiles (including the player1 tile), takes_p1_tile
+            WALL_TILE: player, round, line, column, tile_type, score,
+                order (the number of tiles that were on the player's wall before this one)
+            ROUND_END: round, player1_score, player2_score ...,
+                player1_floor_penalty, player2_floor_penalty ... (0 or negative), players
+            GAME_OVER: rounds_played, moves_this_game, player1_score, player2_score ...,
+                player1_bonus, player2_bonus ..., players
+        with a score, penalty and bonus for every player, and players the number of players.
+        Every event also has game, the game_id of the game.
+        round counts from 0. Listeners stay with the game when it is reset,
+        but are not copied with it (e.g by determinize)
+        """
+        if not callable(listener):
+            raise ValueError(f"{listener} - A listener must be callable")
+        self.__listeners.append(listener)
+
+    def remove_listener(
+        self, listener: Callable[[GameEvent, MappingProxyType[str, Any]], None]
+    ) -> None:
+        """
+        This method stops calling a listener added with add_listener
+        """
+        self.__listeners.remove(listener)
+
+    def add_span_listener(self, listener: SpanListener) -> None:
+        """
+        This method adds a function that is called at the end of every engine call of the game,
+        as listener(name, details). name is one of
+            make_factory_offer, place_on_patternlines, forced_move, wall_tiling, score_penalty,
+            prepare_next_round
+        details is an immutable dictionary of
+            args: The arguments of the call, in order, whether passed by position or keyword
+            duration_ns: How long the call took, in nanoseconds, including the calls it made
+            depth: The number of engine calls it was made from, 0 for a call from outside
+            error: The exception the call raised, or None
+        Calls made from within another call are reported first, e.g a wall_tiling (depth 1)
+        before the place_on_patternlines (depth 0) that ended the round.
+        Like listeners, span listeners are not copied with the game.
+        The engine calls are only wrapped and timed while the game has a span listener
+        """
+        if not callable(listener):
+            raise ValueError(f"{listener} - A span listener must be callable")
+        if not self.__span_listeners:
+            for method_name, name in _SPANS.items():
+                method = getattr(Game, method_name).__get__(self)
+                setattr(self, method_name, _traced(self, name, method))
+        self.__span_listeners.append(listener)
+
+    def remove_span_listener(self, listener: SpanListener) -> None:
+        """
+        This method stops calling a span listener added with add_span_listener
+        """
+        self.__span_listeners.remove(listener)
+        if not self.__span_listeners:
+            self.__untrace()
+
+    def __untrace(self) -> None:
+        """
+        Removes the timed wrappers of the engine calls, so they are called directly again
+        """
+        for method_name in _SPANS:
+            self.__dict__.pop(method_name, None)
+
+    # Protected, used by GamePool when a game is returned to the pool
+    def _clear_listeners(self) -> None:
+        """
+        This method removes every listener and span listener of the game
+        """
+        self.__listeners.clear()
+        self.__span_listeners.clear()
+        self.__untrace()
+
+    def _emit(self, event: GameEvent, **details: Any) -> None:
+        """
+        This method calls every listener with an event
+        """
+        view = MappingProxyType({"game": self.__game_id, **details})
+        for listener in self.__listeners:
+            listener(event, view)
 
     def show_game_state(self) -> GameState:
         """
@@ -188,9 +471,29 @@ class Game:
         This method returns the current player as an int
         PLAYER_1 = 1
         PLAYER_2 = 2
+        PLAYER_3 = 3 and PLAYER_4 = 4 in games of 3 and 4 players
         """
         return self.__current_player
 
+    def show_number_of_players(self) -> int:
+        """
+        This method returns the number of players, 2, 3 or 4
+        """
+        return len(self.__scores)
+
+    def show_number_of_factories(self) -> int:
+        """
+        This method returns the number of factories, not counting the centre of the table:
+        5 with 2 players, 7 with 3 and 9 with 4
+        """
+        return self.__my_factories.number_of_factories
+
+    def show_validate(self) -> bool:
+        """
+        This method returns True if the moves of the game are checked (the validate argument)
+        """
+        return self.__validate
+
     def show_factory(
         self, factory_number: int
     ) -> tuple[ColourTile | P1Tile, ...]:
@@ -206,6 +509,7 @@ class Game:
         factory 3: factory_number = 3
         factory 4: factory_number = 4
         factory 5: factory_number = 5
+        up to factory 9 in games of more than 2 players (show_number_of_factories)
         """
         return_tuple: tuple[ColourTile | P1Tile, ...] = (
             self.__my_factories.show_factory(factory_number)
@@ -219,23 +523,13 @@ class Game:
         This method returns the pattern lines of the specified player
         In the form of a MappingProxyType (an immutable dictionary)
         """
-        if player == 1:
-            return self.__player1_patternlines.show_pattern_lines()
-        elif player == 2:
-            return self.__player2_patternlines.show_pattern_lines()
-        else:
-            raise ValueError("Invalid player number")
+        return self.__patternlines[self._player_index(player)].show_pattern_lines()
 
     def show_floor(self, player: int) -> tuple[ColourTile | P1Tile | None, ...]:
         """
         This method returns the floor of the specified player
         """
-        if player == 1:
-            return self.__player1_floor.show_floor()
-        elif player == 2:
-            return self.__player2_floor.show_floor()
-        else:
-            raise ValueError("Invalid player number")
+        return self.__floors[self._player_index(player)].show_floor()
 
     def show_wall(
         self, player: int
@@ -243,23 +537,51 @@ class Game:
         """
         This method returns the wall of the specified player
         """
-        if player == 1:
-            return self.__player1_wall.show_wall()
-        elif player == 2:
-            return self.__player2_wall.show_wall()
-        else:
-            raise ValueError("Invalid player number")
+        return self.__walls[self._player_index(player)].show_wall()
 
     def show_score(self, player: int) -> int:
         """
         This method returns the score of the specified player
         """
-        if player == 1:
-            return self.__player1score
-        elif player == 2:
-            return self.__player2score
-        else:
-            raise ValueError("Invalid player number")
+        return self.__scores[self._player_index(player)]
+
+    def show_bag_counts(self) -> tuple[int, ...]:
+        """
+        This method returns the number of tiles of each colour left in the tile bag
+        as a tuple in the order ("blue", "yellow", "red", "black", "white").
+        The order of the bag is hidden, only the counts are shown
+        """
+        return self.__my_factories.show_bag_counts()
+
+    def show_bag_refills(self) -> int:
+        """
+        This method returns the number of times the tile bag has been filled this game,
+        counting the first fill
+        """
+        return self.__my_factories.get_refills()
+
+    def show_end_game_bonus(self, player: int) -> int:
+        """
+        This method returns the end of game bonus the wall of the specified player has earned so far
+        It is added to the score when the game ends
+        """
+        return self.__walls[self._player_index(player)].end_game_bonus
+
+    def show_projected_bonus(self, player: int) -> int:
+        """
+        This method returns the end of game bonus the specified player would have once
+        the complete pattern lines are tiled at the end of this round
+        """
+        index = self._player_index(player)
+        pattern_lines = self.__patternlines[index]
+        wall = self.__walls[index]
+
+        placements = []
+        for line, capacity in _LINE_CAPACITY.items():
+            colour, count = pattern_lines.show_line_fill(line)
+            if count == capacity:
+                placements.append((colour, line))
+        return wall.projected_end_game_bonus(placements)
 
     def make_factory_offer(
         self, factory_number: int, tile_type: str | ColourTile
@@ -272,7 +594,7 @@ class Game:
 
         Args:
             factory_number (int): The number of the factory to take tiles from,
-                0 = centre of the table, 1-5 = factory number
+                0 = centre of the table, 1-9 = factory number (see show_number_of_factories)
             tile_type (str | ColourTile): The type of tile to take from the factory
                 tile_type can be a string denoting colout, e.g 'black'
                 or a ColourTile object
@@ -280,7 +602,7 @@ class Game:
         self._check_phase(GameState.FACTORY_OFFER)
         # Are we in the Factory Offer phase?
 
-        if self.__hand:
+        if self.__hand and self.__validate:
             raise ValueError(
                 "You must place the tiles you've selected on your pattern lines before selecting more tiles from the factory"
             )
@@ -288,16 +610,20 @@ class Game:
             # I found it forgiving to allow the user to pass a string or a ColourTile object
             if type(tile_type) is ColourTile:
                 self.__hand = self.__my_factories.take_factory_tiles(
-                    factory_number, tile_type.get_tile_type()
+                    factory_number, tile_type.get_tile_type(), self.__validate
                 )
             elif isinstance(tile_type, str):
                 self.__hand = self.__my_factories.take_factory_tiles(
-                    factory_number, tile_type
+                    factory_number, tile_type, self.__validate
                 )
             else:
                 raise ValueError(
                     f"{tile_type} - Invalid tile type, use either a string or a ColourTile object"
                 )
+            self.__offer = (
+                factory_number,
+                tile_type if isinstance(tile_type, str) else tile_type.get_tile_type(),
+            )
 
         for tile in self.__hand:
             if not type(tile) is P1Tile:
@@ -319,26 +645,33 @@ class Game:
 
         floor_tiles: deque[ColourTile | P1Tile] = deque()
         if self.__hand:
-            if not self._is_move_valid(line):
+            if self.__validate and not self._is_move_valid(line):
                 raise ValueError("Invalid move, please select a different line")
 
-            if self.__current_player == self.PLAYER_1:
-
-                floor_tiles = self.__player1_patternlines.place_on_patternlines(
-                    deque(self.__hand), line
-                )
-                if floor_tiles:
-                    self.__player1_floor.add_to_floor(floor_tiles)
-            else:
-                floor_tiles = self.__player2_patternlines.place_on_patternlines(
-                    deque(self.__hand), line
-                )
-                if floor_tiles:
-                    self.__player2_floor.add_to_floor(floor_tiles)
+            hand_size = len(self.__hand)
+            index = self.__current_player - 1
+            floor_tiles = self.__patternlines[index].place_on_patternlines(
+                deque(self.__hand), line, self.__validate
+            )
+            if floor_tiles:
+                self.__floors[index].add_to_floor(floor_tiles)
 
             self.__hand.clear()
             self.moves_this_round += 1
             self.moves_this_game += 1
+            self.__move_history.append(encode_move((*self.__offer, line)))
+            if self.__listeners:
+                self._emit(
+                    GameEvent.MOVE,
+                    player=self.__current_player,
+                    round=self.rounds_played,
+                    factory_number=self.__offer[0],
+                    tile_type=self.__offer[1],
+                    line=line,
+                    tiles_to_line=hand_size - len(floor_tiles),
+                    floor_tiles=len(floor_tiles),
+                    takes_p1_tile=any(type(tile) is P1Tile for tile in floor_tiles),
+                )
         else:
             raise ValueError(
                 "You must select tiles from the factory before placing them on your pattern lines"
@@ -349,16 +682,270 @@ class Game:
         else:
             self._change_player()  # Change the player after the move
 
+    def legal_moves(self) -> tuple[tuple[int, str, str | None], ...]:
+        """
+        This method returns every legal move for the current player as a tuple of
+        (factory_number, tile_type, line) tuples, e.g (3, "blue", "line2")
+        factory_number is 1-based, 0 is the centre of the table.
+        line is None if the tiles can not be placed on any pattern line, in which
+        case the factory offer alone completes the move and the tiles drop to the floor.
+        No moves are returned once the game is over
+        """
+        if self.__gamestate != GameState.FACTORY_OFFER:
+            return ()
+
+        if self.__hand:
+            raise ValueError(
+                "You must place the tiles you've selected on your pattern lines before a new move can be made"
+            )
+
+        pattern_lines = self.__patternlines[self.__current_player - 1]
+        wall = self.__walls[self.__current_player - 1]
+
+        # Which lines can take each colour does not depend on the factory, so work it out once
+        colour_lines: dict[str, list[str]] = {colour: [] for colour in TILE_COLOURS}
+        for line, capacity in _LINE_CAPACITY.items():
+            line_colour, count = pattern_lines.show_line_fill(line)
+            if count == capacity:
+                continue
+            for colour in (line_colour,) if line_colour else TILE_COLOURS:
+                if wall._is_position_free(colour, line):
+                    colour_lines[colour].append(line)
+
+        moves: list[tuple[int, str, str | None]] = []
+        for factory_number in range(self.__my_factories.number_of_factories + 1):
+            colours_in_factory = {
+                tile.get_tile_type()
+                for tile in self.__my_factories.show_factory(factory_number)
+                if type(tile) is ColourTile
+            }
+            for colour in TILE_COLOURS:  # Keeps the order of the moves stable
+                if colour in colours_in_factory:
+                    if colour_lines[colour]:
+                        moves.extend(
+                            (factory_number, colour, line)
+                            for line in colour_lines[colour]
+                        )
+                    else:
+                        moves.append((factory_number, colour, None))
+
+        return tuple(moves)
+
+    def play_move(self, move: tuple[int, str, str | None]) -> None:
+        """
+        This method plays a complete move for the current player,
+        a factory offer followed by placing the tiles on a pattern line.
+
+        Args:
+            move (tuple[int, str, str | None]): (factory_number, tile_type, line) as returned by legal_moves
+                line is None when the tiles can only drop to the floor
+        """
+        factory_number, tile_type, line = move
+
+        # Checked before the factory offer is made, as an offer can not be taken back
+        if not self.__validate:
+            pass  # Trusted caller, the move is known to be legal
+        elif line is None:
+            if self._is_move_possible(ColourTile(tile_type)):
+                raise ValueError(
+                    f"{tile_type} tiles can be placed on a pattern line, you must supply a line for this move"
+                )
+        else:
+            self._check_line_string(line)
+            if not self._is_line_possible(tile_type, line):
+                raise ValueError("Invalid move, please select a different line")
+
+        self.make_factory_offer(factory_number, tile_type)
+
+        if line is not None:
+            self.place_on_patternlines(line)
+
+    def legal_actions(self) -> tuple[int, ...]:
+        """
+        This method returns every legal move for the current player as an integer action id
+        See actions.py for the encoding. The order matches legal_moves
+        """
+        return tuple(encode_move(move) for move in self.legal_moves())
+
+    def apply_moves(
+        self, action_ids: list[int] | tuple[int, ...]
+    ) -> tuple[tuple[int, ...], ...]:
+        """
+        This method plays a sequence of moves, given as integer action ids, in one call.
+        It returns the score change of each move as (player 1 change, player 2 change ...),
+        one change for each player. Scores only change when a move ends a round, and every
+        player's score can change then.
+
+        Every id is decoded before any move is played. Each move is then checked once
+        (skipped for trusted games) and played without the checks of the individual steps.
+        If a move is illegal a ValueError is raised, the moves before it remain played
+
+        Args:
+            action_ids (list[int] | tuple[int, ...]): The moves to play, e.g from legal_actions
+        """
+        moves = [decode_action(action_id) for action_id in action_ids]
+
+        validate = self.__validate
+        score_changes: list[tuple[int, ...]] = []
+        self.__validate = False  # Each move is checked once below, then played on the trusted path
+        try:
+            for move_number, move in enumerate(moves):
+                if validate:
+                    self._check_move(move, move_number)
+                scores = self.__scores.copy()
+                self.play_move(move)
+                score_changes.append(
+                    tuple(after - before for after, before in zip(self.__scores, scores))
+                )
+        finally:
+            self.__validate = validate
+
+        return tuple(score_changes)
+
+    def preview(
+        self, move: tuple[int, str, str | None] | int
+    ) -> MappingProxyType[str, int | bool]:
+        """
+        This method shows what a move would do for the current player, without changing the game.
+        It is worked out from the state the components keep up to date, not by playing a copy.
+        It returns an immutable dictionary of
+            tiles_to_line: The number of tiles that would land on the pattern line
+            floor_tiles: The number of tiles that would drop to the floor, including the player1 tile
+            floor_penalty: The change in the floor penalty (0 or negative)
+            takes_p1_tile: True if the move takes the player1 tile
+            completes_line: True if the pattern line would be complete
+            wall_score: The score of tiling the completed line at the end of the round, against the
+                wall as it is now. 0 if the line would not be complete
+
+        Args:
+            move (tuple[int, str, str | None] | int): A move from legal_moves, or its action id
+        """
+        if isinstance(move, int):
+            move = decode_action(move)
+        factory_number, tile_type, line = move
+
+        if self.__gamestate != GameState.FACTORY_OFFER or self.__hand:
+            raise RuntimeError(
+                "Moves can only be previewed in the FACTORY_OFFER phase, before tiles are selected"
+            )
+
+        index = self.__current_player - 1
+        pattern_lines = self.__patternlines[index]
+        wall = self.__walls[index]
+        floor = self.__floors[index]
+
+        tiles = self.__my_factories.show_factory(factory_number)
+        number_of_tiles = 0
+        takes_p1_tile = False
+        for tile in tiles:
+            if type(tile) is P1Tile:
+                takes_p1_tile = True
+            elif tile.get_tile_type() == tile_type:
+                number_of_tiles += 1
+
+        if not number_of_tiles:
+            raise ValueError(
+                f"Not tile(s) of colour {tile_type} exists in factory {factory_number}"
+            )
+
+        tiles_to_line = 0
+        completes_line = False
+        wall_score = 0
+        if line is None:
+            if self.__validate and self._is_move_possible(ColourTile(tile_type)):
+                raise ValueError(
+                    f"{tile_type} tiles can be placed on a pattern line, you must supply a line for this move"
+                )
+        else:
+            if self.__validate:
+                self._check_line_string(line)
+                if not self._is_line_possible(tile_type, line):
+                    raise ValueError("Invalid move, please select a different line")
+
+            _, count = pattern_lines.show_line_fill(line)
+            tiles_to_line = min(number_of_tiles, _LINE_CAPACITY[line] - count)
+            completes_line = count + tiles_to_line == _LINE_CAPACITY[line]
+            if completes_line:
+                wall_score = wall._preview_score(tile_type, line)
+
+        floor_tiles = number_of_tiles - tiles_to_line + takes_p1_tile
+
+        return MappingProxyType(
+            {
+                "tiles_to_line": tiles_to_line,
+                "floor_tiles": floor_tiles,
+                "floor_penalty": floor.marginal_penalty(floor_tiles),
+                "takes_p1_tile": takes_p1_tile,
+                "completes_line": completes_line,
+                "wall_score": wall_score,
+            }
+        )
+
+    def _check_move(
+        self, move: tuple[int, str, str | None], move_number: int = 0
+    ) -> None:
+        """
+        This method checks that a complete move is legal for the current player,
+        raising an error if not. It is used by apply_moves
+        """
+        if self.__gamestate != GameState.FACTORY_OFFER:
+            raise RuntimeError(
+                f"Move {move_number}: Out of phase, moves can only be played in the FACTORY_OFFER phase, it is currently the {self.__gamestate.name} phase"
+            )
+        if self.__hand:
+            raise ValueError(
+                f"Move {move_number}: You must place the tiles you've selected on your pattern lines before a new move can be made"
+            )
+
+        factory_number, tile_type, line = move
+        if not any(
+            tile.get_tile_type() == tile_type
+            for tile in self.__my_factories.show_factory(factory_number)
+        ):
+            raise ValueError(
+                f"Move {move_number}: Not tile(s) of colour {tile_type} exists in factory {factory_number}"
+            )
+
+        lines = ["line1", "line2", "line3", "line4", "line5"]
+        if line is None:
+            if any(self._is_line_possible(tile_type, other) for other in lines):
+                raise ValueError(
+                    f"Move {move_number}: {tile_type} tiles can be placed on a pattern line, you must supply a line for this move"
+                )
+        elif not self._is_line_possible(tile_type, line):
+            raise ValueError(
+                f"Move {move_number}: Invalid move, {tile_type} tiles can not be placed on {line}"
+            )
+
+    def determinize(self, rng: random.Random | None = None) -> "Game":
+        """
+        This method returns an independent copy of the game in which the hidden order of the
+        tile bag has been reshuffled. Everything a player can see is unchanged.
+        Search algorithms should play on determinized copies, as playing on a plain copy
+        lets them peek at the factories of future rounds.
+
+        Args:
+            rng (random.Random): OPTIONAL: The random number generator used to reshuffle the bag
+        """
+        clone = copy.deepcopy(self)
+        clone.__my_factories._shuffle_tile_bag(rng or random.Random())
+        return clone
+
+    def _check_line_string(self, line: str) -> None:
+        """
+        This method checks if the line string is in the correct format
+        """
+        if line not in ["line1", "line2", "line3", "line4", "line5"]:
+            raise ValueError(
+                f"{line} - Invalid line string, must be in format of line*, where * is a number between 1 and 5 inclusive."
+            )
+
     def _is_move_valid(self, line: str) -> bool:
         """
         This method checks if a chosen move on the patternline is a valid.
         """
-        if self.show_current_player() == self.PLAYER_1:
-            pattern_lines = self.__player1_patternlines
-            wall = self.__player1_wall
-        else:
-            pattern_lines = self.__player2_patternlines
-            wall = self.__player2_wall
+        pattern_lines = self.__patternlines[self.__current_player - 1]
+        wall = self.__walls[self.__current_player - 1]
 
         if not self.__hand:
             raise RuntimeError("Hand is empty")
@@ -384,14 +971,24 @@ class Game:
         If a player males a factory offer, and there are no possible moves, this method will be called on their behalf.
         It automatically drops tiles to the floor and changes the player.
         """
-        if self.__current_player == self.PLAYER_1:
-            self.__player1_floor.add_to_floor(deque(self.__hand))
-        else:
-            self.__player2_floor.add_to_floor(deque(self.__hand))
-
+        self.__floors[self.__current_player - 1].add_to_floor(deque(self.__hand))
+
+        if self.__listeners:
+            self._emit(
+                GameEvent.MOVE,
+                player=self.__current_player,
+                round=self.rounds_played,
+                factory_number=self.__offer[0],
+                tile_type=self.__offer[1],
+                line=None,
+                tiles_to_line=0,
+                floor_tiles=len(self.__hand),
+                takes_p1_tile=any(type(tile) is P1Tile for tile in self.__hand),
+            )
         self.__hand.clear()
         self.moves_this_round += 1
         self.moves_this_game += 1
+        self.__move_history.append(encode_move((*self.__offer, None)))
 
         if self.__my_factories.isempty:
             self._wall_tiling()  # If factories are empty advance to wall tiling phase
@@ -400,12 +997,9 @@ class Game:
 
     def _change_player(self) -> None:
         """
-        Change Player
+        Change Player, to the next player in turn. The last player is followed by player1
         """
-        if self.show_current_player() == self.PLAYER_1:
-            self.__current_player = self.PLAYER_2
-        else:
-            self.__current_player = self.PLAYER_1
+        self.__current_player = self.__current_player % len(self.__scores) + 1
 
     def _wall_tiling(self) -> None:
         """
@@ -420,60 +1014,134 @@ class Game:
         lines = ["line1", "line2", "line3", "line4", "line5"]
 
         for line in lines:
-            p1_t = self.__player1_patternlines.select_tile_for_wall(line)
-            p2_t = self.__player2_patternlines.select_tile_for_wall(line)
-            if p1_t:  # Perform wall tiling for player1
-                self.__player1score += self.__player1_wall.move_tile_to_wall(
-                    p1_t, line
-                )
-            if p2_t:  # Perform wall tiling for player2
-                self.__player2score += self.__player2_wall.move_tile_to_wall(
-                    p2_t, line
-                )
+            for index, pattern_lines in enumerate(self.__patternlines):
+                tile = pattern_lines.select_tile_for_wall(line)
+                if tile:  # Perform wall tiling for this player
+                    score = self.__walls[index].move_tile_to_wall(
+                        tile, line, self.__validate
+                    )
+                    self.__scores[index] += score
+                    if self.__listeners:
+                        self.__emit_wall_tile(index + 1, tile, line, score)
 
         self._apply_score_penalty()  # Apply the score penalty from floor tiles
+        if self.__listeners:
+            self._emit(
+                GameEvent.ROUND_END,
+                round=self.rounds_played,
+                **self.__by_player(
+                    score=self.__scores,
+                    floor_penalty=[floor.floor_penalty for floor in self.__floors],
+                ),
+                players=len(self.__scores),
+            )
 
         if self.is_game_over:
+            self._apply_end_game_bonus()
             self.__gamestate = GameState.GAMEOVER
+            if self.__listeners:
+                self._emit(
+                    GameEvent.GAME_OVER,
+                    rounds_played=self.rounds_played,
+                    moves_this_game=self.moves_this_game,
+                    **self.__by_player(
+                        score=self.__scores,
+                        bonus=[wall.end_game_bonus for wall in self.__walls],
+                    ),
+                    players=len(self.__scores),
+                )
         else:
             self._prepare_for_next_round()  # Advance to the prepare for next round phase
 
+    @staticmethod
+    def __by_player(**values: list[int]) -> dict[str, int]:
+        """
+        Names a value of each player for the listeners, e.g score=[12, 9] as
+        player1_score=12, player2_score=9
+        """
+        return {
+            f"player{player}_{name}": value
+            for name, by_player in values.items()
+            for player, value in enumerate(by_player, 1)
+        }
+
+    def _player_index(self, player: int) -> int:
+        """
+        This method returns the index of a player's score and board, raising an error
+        if the game has no such player
+        """
+        if type(player) is not int or not 0 < player <= len(self.__scores):
+            raise ValueError("Invalid player number")
+        return player - 1
+
+    def __emit_wall_tile(
+        self, player: int, tile: ColourTile, line: str, score: int
+    ) -> None:
+        """
+        Reports a tile moved to the wall to the listeners
+        """
+        self._emit(
+            GameEvent.WALL_TILE,
+            player=player,
+            round=self.rounds_played,
+            line=line,
+            column=tile.wall_position(line),
+            tile_type=tile.get_tile_type(),
+            score=score,
+            order=self.__walls[player - 1].number_of_tiles - 1,
+        )
+
     def _apply_score_penalty(self) -> None:
         """
-        This method applies the score penalty to both players
+        This method applies the score penalty to every player
         """
         # Score from floor is a negative value
-        new_score_1 = self.__player1score + self.__player1_floor.floor_penalty
-        new_score_2 = self.__player2score + self.__player2_floor.floor_penalty
+        scores = self.__scores
+        for index, floor in enumerate(self.__floors):
+            scores[index] = max(scores[index] + floor.floor_penalty, 0)
 
-        self.__player1score = max(new_score_1, 0)
-        self.__player2score = max(new_score_2, 0)
+    def _apply_end_game_bonus(self) -> None:
+        """
+        This method adds the end of game bonuses to every player's score
+        """
+        for index, wall in enumerate(self.__walls):
+            self.__scores[index] += wall.end_game_bonus
 
     def _is_move_possible(self, tile: ColourTile) -> bool:
         """
         Returns true if there is a move possible to ANY pattern line
         """
-        if self.show_current_player() == self.PLAYER_1:
-            pattern_lines = self.__player1_patternlines
-            wall = self.__player1_wall
-        else:
-            pattern_lines = self.__player2_patternlines
-            wall = self.__player2_wall
-
         lines = ["line1", "line2", "line3", "line4", "line5"]
         for line in lines:
-            if tile.get_tile_type() in pattern_lines.get_possible_moves(
-                line
-            ) and tile.get_tile_type() in wall.get_possible_moves(line):
+            if self._is_line_possible(tile.get_tile_type(), line):
                 return True
         return False
 
+    def _is_line_possible(self, tile_type: str, line: str) -> bool:
+        """
+        Returns true if tiles of this colour can be placed on the specified pattern line
+        of the current player
+        """
+        pattern_lines = self.__patternlines[self.__current_player - 1]
+        wall = self.__walls[self.__current_player - 1]
+
+        if tile_type not in TILE_COLOURS:
+            return False
+
+        line_colour, count = pattern_lines.show_line_fill(line)
+        return (
+            line_colour in ("", tile_type)
+            and count < _LINE_CAPACITY[line]
+            and wall._is_position_free(tile_type, line)
+        )
+
     def _check_phase(self, phase: GameState) -> None:
         """
         This method checks if the game is in the specified phase
         It returns an error if not
+        Skipped for trusted games (validate=False), whose callers only make legal moves
         """
-        if not self.__gamestate == phase:
+        if self.__validate and not self.__gamestate == phase:
             raise RuntimeError(
                 f"Out of phase, this move can only be played in the {phase.name} phase, it is currently the {self.__gamestate.name} phase"
             )
@@ -488,96 +1156,278 @@ class Game:
         # Advance to the preparing for next round phase
 
         # Decide who the starting player will be, and return P1 Tile to the centre of the table
-        if self.__player1_floor.check_player1_tile:
-            self.__current_player = self.PLAYER_1
-            tile = self.__player1_floor.get_p1_tile()
-            self.__my_factories.replace_p1_tile(tile)
-
-        elif self.__player2_floor.check_player1_tile:
-            self.__current_player = self.PLAYER_2
-            tile = self.__player2_floor.get_p1_tile()
-            self.__my_factories.replace_p1_tile(tile)
-
+        for index, floor in enumerate(self.__floors):
+            if floor.check_player1_tile:
+                self.__current_player = index + 1
+                tile = floor.get_p1_tile()
+                self.__my_factories.replace_p1_tile(tile)
+                break
         else:
             raise RuntimeError(
                 "Cannot determine from player floors who the next round's starting player will be"
             )
 
         # Clean floor, clean patternlines, refill factory
-        self.__player1_floor.clean_floor()
-        self.__player2_floor.clean_floor()
-        self.__player1_patternlines.clean_pattern_lines()
-        self.__player2_patternlines.clean_pattern_lines()
+        for floor in self.__floors:
+            floor.clean_floor()
+        for pattern_lines in self.__patternlines:
+            pattern_lines.clean_pattern_lines()
         self.__my_factories.reset_factory()
         self.rounds_played += 1
         self.moves_this_round = 0
         self.__gamestate = GameState.FACTORY_OFFER
 
+    # Fixed width layout of pack_state: the phase, current player, counters and scores,
+    # the hand (at most 16 tiles with 5 factories) and last factory offer, the factories and
+    # tile bag, then the wall, pattern lines and floor of each player.
+    # The size depends on the number of players, STATE_SIZES holds it for each. STATE_SIZE is the
+    # size of a 2 player game
+    _STATE_HEADERS = MappingProxyType(
+        {players: struct.Struct("<BBBHH" + "H" * players) for players in FACTORIES_BY_PLAYERS}
+    )
+    _STATE_HEADER = _STATE_HEADERS[2]
+    STATE_SIZES: MappingProxyType[int, int] = MappingProxyType(
+        {
+            players: header.size
+            + Factory.centre_size(FACTORIES_BY_PLAYERS[players])
+            + 2
+            + Factory.state_size(FACTORIES_BY_PLAYERS[players])
+            + players * _BOARD_SIZE
+            for players, header in _STATE_HEADERS.items()
+        }
+    )
+    STATE_SIZE = STATE_SIZES[2]
+
+    def pack_state(self) -> bytes:
+        """
+        This method returns the complete state of the game as STATE_SIZES[players] bytes
+        (STATE_SIZE for 2 players), including the hidden order of the tile bag and its seed.
+        Two games with the same packed state play on identically.
+        Display colours and text of the tiles are not included
+        """
+        header = self._STATE_HEADERS[len(self.__scores)].pack(
+            self.__gamestate.value,
+            self.__current_player,
+            self.moves_this_round,
+            self.rounds_played,
+            self.moves_this_game,
+            *self.__scores,
+        )
+        hand = bytes(TILE_CODES[tile.get_tile_type()] for tile in self.__hand).ljust(
+            Factory.centre_size(self.__my_factories.number_of_factories), b"\0"
+        )
+        factory_number, colour = self.__offer
+        offer = bytes((factory_number, TILE_CODES[colour] if colour else 0))
+
+        return b"".join(
+            (
+                header,
+                hand,
+                offer,
+                self.__my_factories._export_state(),
+                *self.__export_boards(),
+            )
+        )
+
+    def __export_boards(self) -> list[bytes]:
+        """
+        The packed wall, pattern lines and floor of each player, in player order
+        """
+        return [
+            component._export_state()
+            for board in zip(self.__walls, self.__patternlines, self.__floors)
+            for component in board
+        ]
+
+    # Fixed width layout of pack_position: the phase, current player and scores, the hand,
+    # the factories and centre of the table, the bag counts, then the boards of each player.
+    # As for pack_state, POSITION_SIZES holds the size for each number of players
+    _POSITION_HEADERS = MappingProxyType(
+        {players: struct.Struct("<BB" + "H" * players) for players in FACTORIES_BY_PLAYERS}
+    )
+    _POSITION_HEADER = _POSITION_HEADERS[2]
+    POSITION_SIZES: MappingProxyType[int, int] = MappingProxyType(
+        {
+            players: header.size
+            + Factory.centre_size(FACTORIES_BY_PLAYERS[players])
+            + Factory.tiles_size(FACTORIES_BY_PLAYERS[players])
+            + len(TILE_COLOURS)
+            + players * _BOARD_SIZE
+            for players, header in _POSITION_HEADERS.items()
+        }
+    )
+    POSITION_SIZE = POSITION_SIZES[2]
+
+    def pack_position(self) -> bytes:
+        """
+        This method returns the position as every player sees it, as POSITION_SIZES[players] bytes
+        (POSITION_SIZE for 2 players). Unlike pack_state it leaves out the hidden order of the tile bag (only the counts of each
+        colour are kept), the seed and the move counters, none of which change how the game
+        can go on. Games reached by different moves or seeds can have the same position
+        """
+        return b"".join(
+            (
+                self._POSITION_HEADERS[len(self.__scores)].pack(
+                    self.__gamestate.value,
+                    self.__current_player,
+                    *self.__scores,
+                ),
+                bytes(TILE_CODES[tile.get_tile_type()] for tile in self.__hand).ljust(
+                    Factory.centre_size(self.__my_factories.number_of_factories), b"\0"
+                ),
+                self.__my_factories._export_tiles(),
+                bytes(self.__my_factories.show_bag_counts()),
+                *self.__export_boards(),
+            )
+        )
+
+    @classmethod
+    def unpack_state(
+        cls, state: bytes, move_history: tuple[int, ...] = (), validate: bool = True
+    ) -> "Game":
+        """
+        This method creates a game from the bytes of pack_state.
+        The number of players is known from the number of bytes
+
+        Args:
+            state (bytes): The bytes returned by pack_state
+            move_history (tuple[int, ...]): OPTIONAL: The moves that led to the state, as action ids.
+                The moves are not part of the packed state, so show_move_history
+                starts from these
+            validate (bool): OPTIONAL: As for the constructor
+        """
+        players = next(
+            (players for players, size in cls.STATE_SIZES.items() if size == len(state)), 2
+        )
+        game = cls(validate=validate, players=players)
+        game.load_state(state, move_history)
+        return game
+
+    def load_state(self, state: bytes, move_history: tuple[int, ...] = ()) -> None:
+        """
+        This method restores the game from the bytes of pack_state, in place.
+        Every component is reused, as in reset, so the state must be of a game
+        with the same number of players
+
+        Args:
+            state (bytes): The bytes returned by pack_state
+            move_history (tuple[int, ...]): OPTIONAL: The moves that led to the state, as action ids
+        """
+        players = len(self.__scores)
+        if len(state) != self.STATE_SIZES[players]:
+            raise ValueError(
+                f"{len(state)} bytes - A packed {players} player game state is {self.STATE_SIZES[players]} bytes"
+            )
+
+        header = self._STATE_HEADERS[players]
+        (
+            gamestate,
+            self.__current_player,
+            self.moves_this_round,
+            self.rounds_played,
+            self.moves_this_game,
+            *scores,
+        ) = header.unpack_from(state)
+        self.__scores[:] = scores
+        self.__gamestate = GameState(gamestate)
+
+        factories = self.__my_factories.number_of_factories
+        hand_size = Factory.centre_size(factories)
+        offset = header.size
+        self.__hand = cast(
+            list[ColourTile | P1Tile] | list[ColourTile],
+            [tile_from_code(code) for code in state[offset : offset + hand_size] if code],
+        )
+        offset += hand_size
+        factory_number, colour = state[offset], state[offset + 1]
+        self.__offer = (factory_number, TILE_TYPES[colour] if colour else "")
+        offset += 2
+
+        factory_size = Factory.state_size(factories)
+        self.__my_factories._import_state(state[offset : offset + factory_size])
+        offset += factory_size
+
+        for board in zip(self.__walls, self.__patternlines, self.__floors):
+            for component in board:
+                component._import_state(state[offset : offset + component.STATE_SIZE])
+                offset += component.STATE_SIZE
+
+        self.__move_history[:] = move_history
+
+    def __getstate__(self) -> dict[str, Any]:
+        """
+        The listeners are left out when the game is copied or pickled,
+        so copies made for search do not report their moves
+        """
+        state = self.__dict__.copy()
+        state["_Game__listeners"] = []
+        state["_Game__span_listeners"] = []
+        state["_Game__span_depth"] = 0
+        for method_name in _SPANS:
+            state.pop(method_name, None)
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        """
+        A copy is a game of its own, with its own game_id
+        """
+        self.__dict__.update(state)
+        self.__game_id = next(_game_ids)
+
+    @property
+    def game_id(self) -> int:
+        """
+        A number identifying this game among the games of this process, reported in every event.
+        It is kept when the game is reset, copies of the game get a new one
+        """
+        return self.__game_id
+
     @property
     def is_game_over(self) -> bool:
         """
         Returns True if the game is over.
-        Game ends when either player has
+        Game ends when any player has
         completed a horizontal line on their wall
         """
-        if self.__player1_wall.is_game_over or self.__player2_wall.is_game_over:
-            return True
+        for wall in self.__walls:
+            if wall.is_game_over:
+                return True
         return False
 
     def __repr__(self) -> str:
         """
         This method returns a detailed string representation of the game
         """
-        p1pl = self.__player1_patternlines
-        p1w = self.__player1_wall
-        p1f = self.__player1_floor
-        p2pl = self.__player2_patternlines
-        p2w = self.__player2_wall
-        p2f = self.__player2_floor
         mf = self.__my_factories
 
         # dedent() was producing strange behaviour, so I used a multiple string approach
-        return (
-            f"**************** Round {self.rounds_played} *****************\n"
-            f"********* Phase  {self.__gamestate.name} *********\n"
-            f"Current player: {self.__current_player}\n"
-            f"Player1 score: {self.__player1score}\n"
-            f"Player2 score: {self.__player2score}\n"
-            f"Moves this round: {self.moves_this_round}\n"
-            f"Rounds played: {self.rounds_played}\n"
-            f"Moves this game: {self.moves_this_game}\n"
-            f"{str(mf)}\n"
-            f"=========PLAYER1 SUMMARY==========\n"
-            f"Score: {self.__player1score}\n"
+        summaries = "".join(
+            f"=========PLAYER{index + 1} SUMMARY==========\n"
+            f"Score: {self.__scores[index]}\n"
             "-------------------------------------------------------------\n"
-            f"{str(p1pl)}\n"
+            f"{str(self.__patternlines[index])}\n"
             "-------------------------------------------------------------\n"
-            f"{str(p1w)}\n"
+            f"{str(self.__walls[index])}\n"
             "-------------------------------------------------------------\n"
-            f"{str(p1f)}\n"
-            f"=========PLAYER2 SUMMARY==========\n"
-            f"Score: {self.__player2score}\n"
-            "-------------------------------------------------------------\n"
-            f"{str(p2pl)}\n"
-            "-------------------------------------------------------------\n"
-            f"{str(p2w)}\n"
-            "-------------------------------------------------------------\n"
-            f"{str(p2f)}\n"
+            f"{str(self.__floors[index])}\n"
+            for index in range(len(self.__scores))
         )
+        return f"{str(self)}{str(mf)}\n{summaries}"
 
     def __str__(self) -> str:
         """
         This method returns a summary string representation of the game
         """
-        return dedent(
-            f"""\
-            **************** Round {self.rounds_played} *****************
-            ********* Phase  {self.__gamestate.name} *********
-            Current player: {self.__current_player}
-            Player1 score: {self.__player1score}
-            Player2 score: {self.__player2score}
-            Moves this round: {self.moves_this_round}
-            Rounds played: {self.rounds_played}
-            Moves this game: {self.moves_this_game}
-            """
+        scores = "".join(
+            f"Player{player} score: {score}\n"
+            for player, score in enumerate(self.__scores, 1)
+        )
+        return (
+            f"**************** Round {self.rounds_played} *****************\n"
+            f"********* Phase  {self.__gamestate.name} *********\n"
+            f"Current player: {self.__current_player}\n"
+            f"{scores}"
+            f"Moves this round: {self.moves_this_round}\n"
+            f"Rounds played: {self.rounds_played}\n"
+            f"Moves this game: {self.moves_this_game}\n"
         )
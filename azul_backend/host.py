@@ -0,0 +1,279 @@
+## File: host.py
+## Date: 2024-03-27
+## This module creates a game host: a server that plays Azul against clients over TCP
+
+# Clients connect over TCP and speak JSON lines. Each client plays as player 1 and the host's
+# opponent agent (see agents.py) plays as player 2. Every request carries an id, which is
+# copied into the reply.
+#   {"id": 1, "op": "new", "seed": 42}                      starts a game (the seed is optional)
+#   {"id": 2, "op": "move", "game": 7, "move": [3, "red", "line2"]}    plays the client's move
+#   {"id": 3, "op": "stats"}                                 the host's games, moves and memory
+# new and move reply with the game once the opponent has answered:
+#   {"id": 2, "game": 7, "state": "<hex>", "over": false, "scores": [12, 9],
+#    "opponent_moves": [[0, "blue", "line1"]]}
+# state is the packed state (Game.pack_state) of a determinization of the game, so a client learns
+# the position (and can work out its legal moves with Game.unpack_state) but not the bag order.
+# A request that fails gets {"id": ..., "error": "..."}. A connection can only play in the games it
+# started; any other game id gets "No such game". A game is forgotten when it is over,
+# or when the connection that started it closes.
+
+# With a GameMetrics (metrics.py) the host attaches every game it plays, so the latency of its
+# engine calls and its game gauges can be scraped or dumped to a file. With a Tracer (tracing.py)
+# a sample of its games is traced.
+
+# Run the host with:  python -m azul_backend.host [--port 7777] [--metrics-port 9464]
+#                                                 [--trace-file trace.jsonl --trace-sample 1000]
+
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import resource
+import sys
+from types import MappingProxyType
+from typing import Any
+
+from azul_backend.agents import Agent, GreedyAgent, decode_move
+from azul_backend.game import Game
+from azul_backend.metrics import GameMetrics
+from azul_backend.tracing import Tracer
+
+DEFAULT_PORT = 7777
+
+
+def resident_memory() -> int:
+    """
+    This function returns the resident memory of this process in bytes,
+    or the peak resident memory where the current figure is not available
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024  # kB on Linux
+
+
+class GameHost:
+    """
+    This class hosts games against an opponent agent for clients connected over TCP
+
+    Args:
+        opponent (Agent): OPTIONAL: The agent that plays player 2, the greedy agent by default
+        metrics (GameMetrics): OPTIONAL: Records the engine calls of every game hosted
+        tracer (Tracer): OPTIONAL: Traces a sample of the games hosted
+
+    Methods:
+        start: Coroutine that starts listening
+        serve_forever: Coroutine that serves until cancelled
+        close: Coroutine that stops the host
+        handle: Coroutine that answers one request, as a dictionary
+        stats: The host's counters, as an immutable dictionary
+    """
+
+    _opponent: Agent
+    _metrics: GameMetrics | None
+    _tracer: Tracer | None
+    __games: dict[int, Game]
+    __game_ids: "itertools.count[int]"
+    __connections: int
+    __moves: int
+    __server: asyncio.Server | None
+
+    def __init__(
+        self,
+        opponent: Agent | None = None,
+        metrics: GameMetrics | None = None,
+        tracer: Tracer | None = None,
+    ) -> None:
+        """Create a host with no games"""
+        self._opponent = GreedyAgent() if opponent is None else opponent
+        self._metrics = metrics
+        self._tracer = tracer
+        self.__games = {}
+        self.__game_ids = itertools.count(1)
+        self.__connections = 0
+        self.__moves = 0
+        self.__server = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> int:
+        """
+        This method starts listening, and returns the port (useful with port 0)
+        """
+        self.__server = await asyncio.start_server(self.__connection, host, port)
+        return int(self.__server.sockets[0].getsockname()[1])
+
+    async def serve_forever(self) -> None:
+        if self.__server is None:
+            raise RuntimeError("The host has not been started")
+        await self.__server.serve_forever()
+
+    async def close(self) -> None:
+        if self.__server is not None:
+            self.__server.close()
+            await self.__server.wait_closed()
+            self.__server = None
+
+    def stats(self) -> MappingProxyType[str, int]:
+        """
+        This method returns the number of games and connections open, the moves played,
+        and the resident memory of the host in bytes
+        """
+        return MappingProxyType(
+            {
+                "games": len(self.__games),
+                "connections": self.__connections,
+                "moves": self.__moves,
+                "rss": resident_memory(),
+            }
+        )
+
+    async def handle(
+        self, request: dict[str, Any], owned: set[int] | None = None
+    ) -> dict[str, Any]:
+        """
+        This method answers one request. The ids of games started are added to owned,
+        and when owned is given, moves are only accepted in the games in it
+        """
+        reply: dict[str, Any] = {"id": request.get("id")}
+        try:
+            op = request.get("op")
+            if op == "new":
+                seed = request.get("seed")
+                if seed is not None and type(seed) is not int:
+                    raise ValueError(f"{seed} - seed must be an int")
+                game_id = next(self.__game_ids)
+                self.__games[game_id] = Game(seed)
+                if self._metrics is not None:
+                    self._metrics.attach(self.__games[game_id])
+                if self._tracer is not None:
+                    self._tracer.attach(self.__games[game_id])
+                if owned is not None:
+                    owned.add(game_id)
+                reply.update(await self.__reply(game_id, []))
+            elif op == "move":
+                game_id = request.get("game")
+                game = self.__games.get(game_id)  # type: ignore[arg-type]
+                if game is None or (owned is not None and game_id not in owned):
+                    raise ValueError(f"{game_id} - No such game")
+                if game.show_current_player() != Game.PLAYER_1:
+                    raise ValueError("It is not the client's turn")
+                game.play_move(decode_move(request.get("move")))
+                self.__moves += 1
+                reply.update(await self.__reply(game_id, []))
+            elif op == "stats":
+                reply.update(self.stats())
+            else:
+                raise ValueError(f"{op} - Unknown op")
+        except (ValueError, RuntimeError) as error:
+            reply["error"] = str(error)
+        return reply
+
+    async def __reply(self, game_id: int, opponent_moves: list[Any]) -> dict[str, Any]:
+        """
+        Plays the opponent's moves until it is the client's turn, and describes the game
+        """
+        game = self.__games[game_id]
+        while not game.is_game_over and game.show_current_player() == Game.PLAYER_2:
+            move = await self._opponent.choose_move(game)
+            game.play_move(move)
+            self.__moves += 1
+            opponent_moves.append(list(move))
+
+        if game.is_game_over:
+            self.__forget(game_id)
+        return {
+            "game": game_id,
+            "state": game.determinize().pack_state().hex(),
+            "over": game.is_game_over,
+            "scores": [game.show_score(1), game.show_score(2)],
+            "opponent_moves": opponent_moves,
+        }
+
+    async def __connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """
+        Serves one client connection until it closes
+        """
+        self.__connections += 1
+        owned: set[int] = set()
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("A request must be a JSON object")
+                except ValueError as error:
+                    reply: dict[str, Any] = {"id": None, "error": str(error)}
+                else:
+                    reply = await self.handle(request, owned)
+                writer.write((json.dumps(reply) + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.__connections -= 1
+            for game_id in owned:
+                self.__forget(game_id)
+            writer.close()
+
+    def __forget(self, game_id: int) -> None:
+        game = self.__games.pop(game_id, None)
+        if game is not None and self._metrics is not None:
+            self._metrics.detach(game)
+        if game is not None and self._tracer is not None:
+            self._tracer.detach(game)
+
+
+async def _dump_metrics(metrics: GameMetrics, path: str, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        metrics.dump(path)
+
+
+async def _main(arguments: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Host Azul games over TCP")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--metrics-port", type=int, help="Serve /metrics on this port")
+    parser.add_argument("--metrics-file", help="Dump the metrics to this file")
+    parser.add_argument("--metrics-interval", type=float, default=15.0)
+    parser.add_argument("--trace-file", help="Trace a sample of the games to this file")
+    parser.add_argument("--trace-sample", type=int, default=1000, help="Trace 1 in N games")
+    options = parser.parse_args(arguments)
+
+    metrics = None
+    if options.metrics_port is not None or options.metrics_file:
+        metrics = GameMetrics()
+    if options.metrics_port is not None:
+        metrics.serve(options.metrics_port)  # type: ignore[union-attr]
+        print(f"Serving metrics on port {options.metrics_port}")
+    # The loop only keeps a weak reference to a task, so the dumper is held here until shutdown
+    dumper: "asyncio.Task[None] | None" = None
+    if options.metrics_file:
+        dumper = asyncio.create_task(
+            _dump_metrics(metrics, options.metrics_file, options.metrics_interval)  # type: ignore[arg-type]
+        )
+
+    tracer = None
+    if options.trace_file:
+        tracer = Tracer(options.trace_file, options.trace_sample)
+
+    host = GameHost(metrics=metrics, tracer=tracer)
+    port = await host.start(port=options.port)
+    print(f"Hosting Azul on port {port}")
+    try:
+        await host.serve_forever()
+    finally:
+        if dumper is not None:
+            dumper.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await dumper
+        if tracer is not None:
+            tracer.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,349 @@
+## File: ismcts.py
+## Date: 2024-03-06
+## This module creates an Information Set Monte Carlo Tree Search (ISMCTS) bot
+
+# The order of the tile bag is hidden from the players. A bot that searches on a plain copy of
+# the Game can see which tiles will be drawn into the factories of future rounds, i.e it cheats.
+# ISMCTS avoids this. Every iteration plays on a fresh determinization of the game
+# (Game.determinize), in which the hidden bag order is resampled from the publicly known counts.
+# All determinizations share one tree, so statistics gathered on one determinization
+# inform the others.
+
+# As the set of legal moves is the same in every determinization of a position, but the positions
+# reached after a round boundary differ, each node also counts how often it was available
+# and the UCB formula uses the availability count in place of the parent's visit count.
+
+# Searches can be spread over worker processes (root parallelisation).
+# Each worker grows its own tree from a different seed and the root statistics are summed.
+# The root position is handed to the workers through a StateArena (see arena.py) rather than
+# by pickling the game. The worker processes and the arena are created by the first parallel search
+# and kept for the searches that follow, so close the searcher (or use it in a with block) when done.
+
+# A SearchTree is the tree of one position on its own. It can be grown a few iterations at a time
+# and keeps its statistics in between, e.g for a search that runs in the background (background.py).
+
+import math
+import random
+from concurrent.futures import ProcessPoolExecutor
+from types import MappingProxyType
+
+from azul_backend.arena import StateArena
+from azul_backend.game import Game
+from azul_backend.states import GameState
+
+Move = tuple[int, str, str | None]
+
+
+class _Node:
+    """
+    A node of the ISMCTS tree. Internal use only.
+    The statistics are stored from the point of view of the player who made the move into this node
+    """
+
+    __slots__ = ("move", "player", "children", "visits", "reward", "availability")
+
+    def __init__(self, move: Move | None, player: int) -> None:
+        self.move = move
+        self.player = player  # The player who made the move into this node
+        self.children: dict[Move, _Node] = {}
+        self.visits = 0
+        self.reward = 0.0
+        self.availability = 0
+
+    def ucb(self, exploration: float) -> float:
+        """
+        Upper confidence bound, using the availability count in place of the parent visit count
+        """
+        return self.reward / self.visits + exploration * math.sqrt(
+            math.log(self.availability) / self.visits
+        )
+
+
+class InformationSetMCTS:
+    """
+    This class is a bot that chooses moves with Single Observer Information Set MCTS
+    It never looks at the hidden order of the tile bag.
+
+    Args:
+        iterations (int): The number of iterations per move, shared between the workers
+        exploration (float): The UCB exploration constant
+        workers (int): The number of worker processes. 1 searches in the calling process
+        seed (int): OPTIONAL: Seed for reproducible searches
+        max_rollout_moves (int): OPTIONAL: Cut rollouts short after this many moves,
+            the leading player is then taken as the winner
+
+    Methods:
+        choose_move: Returns the move with the most visits
+        search: Returns the statistics of every move from the root
+        close: Stops the worker processes and frees the arena
+    """
+
+    _iterations: int
+    _exploration: float
+    _workers: int
+    _max_rollout_moves: int | None
+    __rng: random.Random
+    __executor: ProcessPoolExecutor | None
+    __arenas: dict[int, StateArena]  # One single slot arena for each number of players searched
+
+    def __init__(
+        self,
+        iterations: int = 1000,
+        exploration: float = 0.7,
+        workers: int = 1,
+        seed: int | None = None,
+        max_rollout_moves: int | None = None,
+    ) -> None:
+        """Initialise the search parameters"""
+        if not isinstance(iterations, int) or iterations < 1:
+            raise ValueError(f"{iterations} - iterations must be a positive int")
+        if not isinstance(workers, int) or workers < 1:
+            raise ValueError(f"{workers} - workers must be a positive int")
+
+        self._iterations = iterations
+        self._exploration = exploration
+        self._workers = workers
+        self._max_rollout_moves = max_rollout_moves
+        self.__rng = random.Random(seed)
+        self.__executor = None
+        self.__arenas = {}
+
+    def choose_move(self, game: Game) -> Move:
+        """
+        This method returns the move for the current player with the most visits
+        """
+        statistics = self.search(game)
+        if not statistics:
+            raise ValueError("There are no legal moves, the game is over")
+
+        return max(statistics, key=lambda move: statistics[move][0])
+
+    def search(self, game: Game) -> MappingProxyType[Move, tuple[int, float]]:
+        """
+        This method searches from the current position of the game, which is not changed.
+        It returns an immutable dictionary of move: (visits, mean reward) for the current player
+        """
+        legal_moves = game.legal_moves()
+        if len(legal_moves) <= 1:
+            return MappingProxyType({move: (0, 0.0) for move in legal_moves})
+
+        # Split the iterations as evenly as possible between the workers
+        workers = min(self._workers, self._iterations)
+        shares = [
+            self._iterations // workers + (i < self._iterations % workers)
+            for i in range(workers)
+        ]
+        seeds = [self.__rng.getrandbits(64) for _ in shares]
+        settings = (self._exploration, self._max_rollout_moves)
+
+        if workers == 1:
+            results = [_search_worker((game, shares[0], seeds[0], *settings))]
+        else:
+            arena = self.__arena(game.show_number_of_players())
+            arena.store(0, game)
+            jobs = [((arena, 0), share, seed, *settings) for share, seed in zip(shares, seeds)]
+            if self.__executor is None:
+                self.__executor = ProcessPoolExecutor(max_workers=self._workers)
+            results = list(self.__executor.map(_search_worker, jobs))
+
+        # Sum the root statistics of every worker
+        totals: dict[Move, list[float]] = {move: [0, 0.0] for move in legal_moves}
+        for result in results:
+            for move, (visits, reward) in result.items():
+                totals[move][0] += visits
+                totals[move][1] += reward
+
+        return MappingProxyType(
+            {
+                move: (int(visits), reward / visits if visits else 0.0)
+                for move, (visits, reward) in totals.items()
+            }
+        )
+
+    def __arena(self, players: int) -> StateArena:
+        """
+        Returns the arena for games of a number of players, creating it on first use
+        """
+        if players not in self.__arenas:
+            arena = StateArena(1, players=players)
+            arena.allocate()
+            self.__arenas[players] = arena
+        return self.__arenas[players]
+
+    def close(self) -> None:
+        """
+        This method stops the worker processes and frees the arenas of parallel searches.
+        The searcher can still be used, they are created again when needed
+        """
+        if self.__executor is not None:
+            self.__executor.shutdown()
+            self.__executor = None
+        for arena in self.__arenas.values():
+            arena.close()
+            arena.unlink()
+        self.__arenas.clear()
+
+    def __enter__(self) -> "InformationSetMCTS":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+
+class SearchTree:
+    """
+    This class is the ISMCTS tree of one position, grown a number of iterations at a time.
+    The game is not changed, and must not be changed while the tree is in use
+
+    Args:
+        game (Game): The position at the root of the tree
+        exploration (float): The UCB exploration constant
+        seed (int): OPTIONAL: Seed for reproducible searches
+        max_rollout_moves (int): OPTIONAL: Cut rollouts short after this many moves
+
+    Methods:
+        grow: Runs more iterations of the search
+        statistics: Returns the root statistics as move: (visits, total reward)
+    """
+
+    __slots__ = ("_game", "_exploration", "_max_rollout_moves", "__rng", "__root")
+
+    def __init__(
+        self,
+        game: Game,
+        exploration: float = 0.7,
+        seed: int | None = None,
+        max_rollout_moves: int | None = None,
+    ) -> None:
+        """Create a tree holding only the root"""
+        self._game = game
+        self._exploration = exploration
+        self._max_rollout_moves = max_rollout_moves
+        self.__rng = random.Random(seed)
+        # The root "move" was made by the other player, it is never scored
+        self.__root = _Node(None, 0)
+
+    @property
+    def iterations(self) -> int:
+        """The number of iterations grown so far"""
+        return self.__root.visits
+
+    def statistics(self) -> dict[Move, tuple[int, float]]:
+        """
+        This method returns the statistics of the moves from the root as move: (visits, total reward)
+        """
+        return {
+            move: (child.visits, child.reward) for move, child in self.__root.children.items()
+        }
+
+    def grow(self, iterations: int) -> None:
+        """
+        This method runs more iterations of the search, adding to the statistics of the tree
+        """
+        _grow(
+            self.__root,
+            self._game,
+            iterations,
+            self.__rng,
+            self._exploration,
+            self._max_rollout_moves,
+        )
+
+
+def _search_worker(
+    job: tuple[Game | tuple[StateArena, int], int, int, float, int | None]
+) -> dict[Move, tuple[int, float]]:
+    """
+    Grows one ISMCTS tree and returns the root statistics as move: (visits, total reward)
+    Module level, so that it can be sent to worker processes.
+    The root is either a game, or the (arena, slot) it has been stored in
+    """
+    root_game, iterations, seed, exploration, max_rollout_moves = job
+    if isinstance(root_game, Game):
+        game = root_game
+    else:
+        arena, slot = root_game
+        game = arena.load(slot, validate=False)  # The search only plays legal moves
+        arena.close()
+    tree = SearchTree(game, exploration, seed, max_rollout_moves)
+    tree.grow(iterations)
+    return tree.statistics()
+
+
+def _grow(
+    root: _Node,
+    game: Game,
+    iterations: int,
+    rng: random.Random,
+    exploration: float,
+    max_rollout_moves: int | None,
+) -> None:
+    """
+    Runs iterations of ISMCTS from the root, whose position is the game
+    """
+    for _ in range(iterations):
+        state = game.determinize(rng)
+        node = root
+        path = [root]
+
+        # Selection. Descend while every legal move of this determinization has been tried
+        legal_moves = state.legal_moves()
+        while legal_moves:
+            untried = [move for move in legal_moves if move not in node.children]
+            if untried:
+                break
+            for move in legal_moves:
+                node.children[move].availability += 1
+            node = max(
+                (node.children[move] for move in legal_moves),
+                key=lambda child: child.ucb(exploration),
+            )
+            state.play_move(node.move)  # type: ignore[arg-type]
+            path.append(node)
+            legal_moves = state.legal_moves()
+
+        # Expansion
+        if legal_moves:
+            move = rng.choice(untried)
+            for available in legal_moves:
+                if available in node.children:
+                    node.children[available].availability += 1
+            child = _Node(move, state.show_current_player())
+            child.availability = 1
+            node.children[move] = child
+            state.play_move(move)
+            node = child
+            path.append(node)
+
+        # Simulation
+        rewards = _rollout(state, rng, max_rollout_moves)
+
+        # Backpropagation
+        for visited in path:
+            visited.visits += 1
+            if visited.player:
+                visited.reward += rewards[visited.player]
+
+
+def _rollout(
+    state: Game, rng: random.Random, max_rollout_moves: int | None
+) -> dict[int, float]:
+    """
+    Plays random moves until the game is over (or the move limit is reached)
+    Returns the reward of each player: 1 for a win, 0 for a loss, and a win shared equally
+    between the players with the top score (0.5 each for a 2 player draw)
+    """
+    moves = 0
+    while state.show_game_state() != GameState.GAMEOVER:
+        if max_rollout_moves is not None and moves >= max_rollout_moves:
+            break
+        state.play_move(rng.choice(state.legal_moves()))
+        moves += 1
+
+    scores = {
+        player: state.show_score(player)
+        for player in range(Game.PLAYER_1, state.show_number_of_players() + 1)
+    }
+    best = max(scores.values())
+    winners = sum(score == best for score in scores.values())
+    return {player: 1.0 / winners if score == best else 0.0 for player, score in scores.items()}
@@ -0,0 +1,421 @@
+## File: loadgen.py
+## Date: 2024-03-27
+## This module creates a load generator for the game host
+
+# Simulates many clients playing whole games against a running game host (host.py), to find out
+# how many players a machine can take. Each client connects, starts games and plays its moves
+# after a think time drawn from a distribution:
+#   fixed:S  (or just S)     always S seconds
+#   uniform:A:B              between A and B seconds
+#   exp:M                    exponential, mean M seconds
+#   lognormal:M:S            log-normal, median M seconds, shape S
+# Moves are chosen from the legal moves of the position the host sends back (Game.unpack_state and
+# Game.legal_moves), so every move is legal by the backend's own rules. The policy picks one:
+# random, greedy (background.likely_moves) or first (the first legal move, a fixed script).
+
+# The report gives the latency percentiles of each kind of request (measured from sending the
+# request to reading the reply, so it includes the opponent's moves), the throughput, the errors
+# by kind, and samples of the host's memory and open games, taken every interval.
+# A reply that is not a JSON object is counted as a protocol error, and the client abandons the game.
+
+#   python -m azul_backend.loadgen --clients 2000 --games 3 --think exp:1.5 --ramp 20
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import resource
+import time
+from types import MappingProxyType
+from typing import Any, Callable
+
+from azul_backend.background import likely_moves
+from azul_backend.game import Game
+from azul_backend.host import DEFAULT_PORT
+from azul_backend.ismcts import Move
+from azul_backend.stats import QuantileSketch
+
+ThinkTime = Callable[[random.Random], float]
+Policy = Callable[[Game, random.Random], Move]
+
+POLICIES: MappingProxyType[str, Policy] = MappingProxyType(
+    {
+        "random": lambda game, rng: rng.choice(game.legal_moves()),
+        "greedy": lambda game, rng: likely_moves(game, 1)[0],
+        "first": lambda game, rng: game.legal_moves()[0],
+    }
+)
+
+
+def parse_think_time(spec: str) -> ThinkTime:
+    """
+    This function turns a think time distribution (see the top of the module) into a function
+    that draws think times, in seconds, from a random.Random
+    """
+    name, *values = spec.split(":")
+    try:
+        if not values:  # A plain number of seconds
+            values, name = [name], "fixed"
+        numbers = [float(value) for value in values]
+    except ValueError:
+        raise ValueError(f"{spec} - Invalid think time") from None
+    if any(number < 0 for number in numbers):
+        raise ValueError(f"{spec} - Think times can not be negative")
+
+    if name == "fixed" and len(numbers) == 1:
+        return lambda rng: numbers[0]
+    if name == "uniform" and len(numbers) == 2:
+        return lambda rng: rng.uniform(numbers[0], numbers[1])
+    if name == "exp" and len(numbers) == 1 and numbers[0] > 0:
+        return lambda rng: rng.expovariate(1 / numbers[0])
+    if name == "lognormal" and len(numbers) == 2 and numbers[0] > 0:
+        return lambda rng: rng.lognormvariate(math.log(numbers[0]), numbers[1])
+    raise ValueError(f"{spec} - Invalid think time")
+
+
+class LoadReport:
+    """
+    This class gathers the measurements of a load test
+
+    Methods:
+        request: Records the latency of a request
+        error: Counts an error, by kind
+        game_finished: Counts a finished game
+        sample: Records a sample of the host's stats
+        summary: The results, as a dictionary (JSON serialisable)
+        format: The results, as text
+    """
+
+    __latencies: dict[str, QuantileSketch]
+    __errors: dict[str, int]
+    __games: int
+    __samples: list[dict[str, float]]
+    __start: float
+
+    def __init__(self) -> None:
+        self.__latencies = {}
+        self.__errors = {}
+        self.__games = 0
+        self.__samples = []
+        self.__start = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.__start
+
+    def request(self, op: str, seconds: float) -> None:
+        self.__latencies.setdefault(op, QuantileSketch()).add(seconds)
+
+    def error(self, kind: str) -> None:
+        self.__errors[kind] = self.__errors.get(kind, 0) + 1
+
+    def game_finished(self) -> None:
+        self.__games += 1
+
+    def sample(self, stats: dict[str, Any]) -> None:
+        self.__samples.append({"time": round(self.elapsed, 3), **stats})
+
+    def count(self, op: str) -> int:
+        """The number of successful requests of a kind"""
+        sketch = self.__latencies.get(op)
+        return 0 if sketch is None else sketch.count
+
+    def summary(self) -> dict[str, Any]:
+        """
+        This method returns the results: latency percentiles in milliseconds for each kind of
+        request, requests and moves per second, errors by kind and error rate, and the host samples
+        """
+        elapsed = self.elapsed
+        requests = sum(sketch.count for sketch in self.__latencies.values())
+        errors = sum(self.__errors.values())
+        return {
+            "elapsed": round(elapsed, 3),
+            "games_finished": self.__games,
+            "requests": requests,
+            "requests_per_second": round(requests / elapsed, 1),
+            "moves_per_second": round(self.count("move") / elapsed, 1),
+            "errors": dict(self.__errors),
+            "error_rate": round(errors / (requests + errors), 5) if errors else 0.0,
+            "latency_ms": {
+                op: {
+                    **{
+                        f"p{percent:g}": round(value * 1000, 3)
+                        for percent, value in sketch.percentiles(
+                            (50, 90, 99, 99.9)
+                        ).items()
+                    },
+                    "max": round(sketch.max * 1000, 3),
+                    "mean": round(sketch.mean * 1000, 3),
+                }
+                for op, sketch in sorted(self.__latencies.items())
+            },
+            "host": self.__samples,
+        }
+
+    def format(self) -> str:
+        summary = self.summary()
+        lines = [
+            f"{summary['elapsed']:.1f}s  {summary['games_finished']} games  "
+            f"{summary['requests_per_second']} requests/s  {summary['moves_per_second']} moves/s",
+            f"errors: {summary['errors'] or 'none'}  (rate {summary['error_rate']:.3%})",
+        ]
+        for op, latency in summary["latency_ms"].items():
+            lines.append(
+                f"{op:>6} ms: "
+                + "  ".join(f"{name} {value:.1f}" for name, value in latency.items())
+            )
+        if summary["host"]:
+            peak = max(sample["rss"] for sample in summary["host"])
+            lines.append(f"host peak memory: {peak / 2**20:.1f} MiB")
+        return "\n".join(lines)
+
+
+class _Connection:
+    """
+    One client's connection to the host. Internal use only
+    """
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        report: LoadReport,
+        timeout: float,
+    ) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.report = report
+        self.timeout = timeout
+        self.request_id = 0
+
+    async def request(self, message: dict[str, Any]) -> dict[str, Any] | None:
+        """
+        Sends a request and returns the reply, None if it failed (the error is counted).
+        Raises ConnectionError if the connection is unusable
+        """
+        self.request_id += 1
+        message["id"] = self.request_id
+        start = time.perf_counter()
+        try:
+            self.writer.write((json.dumps(message) + "\n").encode())
+            await self.writer.drain()
+            line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+        except asyncio.TimeoutError:
+            self.report.error("timeout")
+            raise ConnectionError("The host did not reply in time") from None
+        except OSError:
+            self.report.error("connection")
+            raise ConnectionError("The connection failed") from None
+        if not line:
+            self.report.error("connection")
+            raise ConnectionError("The host closed the connection")
+
+        try:
+            reply = json.loads(line)
+        except ValueError:  # Not JSON (or not UTF-8), the game is abandoned but not the client
+            reply = None
+        if not isinstance(reply, dict):
+            self.report.error("protocol")
+            return None
+        if "error" in reply or reply.get("id") != self.request_id:
+            self.report.error("host")
+            return None
+        self.report.request(message["op"], time.perf_counter() - start)
+        return reply
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+async def _client(
+    number: int,
+    host: str,
+    port: int,
+    games: int,
+    think_time: ThinkTime,
+    policy: Policy,
+    delay: float,
+    timeout: float,
+    seed: int | None,
+    report: LoadReport,
+) -> None:
+    """
+    One simulated client: plays its games one after the other
+    """
+    await asyncio.sleep(delay)
+    rng = random.Random(None if seed is None else f"{seed}:{number}")
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port), timeout
+        )
+    except (OSError, asyncio.TimeoutError):
+        report.error("connect")
+        return
+
+    connection = _Connection(reader, writer, report, timeout)
+    try:
+        for _ in range(games):
+            reply = await connection.request({"op": "new"})
+            while reply is not None and not reply["over"]:
+                game = Game.unpack_state(bytes.fromhex(reply["state"]))
+                move = policy(game, rng)
+                await asyncio.sleep(think_time(rng))
+                reply = await connection.request(
+                    {"op": "move", "game": reply["game"], "move": list(move)}
+                )
+            if reply is not None:
+                report.game_finished()
+    except ConnectionError:
+        pass
+    finally:
+        connection.close()
+
+
+async def _monitor(
+    host: str,
+    port: int,
+    interval: float,
+    timeout: float,
+    report: LoadReport,
+    verbose: bool,
+) -> None:
+    """
+    Samples the host's stats every interval on a connection of its own, until cancelled
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    monitor_report = LoadReport()  # Its requests are not part of the load
+    connection = _Connection(reader, writer, monitor_report, timeout)
+    moves = 0
+    try:
+        while True:
+            stats = await connection.request({"op": "stats"})
+            if stats is not None:
+                del stats["id"]
+                report.sample(stats)
+                if verbose:
+                    done = report.count("move")
+                    print(
+                        f"{report.elapsed:7.1f}s  {stats['connections']:5} connections  "
+                        f"{stats['games']:5} games  {(done - moves) / interval:8.1f} moves/s  "
+                        f"rss {stats['rss'] / 2**20:.1f} MiB"
+                    )
+                    moves = done
+            await asyncio.sleep(interval)
+    except ConnectionError:
+        report.error("monitor")
+    finally:
+        connection.close()
+
+
+async def run_load(
+    host: str = "127.0.0.1",
+    port: int = DEFAULT_PORT,
+    clients: int = 100,
+    games: int = 1,
+    think_time: str = "exp:0.5",
+    policy: str = "random",
+    ramp: float = 5.0,
+    interval: float = 1.0,
+    timeout: float = 30.0,
+    seed: int | None = None,
+    verbose: bool = False,
+) -> LoadReport:
+    """
+    This coroutine runs a load test against a running host and returns its report
+
+    Args:
+        host (str), port (int): The host to load
+        clients (int): The number of concurrent clients
+        games (int): The games each client plays
+        think_time (str): The think time distribution (see the top of the module)
+        policy (str): How clients choose among their legal moves: random, greedy or first
+        ramp (float): Seconds over which the clients connect, evenly spread
+        interval (float): Seconds between samples of the host's stats
+        timeout (float): Seconds a request may take before it is counted as an error
+        seed (int): OPTIONAL: Seed for reproducible moves and think times
+        verbose (bool): Print a progress line every interval
+    """
+    if clients < 1 or games < 1:
+        raise ValueError("clients and games must be positive")
+    if policy not in POLICIES:
+        raise ValueError(f"{policy} - policy must be one of {', '.join(POLICIES)}")
+    draw = parse_think_time(think_time)
+
+    report = LoadReport()
+    monitor = asyncio.create_task(
+        _monitor(host, port, interval, timeout, report, verbose)
+    )
+    await asyncio.gather(
+        *(
+            _client(
+                number,
+                host,
+                port,
+                games,
+                draw,
+                POLICIES[policy],
+                ramp * number / clients,
+                timeout,
+                seed,
+                report,
+            )
+            for number in range(clients)
+        )
+    )
+    monitor.cancel()
+    try:
+        await monitor
+    except asyncio.CancelledError:
+        pass
+    return report
+
+
+def _raise_file_limit() -> None:
+    """
+    Every client needs a socket: raise the open file limit as far as the system allows
+    """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def main(arguments: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Load test an Azul game host")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--games", type=int, default=1)
+    parser.add_argument("--think", default="exp:0.5")
+    parser.add_argument("--policy", default="random", choices=sorted(POLICIES))
+    parser.add_argument("--ramp", type=float, default=5.0)
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", help="Write the summary to this file")
+    options = parser.parse_args(arguments)
+
+    _raise_file_limit()
+    report = asyncio.run(
+        run_load(
+            options.host,
+            options.port,
+            options.clients,
+            options.games,
+            options.think,
+            options.policy,
+            options.ramp,
+            options.interval,
+            options.timeout,
+            options.seed,
+            verbose=True,
+        )
+    )
+    print(report.format())
+    if options.json:
+        with open(options.json, "w") as output:
+            json.dump(report.summary(), output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
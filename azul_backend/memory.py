@@ -0,0 +1,342 @@
+## File: memory.py
+## Date: 2024-03-30
+## This module measures how much memory a Game holds, in total and for each component
+
+# A host keeps many thousands of games in memory, so the bytes per game decide how many games a
+# machine can hold. Two measurements are made, at several stages of a game (STAGES):
+#   tracemalloc: many games are created and played to the stage, and the memory allocated and
+#       still held, divided by the number of games, is the retained size of a game. The allocations
+#       are also attributed to the backend module that made them (factory.py, wall.py ...)
+#   deep sizing: the objects of one game are walked and their sys.getsizeof added up, by component:
+#       the Factory (without its bag), TileBag, Wall, PatternLines and Floor of both players, the tile
+#       objects wherever they are, and the Game itself. Objects shared by every game (classes,
+#       enums, module constants, interned strings) are not counted
+
+# The tracemalloc figures can be written to a baseline file and later runs compared against it:
+#   python -m azul_backend.memory                              print the report
+#   python -m azul_backend.memory --update-baseline            record the figures as the baseline
+#   python -m azul_backend.memory --baseline FILE              also compare with the baseline,
+#                                                              exit with 1 if a stage has grown
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tracemalloc
+import types
+from enum import Enum
+from typing import Any, Callable, Iterable
+
+import azul_backend
+from azul_backend.factory import Factory
+from azul_backend.floor import Floor
+from azul_backend.game import Game
+from azul_backend.patternlines import PatternLines
+from azul_backend.tilebag import TileBag
+from azul_backend.tiles import ColourTile, P1Tile
+from azul_backend.wall import Wall
+
+BASELINE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmark_baseline.json"
+)
+BASELINE_TOLERANCE = 0.10  # A stage may grow by this share of its baseline before it is reported
+_PACKAGE_DIRECTORY = os.path.dirname(os.path.abspath(azul_backend.__file__))
+
+
+def _play_moves(game: Game, rng: random.Random, moves: int) -> None:
+    for _ in range(moves):
+        if game.is_game_over:
+            return
+        game.play_move(rng.choice(game.legal_moves()))
+
+
+def _play_rounds(game: Game, rng: random.Random, rounds: int) -> None:
+    target = game.rounds_played + rounds
+    while not game.is_game_over and game.rounds_played < target:
+        game.play_move(rng.choice(game.legal_moves()))
+
+
+def _play_to_end(game: Game, rng: random.Random) -> None:
+    while not game.is_game_over:
+        game.play_move(rng.choice(game.legal_moves()))
+
+
+# Stage name: how to play a new game to it, with random legal moves
+STAGES: dict[str, Callable[[Game, random.Random], None]] = {
+    "new_game": lambda game, rng: None,
+    "mid_round": lambda game, rng: _play_moves(game, rng, 4),
+    "second_round": lambda game, rng: _play_rounds(game, rng, 1),
+    "game_over": _play_to_end,
+}
+
+
+def _shared_objects() -> set[int]:
+    """
+    The ids of the objects reachable from the backend modules, which every game shares
+    """
+    shared: set[int] = set()
+    for name, module in list(sys.modules.items()):
+        if name == "azul_backend" or name.startswith("azul_backend."):
+            _walk(vars(module), shared)
+    return shared
+
+
+def _children(obj: Any) -> Iterable[Any]:
+    """
+    The objects an object holds references to, for deep sizing
+    """
+    if isinstance(obj, dict):
+        yield from obj.keys()
+        yield from obj.values()
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        yield from obj
+    elif isinstance(obj, types.MappingProxyType):
+        yield from obj.keys()
+        yield from obj.values()
+    if hasattr(obj, "__dict__") and not isinstance(obj, type):
+        yield vars(obj)
+    for cls in type(obj).__mro__:
+        for slot in getattr(cls, "__slots__", ()):
+            if hasattr(obj, slot):
+                yield getattr(obj, slot)
+
+
+def _never_counted(obj: Any) -> bool:
+    """
+    Objects that belong to the program rather than to a game
+    """
+    return isinstance(
+        obj,
+        (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+         types.MethodType, Enum),
+    ) or obj is None or isinstance(obj, bool)
+
+
+def _walk(obj: Any, seen: set[int]) -> int:
+    """
+    Adds up sys.getsizeof of an object and everything it refers to, skipping the ids in seen,
+    and adds the ids walked to seen
+    """
+    total = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or _never_counted(item):
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        stack.extend(_children(item))
+    return total
+
+
+def deep_size(obj: Any) -> int:
+    """
+    This function returns the bytes held by an object and everything it refers to,
+    not counting the objects the backend modules share between all games
+    """
+    return _walk(obj, _shared_objects())
+
+
+def component_sizes(game: Game) -> dict[str, int]:
+    """
+    This function returns the deep size of each component of a game, in bytes:
+    tiles, TileBag, Factory, Wall, PatternLines, Floor (every player added together) and Game,
+    the rest of the game. An object is only counted once, in the first of these that holds it
+    """
+    seen = _shared_objects()
+    components: dict[str, list[Any]] = {
+        "TileBag": [],
+        "Factory": [],
+        "Wall": [],
+        "PatternLines": [],
+        "Floor": [],
+    }
+    # The boards of the players are held in lists, one entry per player
+    values = [
+        item
+        for value in vars(game).values()
+        for item in (value if isinstance(value, list) else (value,))
+    ]
+    for value in values:
+        if isinstance(value, Factory):
+            components["Factory"].append(value)
+            components["TileBag"] += [
+                bag for bag in vars(value).values() if isinstance(bag, TileBag)
+            ]
+        for component in (Wall, PatternLines, Floor):
+            if isinstance(value, component):
+                components[component.__name__].append(value)
+
+    # The tiles are counted on their own, wherever they are held
+    tiles: list[Any] = []
+    found: set[int] = set(seen)
+    stack: list[Any] = [game]
+    while stack:
+        item = stack.pop()
+        if id(item) in found or _never_counted(item):
+            continue
+        found.add(id(item))
+        if isinstance(item, (ColourTile, P1Tile)):
+            tiles.append(item)
+        stack.extend(_children(item))
+
+    sizes = {"tiles": sum(_walk(tile, seen) for tile in tiles)}
+    for name, objects in components.items():
+        sizes[name] = sum(_walk(component, seen) for component in objects)
+    sizes["Game"] = _walk(game, seen)
+    sizes["total"] = sum(sizes.values())
+    return sizes
+
+
+def retained_per_game(
+    stage: str, games: int = 500, seed: int = 0
+) -> tuple[float, dict[str, float]]:
+    """
+    This function measures with tracemalloc the memory retained by a game at a stage.
+    It returns the bytes per game, and the bytes per game allocated by each backend module
+    """
+    play = STAGES[stage]
+    rng = random.Random(seed)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        held = []
+        for number in range(games):
+            game = Game(seed * games + number)
+            play(game, rng)
+            held.append(game)
+        gc.collect()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    by_module: dict[str, float] = {}
+    total = 0
+    for statistic in after.compare_to(before, "filename"):
+        total += statistic.size_diff
+        filename = statistic.traceback[0].filename
+        if (
+            os.path.dirname(os.path.abspath(filename)) == _PACKAGE_DIRECTORY
+            and os.path.abspath(filename) != os.path.abspath(__file__)  # The list of games held
+        ):
+            module = os.path.basename(filename)
+            by_module[module] = by_module.get(module, 0) + statistic.size_diff / games
+    del held
+    return total / games, dict(sorted(by_module.items(), key=lambda item: -item[1]))
+
+
+def memory_report(games: int = 500, seed: int = 0) -> dict[str, Any]:
+    """
+    This function measures every stage, and returns the results as a dictionary:
+    stage: {"retained": bytes per game (tracemalloc), "modules": bytes per game by module,
+            "components": deep sizes of one game by component}
+    """
+    report: dict[str, Any] = {}
+    for stage, play in STAGES.items():
+        retained, modules = retained_per_game(stage, games, seed)
+        game = Game(seed)
+        play(game, random.Random(seed))
+        report[stage] = {
+            "phase": game.show_game_state().name,
+            "retained": round(retained),
+            "modules": {module: round(size) for module, size in modules.items()},
+            "components": component_sizes(game),
+        }
+    return report
+
+
+def format_report(report: dict[str, Any]) -> str:
+    stages = list(report)
+    components = list(report[stages[0]]["components"])
+    width = max(map(len, stages)) + 2
+    lines = [
+        "Retained bytes per game (tracemalloc)",
+        *(f"  {stage:<{width}}{report[stage]['retained']:>8}  {report[stage]['phase']}"
+          for stage in stages),
+        "",
+        "Deep size by component (bytes)",
+        "  " + " " * 14 + "".join(f"{stage:>{width}}" for stage in stages),
+    ]
+    for component in components:
+        lines.append(
+            f"  {component:<14}"
+            + "".join(f"{report[stage]['components'][component]:>{width}}" for stage in stages)
+        )
+    lines += ["", "Retained bytes per game by module (tracemalloc)"]
+    modules = sorted({module for stage in stages for module in report[stage]["modules"]})
+    for module in modules:
+        lines.append(
+            f"  {module:<14}"
+            + "".join(f"{report[stage]['modules'].get(module, 0):>{width}}" for stage in stages)
+        )
+    return "\n".join(lines)
+
+
+def compare_with_baseline(
+    report: dict[str, Any], baseline: dict[str, Any], tolerance: float = BASELINE_TOLERANCE
+) -> list[str]:
+    """
+    This function returns a description of every stage whose retained bytes have grown by more than
+    tolerance over the baseline
+    """
+    regressions = []
+    for stage, recorded in baseline.get("stages", {}).items():
+        if stage in report and report[stage]["retained"] > recorded * (1 + tolerance):
+            regressions.append(
+                f"{stage}: {report[stage]['retained']} bytes per game, baseline {recorded}"
+            )
+    return regressions
+
+
+def _read_baselines(path: str) -> dict[str, Any]:
+    try:
+        with open(path) as baseline_file:
+            baselines: dict[str, Any] = json.load(baseline_file)
+            return baselines
+    except FileNotFoundError:
+        return {}
+
+
+def main(arguments: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure the memory held by Azul games")
+    parser.add_argument("--games", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", nargs="?", const=BASELINE_PATH, help="Compare with a baseline")
+    parser.add_argument("--update-baseline", nargs="?", const=BASELINE_PATH, help="Write the baseline")
+    parser.add_argument("--json", help="Write the report to this file")
+    options = parser.parse_args(arguments)
+
+    report = memory_report(options.games, options.seed)
+    print(format_report(report))
+    if options.json:
+        with open(options.json, "w") as output:
+            json.dump(report, output, indent=2)
+
+    status = 0
+    if options.baseline:
+        baseline = _read_baselines(options.baseline).get("memory")
+        if baseline is None:
+            print(f"\nNo memory baseline in {options.baseline}")
+        else:
+            regressions = compare_with_baseline(report, baseline)
+            print("\n" + ("\n".join(regressions) if regressions else "Within the baseline"))
+            status = 1 if regressions else 0
+
+    if options.update_baseline:
+        baselines = _read_baselines(options.update_baseline)
+        baselines["memory"] = {
+            "python": sys.version.split()[0],
+            "games": options.games,
+            "stages": {stage: report[stage]["retained"] for stage in report},
+        }
+        with open(options.update_baseline, "w") as output:
+            json.dump(baselines, output, indent=2)
+            output.write("\n")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
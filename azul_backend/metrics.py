@@ -0,0 +1,399 @@
+## File: metrics.py
+## Date: 2024-03-28
+## This module creates latency histograms and gauges of the engine, exported in Prometheus text format
+
+# GameMetrics listens to the engine calls of the games attached to it (Game.add_span_listener) and
+# records how long every make_factory_offer, place_on_patternlines and round transition
+# (wall tiling, penalties and preparing the next round) took, in LatencyHistograms.
+# It also reports gauges for the games attached (active games, games in each GameState phase)
+# and counts the refills of the tile bags.
+
+# LatencyHistogram is HDR style: values (nanoseconds) are counted in buckets whose width grows with
+# the value, so every value is recorded to within about 3% (significant_bits=5) in a fixed array,
+# a record is a few integer operations, and two histograms merge by adding their counts
+# (e.g the histograms of several host processes). A bucket includes its upper bound, as the `le`
+# buckets of Prometheus do, so a count of the durations up to a bucket boundary is exact.
+
+# The metrics are rendered in the Prometheus text format (render), for a scrape endpoint served
+# on a local port (serve) or for a file read by a textfile collector (dump):
+#   azul_engine_call_seconds             histogram, label call
+#   azul_engine_call_quantile_seconds    gauge, labels call and quantile, the HDR estimates
+#   azul_active_games                    gauge, attached games that are not over
+#   azul_games                           gauge, label phase, attached games in each GameState
+#   azul_bag_refills_total               counter
+
+import math
+import os
+import tempfile
+import threading
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import MappingProxyType
+from typing import Any, Iterable
+
+from azul_backend.game import Game
+from azul_backend.states import GameState
+
+# The engine calls recorded, by the name of their span. A round transition is the wall tiling
+CALLS: MappingProxyType[str, str] = MappingProxyType(
+    {
+        "make_factory_offer": "make_factory_offer",
+        "place_on_patternlines": "place_on_patternlines",
+        "wall_tiling": "round_transition",
+    }
+)
+QUANTILES: tuple[float, ...] = (0.5, 0.9, 0.99, 0.999)
+# Histogram buckets for the export, powers of two nanoseconds (about 1 microsecond to 17 seconds).
+# They are bucket boundaries of every LatencyHistogram, so their counts are exact
+_EXPORT_BOUNDS_NS: tuple[int, ...] = tuple(2**power for power in range(10, 35))
+
+
+class LatencyHistogram:
+    """
+    This class counts durations (in nanoseconds) in HDR style buckets
+
+    Args:
+        significant_bits (int): Buckets are 2**-significant_bits of their value wide, or narrower
+        highest_ns (int): Larger values are counted in the last bucket
+
+    Methods:
+        record: Counts a duration
+        merge: Adds the counts of another histogram with the same settings
+        quantile: Returns an estimate of a quantile, 0 to 1
+        count_at_most: The number of durations up to a power of two
+        count, total, max: Exact summaries of the durations recorded
+    """
+
+    _significant_bits: int
+    __sub_buckets: int
+    __half: int
+    __counts: list[int]
+    __count: int
+    __total: int
+    __max: int
+
+    def __init__(self, significant_bits: int = 5, highest_ns: int = 2**40) -> None:
+        """Create an empty histogram"""
+        if not isinstance(significant_bits, int) or not 1 <= significant_bits <= 16:
+            raise ValueError(f"{significant_bits} - significant_bits must be from 1 to 16")
+        self._significant_bits = significant_bits
+        self.__sub_buckets = 1 << significant_bits
+        self.__half = self.__sub_buckets >> 1
+        self.__counts = [0] * (self.__index(highest_ns) + 1)
+        self.__count = 0
+        self.__total = 0
+        self.__max = 0
+
+    def __index(self, value: int) -> int:
+        """
+        The bucket of a value: values up to 2**significant_bits have a bucket each,
+        above that every power of two is split into 2**(significant_bits - 1) buckets,
+        each holding the values above the bucket before it, up to and including its bound
+        """
+        if value <= self.__sub_buckets:
+            return value
+        value -= 1
+        shift = value.bit_length() - self._significant_bits
+        return self.__sub_buckets + 1 + (shift - 1) * self.__half + (value >> shift) - self.__half
+
+    def __highest(self, index: int) -> int:
+        """The largest value counted in a bucket, its bound"""
+        if index <= self.__sub_buckets:
+            return index
+        shift, offset = divmod(index - self.__sub_buckets, self.__half)
+        return (self.__half + offset) << (shift + 1)
+
+    def record(self, value_ns: int) -> None:
+        """
+        This method counts a duration, in nanoseconds
+        """
+        value_ns = max(0, value_ns)
+        self.__counts[min(self.__index(value_ns), len(self.__counts) - 1)] += 1
+        self.__count += 1
+        self.__total += value_ns
+        if value_ns > self.__max:
+            self.__max = value_ns
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        """
+        This method adds the counts of another histogram, with the same settings, to this one
+        """
+        if (
+            self._significant_bits != other._significant_bits
+            or len(self.__counts) != len(other.__counts)
+        ):
+            raise ValueError("Can only merge histograms with the same settings")
+        for index, count in enumerate(other.__counts):
+            if count:
+                self.__counts[index] += count
+        self.__count += other.__count
+        self.__total += other.__total
+        self.__max = max(self.__max, other.__max)
+
+    def quantile(self, q: float) -> float:
+        """
+        This method returns an estimate of a quantile (0 to 1) in nanoseconds, the middle of its
+        bucket. NaN if nothing has been recorded
+        """
+        if not 0 <= q <= 1:
+            raise ValueError(f"{q} - The quantile must be from 0 to 1")
+        if not self.__count:
+            return math.nan
+
+        rank = q * (self.__count - 1)
+        seen = 0
+        for index, count in enumerate(self.__counts):
+            seen += count
+            if seen > rank:
+                if not index:
+                    return 0.0
+                middle = (self.__highest(index - 1) + 1 + self.__highest(index)) / 2
+                return min(middle, self.__max)
+        return float(self.__max)
+
+    def count_at_most(self, bound_ns: int) -> int:
+        """
+        This method returns the number of durations of at most bound_ns, which must be a power
+        of two (the bound of a bucket, so the count is exact)
+        """
+        if bound_ns < 1 or bound_ns & (bound_ns - 1):
+            raise ValueError(f"{bound_ns} - The bound must be a power of two")
+        return sum(self.__counts[: self.__index(bound_ns) + 1])
+
+    @property
+    def count(self) -> int:
+        return self.__count
+
+    @property
+    def total(self) -> int:
+        """The sum of the durations, in nanoseconds"""
+        return self.__total
+
+    @property
+    def max(self) -> int:
+        return self.__max
+
+    def __len__(self) -> int:
+        """The number of durations recorded"""
+        return self.__count
+
+
+def _labels(**labels: str) -> str:
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels.items()) + "}"
+
+
+def _seconds(value_ns: float) -> str:
+    return "NaN" if math.isnan(value_ns) else repr(value_ns / 1e9)
+
+
+class GameMetrics:
+    """
+    This class records the latency of the engine calls of the games attached to it,
+    and renders them with the game gauges in Prometheus text format. Safe to share between threads
+
+    Methods:
+        attach: Starts recording a game
+        detach: Stops recording a game
+        histogram: Returns the latency histogram of a call
+        merge: Adds the histograms and refills of another GameMetrics
+        render: Returns the metrics in Prometheus text format
+        dump: Writes the metrics to a file, atomically
+        serve: Serves the metrics over HTTP on a local port, from a background thread
+    """
+
+    __histograms: dict[str, LatencyHistogram]
+    __games: "weakref.WeakKeyDictionary[Game, Any]"
+    __refills_seen: "weakref.WeakKeyDictionary[Game, int]"
+    __refills: int
+    __lock: threading.Lock
+
+    def __init__(self) -> None:
+        self.__histograms = {call: LatencyHistogram() for call in CALLS.values()}
+        self.__games = weakref.WeakKeyDictionary()
+        self.__refills_seen = weakref.WeakKeyDictionary()
+        self.__refills = 0
+        self.__lock = threading.Lock()
+
+    def attach(self, game: Game) -> None:
+        """
+        This method starts recording the engine calls of a game, and counting it in the gauges.
+        A game is detached when it is garbage collected
+        """
+        with self.__lock:
+            if game in self.__games:
+                return
+            histograms = self.__histograms
+            reference = weakref.ref(game)  # The listener must not keep the game alive
+
+            def listener(name: str, details: MappingProxyType[str, Any]) -> None:
+                call = CALLS.get(name)
+                if call is not None:
+                    with self.__lock:
+                        histograms[call].record(details["duration_ns"])
+                if name == "prepare_next_round":
+                    attached = reference()
+                    if attached is not None:
+                        self.__count_refills(attached)
+
+            self.__games[game] = listener
+            self.__refills_seen[game] = game.show_bag_refills()
+        game.add_span_listener(listener)
+
+    def detach(self, game: Game) -> None:
+        """
+        This method stops recording a game
+        """
+        with self.__lock:
+            listener = self.__games.pop(game, None)
+            self.__refills_seen.pop(game, None)
+        if listener is not None:
+            game.remove_span_listener(listener)
+
+    def __count_refills(self, game: Game) -> None:
+        """
+        Adds the refills of a game's bag since they were last counted
+        """
+        refills = game.show_bag_refills()
+        with self.__lock:
+            seen = self.__refills_seen.get(game, refills)
+            self.__refills += max(0, refills - seen)  # The count restarts when a game is reset
+            self.__refills_seen[game] = refills
+
+    def histogram(self, call: str) -> LatencyHistogram:
+        """
+        This method returns the histogram of a call: make_factory_offer, place_on_patternlines
+        or round_transition. It is live, not a copy
+        """
+        if call not in self.__histograms:
+            raise ValueError(f"{call} - Unknown call, must be one of {', '.join(self.__histograms)}")
+        return self.__histograms[call]
+
+    def merge(self, other: "GameMetrics") -> None:
+        """
+        This method adds the histograms and bag refills of another GameMetrics to this one.
+        The gauges describe the games attached, so they are not merged
+        """
+        if other is self:
+            raise ValueError("A GameMetrics can not be merged into itself")
+        with self.__lock, other.__lock:
+            for call, histogram in other.__histograms.items():
+                self.__histograms[call].merge(histogram)
+            self.__refills += other.__refills
+
+    def __getstate__(self) -> dict[str, Any]:
+        """
+        Only the histograms and refills are pickled (e.g to merge them from worker processes)
+        """
+        with self.__lock:
+            return {"histograms": self.__histograms, "refills": self.__refills}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__init__()  # type: ignore[misc]
+        self.__histograms = state["histograms"]
+        self.__refills = state["refills"]
+
+    def render(self) -> str:
+        """
+        This method returns the metrics in the Prometheus text exposition format
+        """
+        with self.__lock:
+            games = list(self.__games)
+            lines = [
+                "# HELP azul_engine_call_seconds Duration of engine calls",
+                "# TYPE azul_engine_call_seconds histogram",
+            ]
+            for call, histogram in self.__histograms.items():
+                for bound in _EXPORT_BOUNDS_NS:
+                    lines.append(
+                        f"azul_engine_call_seconds_bucket{_labels(call=call, le=_seconds(bound))} "
+                        f"{histogram.count_at_most(bound)}"
+                    )
+                lines += [
+                    f"azul_engine_call_seconds_bucket{_labels(call=call, le='+Inf')} {histogram.count}",
+                    f"azul_engine_call_seconds_sum{_labels(call=call)} {_seconds(histogram.total)}",
+                    f"azul_engine_call_seconds_count{_labels(call=call)} {histogram.count}",
+                ]
+
+            lines += [
+                "# HELP azul_engine_call_quantile_seconds Quantiles of the duration of engine calls",
+                "# TYPE azul_engine_call_quantile_seconds gauge",
+            ]
+            for call, histogram in self.__histograms.items():
+                for q in QUANTILES:
+                    lines.append(
+                        f"azul_engine_call_quantile_seconds{_labels(call=call, quantile=str(q))} "
+                        f"{_seconds(histogram.quantile(q))}"
+                    )
+            refills = self.__refills
+
+        phases = {phase: 0 for phase in GameState}
+        for game in games:
+            phases[game.show_game_state()] += 1
+        lines += [
+            "# HELP azul_active_games Attached games that are not over",
+            "# TYPE azul_active_games gauge",
+            f"azul_active_games {len(games) - phases[GameState.GAMEOVER]}",
+            "# HELP azul_games Attached games in each phase",
+            "# TYPE azul_games gauge",
+            *(
+                f"azul_games{_labels(phase=phase.name)} {count}"
+                for phase, count in phases.items()
+            ),
+            "# HELP azul_bag_refills_total Refills of the tile bags of the attached games",
+            "# TYPE azul_bag_refills_total counter",
+            f"azul_bag_refills_total {refills}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str) -> None:
+        """
+        This method writes the metrics to a file, e.g for the node exporter's textfile collector.
+        The file is replaced in one step, so a reader never sees half of it
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        handle, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "w") as output:
+                output.write(self.render())
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def serve(self, port: int = 9464, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """
+        This method serves the metrics at http://host:port/metrics from a background thread,
+        and returns the server (call shutdown to stop it)
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass  # Scrapes are too frequent to log
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(
+            target=server.serve_forever, name="GameMetrics", daemon=True
+        ).start()
+        return server
+
+
+def merged(metrics: Iterable[GameMetrics]) -> GameMetrics:
+    """
+    This function returns a new GameMetrics with the histograms and refills of several added up
+    """
+    total = GameMetrics()
+    for other in metrics:
+        total.merge(other)
+    return total
@@ -5,9 +5,12 @@
 # For making the dictionaries immutable when showing contents to the user
 from types import MappingProxyType
 from collections import deque
-from azul_backend.tiles import P1Tile, ColourTile
+from typing import Any
+from azul_backend.tiles import P1Tile, ColourTile, TILE_CODES, TILE_TYPES
 from textwrap import dedent
 
+_EMPTY_LINE = ("", 0, False)  # The fill of an empty pattern line
+
 
 class PatternLines:
     """
@@ -22,11 +25,16 @@ class PatternLines:
         get_possible_moves: returns a tuple of possible moves for a specified line
         select_tile_for_wall: selects a tile from the pattern line to be placed on the wall
         clean_pattern_lines: clears any empty spaces on the pattern lines
+        show_line_fill: returns the colour and number of tiles on a pattern line
     """
 
     # Unlike tiles, I wish to allow the contents of my dictionary to change
     __player_patternlines: dict[str, deque[ColourTile | None]]
-    __line_colours: dict[str, str]
+    # The fill of each line: (colour of its tiles, "" if empty, number of tiles, True once complete).
+    # A complete line stays complete when its tile goes to the wall, until it is cleaned
+    __line_fill: dict[str, tuple[str, int, bool]]
+    # The immutable view handed out by show_pattern_lines. None when a line has changed since it was built
+    _cached_view: MappingProxyType[str, tuple[ColourTile | None, ...]] | None
 
     def __init__(self) -> None:
         """
@@ -43,16 +51,25 @@ class PatternLines:
             "line5": deque([None] * 5, maxlen=5),
         }
 
-        self.__line_state = {
-            "line1": "",
-            "line2": "",
-            "line3": "",
-            "line4": "",
-            "line5": "",
-        }
+        self.__line_fill = dict.fromkeys(self.__player_patternlines, _EMPTY_LINE)
+        self._cached_view = None
+
+    # Protected, only used by Game when a game is reset
+    def _reinitialise(self) -> None:
+        """
+        This method empties every pattern line in place
+        """
+        for line, pattern_line in self.__player_patternlines.items():
+            for i in range(len(pattern_line)):
+                pattern_line[i] = None
+            self.__line_fill[line] = _EMPTY_LINE
+        self._cached_view = None
 
     def place_on_patternlines(
-        self, hand: deque[ColourTile | P1Tile] | ColourTile, line: str
+        self,
+        hand: deque[ColourTile | P1Tile] | ColourTile,
+        line: str,
+        validate: bool = True,
     ) -> deque[ColourTile | P1Tile]:
         """
         Place the supplied tiles on the pattern line.
@@ -61,30 +78,34 @@ class PatternLines:
         ARGS:
             hand: deque[ColourTile | P1Tile] - The tiles to be placed on the pattern line
             line: str - The line to place the tiles on
+            validate: bool - OPTIONAL: If False the checks on the hand and the line are skipped,
+                for trusted callers whose moves are known to be legal
         """
         if isinstance(hand, (ColourTile)):
             hand = deque([hand])  # Convert to deque if single tile
 
         # Is hand empty
-        if not hand:
+        if validate and not hand:
             raise ValueError("You have not passed any tiles")
 
         pattern_line = self.__player_patternlines[line]
+        colour, count, full = self.__line_fill[line]
         # If there's already tiles on the pattern line, you can only add tiles of the same type and colour
         # Need to be careful not to check the Player1 tile
 
         # If the pattern line is full, you can't add any more tiles
-        if self.__line_state[line] == "full":  # If the line is full
+        if validate and full:
             raise ValueError("This pattern line is full")
 
-        if self.__line_state[line] != "":  # If the pattern line is not empty
+        if validate and colour != "":  # If the pattern line is not empty
             for tile in hand:
                 if tile.get_tile_type() != "player1":
-                    if tile.get_tile_type() != self.__line_state[line]:
+                    if tile.get_tile_type() != colour:
                         raise ValueError(
                             "You can only add tiles of the same type to the pattern line"
                         )
 
+        self._cached_view = None
         return_hand: deque[ColourTile | P1Tile] = deque([], maxlen=16)
         # We have space on the pattern line so append from the right
         for tile in hand:
@@ -96,12 +117,10 @@ class PatternLines:
                 # Checking if this is a Colour_Tile to satisy MyPy
                 pattern_line.popleft()  # take off an empty space
                 pattern_line.append(tile)
-                if pattern_line[0] is not None:
-                    self.__line_state[line] = "full"
-                else:
-                    self.__line_state[line] = (
-                        tile.get_tile_type()
-                    )  # mark as full or reserved of a particular colour
+                colour = tile.get_tile_type()
+                count += 1
+                # mark as full or reserved of a particular colour
+                self.__line_fill[line] = (colour, count, pattern_line[0] is not None)
             else:
                 return_hand.append(tile)
 
@@ -114,23 +133,23 @@ class PatternLines:
         This method returns the pattern lines of the specified player
         In the form of a MappingProxyType (an immutable dictionary).
         Internal deques are converted to tuples for immutability
+        The view is built once and reused until a pattern line next changes
         """
-        tuple_dict_patternlines = {
-            key: tuple(value)
-            for key, value in self.__player_patternlines.items()
-        }
+        if self._cached_view is None:
+            tuple_dict_patternlines = {
+                key: tuple(value)
+                for key, value in self.__player_patternlines.items()
+            }
 
-        # I have chosen to use MappingProxyType to make the dictionary immutable
-        return MappingProxyType(tuple_dict_patternlines)
+            # I have chosen to use MappingProxyType to make the dictionary immutable
+            self._cached_view = MappingProxyType(tuple_dict_patternlines)
+        return self._cached_view
 
     def is_patternline_complete(self, line: str) -> bool:
         """
         This method checks if a pattern line is complete and returns a boolean
         """
-        if self.__line_state[line] == "full":
-            return True
-        else:
-            return False
+        return self.__line_fill[line][2]
 
     def get_possible_moves(self, line: str) -> tuple[str, ...]:
         """
@@ -138,12 +157,21 @@ class PatternLines:
         .i.e does not take into account wall tiles
         """
         possible_moves = tuple(["blue", "yellow", "red", "black", "white"])
-        if self.__line_state[line] == "":
-            return possible_moves
-        elif self.__line_state[line] == "full":
+        colour, _, full = self.__line_fill[line]
+        if full:
             return ()
+        elif colour == "":
+            return possible_moves
         else:
-            return tuple([self.__line_state[line]])
+            return tuple([colour])
+
+    def show_line_fill(self, line: str) -> tuple[str, int]:
+        """
+        This method returns the colour of the tiles on a pattern line ("" if it is empty)
+        and the number of tiles on it, e.g ("blue", 2)
+        """
+        colour, count, _ = self.__line_fill[line]
+        return colour, count
 
     def select_tile_for_wall(self, line: str) -> ColourTile | None:
         """
@@ -154,10 +182,13 @@ class PatternLines:
         If the pattern line is not complete, the method will return None
         """
         # Not raising an error, but instead doing nothing if the pattern line is not complete
-        if self.is_patternline_complete(line):
+        colour, count, full = self.__line_fill[line]
+        if full:
             pattern_line = self.__player_patternlines[line]
             tile = pattern_line[-1]
             pattern_line[-1] = None  # Remove the tile from the pattern line
+            self.__line_fill[line] = (colour, count - 1, True)
+            self._cached_view = None
             return tile
         else:
             return None
@@ -176,7 +207,56 @@ class PatternLines:
                     [None for _ in self.__player_patternlines[line]]
                 )
                 self.__player_patternlines[line] = none_list
-                self.__line_state[line] = ""
+                self.__line_fill[line] = _EMPTY_LINE
+                self._cached_view = None
+
+    STATE_SIZE = 10  # Colour code and count of each line
+    # Set on the count of a complete line whose tile has gone to the wall, but has not been cleaned.
+    # Only seen at the end of a game, as the lines are cleaned when the next round is prepared
+    _TILED_FLAG = 0x80
+
+    # Protected, used by Game to pack the state of a game
+    def _export_state(self) -> bytes:
+        """
+        This method returns the state of the pattern lines as bytes
+        """
+        state = bytearray()
+        for line, pattern_line in self.__player_patternlines.items():
+            colour, count, full = self.__line_fill[line]
+            if full and pattern_line[-1] is None:
+                count |= self._TILED_FLAG
+            state += bytes((TILE_CODES[colour] if colour else 0, count))
+        return bytes(state)
+
+    # Protected, used by Game to restore a packed game
+    def _import_state(self, state: bytes) -> None:
+        """
+        This method restores the pattern lines from the bytes of _export_state, in place
+        """
+        for i, (line, pattern_line) in enumerate(self.__player_patternlines.items()):
+            code, count = state[2 * i], state[2 * i + 1]
+            tiled = bool(count & self._TILED_FLAG)
+            count &= ~self._TILED_FLAG
+            colour = TILE_TYPES[code] if code else ""
+
+            tiles: list[ColourTile | None] = [ColourTile(colour) for _ in range(count)]
+            if tiled:
+                tiles.append(None)
+            self.__player_patternlines[line] = deque(
+                [None] * (len(pattern_line) - len(tiles)) + tiles,
+                maxlen=len(pattern_line),
+            )
+            self.__line_fill[line] = (colour, count, tiled or count == len(pattern_line))
+        self._cached_view = None
+
+    def __getstate__(self) -> dict[str, Any]:
+        """
+        The cached view is left out when the pattern lines are copied or pickled
+        (MappingProxyType can not be pickled). It is rebuilt on demand
+        """
+        state = self.__dict__.copy()
+        state["_cached_view"] = None
+        return state
 
     def __str__(self) -> str:
         """
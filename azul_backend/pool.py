@@ -0,0 +1,120 @@
+## File: pool.py
+## Date: 2024-03-09
+## This module creates a pool of reusable Game objects
+
+# Creating a Game allocates a Factory, a TileBag, and a Wall, PatternLines and Floor for each player.
+# Simulators that play game after game spend a noticeable share of their time creating these
+# objects and collecting them again. GamePool hands out games and takes them back when they are
+# finished, and Game.reset makes a returned game as good as new.
+# A pool holds games of one kind (number of players, and whether moves are validated), so a game
+# handed out is always the kind asked for. Listeners are removed from a game when it is released,
+# so they do not hear the games played by its next user.
+
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator
+
+from azul_backend.game import Game
+
+
+class GamePool:
+    """
+    This class hands out reusable games and recycles them once they are released.
+    It is safe to share between threads.
+
+    Args:
+        max_size (int): The largest number of idle games kept for reuse
+        players (int): OPTIONAL: The number of players of the games, 2 by default
+        validate (bool): OPTIONAL: The validate argument of the games (see Game), True by default
+
+    Methods:
+        acquire: Returns a game at the start of a new game
+        release: Returns a game to the pool
+        game: Context manager that acquires a game and releases it afterwards
+        __len__: The number of idle games in the pool
+    """
+
+    _max_size: int
+    _players: int
+    _validate: bool
+    __idle: deque[Game]
+    __lock: threading.Lock
+
+    def __init__(self, max_size: int = 64, players: int = 2, validate: bool = True) -> None:
+        """Create an empty pool"""
+        if not isinstance(max_size, int) or max_size < 0:
+            raise ValueError(f"{max_size} - max_size must be a non-negative int")
+        if players not in Game.STATE_SIZES:
+            raise ValueError(
+                f"{players} - Invalid number of players, must be from "
+                f"{min(Game.STATE_SIZES)} to {max(Game.STATE_SIZES)}"
+            )
+
+        self._max_size = max_size
+        self._players = players
+        self._validate = validate
+        self.__idle = deque()
+        self.__lock = threading.Lock()
+
+    def acquire(self, seed: int | None = None) -> Game:
+        """
+        This method returns a game at the start of a new game.
+        An idle game is reset and reused if there is one, otherwise a new game is created
+
+        Args:
+            seed (int): OPTIONAL: Seed for the tile bag, for reproducible games
+        """
+        with self.__lock:
+            game = self.__idle.pop() if self.__idle else None
+
+        if game is None:
+            return Game(seed, validate=self._validate, players=self._players)
+
+        game.reset(seed)
+        return game
+
+    def release(self, game: Game) -> None:
+        """
+        This method returns a game to the pool. The game must not be used after it is released.
+        Its listeners are removed. If the pool is full, the game is left for the garbage collector
+        """
+        if not isinstance(game, Game):
+            raise ValueError(f"{game} - Only Game objects can be released to the pool")
+        if (
+            game.show_number_of_players() != self._players
+            or game.show_validate() != self._validate
+        ):
+            raise ValueError(
+                f"The pool holds {self._players} player games with validate={self._validate}, "
+                f"this game has {game.show_number_of_players()} players "
+                f"with validate={game.show_validate()}"
+            )
+
+        game._clear_listeners()
+        with self.__lock:
+            if len(self.__idle) < self._max_size and not any(
+                idle is game for idle in self.__idle
+            ):
+                self.__idle.append(game)
+
+    @contextmanager
+    def game(self, seed: int | None = None) -> Iterator[Game]:
+        """
+        Context manager that acquires a game, and releases it when the block ends
+
+        with pool.game() as game:
+            ...
+        """
+        game = self.acquire(seed)
+        try:
+            yield game
+        finally:
+            self.release(game)
+
+    def __len__(self) -> int:
+        """
+        The number of idle games in the pool
+        """
+        with self.__lock:
+            return len(self.__idle)
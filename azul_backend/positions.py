@@ -0,0 +1,482 @@
+## File: positions.py
+## Date: 2024-03-20
+## This module creates an on disk database of positions, keyed by a hash of the position
+
+# Self-play reaches the same positions again and again, especially early in a game. PositionDB keeps
+# one entry per position, however often it is seen:
+#   visits, and the outcomes of the games that went through it (wins, draws and losses
+#   of the player to move, and the sum of their final score margins)
+#   the best known moves: up to MOVE_SLOTS moves with the most visits, and the mean margin of each
+# It works as an opening book for bots (best_move), and as a dedup layer for training data (seen).
+
+# The key of a position is a 16 byte hash of its canonical form (see canonical.py), from the
+# perspective of the player to move. It leaves out the hidden order of the bag, the move counters,
+# the order of the factories and of the tiles within them, so games reached by different seeds
+# and moves, with the factories in any order, share entries. Moves are stored in the canonical
+# factory numbering, and translated back to the numbering of the game when they are looked up.
+
+# Files, in the database directory:
+#   log.<n>: append-only entries. An update appends a new version of the entry, so an entry that is
+#       being read is never written to. Old versions are dropped by compact
+#   index.<n>: an open addressing hash table of (key, offset of the latest version in the log).
+#       Rebuilt twice the size when it is 60% full
+#   CURRENT: the names of the log and index in use. Replaced (atomically) after a new log or
+#       index has been written completely
+# Readers memory map the log and index named in CURRENT, and map them again when CURRENT changes.
+# An index slot is written key first, then its offset, and only after its entry is in the log,
+# so readers in other processes never see a half written entry. There must only be one writer.
+
+import mmap
+import os
+import struct
+from types import MappingProxyType
+from typing import Any
+
+from azul_backend.actions import decode_action, encode_move
+from azul_backend.canonical import canonical_key, canonical_move, original_move
+from azul_backend.game import Game
+from azul_backend.replay import GameRecord
+
+KEY_SIZE: int = 16
+MOVE_SLOTS: int = 4  # Best known moves kept per position
+
+_LOG_HEADER = b"AZPLOG02"  # 02: two byte action ids, for games of up to 4 players
+_INDEX_MAGIC = b"AZPIDX01"
+_INDEX_HEADER = struct.Struct("<8sQQ")  # magic, capacity, number of entries
+_SLOT = struct.Struct(f"<{KEY_SIZE}sQ")  # key, offset of the entry in the log (0 is empty)
+# key, visits, wins, draws, losses, margin sum, then (action id, visits, value sum) for each move slot
+_ENTRY = struct.Struct(f"<{KEY_SIZE}sIIIId" + "HIf" * MOVE_SLOTS)
+_NO_MOVE = 0xFFFF  # An empty move slot, outside the action ids (actions.ACTION_COUNT)
+_MAX_LOAD = 0.6
+_INITIAL_CAPACITY = 1024
+
+
+def position_key(game: Game) -> bytes:
+    """
+    This function returns the key of the position of a game, a 16 byte hash
+    """
+    return canonical_key(game, perspective=True, digest_size=KEY_SIZE)
+
+
+class PositionDB:
+    """
+    This class stores statistics for each position seen, on disk
+
+    Args:
+        directory (str): The directory of the database. Created if it does not exist, unless read only
+        readonly (bool): OPTIONAL: Open for reading only. Any number of processes can read,
+            while one process writes
+
+    Methods:
+        update: Records one visit to a position, with the outcome and the move played
+        add_game: Records every position of a finished game
+        lookup: Returns the statistics of a position, or None if it has not been seen
+        best_move: Returns the best known move of a position, or None
+        seen: Returns True if a position has been seen
+        compact: Rewrites the log without old versions of entries
+        refresh: Maps the latest files, if the writer has replaced them
+        close: Closes the files
+        __len__: The number of positions stored
+    """
+
+    _directory: str
+    _readonly: bool
+    __current: tuple[str, str]
+    __current_mtime: int
+    __log_file: Any
+    __log_map: mmap.mmap | None
+    __index_file: Any
+    __index_map: mmap.mmap | None
+    __capacity: int
+    __count: int
+
+    def __init__(self, directory: str, readonly: bool = False) -> None:
+        """Open a database, creating it if needed"""
+        self._directory = directory
+        self._readonly = readonly
+        self.__log_file = None
+        self.__log_map = None
+        self.__index_file = None
+        self.__index_map = None
+
+        if not os.path.exists(self.__path("CURRENT")):
+            if readonly:
+                raise ValueError(f"{directory} - No position database here")
+            os.makedirs(directory, exist_ok=True)
+            with open(self.__path("log.0"), "wb") as file:
+                file.write(_LOG_HEADER)
+            self.__write_index("index.0", _INITIAL_CAPACITY, [])
+            self.__write_current(("log.0", "index.0"))
+
+        self.__open()
+
+    # -READING---------------------------------------------------------------------------------
+
+    def lookup(self, game: Game) -> MappingProxyType[str, Any] | None:
+        """
+        This method returns the statistics of the position of a game, as an immutable dictionary
+            visits, wins, draws, losses: for the player to move
+            mean_margin: the mean final score margin of the player to move
+            moves: ((move, visits, mean margin), ...) the best known moves, most visited first
+        None if the position has not been seen
+        """
+        entry = self.__read(position_key(game))
+        if entry is None:
+            return None
+
+        _, visits, wins, draws, losses, margin_sum, *slots = entry
+        moves = sorted(
+            (
+                (original_move(game, action_id), move_visits, value_sum / move_visits)
+                for action_id, move_visits, value_sum in zip(*[iter(slots)] * 3)
+                if action_id != _NO_MOVE and move_visits
+            ),
+            key=lambda move: -move[1],
+        )
+        return MappingProxyType(
+            {
+                "visits": visits,
+                "wins": wins,
+                "draws": draws,
+                "losses": losses,
+                "mean_margin": margin_sum / visits if visits else 0.0,
+                "moves": tuple(moves),
+            }
+        )
+
+    def best_move(
+        self, game: Game, min_visits: int = 1
+    ) -> tuple[int, str, str | None] | None:
+        """
+        This method returns the most visited known move of a position, if it has been
+        visited at least min_visits times and is legal. Otherwise None
+        """
+        stats = self.lookup(game)
+        if stats is None:
+            return None
+        legal_moves = set(game.legal_moves())
+        for move, visits, _ in stats["moves"]:
+            if visits >= min_visits and move in legal_moves:
+                return move
+        return None
+
+    def seen(self, game: Game) -> bool:
+        """
+        This method returns True if the position of a game has been seen before
+        """
+        return self.__read(position_key(game)) is not None
+
+    def refresh(self) -> None:
+        """
+        This method maps the latest log and index, if the writer has replaced them.
+        Readers call it before every lookup, it is cheap when nothing has changed
+        """
+        if os.stat(self.__path("CURRENT")).st_mtime_ns != self.__current_mtime:
+            if self.__read_current() != self.__current:
+                self.__close_files()
+                self.__open()
+
+    def __len__(self) -> int:
+        """The number of positions stored"""
+        self.refresh()
+        assert self.__index_map is not None
+        return _INDEX_HEADER.unpack_from(self.__index_map)[2]
+
+    # -WRITING---------------------------------------------------------------------------------
+
+    def update(
+        self,
+        game: Game,
+        margin: int,
+        move: tuple[int, str, str | None] | int | None = None,
+    ) -> None:
+        """
+        This method records one visit to the position of a game
+
+        Args:
+            game (Game): The game, at the position visited
+            margin (int): The final score of the player to move, less the best final score
+                of the other players
+            move (tuple[int, str, str | None] | int): OPTIONAL: The move played from the position,
+                in the factory numbering of the game
+        """
+        self.__check_writable()
+        if move is not None:
+            move = canonical_move(game, move)
+        self.__update(position_key(game), margin, move)
+
+    def add_game(self, record: GameRecord) -> int:
+        """
+        This method records every position of a finished game, with the move played from it.
+        Returns the number of positions that had not been seen before
+        """
+        self.__check_writable()
+        game = Game(record.seed, players=record.players)
+        keys = []
+        for action_id in record.moves:
+            keys.append(
+                (
+                    position_key(game),
+                    game.show_current_player(),
+                    encode_move(canonical_move(game, action_id)),
+                )
+            )
+            game.play_move(decode_action(action_id))
+        if not game.is_game_over:
+            raise ValueError("Only finished games can be added")
+
+        final = {
+            player: game.show_score(player)
+            for player in range(Game.PLAYER_1, record.players + 1)
+        }
+        # The margin of each player is their final score less the best final score of the others
+        margins = {
+            player: score - max(other for p, other in final.items() if p != player)
+            for player, score in final.items()
+        }
+        new = 0
+        for key, player, action_id in keys:
+            new += self.__read(key) is None
+            self.__update(key, margins[player], action_id)
+        return new
+
+    def compact(self) -> None:
+        """
+        This method writes a new log holding only the latest version of each entry,
+        with a new index, then switches to them. Readers move to the new files on their next refresh
+        """
+        self.__check_writable()
+        log_name, index_name = self.__current
+        log_number = int(log_name.split(".")[1]) + 1
+        index_number = int(index_name.split(".")[1]) + 1
+        new_log, new_index = f"log.{log_number}", f"index.{index_number}"
+
+        slots = []
+        with open(self.__path(new_log), "wb") as file:
+            file.write(_LOG_HEADER)
+            for key, offset in self.__slots():
+                slots.append((key, file.tell()))
+                file.write(self.__entry_bytes(offset))
+        self.__write_index(new_index, self.__capacity, slots)
+        self.__switch((new_log, new_index), (log_name, index_name))
+
+    def close(self) -> None:
+        """
+        This method closes the files of the database
+        """
+        self.__close_files()
+
+    def __enter__(self) -> "PositionDB":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    # -PRIVATE---------------------------------------------------------------------------------
+
+    def __path(self, name: str) -> str:
+        return os.path.join(self._directory, name)
+
+    def __read_current(self) -> tuple[str, str]:
+        with open(self.__path("CURRENT")) as file:
+            log_name, index_name = file.read().split()
+        return log_name, index_name
+
+    def __write_current(self, current: tuple[str, str]) -> None:
+        with open(self.__path("CURRENT.tmp"), "w") as file:
+            file.write(" ".join(current))
+        os.replace(self.__path("CURRENT.tmp"), self.__path("CURRENT"))
+
+    def __open(self) -> None:
+        """
+        Opens and maps the log and index named in CURRENT
+        """
+        self.__current_mtime = os.stat(self.__path("CURRENT")).st_mtime_ns
+        self.__current = self.__read_current()
+        log_name, index_name = self.__current
+        mode, access = ("rb", mmap.ACCESS_READ) if self._readonly else ("r+b", mmap.ACCESS_WRITE)
+
+        self.__log_file = open(self.__path(log_name), mode)
+        self.__log_map = None
+        if self.__log_file.read(len(_LOG_HEADER)) != _LOG_HEADER:
+            raise ValueError(f"{log_name} - Not a position log, or written by an older version")
+        self.__index_file = open(self.__path(index_name), mode)
+        self.__index_map = mmap.mmap(self.__index_file.fileno(), 0, access=access)
+        magic, self.__capacity, self.__count = _INDEX_HEADER.unpack_from(self.__index_map)
+        if magic != _INDEX_MAGIC:
+            raise ValueError(f"{index_name} - Not a position index")
+
+    def __close_files(self) -> None:
+        for mapped in (self.__log_map, self.__index_map):
+            if mapped is not None:
+                mapped.close()
+        for file in (self.__log_file, self.__index_file):
+            if file is not None:
+                file.close()
+        self.__log_map = self.__index_map = None
+        self.__log_file = self.__index_file = None
+
+    def __check_writable(self) -> None:
+        if self._readonly:
+            raise RuntimeError("The position database was opened read only")
+
+    def __find(self, key: bytes) -> tuple[int, int]:
+        """
+        Returns (slot number, offset) of a key in the index.
+        The offset is 0 if the key is not there, and the slot is where it would go
+        """
+        assert self.__index_map is not None
+        mask = self.__capacity - 1
+        slot = int.from_bytes(key[:8], "little") & mask
+        while True:
+            slot_key, offset = _SLOT.unpack_from(
+                self.__index_map, _INDEX_HEADER.size + slot * _SLOT.size
+            )
+            if offset == 0 or slot_key == key:
+                return slot, offset
+            slot = (slot + 1) & mask
+
+    def __entry_bytes(self, offset: int) -> bytes:
+        """
+        Returns the bytes of the log entry at offset. The log is mapped again if it has grown
+        """
+        if self.__log_map is None or offset + _ENTRY.size > len(self.__log_map):
+            if self.__log_map is not None:
+                self.__log_map.close()
+            self.__log_map = mmap.mmap(
+                self.__log_file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        return self.__log_map[offset : offset + _ENTRY.size]
+
+    def __read(self, key: bytes) -> tuple[Any, ...] | None:
+        """
+        Returns the unpacked entry of a key, None if it is not in the database
+        """
+        if self._readonly:
+            self.refresh()
+        _, offset = self.__find(key)
+        if offset == 0:
+            return None
+        return _ENTRY.unpack(self.__entry_bytes(offset))
+
+    def __update(
+        self, key: bytes, margin: int, move: tuple[int, str, str | None] | int | None
+    ) -> None:
+        """
+        Appends a new version of the entry of a key, with one more visit
+        """
+        action_id = encode_move(move) if isinstance(move, tuple) else move
+        slot, offset = self.__find(key)
+        if offset:
+            _, visits, wins, draws, losses, margin_sum, *moves = _ENTRY.unpack(
+                self.__entry_bytes(offset)
+            )
+        else:
+            visits = wins = draws = losses = 0
+            margin_sum = 0.0
+            moves = [_NO_MOVE, 0, 0.0] * MOVE_SLOTS
+
+        visits += 1
+        wins += margin > 0
+        draws += margin == 0
+        losses += margin < 0
+        margin_sum += margin
+        if action_id is not None:
+            self.__count_move(moves, action_id, margin)
+
+        self.__log_file.seek(0, os.SEEK_END)
+        new_offset = self.__log_file.tell()
+        self.__log_file.write(
+            _ENTRY.pack(key, visits, wins, draws, losses, margin_sum, *moves)
+        )
+        self.__log_file.flush()
+
+        assert self.__index_map is not None
+        position = _INDEX_HEADER.size + slot * _SLOT.size
+        if not offset:
+            self.__index_map[position : position + KEY_SIZE] = key
+        self.__index_map[position + KEY_SIZE : position + _SLOT.size] = new_offset.to_bytes(
+            8, "little"
+        )
+        if not offset:
+            self.__count += 1
+            _INDEX_HEADER.pack_into(
+                self.__index_map, 0, _INDEX_MAGIC, self.__capacity, self.__count
+            )
+            if self.__count > self.__capacity * _MAX_LOAD:
+                self.__grow()
+
+    @staticmethod
+    def __count_move(moves: list[Any], action_id: int, margin: int) -> None:
+        """
+        Counts a move in the move slots of an entry (flat list of action id, visits, value sum).
+        When every slot is taken, a new move replaces the least visited one and inherits
+        its visits (the space saving algorithm), so a move that keeps being played rises to the top
+        """
+        slots = range(0, 3 * MOVE_SLOTS, 3)
+        for i in slots:
+            if moves[i] == action_id:
+                moves[i + 1] += 1
+                moves[i + 2] += margin
+                return
+        for i in slots:
+            if moves[i] == _NO_MOVE:
+                moves[i : i + 3] = [action_id, 1, float(margin)]
+                return
+        i = min(slots, key=lambda i: moves[i + 1])
+        mean = moves[i + 2] / moves[i + 1]
+        moves[i : i + 3] = [action_id, moves[i + 1] + 1, mean * moves[i + 1] + margin]
+
+    def __slots(self) -> list[tuple[bytes, int]]:
+        """
+        Returns (key, offset) of every entry in the index
+        """
+        assert self.__index_map is not None
+        slots = []
+        for slot in range(self.__capacity):
+            key, offset = _SLOT.unpack_from(
+                self.__index_map, _INDEX_HEADER.size + slot * _SLOT.size
+            )
+            if offset:
+                slots.append((key, offset))
+        return slots
+
+    def __write_index(
+        self, name: str, capacity: int, slots: list[tuple[bytes, int]]
+    ) -> None:
+        """
+        Writes a new index file holding the supplied (key, offset) slots
+        """
+        table = bytearray(_INDEX_HEADER.size + capacity * _SLOT.size)
+        _INDEX_HEADER.pack_into(table, 0, _INDEX_MAGIC, capacity, len(slots))
+        mask = capacity - 1
+        for key, offset in slots:
+            slot = int.from_bytes(key[:8], "little") & mask
+            while _SLOT.unpack_from(table, _INDEX_HEADER.size + slot * _SLOT.size)[1]:
+                slot = (slot + 1) & mask
+            _SLOT.pack_into(table, _INDEX_HEADER.size + slot * _SLOT.size, key, offset)
+        with open(self.__path(name), "wb") as file:
+            file.write(table)
+
+    def __grow(self) -> None:
+        """
+        Moves the index to a new file twice the size
+        """
+        log_name, index_name = self.__current
+        new_index = f"index.{int(index_name.split('.')[1]) + 1}"
+        self.__write_index(new_index, self.__capacity * 2, self.__slots())
+        self.__switch((log_name, new_index), (None, index_name))
+
+    def __switch(
+        self, current: tuple[str, str], old: tuple[str | None, str | None]
+    ) -> None:
+        """
+        Makes the supplied log and index current, and removes the old files.
+        Readers that still map the old files keep reading them until they refresh
+        """
+        self.__close_files()
+        self.__write_current(current)
+        for name in old:
+            if name is not None and name not in current:
+                os.remove(self.__path(name))
+        self.__open()
@@ -0,0 +1,316 @@
+## File: profiling.py
+## Date: 2024-03-31
+## This module is a profiling harness: it runs canned workloads and reports where the time goes
+
+# Each workload is a typical use of the engine, with a fixed seed so that runs can be compared:
+#   random_playouts    games played to the end with random legal moves, as in a search rollout
+#   greedy_selfplay    games played by the greedy move (background.likely_moves) on both sides
+#   replay             recorded games replayed and verified from their records (replay.py)
+# A workload is run under cProfile, under a sampling profiler, or both. Its input (the new games,
+# or the records to replay) is made by its prepare function before profiling starts, so only the
+# run function is profiled.
+
+# cProfile counts every call, so it gives exact call counts but slows small functions down.
+# The hotspot table lists the functions with the most time of their own, and the module table adds
+# that time up by backend module (wall.py, factory.py, patternlines.py ...).
+# The sampling profiler looks at the stack of the profiled thread every interval from a background
+# thread, so it hardly slows the workload down. It writes collapsed stacks, one line per distinct
+# stack with its number of samples, which flamegraph.pl, speedscope and inferno read:
+#   profiling.py:random_playouts;game.py:play_move;game.py:place_on_patternlines;patternlines.py:place_on_patternlines 52
+
+#   python -m azul_backend.profiling                         every workload, both profilers
+#   python -m azul_backend.profiling replay --profiler sampling --games 200 --out profiles
+
+import argparse
+import collections
+import cProfile
+import io
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from types import FrameType, MappingProxyType
+from typing import Any, Callable, NamedTuple
+
+from azul_backend.background import likely_moves
+from azul_backend.game import Game
+from azul_backend.replay import GameRecord, Replay
+
+
+def _new_games(games: int, seed: int) -> list[Game]:
+    return [Game(seed * games + number) for number in range(games)]
+
+
+def _random_players(games: int, seed: int) -> list[tuple[Game, random.Random]]:
+    """
+    New games, each with the random number generator that chooses its moves
+    """
+    return [
+        (Game(seed * games + number, validate=False), random.Random(seed * games + number))
+        for number in range(games)
+    ]
+
+
+def random_playouts(playouts: list[tuple[Game, random.Random]]) -> None:
+    for game, rng in playouts:
+        while not game.is_game_over:
+            game.play_move(rng.choice(game.legal_moves()))
+
+
+def greedy_selfplay(games: list[Game]) -> None:
+    for game in games:
+        while not game.is_game_over:
+            game.play_move(likely_moves(game, 1)[0])
+
+
+def _recorded_games(games: int, seed: int) -> list[GameRecord]:
+    rng = random.Random(seed)
+    records = []
+    for number in range(games):
+        game = Game(seed * games + number, validate=False)
+        while not game.is_game_over:
+            game.play_move(rng.choice(game.legal_moves()))
+        records.append(GameRecord.from_game(game))
+    return records
+
+
+def replay(records: list[GameRecord]) -> None:
+    for record in records:
+        if not Replay(record).verify():
+            raise RuntimeError(f"{record} - The replay does not match its checksum")
+
+
+class Workload(NamedTuple):
+    """
+    A canned workload: prepare(games, seed) makes its input, outside of the profile,
+    and run(input) is the work profiled
+    """
+
+    prepare: Callable[[int, int], Any]
+    run: Callable[[Any], None]
+
+
+WORKLOADS: MappingProxyType[str, Workload] = MappingProxyType(
+    {
+        "random_playouts": Workload(_random_players, random_playouts),
+        "greedy_selfplay": Workload(_new_games, greedy_selfplay),
+        "replay": Workload(_recorded_games, replay),
+    }
+)
+
+
+def _frame_label(frame: FrameType) -> str:
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}"
+
+
+class SamplingProfiler:
+    """
+    This class samples the stack of a thread from a background thread, and counts the stacks seen
+
+    Args:
+        interval (float): Seconds between samples
+        thread_id (int): OPTIONAL: The thread to sample, the thread that starts the profiler by default
+
+    Methods:
+        start: Starts sampling
+        stop: Stops sampling
+        collapsed: The stacks seen, as collapsed stack lines
+        hotspots: The functions and the modules most often at the top of the stack
+        samples: The number of samples taken
+    """
+
+    _interval: float
+    __thread_id: int | None
+    __stacks: collections.Counter[tuple[str, ...]]
+    __stop: threading.Event
+    __thread: threading.Thread | None
+    __switch_interval: float
+
+    def __init__(self, interval: float = 0.001, thread_id: int | None = None) -> None:
+        if interval <= 0:
+            raise ValueError(f"{interval} - interval must be positive")
+        self._interval = interval
+        self.__thread_id = thread_id
+        self.__stacks = collections.Counter()
+        self.__stop = threading.Event()
+        self.__thread = None
+        self.__switch_interval = sys.getswitchinterval()
+
+    @property
+    def samples(self) -> int:
+        return sum(self.__stacks.values())
+
+    def start(self) -> None:
+        if self.__thread is not None:
+            raise RuntimeError("The profiler is already running")
+        if self.__thread_id is None:
+            self.__thread_id = threading.get_ident()
+        # The sampler needs the interpreter lock to look at the stack, ask for it as often as we sample
+        self.__switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self.__switch_interval, self._interval / 2))
+        self.__stop.clear()
+        self.__thread = threading.Thread(
+            target=self.__run, name="SamplingProfiler", daemon=True
+        )
+        self.__thread.start()
+
+    def stop(self) -> None:
+        if self.__thread is None:
+            return
+        self.__stop.set()
+        self.__thread.join()
+        self.__thread = None
+        sys.setswitchinterval(self.__switch_interval)
+
+    def __enter__(self) -> "SamplingProfiler":
+        self.start()
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.stop()
+
+    def __run(self) -> None:
+        while not self.__stop.wait(self._interval):
+            frame = sys._current_frames().get(self.__thread_id)  # type: ignore[arg-type]
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.__stacks[tuple(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        """
+        This method returns the stacks seen in the collapsed stack format, outermost frame first
+        """
+        return "".join(
+            f"{';'.join(stack)} {count}\n" for stack, count in sorted(self.__stacks.items())
+        )
+
+    def hotspots(self) -> tuple[list[tuple[str, int]], list[tuple[str, int]]]:
+        """
+        This method returns (function, samples) and (module, samples) for the frame at the top of
+        the stack, most samples first
+        """
+        functions: collections.Counter[str] = collections.Counter()
+        modules: collections.Counter[str] = collections.Counter()
+        for stack, count in self.__stacks.items():
+            functions[stack[-1]] += count
+            modules[stack[-1].split(":")[0]] += count
+        return functions.most_common(), modules.most_common()
+
+
+def cprofile_tables(profile: cProfile.Profile, top: int = 25) -> str:
+    """
+    This function returns the hotspot table (functions by their own time) and the module table
+    (own time added up by file) of a cProfile run
+    """
+    output = io.StringIO()
+    statistics = pstats.Stats(profile, stream=output)
+    statistics.sort_stats(pstats.SortKey.TIME).print_stats(top)
+
+    by_module: collections.Counter[str] = collections.Counter()
+    for (filename, _, _), (_, _, own_time, _, _) in statistics.stats.items():  # type: ignore[attr-defined]
+        by_module["<built-in>" if filename == "~" else os.path.basename(filename)] += own_time
+    total = sum(by_module.values()) or 1.0
+    output.write("Own time by module\n")
+    for module, seconds in by_module.most_common(top):
+        output.write(f"  {module:<28}{seconds:10.3f}s {100 * seconds / total:6.1f}%\n")
+    return output.getvalue()
+
+
+def sampling_tables(profiler: SamplingProfiler, top: int = 25) -> str:
+    functions, modules = profiler.hotspots()
+    total = profiler.samples or 1
+    lines = [f"{profiler.samples} samples", "Top of stack by function"]
+    lines += [f"  {name:<48}{count:8} {100 * count / total:6.1f}%" for name, count in functions[:top]]
+    lines.append("Top of stack by module")
+    lines += [f"  {name:<28}{count:8} {100 * count / total:6.1f}%" for name, count in modules[:top]]
+    return "\n".join(lines) + "\n"
+
+
+def profile_workload(
+    name: str,
+    profiler: str = "both",
+    games: int = 100,
+    seed: int = 0,
+    out: str | None = None,
+    top: int = 25,
+    interval: float = 0.001,
+) -> str:
+    """
+    This function runs a workload under cProfile and/or the sampling profiler and returns the
+    report. With out, the reports, the raw cProfile statistics (.pstats) and the collapsed stacks
+    (.collapsed) are also written to that directory
+    """
+    if name not in WORKLOADS:
+        raise ValueError(f"{name} - Unknown workload, must be one of {', '.join(WORKLOADS)}")
+    if profiler not in ("cprofile", "sampling", "both"):
+        raise ValueError(f"{profiler} - profiler must be cprofile, sampling or both")
+    prepare, run = WORKLOADS[name]
+    if out is not None:
+        os.makedirs(out, exist_ok=True)
+
+    report = []
+    if profiler in ("cprofile", "both"):
+        workload_input = prepare(games, seed)
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        profile.runcall(run, workload_input)
+        elapsed = time.perf_counter() - start
+        tables = cprofile_tables(profile, top)
+        report.append(f"== {name}: cProfile, {elapsed:.2f}s ==\n{tables}")
+        if out is not None:
+            profile.dump_stats(os.path.join(out, f"{name}.pstats"))
+            with open(os.path.join(out, f"{name}.cprofile.txt"), "w") as output:
+                output.write(tables)
+
+    if profiler in ("sampling", "both"):
+        workload_input = prepare(games, seed)
+        sampler = SamplingProfiler(interval)
+        start = time.perf_counter()
+        with sampler:
+            run(workload_input)
+        elapsed = time.perf_counter() - start
+        tables = sampling_tables(sampler, top)
+        report.append(f"== {name}: sampling, {elapsed:.2f}s ==\n{tables}")
+        if out is not None:
+            with open(os.path.join(out, f"{name}.collapsed"), "w") as output:
+                output.write(sampler.collapsed())
+            with open(os.path.join(out, f"{name}.sampling.txt"), "w") as output:
+                output.write(tables)
+    return "\n".join(report)
+
+
+def main(arguments: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Profile canned Azul engine workloads")
+    parser.add_argument("workloads", nargs="*", help=f"Any of {', '.join(WORKLOADS)}, all by default")
+    parser.add_argument("--profiler", choices=("cprofile", "sampling", "both"), default="both")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--interval", type=float, default=0.001, help="Seconds between samples")
+    parser.add_argument("--out", help="Write the reports, .pstats and .collapsed files here")
+    options = parser.parse_args(arguments)
+    for name in options.workloads:
+        if name not in WORKLOADS:
+            parser.error(f"{name} - Unknown workload, must be one of {', '.join(WORKLOADS)}")
+
+    for name in options.workloads or WORKLOADS:
+        print(
+            profile_workload(
+                name,
+                options.profiler,
+                options.games,
+                options.seed,
+                options.out,
+                options.top,
+                options.interval,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+## File: refills.py
+## Date: 2024-03-05
+## This module describes the chance events of the game: refilling the factories from the tile bag
+
+# At the start of each round Factory.reset_factory draws 4 tiles for each factory from the TileBag:
+# 20 tiles for the 5 factories of a 2 player game, 28 for 7 factories (3 players), 36 for 9
+# (4 players). The order of the bag is hidden, but the number of tiles of each colour left in
+# the bag is public knowledge (Game.show_bag_counts). From those counts the multiset of the next
+# refill follows a multivariate hypergeometric distribution, which this module enumerates exactly.
+
+# Bag counts and outcomes are tuples of five ints in the TILE_COLOURS order
+# ("blue", "yellow", "red", "black", "white"). Results are cached, as identical bag states
+# come up again and again during a search.
+
+# The factories are filled one after the other, so the contents of any single factory follow the
+# same distribution with draw=4. Without a draw, a full refill for the number of players is drawn.
+
+import random
+from bisect import bisect
+from fractions import Fraction
+from functools import lru_cache
+from itertools import accumulate
+from math import comb
+from typing import Iterator
+
+from azul_backend.factory import FACTORIES_BY_PLAYERS
+from azul_backend.tiles import TILE_COLOURS
+
+TILES_PER_FACTORY: int = 4
+REFILL_SIZE: int = TILES_PER_FACTORY * FACTORIES_BY_PLAYERS[2]  # A 2 player refill, see refill_size
+FRESH_BAG: tuple[int, ...] = (20,) * len(TILE_COLOURS)  # The bag magically refills to 20 of each colour
+
+
+def refill_size(players: int = 2) -> int:
+    """
+    This function returns the number of tiles drawn to fill every factory of a game
+    with the given number of players: 20, 28 or 36
+    """
+    if players not in FACTORIES_BY_PLAYERS:
+        raise ValueError(
+            f"{players} - Invalid number of players, must be from "
+            f"{min(FACTORIES_BY_PLAYERS)} to {max(FACTORIES_BY_PLAYERS)}"
+        )
+    return TILES_PER_FACTORY * FACTORIES_BY_PLAYERS[players]
+
+
+def _check_bag_counts(bag_counts: tuple[int, ...], draw: int) -> None:
+    """
+    This function checks that the bag counts and the number of tiles drawn are valid
+    """
+    if len(bag_counts) != len(TILE_COLOURS) or any(
+        not isinstance(count, int) or count < 0 for count in bag_counts
+    ):
+        raise ValueError(
+            f"{bag_counts} - Invalid bag counts, must be five non-negative ints ordered {TILE_COLOURS}"
+        )
+    if not isinstance(draw, int) or draw < 0 or draw > sum(FRESH_BAG):
+        raise ValueError(
+            f"{draw} - Invalid number of tiles to draw, must be between 0 and {sum(FRESH_BAG)}"
+        )
+
+
+def _compositions(
+    total: int, limits: tuple[int, ...]
+) -> Iterator[tuple[int, ...]]:
+    """
+    Generates every way of splitting total tiles between the colours,
+    without taking more tiles of a colour than the limit allows
+    """
+    if len(limits) == 1:
+        if total <= limits[0]:
+            yield (total,)
+        return
+
+    remaining_capacity = sum(limits[1:])
+    for count in range(max(0, total - remaining_capacity), min(total, limits[0]) + 1):
+        for rest in _compositions(total - count, limits[1:]):
+            yield (count,) + rest
+
+
+@lru_cache(maxsize=4096)
+def _hypergeometric(
+    bag_counts: tuple[int, ...], draw: int
+) -> tuple[tuple[tuple[int, ...], Fraction], ...]:
+    """
+    Exact distribution of drawing tiles from a bag that holds enough tiles
+    """
+    denominator = comb(sum(bag_counts), draw)
+    outcomes = []
+    for outcome in _compositions(draw, bag_counts):
+        numerator = 1
+        for count, drawn in zip(bag_counts, outcome):
+            numerator *= comb(count, drawn)
+        outcomes.append((outcome, Fraction(numerator, denominator)))
+
+    return tuple(outcomes)
+
+
+def refill_outcomes(
+    bag_counts: tuple[int, ...], draw: int | None = None, players: int = 2
+) -> tuple[tuple[tuple[int, ...], Fraction], ...]:
+    """
+    Returns every possible multiset of tiles the next refill can draw, with its exact probability.
+    Each outcome is a tuple of counts in the TILE_COLOURS order, paired with a Fraction.
+    The probabilities sum to exactly 1.
+
+    If the bag holds fewer tiles than are drawn, every remaining tile is drawn and the rest
+    come from a freshly refilled bag, exactly as TileBag.draw_tile does.
+
+    Args:
+        bag_counts: tuple[int, ...] - Tiles of each colour left in the bag (Game.show_bag_counts)
+        draw: int - OPTIONAL: The number of tiles drawn, e.g 4 for a single factory.
+            A full refill for the number of players by default
+        players: int - OPTIONAL: The number of players, for a full refill. 2 by default
+    """
+    return _refill_outcomes(bag_counts, refill_size(players) if draw is None else draw)
+
+
+@lru_cache(maxsize=4096)
+def _refill_outcomes(
+    bag_counts: tuple[int, ...], draw: int
+) -> tuple[tuple[tuple[int, ...], Fraction], ...]:
+    """
+    The distribution of refill_outcomes, for a given number of tiles drawn
+    """
+    _check_bag_counts(bag_counts, draw)
+
+    if sum(bag_counts) >= draw:
+        return _hypergeometric(bag_counts, draw)
+
+    # Bag runs out part way through the refill
+    from_fresh_bag = _hypergeometric(FRESH_BAG, draw - sum(bag_counts))
+    return tuple(
+        (tuple(left + drawn for left, drawn in zip(bag_counts, outcome)), probability)
+        for outcome, probability in from_fresh_bag
+    )
+
+
+@lru_cache(maxsize=4096)
+def _cumulative_weights(
+    bag_counts: tuple[int, ...], draw: int
+) -> tuple[float, ...]:
+    """
+    Cumulative probabilities of refill_outcomes, used to sample outcomes quickly
+    """
+    return tuple(
+        accumulate(float(probability) for _, probability in _refill_outcomes(bag_counts, draw))
+    )
+
+
+def sample_refills(
+    bag_counts: tuple[int, ...],
+    k: int = 1,
+    draw: int | None = None,
+    rng: random.Random | None = None,
+    players: int = 2,
+) -> list[tuple[int, ...]]:
+    """
+    Returns k refill outcomes sampled from the exact distribution given by refill_outcomes
+    Each outcome is a tuple of counts in the TILE_COLOURS order
+
+    Args:
+        bag_counts: tuple[int, ...] - Tiles of each colour left in the bag (Game.show_bag_counts)
+        k: int - The number of samples
+        draw: int - OPTIONAL: The number of tiles drawn, a full refill by default
+            (see refill_outcomes)
+        rng: random.Random - OPTIONAL: The random number generator to use, for reproducible samples
+        players: int - OPTIONAL: The number of players, for a full refill. 2 by default
+    """
+    if draw is None:
+        draw = refill_size(players)
+    outcomes = refill_outcomes(bag_counts, draw)
+    cumulative_weights = _cumulative_weights(bag_counts, draw)
+    rng = rng or random.Random()
+
+    # Guard against the float total falling fractionally short of 1
+    total = cumulative_weights[-1]
+    last = len(outcomes) - 1
+    return [
+        outcomes[min(bisect(cumulative_weights, rng.random() * total), last)][0]
+        for _ in range(k)
+    ]
+
+
+def expected_refill(
+    bag_counts: tuple[int, ...], draw: int | None = None, players: int = 2
+) -> tuple[Fraction, ...]:
+    """
+    Returns the exact expected number of tiles of each colour in the next refill,
+    with draw and players as for refill_outcomes
+    """
+    expected = [Fraction(0)] * len(TILE_COLOURS)
+    for outcome, probability in refill_outcomes(bag_counts, draw, players):
+        for i, drawn in enumerate(outcome):
+            expected[i] += drawn * probability
+
+    return tuple(expected)
+
+
+def clear_refill_cache() -> None:
+    """
+    Clears the cached distributions, e.g to free memory after a long search
+    """
+    _refill_outcomes.cache_clear()
+    _hypergeometric.cache_clear()
+    _cumulative_weights.cache_clear()
@@ -0,0 +1,421 @@
+## File: replay.py
+## Date: 2024-03-14
+## This module creates compact game records, and replays them
+
+# The tile bag is the only source of chance in a game, and its draws are decided by its seed.
+# So a game is completely described by the number of players, the seed and the moves played,
+# and a GameRecord stores nothing else: the number of players, a 64 bit seed, two bytes per move
+# (an action id, see actions.py) and a checksum.
+# A full 2 player game of around 100 moves fits in well under 250 bytes.
+
+# Binary layout of a record (little endian):
+#   magic b"AZR", format version (1 byte), number of players (1 byte)
+#   seed (8 bytes), number of moves (2 bytes)
+#   action ids (2 bytes each)
+#   checksum (8 bytes)
+
+# The checksum is the end of a chain, one link per move:
+#   link 0 = blake2b(packed state of the new game)
+#   link n = blake2b(link n-1 + packed state after move n)
+# Any difference in any intermediate state (e.g a change to the rules, or a corrupt record)
+# breaks every link after it, so Replay.verify only needs to compare the last link.
+
+# Replaying from the start to reach move N gets slow when a viewer scrubs back and forth.
+# Keyframes are packed states (Game.pack_state) taken at the start of the game and at each round
+# boundary, after the next round has been prepared. Replay.seek restores the nearest keyframe at or
+# before move N and plays forward from there, which is at most one round of moves.
+# Keyframes are built from a record in one replay, and can be stored alongside it (to_bytes).
+
+# Binary layout of keyframes (little endian):
+#   magic b"AZK", format version (1 byte), number of players (1 byte)
+#   checksum of the record they were built from (8 bytes), number of keyframes (2 bytes)
+#   then for each keyframe: move number (2 bytes), packed state (Game.STATE_SIZES[players] bytes)
+
+import bisect
+import hashlib
+import struct
+from typing import Iterator
+
+from azul_backend.actions import decode_action, decode_moves, encode_moves
+from azul_backend.game import Game
+
+MAGIC: bytes = b"AZR"
+KEYFRAME_MAGIC: bytes = b"AZK"
+VERSION: int = 2  # 2: the number of players, and two byte action ids
+_HEADER = struct.Struct("<3sBBQH")
+_KEYFRAME_HEADER = struct.Struct("<3sBB8sH")
+_ACTION_ID_SIZE = 2
+_MOVE_NUMBER = struct.Struct("<H")
+_CHECKSUM_SIZE = 8
+
+
+def chain_checksum(previous: bytes, game: Game) -> bytes:
+    """
+    This function returns the next link of a checksum chain, from the previous link
+    and the current state of a game. The first link of a chain uses b"" as the previous link
+    """
+    return hashlib.blake2b(
+        previous + game.pack_state(), digest_size=_CHECKSUM_SIZE
+    ).digest()
+
+
+class GameRecord:
+    """
+    This class is the compact record of a game: the number of players, the seed,
+    the moves and a checksum
+
+    Args:
+        seed (int): The seed of the tile bag, see Game.show_seed
+        moves (tuple[int, ...]): The moves played, as action ids
+        checksum (bytes): The last link of the checksum chain, see Replay
+        players (int): OPTIONAL: The number of players, 2, 3 or 4
+
+    Methods:
+        from_game: Creates the record of a game
+        to_bytes: Returns the record in its binary layout
+        from_bytes: Reads a record from its binary layout
+    """
+
+    __seed: int
+    __moves: tuple[int, ...]
+    __checksum: bytes
+    __players: int
+
+    def __init__(
+        self, seed: int, moves: tuple[int, ...], checksum: bytes, players: int = 2
+    ) -> None:
+        """Create a record. The moves are checked, the checksum is checked when replayed"""
+        if type(seed) is not int or not 0 <= seed < 2**64:
+            raise ValueError(f"{seed} - The seed must be a 64 bit unsigned int")
+        if players not in Game.STATE_SIZES:
+            raise ValueError(f"{players} - Invalid number of players, must be 2, 3 or 4")
+        if len(checksum) != _CHECKSUM_SIZE:
+            raise ValueError(f"The checksum must be {_CHECKSUM_SIZE} bytes")
+        for action_id in moves:
+            decode_action(action_id)  # Checks the id
+
+        self.__seed = seed
+        self.__moves = tuple(moves)
+        self.__checksum = bytes(checksum)
+        self.__players = players
+
+    @classmethod
+    def from_game(cls, game: Game) -> "GameRecord":
+        """
+        This method creates the record of a game, finished or not.
+        The game is replayed from its seed to build the checksum chain, and the replay must
+        finish in the same state as the game
+        """
+        seed, moves = game.show_seed(), game.show_move_history()
+        players = game.show_number_of_players()
+        link = b""
+        for state in Replay(cls(seed, moves, bytes(_CHECKSUM_SIZE), players)).states():
+            link = chain_checksum(link, state)
+
+        if state.pack_state() != game.pack_state():
+            raise RuntimeError(
+                "The game could not be reproduced from its seed and moves"
+            )
+        return cls(seed, moves, link, players)
+
+    @property
+    def seed(self) -> int:
+        return self.__seed
+
+    @property
+    def moves(self) -> tuple[int, ...]:
+        return self.__moves
+
+    @property
+    def checksum(self) -> bytes:
+        return self.__checksum
+
+    @property
+    def players(self) -> int:
+        return self.__players
+
+    def to_bytes(self) -> bytes:
+        """
+        This method returns the record in its binary layout
+        """
+        return (
+            _HEADER.pack(MAGIC, VERSION, self.__players, self.__seed, len(self.__moves))
+            + encode_moves(self.__moves)
+            + self.__checksum
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "GameRecord":
+        """
+        This method reads a record from its binary layout
+        """
+        if len(data) < _HEADER.size + _CHECKSUM_SIZE:
+            raise ValueError("Too few bytes for a game record")
+
+        magic, version, players, seed, count = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError(f"{magic!r} - Not a game record")
+        if version != VERSION:
+            raise ValueError(f"{version} - Unsupported game record version")
+        moves_end = _HEADER.size + count * _ACTION_ID_SIZE
+        if len(data) != moves_end + _CHECKSUM_SIZE:
+            raise ValueError(
+                f"{len(data)} bytes - Wrong length for a record of {count} moves"
+            )
+
+        moves = decode_moves(data[_HEADER.size : moves_end])
+        return cls(seed, moves, data[moves_end:], players)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, GameRecord):
+            return NotImplemented
+        return self.to_bytes() == other.to_bytes()
+
+    def __hash__(self) -> int:
+        return hash(self.to_bytes())
+
+    def __len__(self) -> int:
+        """The number of moves in the record"""
+        return len(self.__moves)
+
+    def __repr__(self) -> str:
+        return f"GameRecord(players={self.__players}, seed={self.__seed}, moves={len(self.__moves)}, checksum={self.__checksum.hex()})"
+
+
+class Keyframes:
+    """
+    This class holds the keyframes of a GameRecord: packed states at the start of the game
+    and at each round boundary, by move number
+
+    Args:
+        checksum (bytes): The checksum of the record the keyframes belong to
+        frames (tuple[tuple[int, bytes], ...]): (move number, packed state) pairs, in move order
+
+    Methods:
+        from_record: Builds the keyframes of a record
+        nearest: Returns the last keyframe at or before a move number
+        to_bytes: Returns the keyframes in their binary layout
+        from_bytes: Reads keyframes from their binary layout
+    """
+
+    __checksum: bytes
+    __move_numbers: tuple[int, ...]
+    __states: tuple[bytes, ...]
+    __players: int
+
+    def __init__(
+        self, checksum: bytes, frames: tuple[tuple[int, bytes], ...]
+    ) -> None:
+        """Create the keyframes of a record. The number of players is known from the states"""
+        move_numbers = tuple(move_number for move_number, _ in frames)
+        if not move_numbers or move_numbers[0] != 0:
+            raise ValueError("The first keyframe must be the start of the game")
+        if any(a >= b for a, b in zip(move_numbers, move_numbers[1:])):
+            raise ValueError("Keyframes must be in increasing move order")
+        sizes = {len(state) for _, state in frames}
+        players = [players for players, size in Game.STATE_SIZES.items() if {size} == sizes]
+        if not players:
+            raise ValueError(
+                f"Keyframe states must all be the packed state of a game, one of {tuple(Game.STATE_SIZES.values())} bytes"
+            )
+
+        self.__checksum = bytes(checksum)
+        self.__players = players[0]
+        self.__move_numbers = move_numbers
+        self.__states = tuple(bytes(state) for _, state in frames)
+
+    @classmethod
+    def from_record(cls, record: GameRecord) -> "Keyframes":
+        """
+        This method replays a record once, keeping the state at the start of the game
+        and after every move that ends a round
+        """
+        frames = []
+        rounds_played = -1
+        for move_number, game in enumerate(Replay(record).states()):
+            if game.rounds_played != rounds_played:
+                rounds_played = game.rounds_played
+                frames.append((move_number, game.pack_state()))
+        return cls(record.checksum, tuple(frames))
+
+    @property
+    def checksum(self) -> bytes:
+        return self.__checksum
+
+    @property
+    def players(self) -> int:
+        return self.__players
+
+    def nearest(self, move_number: int) -> tuple[int, bytes]:
+        """
+        This method returns the (move number, packed state) of the last keyframe at or before move_number
+        """
+        i = bisect.bisect_right(self.__move_numbers, move_number) - 1
+        return self.__move_numbers[max(i, 0)], self.__states[max(i, 0)]
+
+    def to_bytes(self) -> bytes:
+        """
+        This method returns the keyframes in their binary layout
+        """
+        return _KEYFRAME_HEADER.pack(
+            KEYFRAME_MAGIC, VERSION, self.__players, self.__checksum, len(self)
+        ) + b"".join(
+            _MOVE_NUMBER.pack(move_number) + state
+            for move_number, state in zip(self.__move_numbers, self.__states)
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Keyframes":
+        """
+        This method reads keyframes from their binary layout
+        """
+        if len(data) < _KEYFRAME_HEADER.size:
+            raise ValueError("Too few bytes for keyframes")
+
+        magic, version, players, checksum, count = _KEYFRAME_HEADER.unpack_from(data)
+        if magic != KEYFRAME_MAGIC:
+            raise ValueError(f"{magic!r} - Not keyframes")
+        if version != VERSION:
+            raise ValueError(f"{version} - Unsupported keyframe version")
+        if players not in Game.STATE_SIZES:
+            raise ValueError(f"{players} - Invalid number of players in keyframes")
+
+        frame_size = _MOVE_NUMBER.size + Game.STATE_SIZES[players]
+        if len(data) != _KEYFRAME_HEADER.size + count * frame_size:
+            raise ValueError(f"{len(data)} bytes - Wrong length for {count} keyframes")
+
+        frames = []
+        for i in range(count):
+            offset = _KEYFRAME_HEADER.size + i * frame_size
+            (move_number,) = _MOVE_NUMBER.unpack_from(data, offset)
+            frames.append(
+                (move_number, data[offset + _MOVE_NUMBER.size : offset + frame_size])
+            )
+        return cls(checksum, tuple(frames))
+
+    def __len__(self) -> int:
+        """The number of keyframes"""
+        return len(self.__move_numbers)
+
+
+class Replay:
+    """
+    This class replays a GameRecord, reconstructing the game as it was after any move
+
+    Args:
+        record (GameRecord): The record to replay
+        keyframes (Keyframes): OPTIONAL: Stored keyframes of the record.
+            If not supplied they are built by the first seek
+
+    Methods:
+        seek: Returns the game as it was after a number of moves, starting from the nearest keyframe
+        state_at: Returns a new game as it was after a number of moves, played from the start
+        states: Iterates over the game after every move
+        checksums: Returns the checksum chain of the record, one link per state
+        verify: Checks the record against its checksum
+    """
+
+    _record: GameRecord
+    _keyframes: Keyframes | None
+
+    def __init__(self, record: GameRecord, keyframes: Keyframes | None = None) -> None:
+        """Create a replay of a record"""
+        if not isinstance(record, GameRecord):
+            raise ValueError(f"{record} - Only GameRecord objects can be replayed")
+        if keyframes is not None and (
+            keyframes.checksum != record.checksum or keyframes.players != record.players
+        ):
+            raise ValueError("The keyframes belong to a different record")
+        self._record = record
+        self._keyframes = keyframes
+
+    @property
+    def keyframes(self) -> Keyframes:
+        """
+        The keyframes of the record, built on first use if they were not supplied
+        """
+        if self._keyframes is None:
+            self._keyframes = Keyframes.from_record(self._record)
+        return self._keyframes
+
+    def seek(self, move_number: int, game: Game | None = None) -> Game:
+        """
+        This method returns the game as it was after move_number moves.
+        The nearest keyframe is restored, and at most one round of moves is played forward
+
+        Args:
+            move_number (int): 0 for the start of the game, up to len(replay) for the end of the record
+            game (Game): OPTIONAL: A game to restore into, in place. A viewer that scrubs through
+                a replay can reuse one game rather than creating a new one for each seek
+        """
+        self.__check_move_number(move_number)
+        keyframe_move, state = self.keyframes.nearest(move_number)
+        moves = self._record.moves
+
+        if game is None:
+            game = Game.unpack_state(state, moves[:keyframe_move])
+        else:
+            game.load_state(state, moves[:keyframe_move])
+        for action_id in moves[keyframe_move:move_number]:
+            game.play_move(decode_action(action_id))
+        return game
+
+    def state_at(self, move_number: int) -> Game:
+        """
+        This method returns a new game as it was after move_number moves,
+        0 for the start of the game and len(replay) for the end of the record.
+        Every move is played from the start, see seek for a faster way
+        """
+        self.__check_move_number(move_number)
+        game = Game(self._record.seed, players=self._record.players)
+        for action_id in self._record.moves[:move_number]:
+            game.play_move(decode_action(action_id))
+        return game
+
+    def __check_move_number(self, move_number: int) -> None:
+        """
+        Raises an error if the move number is not in the record
+        """
+        if type(move_number) is not int or not 0 <= move_number <= len(self):
+            raise ValueError(
+                f"{move_number} - Invalid move number, must be from 0 to {len(self)}"
+            )
+
+    def states(self) -> Iterator[Game]:
+        """
+        This method yields the game at the start, then after every move.
+        The same game object is yielded each time, advanced by one move,
+        so copy it to keep a state
+        """
+        game = Game(self._record.seed, players=self._record.players)
+        yield game
+        for action_id in self._record.moves:
+            game.play_move(decode_action(action_id))
+            yield game
+
+    def checksums(self) -> tuple[bytes, ...]:
+        """
+        This method returns the checksum chain of the record,
+        the link for the start of the game then one link after every move
+        """
+        links = []
+        link = b""
+        for game in self.states():
+            link = chain_checksum(link, game)
+            links.append(link)
+        return tuple(links)
+
+    def verify(self) -> bool:
+        """
+        This method replays the record and returns True if it ends on the recorded checksum.
+        A record with a move that can not be played when replayed (an illegal move,
+        or a move after the end of the game) fails verification
+        """
+        try:
+            return self.checksums()[-1] == self._record.checksum
+        except (ValueError, RuntimeError):
+            return False
+
+    def __len__(self) -> int:
+        """The number of moves in the record"""
+        return len(self._record)
@@ -0,0 +1,360 @@
+## File: scheduler.py
+## Date: 2024-03-25
+## This module schedules the bot moves of many hosted games onto a bounded pool of workers
+
+# A server hosting many games can be asked for a lot of bot moves at once, e.g when a round ends
+# in every game at the same time. Running every search straight away overloads the machine and
+# every game gets slow, the ones with human players too. MoveScheduler runs at most one search per
+# worker process and queues the rest:
+#   Earliest deadline first: every request has a deadline, the request due soonest is searched next.
+#   Fair sharing: a game that already has a search running waits behind games that have none,
+#   so one game (e.g bot against bot) can not take over the workers.
+#   Degradation: the iterations of a search are chosen from budgets (most first), taking the largest
+#   that fits in the time left before the deadline. The time left is shared with the requests queued
+#   behind, so under load searches get shallower instead of late. The search speed (iterations per
+#   second) is measured from the searches that have finished.
+#   Fallback: a request that can not be searched in time, or whose search is still running at its
+#   deadline, is answered with the greedy move (background.likely_moves), so it is never late.
+# Requests carry the packed state of the game (Game.pack_state), so no Game objects are pickled.
+
+import itertools
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, InvalidStateError, ProcessPoolExecutor
+from types import MappingProxyType
+from typing import Hashable
+
+from azul_backend.background import likely_moves
+from azul_backend.game import Game
+from azul_backend.ismcts import InformationSetMCTS, Move
+
+FALLBACK = 0  # The budget counted for requests answered with the greedy move
+_SAFETY = 0.8  # The share of the time left a search may plan to use
+_RATE_SMOOTHING = 0.2  # Weight of the latest search in the measured speed
+
+
+def _search(
+    state: bytes, iterations: int, exploration: float, seed: int
+) -> tuple[Move, float]:
+    """
+    Searches a packed position in a worker. Returns the move and the seconds the search took
+    """
+    start = time.perf_counter()
+    move = InformationSetMCTS(iterations, exploration, seed=seed).choose_move(
+        Game.unpack_state(state)
+    )
+    return move, time.perf_counter() - start
+
+
+def _resolve(future: "Future[Move]", move: Move) -> bool:
+    """
+    Sets the result of a future, unless it is already done (answered or cancelled by the caller)
+    """
+    if future.done():
+        return False
+    try:
+        future.set_result(move)
+    except InvalidStateError:  # Cancelled by the caller in the meantime
+        return False
+    return True
+
+
+class _Request:
+    """
+    A bot move waiting for, or being computed by, a worker. Internal use only
+    """
+
+    __slots__ = ("game_id", "state", "deadline", "fallback", "future", "order")
+
+    def __init__(
+        self,
+        game_id: Hashable,
+        state: bytes,
+        deadline: float,
+        fallback: Move,
+        order: int,
+    ) -> None:
+        self.game_id = game_id
+        self.state = state
+        self.deadline = deadline
+        self.fallback = fallback
+        self.future: "Future[Move]" = Future()
+        self.order = order
+
+
+class MoveScheduler:
+    """
+    This class computes bot moves for many games on a bounded pool of worker processes,
+    earliest deadline first, shared fairly between games, with shallower searches under load
+
+    Args:
+        workers (int): OPTIONAL: The number of worker processes, the number of CPUs by default
+        budgets (tuple[int, ...]): The search iterations to choose from, most preferred first
+        exploration (float): The UCB exploration constant
+        margin (float): Seconds before a deadline at which the fallback move is given,
+            to allow for delivering the move
+        initial_rate (float): The assumed iterations per second, until searches have been measured
+        seed (int): OPTIONAL: Seed for the search seeds
+
+    Methods:
+        submit: Queues a bot move for a game, returns a Future of the move
+        served: The number of requests answered with each budget
+        close: Stops the scheduler and the workers
+        __len__: The number of requests queued or running
+    """
+
+    _workers: int
+    _budgets: tuple[int, ...]
+    _exploration: float
+    _margin: float
+    __rate: float
+    __rng: random.Random
+    __order: "itertools.count[int]"
+    __queues: dict[Hashable, deque[_Request]]
+    __running: dict[Hashable, int]
+    __in_flight: set[_Request]
+    __served: dict[int, int]
+    __executor: ProcessPoolExecutor
+    __condition: threading.Condition
+    __closed: bool
+    __thread: threading.Thread
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        budgets: tuple[int, ...] = (2000, 1000, 400, 100),
+        exploration: float = 0.7,
+        margin: float = 0.05,
+        initial_rate: float = 1000.0,
+        seed: int | None = None,
+    ) -> None:
+        """Start the workers and the dispatching thread"""
+        workers = (os.cpu_count() or 1) if workers is None else workers
+        if not isinstance(workers, int) or workers < 1:
+            raise ValueError(f"{workers} - workers must be a positive int")
+        if not budgets or any(
+            not isinstance(budget, int) or budget < 1 for budget in budgets
+        ):
+            raise ValueError(f"{budgets} - budgets must be positive ints")
+        if margin < 0 or initial_rate <= 0:
+            raise ValueError("margin must not be negative, initial_rate must be positive")
+
+        self._workers = workers
+        self._budgets = tuple(sorted(budgets, reverse=True))
+        self._exploration = exploration
+        self._margin = margin
+        self.__rate = initial_rate
+        self.__rng = random.Random(seed)
+        self.__order = itertools.count()
+        self.__queues = {}
+        self.__running = {}
+        self.__in_flight = set()
+        self.__served = {budget: 0 for budget in (*self._budgets, FALLBACK)}
+        self.__executor = ProcessPoolExecutor(max_workers=workers)
+        self.__condition = threading.Condition()
+        self.__closed = False
+        self.__thread = threading.Thread(
+            target=self.__run, name="MoveScheduler", daemon=True
+        )
+        self.__thread.start()
+
+    def submit(
+        self, game_id: Hashable, state: bytes, time_limit: float
+    ) -> "Future[Move]":
+        """
+        This method queues a bot move and returns a Future of the move,
+        which is answered within time_limit seconds
+
+        Args:
+            game_id (Hashable): The game the move is for, for fair sharing
+            state (bytes): The packed state of the game (Game.pack_state), with the bot to move
+            time_limit (float): Seconds from now by which the move is needed
+        """
+        game = Game.unpack_state(state)
+        legal_moves = game.legal_moves()
+        if not legal_moves:
+            raise ValueError("There are no legal moves, the game is over")
+
+        deadline = time.monotonic() + time_limit
+        request = _Request(
+            game_id, bytes(state), deadline, likely_moves(game, 1)[0], next(self.__order)
+        )
+        with self.__condition:
+            if self.__closed:
+                raise RuntimeError("The scheduler has been closed")
+            if len(legal_moves) == 1:  # Nothing to search
+                _resolve(request.future, legal_moves[0])
+                return request.future
+
+            # Requests of a game are kept in deadline order
+            queue = self.__queues.setdefault(game_id, deque())
+            position = len(queue)
+            while position and queue[position - 1].deadline > deadline:
+                position -= 1
+            queue.insert(position, request)
+            self.__condition.notify()
+        return request.future
+
+    @property
+    def rate(self) -> float:
+        """The measured search speed of a worker, in iterations per second"""
+        with self.__condition:
+            return self.__rate
+
+    def served(self) -> MappingProxyType[int, int]:
+        """
+        This method returns budget: the number of requests answered with a search of that many
+        iterations. Requests answered with the fallback move are counted under FALLBACK (0)
+        """
+        with self.__condition:
+            return MappingProxyType(dict(self.__served))
+
+    def close(self) -> None:
+        """
+        This method answers every outstanding request with its fallback move and stops the workers
+        """
+        with self.__condition:
+            self.__closed = True
+            for request in self.__in_flight | {
+                request for queue in self.__queues.values() for request in queue
+            }:
+                _resolve(request.future, request.fallback)
+            self.__queues.clear()
+            self.__condition.notify()
+        self.__thread.join()
+        self.__executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> "MoveScheduler":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        """The number of requests queued or running"""
+        with self.__condition:
+            return len(self.__in_flight) + sum(map(len, self.__queues.values()))
+
+    def __next_request(self) -> _Request | None:
+        """
+        Takes the next request off the queues: the earliest deadline of the games with no search
+        running, or of every game if they all have one. Called with the condition held
+        """
+        best: _Request | None = None
+        best_key: tuple[bool, float, int] | None = None
+        for game_id, queue in list(self.__queues.items()):
+            while queue and queue[0].future.done():  # Cancelled by the caller
+                queue.popleft()
+            if not queue:
+                del self.__queues[game_id]
+                continue
+            head = queue[0]
+            key = (self.__running.get(game_id, 0) > 0, head.deadline, head.order)
+            if best_key is None or key < best_key:
+                best, best_key = head, key
+
+        if best is not None:
+            self.__queues[best.game_id].popleft()
+        return best
+
+    def __budget(self, request: _Request, now: float) -> int:
+        """
+        Returns the largest budget that can be searched before the deadline, FALLBACK if none.
+        The time left is shared with the requests waiting behind. Called with the condition held
+        """
+        waiting = sum(map(len, self.__queues.values())) + len(self.__in_flight) + 1
+        time_left = (request.deadline - self._margin - now) * _SAFETY
+        time_left /= max(1.0, waiting / self._workers)
+        for budget in self._budgets:
+            if budget / self.__rate <= time_left:
+                return budget
+        return FALLBACK
+
+    def __expire(self, now: float) -> float | None:
+        """
+        Answers the requests due by now with their fallback moves.
+        Returns the time of the next deadline, None if nothing is waiting.
+        Called with the condition held
+        """
+        next_due: float | None = None
+        requests = list(self.__in_flight) + [
+            request for queue in self.__queues.values() for request in queue
+        ]
+        for request in requests:
+            due = request.deadline - self._margin
+            if request.future.done():
+                continue
+            if due <= now:
+                if _resolve(request.future, request.fallback):
+                    self.__served[FALLBACK] += 1
+            elif next_due is None or due < next_due:
+                next_due = due
+        return next_due
+
+    def __run(self) -> None:
+        """
+        Background thread. Answers overdue requests and keeps every worker busy
+        """
+        with self.__condition:
+            while not self.__closed:
+                now = time.monotonic()
+                next_due = self.__expire(now)
+
+                while len(self.__in_flight) < self._workers:
+                    request = self.__next_request()
+                    if request is None:
+                        break
+                    if request.future.done():  # Answered with its fallback already
+                        continue
+                    budget = self.__budget(request, now)
+                    if budget == FALLBACK:
+                        if _resolve(request.future, request.fallback):
+                            self.__served[FALLBACK] += 1
+                        continue
+
+                    self.__in_flight.add(request)
+                    self.__running[request.game_id] = (
+                        self.__running.get(request.game_id, 0) + 1
+                    )
+                    search = self.__executor.submit(
+                        _search,
+                        request.state,
+                        budget,
+                        self._exploration,
+                        self.__rng.getrandbits(64),
+                    )
+                    search.add_done_callback(
+                        lambda search, request=request, budget=budget: self.__finished(  # type: ignore
+                            request, budget, search
+                        )
+                    )
+
+                timeout = None if next_due is None else max(0.0, next_due - now)
+                self.__condition.wait(timeout)
+
+    def __finished(
+        self, request: _Request, budget: int, search: "Future[tuple[Move, float]]"
+    ) -> None:
+        """
+        Called when a worker finishes a search. Answers the request, unless it has been answered
+        with its fallback move already, and updates the measured speed
+        """
+        with self.__condition:
+            self.__in_flight.discard(request)
+            self.__running[request.game_id] -= 1
+            if not self.__running[request.game_id]:
+                del self.__running[request.game_id]
+
+            if search.cancelled() or search.exception() is not None:
+                if _resolve(request.future, request.fallback):
+                    self.__served[FALLBACK] += 1
+            else:
+                move, seconds = search.result()
+                if seconds > 0:
+                    self.__rate += _RATE_SMOOTHING * (budget / seconds - self.__rate)
+                if _resolve(request.future, move):
+                    self.__served[budget] += 1
+            self.__condition.notify()
@@ -14,3 +14,16 @@ class GameState(Enum):
     WALL_TILING = 2
     PREPARING_FOR_NEXT_ROUND = 3
     GAMEOVER = 4
+
+
+class GameEvent(Enum):
+    """
+    GameEvent is an enumeration of the events a Game reports to its listeners
+    Each event comes with an immutable dictionary of details, see Game.add_listener
+
+    """
+
+    MOVE = 1  # A move has been completed
+    WALL_TILE = 2  # A tile has been moved from a pattern line to the wall
+    ROUND_END = 3  # The wall tiling of a round is complete, and the floor penalties applied
+    GAME_OVER = 4  # The game has ended, and the end of game bonuses added
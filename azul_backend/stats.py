@@ -0,0 +1,595 @@
+## File: stats.py
+## Date: 2024-03-18
+## This module creates streaming statistics over games, from the events games report
+
+# Self-play produces far more games than can be kept. The reducers here are game listeners
+# (see Game.add_listener): each event updates a few counters and is then forgotten, so memory does
+# not grow with the number of games.
+# A reducer can follow many games at once. What it keeps of a game in progress (only FloorPenalties
+# keeps anything, the penalty totals of the players) is keyed by the game_id every event carries,
+# and dropped when the game is over, when it starts again after a reset, or when it is garbage
+# collected before its end (for games the reducer was attached to with attach).
+
+# Every reducer can be merged with another of the same kind, e.g. one per worker process, merged
+# by the parent once the workers finish. Reducers hold only ints, floats, lists and dicts,
+# so they pickle cheaply between processes.
+
+# Distributions are kept in QuantileSketch, a DDSketch: values are counted in buckets whose width
+# grows with the value, so every percentile is within a fixed relative error of the true value,
+# however many values are added. Two sketches with the same accuracy merge exactly.
+
+import math
+import weakref
+from abc import ABC, abstractmethod
+from types import MappingProxyType
+from typing import Any, Iterable
+
+from azul_backend.game import Game
+from azul_backend.states import GameEvent
+from azul_backend.tiles import TILE_COLOURS
+
+_LINES = ("line1", "line2", "line3", "line4", "line5", None)  # None is the floor
+
+
+class QuantileSketch:
+    """
+    This class estimates percentiles of a stream of numbers in a small, fixed amount of memory.
+    Every estimate is within relative_accuracy of a value in the stream at that rank
+
+    Args:
+        relative_accuracy (float): The largest relative error of an estimate, e.g 0.01 for 1%
+
+    Methods:
+        add: Adds a value to the sketch
+        merge: Adds every value of another sketch to this one
+        quantile: Returns an estimate of a quantile, 0 to 1
+        percentiles: Returns estimates of several percentiles, 0 to 100
+        count, min, max, mean: Exact summaries of the values added
+    """
+
+    _relative_accuracy: float
+    __gamma: float
+    __log_gamma: float
+    __positive: dict[int, int]  # Bucket index -> count, for values above 0
+    __negative: dict[int, int]  # Bucket index -> count, for the size of values below 0
+    __zeros: int
+    __count: int
+    __sum: float
+    __min: float
+    __max: float
+
+    def __init__(self, relative_accuracy: float = 0.01) -> None:
+        """Create an empty sketch"""
+        if not 0 < relative_accuracy < 1:
+            raise ValueError(
+                f"{relative_accuracy} - relative_accuracy must be between 0 and 1"
+            )
+        self._relative_accuracy = relative_accuracy
+        self.__gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.__log_gamma = math.log(self.__gamma)
+        self.__positive = {}
+        self.__negative = {}
+        self.__zeros = 0
+        self.__count = 0
+        self.__sum = 0.0
+        self.__min = math.inf
+        self.__max = -math.inf
+
+    def add(self, value: float, count: int = 1) -> None:
+        """
+        This method adds a value to the sketch, count times
+        """
+        if value > 0:
+            index = math.ceil(math.log(value) / self.__log_gamma)
+            self.__positive[index] = self.__positive.get(index, 0) + count
+        elif value < 0:
+            index = math.ceil(math.log(-value) / self.__log_gamma)
+            self.__negative[index] = self.__negative.get(index, 0) + count
+        else:
+            self.__zeros += count
+
+        self.__count += count
+        self.__sum += value * count
+        self.__min = min(self.__min, value)
+        self.__max = max(self.__max, value)
+
+    def merge(self, other: "QuantileSketch") -> None:
+        """
+        This method adds every value of another sketch to this one.
+        Both sketches must have the same accuracy
+        """
+        if not isinstance(other, QuantileSketch):
+            raise ValueError(f"{other} - Only a QuantileSketch can be merged")
+        if other._relative_accuracy != self._relative_accuracy:
+            raise ValueError("Only sketches with the same accuracy can be merged")
+
+        for index, count in other.__positive.items():
+            self.__positive[index] = self.__positive.get(index, 0) + count
+        for index, count in other.__negative.items():
+            self.__negative[index] = self.__negative.get(index, 0) + count
+        self.__zeros += other.__zeros
+        self.__count += other.__count
+        self.__sum += other.__sum
+        self.__min = min(self.__min, other.__min)
+        self.__max = max(self.__max, other.__max)
+
+    def quantile(self, q: float) -> float:
+        """
+        This method returns an estimate of the q quantile (0 to 1), e.g 0.5 for the median.
+        NaN if the sketch is empty
+        """
+        if not 0 <= q <= 1:
+            raise ValueError(f"{q} - The quantile must be between 0 and 1")
+        if not self.__count:
+            return math.nan
+
+        rank = q * (self.__count - 1)
+        seen = 0
+        # Walk the buckets from the most negative value up
+        for index in sorted(self.__negative, reverse=True):
+            seen += self.__negative[index]
+            if seen > rank:
+                return max(-self.__value(index), self.__min)
+        seen += self.__zeros
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.__positive):
+            seen += self.__positive[index]
+            if seen > rank:
+                return min(self.__value(index), self.__max)
+        return self.__max
+
+    def percentiles(
+        self, percents: Iterable[float] = (5, 25, 50, 75, 95)
+    ) -> MappingProxyType[float, float]:
+        """
+        This method returns estimates of several percentiles (0 to 100), as an immutable dictionary
+        """
+        return MappingProxyType(
+            {percent: self.quantile(percent / 100) for percent in percents}
+        )
+
+    def __value(self, index: int) -> float:
+        """
+        The value that represents a bucket, within relative_accuracy of every value in it
+        """
+        return 2 * self.__gamma**index / (self.__gamma + 1)
+
+    @property
+    def count(self) -> int:
+        return self.__count
+
+    @property
+    def min(self) -> float:
+        return self.__min if self.__count else math.nan
+
+    @property
+    def max(self) -> float:
+        return self.__max if self.__count else math.nan
+
+    @property
+    def mean(self) -> float:
+        return self.__sum / self.__count if self.__count else math.nan
+
+    def __len__(self) -> int:
+        """The number of values added"""
+        return self.__count
+
+
+class Reducer(ABC):
+    """
+    This is the abstract base class of the streaming reducers
+    A reducer is a game listener, see Game.add_listener
+
+    Methods:
+        attach: Adds the reducer as a listener of a game
+        update: Takes one event. Called by the game
+        merge: Combines another reducer of the same kind into this one
+        report: Returns the statistics so far, as an immutable dictionary
+        empty: Returns a new reducer of the same kind and settings, with no statistics
+    """
+
+    def attach(self, game: Game) -> None:
+        """
+        This method adds the reducer as a listener of a game. If the game is garbage collected
+        before it is over, what the reducer kept of it is dropped
+        """
+        game.add_listener(self)
+        weakref.finalize(game, self._forget, game.game_id)
+
+    def __call__(self, event: GameEvent, details: MappingProxyType[str, Any]) -> None:
+        self.update(event, details)
+
+    @abstractmethod
+    def update(self, event: GameEvent, details: MappingProxyType[str, Any]) -> None:
+        """
+        This method takes one event of a game
+        """
+
+    @abstractmethod
+    def merge(self, other: "Reducer") -> None:
+        """
+        This method adds the statistics of another reducer of the same kind to this one
+        """
+
+    @abstractmethod
+    def report(self) -> MappingProxyType[str, Any]:
+        """
+        This method returns the statistics so far, as an immutable dictionary
+        """
+
+    def _forget(self, game_id: int) -> None:
+        """
+        Drops what the reducer keeps of a game that is gone. Reducers that keep anything override it
+        """
+
+    def empty(self) -> "Reducer":
+        """
+        This method returns a new reducer of the same kind and settings, with no statistics.
+        Reducers with settings override it to pass them on
+        """
+        return type(self)()
+
+    def _check_merge(self, other: "Reducer") -> None:
+        """
+        Raises an error if other is not a reducer of the same kind
+        """
+        if type(other) is not type(self):
+            raise ValueError(
+                f"{type(other).__name__} - Can only merge with another {type(self).__name__}"
+            )
+
+
+class ColourPicks(Reducer):
+    """
+    This reducer counts the moves and tiles taken of each colour,
+    and how often each colour is taken from the centre of the table
+    """
+
+    _moves: dict[str, int]
+    _tiles: dict[str, int]
+    _from_centre: dict[str, int]
+
+    def __init__(self) -> None:
+        self._moves = dict.fromkeys(TILE_COLOURS, 0)
+        self._tiles = dict.fromkeys(TILE_COLOURS, 0)
+        self._from_centre = dict.fromkeys(TILE_COLOURS, 0)
+
+    def update(self, event: GameEvent, details: MappingProxyType[str, Any]) -> None:
+        if event is GameEvent.MOVE:
+            colour = details["tile_type"]
+            self._moves[colour] += 1
+            # The floor tiles of a centre move include the player1 tile, which is not a colour tile
+            self._tiles[colour] += (
+                details["tiles_to_line"] + details["floor_tiles"] - details["takes_p1_tile"]
+            )
+            if details["factory_number"] == 0:
+                self._from_centre[colour] += 1
+
+    def merge(self, other: Reducer) -> None:
+        self._check_merge(other)
+        assert isinstance(other, ColourPicks)
+        for colour in TILE_COLOURS:
+            self._moves[colour] += other._moves[colour]
+            self._tiles[colour] += other._tiles[colour]
+            self._from_centre[colour] += other._from_centre[colour]
+
+    def report(self) -> MappingProxyType[str, Any]:
+        total = sum(self._moves.values())
+        return MappingProxyType(
+            {
+                "moves": MappingProxyType(dict(self._moves)),
+                "tiles": MappingProxyType(dict(self._tiles)),
+                "from_centre": MappingProxyType(dict(self._from_centre)),
+                "frequency": MappingProxyType(
+                    {
+                        colour: count / total if total else 0.0
+                        for colour, count in self._moves.items()
+                    }
+                ),
+            }
+        )
+
+
+class LineUsage(Reducer):
+    """
+    This reducer builds a heatmap of pattern line usage: the number of tiles placed on each
+    line (and the floor) in each round. Rows are rounds, columns are line1-line5 then the floor
+    """
+
+    _heatmap: list[list[int]]  # [round][line], the last column is the floor
+
+    def __init__(self) -> None:
+        self._heatmap = []
+
+    def update(self, event: GameEvent, details: MappingProxyType[str, Any]) -> None:
+        if event is GameEvent.MOVE:
+            row = self.__row(details["round"])
+            if details["line"] is not None:
+                row[_LINES.index(details["line"])] += details["tiles_to_line"]
+            row[-1] += details["floor_tiles"]
+
+    def __row(self, round_number: int) -> list[int]:
+        while len(self._heatmap) <= round_number:
+            self._heatmap.append([0] * len(_LINES))
+        return self._heatmap[round_number]
+
+    def merge(self, other: Reducer) -> None:
+        self._check_merge(other)
+        assert isinstance(other, LineUsage)
+        for round_number, other_row in enumerate(other._heatmap):
+            row = self.__row(round_number)
+            for i, count in enumerate(other_row):
+                row[i] += count
+
+    def report(self) -> MappingProxyType[str, Any]:
+        return MappingProxyType(
+            {
+                "columns": ("line1", "line2", "line3", "line4", "line5", "floor"),
+                "heatmap": tuple(tuple(row) for row in self._heatmap),
+                "totals": tuple(map(sum, zip(*self._heatmap))) or (0,) * len(_LINES),
+            }
+        )
+
+
+class WallFillOrder(Reducer):
+    """
+    This reducer records when each wall cell is filled: how often, in which round,
+    and its mean position in the order the tiles of a wall were placed (0 for the first tile)
+    """
+
+    _fills: list[int]  # Per cell (row * 5 + column)
+    _order_sum: list[int]
+    _rounds: list[list[int]]  # [cell][round] counts
+
+    def __init__(self) -> None:
+        self._fills = [0] * 25
+        self._order_sum = [0] * 25
+        self._rounds = [[] for _ in range(25)]
+
+    def update(self, event: GameEvent, details: MappingProxyType[str, Any]) -> None:
+        if event is GameEvent.WALL_TILE:
+            cell = (int(details["line"][-1]) - 1) * 5 + details["column"]
+            self._fills[cell] += 1
+            self._order_sum[cell] += details["order"]
+            rounds = self._rounds[cell]
+            while len(rounds) <= details["round"]:
+                rounds.append(0)
+            rounds[details["round"]] += 1
+
+    def merge(self, other: Reducer) -> None:
+        self._check_merge(other)
+        assert isinstance(other, WallFillOrder)
+        for cell in range(25):
+            self._fills[cell] += other._fills[cell]
+            self._order_sum[cell] += other._order_sum[cell]
+            rounds = self._rounds[cell]
+            for round_number, count in enumerate(other._rounds[cell]):
+                while len(rounds) <= round_number:
+                    rounds.append(0)
+                rounds[round_number] += count
+
+    def report(self) -> MappingProxyType[str, Any]:
+        def grid(values: list[Any]) -> tuple[tuple[Any, ...], ...]:
+            return tuple(tuple(values[row * 5 : row * 5 + 5]) for row in range(5))
+
+        return MappingProxyType(
+            {
+                "fills": grid(self._fills),
+                "mean_order": grid(
+                    [
+                        total / fills if fills else math.nan
+                        for total, fills in zip(self._order_sum, self._fills)
+                    ]
+                ),
+                "mean_round": grid(
+                    [
+                        sum(r * count for r, count in enumerate(rounds)) / fills
+                        if fills
+                        else math.nan
+                        for rounds, fills in zip(self._rounds, self._fills)
+                    ]
+                ),
+            }
+        )
+
+
+class FloorPenalties(Reducer):
+    """
+    This reducer collects the distribution of floor penalties, per player per round
+    and in total per player per game
+    """
+
+    _relative_accuracy: float
+    _round_histogram: dict[int, int]  # Penalty -> number of player rounds
+    _per_round: QuantileSketch
+    _per_game: QuantileSketch
+    _game_totals: dict[int, list[int]]  # game_id: the total penalty of each player, games in progress
+
+    def __init__(self, relative_accuracy: float = 0.01) -> None:
+        self._relative_accuracy = relative_accuracy
+        self._round_histogram = {}
+        self._per_round = QuantileSketch(relative_accuracy)
+        self._per_game = QuantileSketch(relative_accuracy)
+        self._game_totals = {}
+
+    def update(self, event: GameEvent, details: MappingProxyType[str, Any]) -> None:
+        if event is GameEvent.ROUND_END:
+            players = details["players"]
+            if details["round"] == 0:  # A new game, or a game reset before its end
+                self._game_totals[details["game"]] = [0] * players
+            totals = self._game_totals.setdefault(details["game"], [0] * players)
+            for player in range(Game.PLAYER_1, players + 1):
+                penalty = details[f"player{player}_floor_penalty"]
+                self._round_histogram[penalty] = self._round_histogram.get(penalty, 0) + 1
+                self._per_round.add(penalty)
+                totals[player - 1] += penalty
+        elif event is GameEvent.GAME_OVER:
+            for total in self._game_totals.pop(details["game"], ()):
+                self._per_game.add(total)
+
+    def _forget(self, game_id: int) -> None:
+        self._game_totals.pop(game_id, None)
+
+    def empty(self) -> "FloorPenalties":
+        return FloorPenalties(self._relative_accuracy)
+
+    def merge(self, other: Reducer) -> None:
+        self._check_merge(other)
+        assert isinstance(other, FloorPenalties)
+        for penalty, count in other._round_histogram.items():
+            self._round_histogram[penalty] = self._round_histogram.get(penalty, 0) + count
+        self._per_round.merge(other._per_round)
+        self._per_game.merge(other._per_game)
+
+    def report(self) -> MappingProxyType[str, Any]:
+        return MappingProxyType(
+            {
+                "round_histogram": MappingProxyType(dict(sorted(self._round_histogram.items()))),
+                "per_round": self._per_round.percentiles(),
+                "per_game": self._per_game.percentiles(),
+                "mean_per_round": self._per_round.mean,
+                "mean_per_game": self._per_game.mean,
+            }
+        )
+
+
+class ScoreByRound(Reducer):
+    """
+    This reducer collects the distribution of scores at the end of each round,
+    and of the final scores, for every player together
+    """
+
+    _relative_accuracy: float
+    _rounds: list[QuantileSketch]
+    _final: QuantileSketch
+    _margin: QuantileSketch  # Winner's score less the runner up's
+
+    def __init__(self, relative_accuracy: float = 0.01) -> None:
+        self._relative_accuracy = relative_accuracy
+        self._rounds = []
+        self._final = QuantileSketch(relative_accuracy)
+        self._margin = QuantileSketch(relative_accuracy)
+
+    def update(self, event: GameEvent, details: MappingProxyType[str, Any]) -> None:
+        if event is GameEvent.ROUND_END:
+            sketch = self.__round(details["round"])
+            for player in range(Game.PLAYER_1, details["players"] + 1):
+                sketch.add(details[f"player{player}_score"])
+        elif event is GameEvent.GAME_OVER:
+            scores = sorted(
+                details[f"player{player}_score"]
+                for player in range(Game.PLAYER_1, details["players"] + 1)
+            )
+            for score in scores:
+                self._final.add(score)
+            self._margin.add(scores[-1] - scores[-2])
+
+    def __round(self, round_number: int) -> QuantileSketch:
+        while len(self._rounds) <= round_number:
+            self._rounds.append(QuantileSketch(self._relative_accuracy))
+        return self._rounds[round_number]
+
+    def empty(self) -> "ScoreByRound":
+        return ScoreByRound(self._relative_accuracy)
+
+    def merge(self, other: Reducer) -> None:
+        self._check_merge(other)
+        assert isinstance(other, ScoreByRound)
+        for round_number, sketch in enumerate(other._rounds):
+            self.__round(round_number).merge(sketch)
+        self._final.merge(other._final)
+        self._margin.merge(other._margin)
+
+    def report(self) -> MappingProxyType[str, Any]:
+        return MappingProxyType(
+            {
+                "rounds": tuple(
+                    MappingProxyType(
+                        {"count": sketch.count, "mean": sketch.mean, **sketch.percentiles()}
+                    )
+                    for sketch in self._rounds
+                ),
+                "final": self._final.percentiles(),
+                "mean_final": self._final.mean,
+                "margin": self._margin.percentiles(),
+            }
+        )
+
+
+class StatsCollector(Reducer):
+    """
+    This reducer runs a set of reducers together, by name.
+    With no reducers supplied, it runs one of each reducer in this module
+
+    Args:
+        reducers (dict[str, Reducer]): OPTIONAL: The reducers to run
+
+    Methods:
+        attach, update, merge, report, empty: As for every reducer, applied to each reducer in turn
+        merge_all: Merges many collectors, e.g one from each worker process
+    """
+
+    _reducers: dict[str, Reducer]
+    _games: int
+
+    def __init__(self, reducers: dict[str, Reducer] | None = None) -> None:
+        self._reducers = (
+            dict(reducers)
+            if reducers is not None
+            else {
+                "colour_picks": ColourPicks(),
+                "line_usage": LineUsage(),
+                "wall_fill_order": WallFillOrder(),
+                "floor_penalties": FloorPenalties(),
+                "score_by_round": ScoreByRound(),
+            }
+        )
+        self._games = 0
+
+    def update(self, event: GameEvent, details: MappingProxyType[str, Any]) -> None:
+        if event is GameEvent.GAME_OVER:
+            self._games += 1
+        for reducer in self._reducers.values():
+            reducer.update(event, details)
+
+    def _forget(self, game_id: int) -> None:
+        for reducer in self._reducers.values():
+            reducer._forget(game_id)
+
+    def merge(self, other: Reducer) -> None:
+        self._check_merge(other)
+        assert isinstance(other, StatsCollector)
+        if other._reducers.keys() != self._reducers.keys():
+            raise ValueError("Can only merge collectors with the same reducers")
+        for name, reducer in self._reducers.items():
+            reducer.merge(other._reducers[name])
+        self._games += other._games
+
+    def empty(self) -> "StatsCollector":
+        return StatsCollector(
+            {name: reducer.empty() for name, reducer in self._reducers.items()}
+        )
+
+    @classmethod
+    def merge_all(cls, collectors: Iterable["StatsCollector"]) -> "StatsCollector":
+        """
+        This method merges many collectors into a new collector.
+        The collectors must all run the same reducers, with the same settings
+        """
+        collectors = iter(collectors)
+        try:
+            merged = next(collectors)
+        except StopIteration:
+            return cls()
+        # Merged into an empty copy, so the collectors passed in are unchanged
+        result = merged.empty()
+        for collector in (merged, *collectors):
+            result.merge(collector)
+        return result
+
+    def report(self) -> MappingProxyType[str, Any]:
+        return MappingProxyType(
+            {"games": self._games}
+            | {name: reducer.report() for name, reducer in self._reducers.items()}
+        )
@@ -1,5 +1,6 @@
 import random
-from azul_backend.tiles import ColourTile, P1Tile
+import struct
+from azul_backend.tiles import ColourTile, P1Tile, TILE_COLOURS, TILE_CODES, TILE_TYPES
 from textwrap import dedent
 
 
@@ -15,6 +16,7 @@ class TileBag:
     Methods:
         draw_tile: Draw a random tile from the bag
         take_p1_tile: Take the P1 tile
+        show_bag_counts: The number of tiles of each colour left in the bag
         __len__: The total number of tiles in the bag
         __str__: Summary information about the TileBag
         __repr__: Detailed information about the TileBag
@@ -26,13 +28,26 @@ class TileBag:
     __tile_bag: list[ColourTile]
     __size: int
     __p1_size: int
+    # Every fill of the bag is shuffled by its own generator, seeded from the seed of the bag and the
+    # number of refills so far. This keeps the whole future of the bag reproducible from two numbers
+    __seed: int
+    __refills: int
 
-    def __init__(self) -> None:
+    # Seeds are stored as 64 bit unsigned ints, so that they pack into a fixed width (see _export_state)
+    SEED_MASK = 2**64 - 1
+
+    def __init__(self, seed: int | None = None) -> None:
         """
         This is the constructor for the TileBag class
         It fills the tile bag with 100 tiles and shuffles them
         It records that the P1 tile has not been taken
+
+        Args:
+            seed (int): OPTIONAL: Seed for the shuffles of this bag, for reproducible games.
+                If not supplied a random seed is chosen, see get_seed
         """
+        self.__set_seed(seed)
+        self.__tile_bag = []
         self._reset_tile_bag()
         # The game starts with the player1 tile possessed by the _tiles object
         # The below is used to ensure player1 tile is released to the game
@@ -51,7 +66,8 @@ class TileBag:
         """
         NO_OF_COLOUR_TILES: int = 20  # Makes it easy for future changes
 
-        self.__tile_bag = [
+        # Refilled in place, so that a reused bag does not allocate a new list
+        self.__tile_bag[:] = [
             ColourTile("blue"),
             ColourTile("yellow"),
             ColourTile("red"),
@@ -62,7 +78,54 @@ class TileBag:
             NO_OF_COLOUR_TILES * 5
         )  # Maintain a count of the number of tiles in the bag
 
-        random.shuffle(self.__tile_bag)  # Shuffle the bag
+        # Shuffle the bag
+        random.Random(f"{self.__seed}:{self.__refills}").shuffle(self.__tile_bag)
+        self.__refills += 1
+
+    def __set_seed(self, seed: int | None) -> None:
+        """
+        Sets the seed of the bag and restarts the count of refills
+        """
+        if seed is None:
+            seed = random.getrandbits(64)
+        elif not isinstance(seed, int):
+            raise ValueError(f"{seed} - Invalid seed, the seed must be an int")
+
+        self.__seed = seed & self.SEED_MASK
+        self.__refills = 0
+
+    def get_seed(self) -> int:
+        """
+        This method returns the seed of the bag, as a 64 bit unsigned int
+        A new bag with this seed shuffles exactly as this one did
+        """
+        return self.__seed
+
+    def get_refills(self) -> int:
+        """
+        This method returns the number of times the bag has been filled, counting the first fill
+        """
+        return self.__refills
+
+    # Protected, only used by Factory when a game is reset
+    def _reinitialise(self, seed: int | None = None) -> None:
+        """
+        This method returns the bag to the state of a new bag, in place.
+        100 freshly shuffled tiles and the P1 tile not yet taken
+        """
+        self.__set_seed(seed)
+        self._reset_tile_bag()
+        self.__p1_size = 1
+
+    # Protected, only used to create determinized copies of a game
+    def _shuffle_tile_bag(self, rng: random.Random) -> None:
+        """
+        This method reshuffles the tiles left in the bag with the supplied random number generator
+        The number of tiles of each colour is unchanged.
+        The bag is also reseeded, so the shuffles of later refills are hidden too
+        """
+        rng.shuffle(self.__tile_bag)
+        self.__seed = rng.getrandbits(64)
 
     def draw_tile(self) -> ColourTile:
         """
@@ -91,6 +154,45 @@ class TileBag:
 
         return P1Tile()
 
+    def show_bag_counts(self) -> tuple[int, ...]:
+        """
+        This method returns the number of tiles of each colour left in the bag
+        as a tuple, in the order ("blue", "yellow", "red", "black", "white").
+        The counts are public knowledge in the real game, the order of the bag is not
+        """
+        counts = dict.fromkeys(TILE_COLOURS, 0)
+        for tile in self.__tile_bag:
+            counts[tile.get_tile_type()] += 1
+
+        return tuple(counts.values())
+
+    # Fixed width layout of _export_state: seed, refills, P1 tile, number of tiles, then 100 tile codes
+    _STATE_HEADER = struct.Struct("<QIBB")
+    STATE_SIZE = _STATE_HEADER.size + 100
+
+    # Protected, used by Factory to pack the state of a game
+    def _export_state(self) -> bytes:
+        """
+        This method returns the complete state of the bag, including the hidden order, as bytes
+        The tiles are drawn from the end of the bag
+        """
+        return self._STATE_HEADER.pack(
+            self.__seed, self.__refills, self.__p1_size, self.__size
+        ) + bytes(TILE_CODES[tile.get_tile_type()] for tile in self.__tile_bag).ljust(
+            100, b"\0"
+        )
+
+    # Protected, used by Factory to restore a packed game
+    def _import_state(self, state: bytes) -> None:
+        """
+        This method restores the bag from the bytes of _export_state, in place
+        """
+        self.__seed, self.__refills, self.__p1_size, self.__size = (
+            self._STATE_HEADER.unpack_from(state)
+        )
+        codes = state[self._STATE_HEADER.size : self._STATE_HEADER.size + self.__size]
+        self.__tile_bag[:] = [ColourTile(TILE_TYPES[code]) for code in codes]
+
     def __len__(self) -> int:
         """
         The total number of tiles in the bag
@@ -19,6 +19,34 @@
 
 from textwrap import dedent
 
+# The five tile colours, in the order used wherever colours are indexed or counted
+TILE_COLOURS: tuple[str, ...] = ("blue", "yellow", "red", "black", "white")
+
+# Each tile type packs into one byte (0 is used for an empty space). See Game.pack_state
+TILE_CODES: dict[str, int] = {
+    colour: code for code, colour in enumerate(TILE_COLOURS, start=1)
+} | {"player1": 6}
+TILE_TYPES: dict[int, str] = {code: tile_type for tile_type, code in TILE_CODES.items()}
+
+
+def tile_from_code(code: int) -> "ColourTile | P1Tile":
+    """
+    This function creates a new tile from its tile code, with the default display colour and text
+    """
+    if code == TILE_CODES["player1"]:
+        return P1Tile()
+    try:
+        return ColourTile(TILE_TYPES[code])
+    except KeyError:
+        raise ValueError(f"{code} - Invalid tile code") from None
+
+# The wall position of each colour on each wall line. Each line is the line above shifted right by one
+# e.g blue is at 0 on line1, 1 on line2 ... yellow is at 1 on line1 ... 0 on line5
+WALL_POSITIONS: dict[str, dict[str, int]] = {
+    colour: {f"line{row + 1}": (column + row) % 5 for row in range(5)}
+    for column, colour in enumerate(TILE_COLOURS)
+}
+
 
 class P1Tile:
     """
@@ -206,59 +234,14 @@ class ColourTile(P1Tile):
         # Performed by the wall module. As this functionality is only used there
         # This is a potential refactor for the future
 
-        if wall_line not in ["line1", "line2", "line3", "line4", "line5"]:
+        # The table is built once at import, this method is called on every wall tiling and score
+        positions = WALL_POSITIONS[self.__tile_type]
+        if wall_line not in positions:
             raise ValueError(
                 f"{wall_line} is not a valid wall line, please use 'line1', 'line2', 'line3', 'line4', 'line5'"
             )
 
-        blue_positions = {
-            "line1": 0,
-            "line2": 1,
-            "line3": 2,
-            "line4": 3,
-            "line5": 4,
-        }
-        yellow_positions = {
-            "line1": 1,
-            "line2": 2,
-            "line3": 3,
-            "line4": 4,
-            "line5": 0,
-        }
-        red_positions = {
-            "line1": 2,
-            "line2": 3,
-            "line3": 4,
-            "line4": 0,
-            "line5": 1,
-        }
-        black_positions = {
-            "line1": 3,
-            "line2": 4,
-            "line3": 0,
-            "line4": 1,
-            "line5": 2,
-        }
-        white_positions = {
-            "line1": 4,
-            "line2": 0,
-            "line3": 1,
-            "line4": 2,
-            "line5": 3,
-        }
-
-        if self.__tile_type == "blue":
-            return blue_positions[wall_line]
-        elif self.__tile_type == "yellow":
-            return yellow_positions[wall_line]
-        elif self.__tile_type == "red":
-            return red_positions[wall_line]
-        elif self.__tile_type == "black":
-            return black_positions[wall_line]
-        elif self.__tile_type == "white":
-            return white_positions[wall_line]
-        else:
-            raise ValueError("Invalid tile type")
+        return positions[wall_line]
 
     # Need to override this method, as __tile_type is private in parent class
     def get_tile_type(self) -> str:
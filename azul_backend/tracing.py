@@ -0,0 +1,223 @@
+## File: tracing.py
+## Date: 2024-03-29
+## This module creates a sampled tracer of the engine calls of live games
+
+# Rare bugs (e.g the RuntimeError of Game._prepare_for_next_round when neither floor holds the
+# player1 tile) are hard to reproduce from a report. Tracer records what the engine did in a
+# sample of live games, cheaply enough to leave on in production.
+
+# A game attached to the tracer is traced if it is sampled: 1 in sample_rate games, picked by
+# a hash of the seed of the game, so the same game is always either traced or not.
+# For a traced game the tracer records a "game" event with the seed and the moves played so far
+# (enough to replay the game exactly, see replay.py), then one event for every engine call the
+# span listeners report (Game.add_span_listener): factory offer, pattern line placement, forced
+# move, wall tiling, penalty and round preparation. Each event holds the arguments, duration,
+# error (if any) and a hash of the state of the game after the call (Game.pack_state).
+
+# Events go into a ring buffer of fixed size, which costs the game thread an append. A background
+# thread writes the buffer to a JSON lines file every interval (or on flush). If the buffer fills
+# between writes the oldest events are dropped, and counted.
+
+import collections
+import hashlib
+import itertools
+import json
+import threading
+import time
+import weakref
+from types import MappingProxyType
+from typing import Any
+
+from azul_backend.game import Game
+
+
+def state_hash(game: Game) -> str:
+    """
+    This function returns a short hash of the complete state of a game, as hex
+    """
+    return hashlib.blake2b(game.pack_state(), digest_size=8).hexdigest()
+
+
+class Tracer:
+    """
+    This class records the engine calls of a sample of games into a ring buffer,
+    and writes them to a JSON lines file from a background thread
+
+    Args:
+        path (str): The JSON lines file, appended to
+        sample_rate (int): 1 in sample_rate games is traced. 1 traces every game
+        capacity (int): The number of events the ring buffer holds
+        interval (float): Seconds between writes of the buffer
+
+    Methods:
+        attach: Starts tracing a game, if it is sampled
+        detach: Stops tracing a game
+        sampled: Whether a game would be traced
+        flush: Writes the buffer now
+        close: Writes the buffer and stops the background thread
+        dropped: The number of events dropped because the buffer was full
+    """
+
+    _path: str
+    _sample_rate: int
+    __buffer: "collections.deque[dict[str, Any]]"
+    __capacity: int
+    __interval: float
+    __listeners: "weakref.WeakKeyDictionary[Game, Any]"
+    __trace_ids: "itertools.count[int]"
+    __dropped: int
+    __lock: threading.Lock
+    __write_lock: threading.Lock
+    __wake: threading.Event
+    __closed: bool
+    __thread: threading.Thread
+
+    def __init__(
+        self,
+        path: str,
+        sample_rate: int = 1000,
+        capacity: int = 100_000,
+        interval: float = 1.0,
+    ) -> None:
+        """Create the tracer, and start its background writer"""
+        if not isinstance(sample_rate, int) or sample_rate < 1:
+            raise ValueError(f"{sample_rate} - sample_rate must be a positive int")
+        if not isinstance(capacity, int) or capacity < 1:
+            raise ValueError(f"{capacity} - capacity must be a positive int")
+
+        self._path = path
+        self._sample_rate = sample_rate
+        self.__buffer = collections.deque(maxlen=capacity)
+        self.__capacity = capacity
+        self.__interval = interval
+        self.__listeners = weakref.WeakKeyDictionary()
+        self.__trace_ids = itertools.count(1)
+        self.__dropped = 0
+        self.__lock = threading.Lock()
+        self.__write_lock = threading.Lock()
+        self.__wake = threading.Event()
+        self.__closed = False
+        self.__thread = threading.Thread(target=self.__run, name="Tracer", daemon=True)
+        self.__thread.start()
+
+    @property
+    def dropped(self) -> int:
+        """The number of events dropped because the buffer was full"""
+        return self.__dropped
+
+    def sampled(self, game: Game) -> bool:
+        """
+        This method returns True if the game would be traced, decided by its seed
+        """
+        digest = hashlib.blake2b(game.show_seed().to_bytes(8, "little"), digest_size=8)
+        return int.from_bytes(digest.digest(), "little") % self._sample_rate == 0
+
+    def attach(self, game: Game) -> bool:
+        """
+        This method starts tracing a game if it is sampled, and returns True if it is
+        """
+        if self.__closed:
+            raise RuntimeError("The tracer has been closed")
+        if game in self.__listeners or not self.sampled(game):
+            return False
+
+        trace = next(self.__trace_ids)
+        sequence = itertools.count(1)
+        reference = weakref.ref(game)  # The listener must not keep the game alive
+
+        def listener(name: str, details: MappingProxyType[str, Any]) -> None:
+            traced = reference()
+            if traced is None:
+                return
+            try:
+                after = state_hash(traced)
+            except Exception:  # A call that failed can leave the game part way through
+                after = None
+            error = details["error"]
+            self.__record(
+                {
+                    "trace": trace,
+                    "seq": next(sequence),
+                    "time": time.time(),
+                    "span": name,
+                    "depth": details["depth"],
+                    "args": details["args"],
+                    "duration_ns": details["duration_ns"],
+                    "error": None if error is None else f"{type(error).__name__}: {error}",
+                    "player": traced.show_current_player(),
+                    "round": traced.rounds_played,
+                    "moves": traced.moves_this_game,
+                    "state_hash": after,
+                }
+            )
+
+        self.__record(
+            {
+                "trace": trace,
+                "seq": 0,
+                "time": time.time(),
+                "span": "game",
+                "seed": game.show_seed(),
+                "move_history": game.show_move_history(),
+                "state_hash": state_hash(game),
+            }
+        )
+        self.__listeners[game] = listener
+        game.add_span_listener(listener)
+        return True
+
+    def detach(self, game: Game) -> None:
+        """
+        This method stops tracing a game
+        """
+        listener = self.__listeners.pop(game, None)
+        if listener is not None:
+            game.remove_span_listener(listener)
+
+    def __record(self, event: dict[str, Any]) -> None:
+        """
+        Adds an event to the ring buffer, dropping the oldest if it is full
+        """
+        with self.__lock:
+            if len(self.__buffer) == self.__capacity:
+                self.__dropped += 1
+            self.__buffer.append(event)
+
+    def flush(self) -> None:
+        """
+        This method writes the events in the buffer to the file now
+        """
+        with self.__write_lock:
+            with self.__lock:
+                events = list(self.__buffer)
+                self.__buffer.clear()
+            if not events:
+                return
+            with open(self._path, "a") as output:
+                for event in events:
+                    output.write(json.dumps(event, default=str) + "\n")
+
+    def close(self) -> None:
+        """
+        This method stops tracing every game, writes the buffer and stops the background thread
+        """
+        for game in list(self.__listeners):
+            self.detach(game)
+        self.__closed = True
+        self.__wake.set()
+        self.__thread.join()
+        self.flush()
+
+    def __enter__(self) -> "Tracer":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def __run(self) -> None:
+        """
+        Background thread. Writes the buffer every interval until closed
+        """
+        while not self.__closed:
+            self.__wake.wait(self.__interval)
+            self.flush()
@@ -7,9 +7,18 @@ from types import MappingProxyType
 # For making the dictionaries immutable when showing contents to the use
 
 from collections import deque
-from azul_backend.tiles import ColourTile
+from typing import Any
+from azul_backend.tiles import ColourTile, TILE_COLOURS, WALL_POSITIONS
 from textwrap import dedent
 
+# Row of each wall line, used to index the occupancy mask
+_ROWS: dict[str, int] = {"line1": 0, "line2": 1, "line3": 2, "line4": 3, "line5": 4}
+
+# End of game bonuses, for each complete row, complete column and colour with all 5 tiles on the wall
+ROW_BONUS: int = 2
+COLUMN_BONUS: int = 7
+COLOUR_BONUS: int = 10
+
 
 class Wall:
     """
@@ -22,9 +31,22 @@ class Wall:
 
     Properties:
         is_game_over: returns True if this wall indicates the game is over
+        end_game_bonus: the end of game bonus earned by this wall so far
+        number_of_tiles: the number of tiles on the wall
     """
 
     __player_wall: dict[str, deque[ColourTile | None]]
+    # Bit (row * 5 + column) is set when that position holds a tile. Kept in step with __player_wall,
+    # it lets scores be worked out (or previewed) without walking the deques
+    _occupied: int
+    # Tiles in each row, column and colour (TILE_COLOURS order), and the bonus they have earned so far.
+    # Updated as each tile is placed, so bonuses never need the wall to be scanned
+    __row_counts: list[int]
+    __column_counts: list[int]
+    __colour_counts: list[int]
+    __end_game_bonus: int
+    # The immutable view handed out by show_wall. None when the wall has changed since it was built
+    _cached_view: MappingProxyType[str, tuple[ColourTile | None, ...]] | None
 
     def __init__(self) -> None:
         """
@@ -41,18 +63,43 @@ class Wall:
             "line4": deque([None] * WALL_SIZE, maxlen=WALL_SIZE),
             "line5": deque([None] * WALL_SIZE, maxlen=WALL_SIZE),
         }
+        self._occupied = 0
+        self.__row_counts = [0] * WALL_SIZE
+        self.__column_counts = [0] * WALL_SIZE
+        self.__colour_counts = [0] * WALL_SIZE
+        self.__end_game_bonus = 0
+        self._cached_view = None
+
+    # Protected, only used by Game when a game is reset
+    def _reinitialise(self) -> None:
+        """
+        This method empties the wall in place
+        """
+        for wall_line in self.__player_wall.values():
+            for i in range(len(wall_line)):
+                wall_line[i] = None
+        self._occupied = 0
+        for counts in (self.__row_counts, self.__column_counts, self.__colour_counts):
+            counts[:] = [0] * len(counts)
+        self.__end_game_bonus = 0
+        self._cached_view = None
 
     def show_wall(self) -> MappingProxyType[str, tuple[ColourTile | None, ...]]:
         """
         This method returns the wall as an immutable dictionary
         (MappingProxyType) from types
+        The view is built once and reused until the wall next changes
         """
-        tuple_dict_wall = {
-            key: tuple(value) for key, value in self.__player_wall.items()
-        }
-        return MappingProxyType(tuple_dict_wall)
-
-    def move_tile_to_wall(self, tile: ColourTile, line: str) -> int:
+        if self._cached_view is None:
+            tuple_dict_wall = {
+                key: tuple(value) for key, value in self.__player_wall.items()
+            }
+            self._cached_view = MappingProxyType(tuple_dict_wall)
+        return self._cached_view
+
+    def move_tile_to_wall(
+        self, tile: ColourTile, line: str, validate: bool = True
+    ) -> int:
         """
         This method moves a supplied Colour_Tile to the specified line on the wall
         Line must be in the format of "line*"
@@ -61,9 +108,12 @@ class Wall:
         Args:
             tile: ColourTile - The tile to be moved to the wall
             line: str - The line on the wall to move the tile to (e.g "line1")
+            validate: bool - OPTIONAL: If False the checks on the tile and line are skipped,
+                for trusted callers whose moves are known to be legal
         """
-        self._check_colour_tile(tile)  # Check that tile is a valid ColourTile
-        self._check_line_string(line)  # Check that line is a valid input.
+        if validate:
+            self._check_colour_tile(tile)  # Check that tile is a valid ColourTile
+            self._check_line_string(line)  # Check that line is a valid input.
 
         wall = self.__player_wall
         wall_line = wall[line]
@@ -72,6 +122,9 @@ class Wall:
         if wall_line[wall_position] is None:
             # Only place the tile on the wall if the position is empty
             wall_line[wall_position] = tile
+            self._occupied |= 1 << (_ROWS[line] * 5 + wall_position)
+            self.__end_game_bonus += self.__count_tile(_ROWS[line], wall_position)
+            self._cached_view = None
         else:
             # If the position is already occupied, raise an error
             # This would only occur due to a failure in PaternLine class not checking the wall was free
@@ -80,7 +133,7 @@ class Wall:
                 f"{tile} - Invalid move, position already occupied on wall"
             )
 
-        return self._score_move(tile, line)
+        return self._score_move(tile, line, validate=False)  # Already checked above
 
     def get_possible_moves(self, line: str) -> tuple[str, ...]:
         """
@@ -105,12 +158,106 @@ class Wall:
         i.e a horizontal line is complete
         """
         # Check if the  player has completed a horizontal line
-        for i in range(1, 6):
-            if not None in self.__player_wall["line" + str(i)]:
+        for row in range(5):
+            if (self._occupied >> (row * 5)) & 0b11111 == 0b11111:
                 return True
         # If not, return False
         return False
 
+    @property
+    def number_of_tiles(self) -> int:
+        """
+        Returns the number of tiles on the wall
+        """
+        return self._occupied.bit_count()
+
+    @property
+    def end_game_bonus(self) -> int:
+        """
+        Returns the end of game bonus this wall has earned so far:
+        2 for each complete row, 7 for each complete column and
+        10 for each colour with all 5 tiles on the wall
+        """
+        return self.__end_game_bonus
+
+    def projected_end_game_bonus(
+        self, placements: list[tuple[str, str]] | tuple[tuple[str, str], ...] = ()
+    ) -> int:
+        """
+        Returns the end of game bonus the wall would have after the supplied tiles were placed,
+        without changing the wall. Each placement is (tile_type, line), e.g ("blue", "line3").
+        Placements on positions that are already occupied are ignored
+        Only the counts of the affected rows, columns and colours are looked at
+        """
+        bonus = self.__end_game_bonus
+        occupied = self._occupied
+        extra_rows: dict[int, int] = {}
+        extra_columns: dict[int, int] = {}
+        extra_colours: dict[int, int] = {}
+
+        for tile_type, line in placements:
+            row = _ROWS[line]
+            column = WALL_POSITIONS[tile_type][line]
+            if occupied >> (row * 5 + column) & 1:
+                continue
+            occupied |= 1 << (row * 5 + column)
+            colour = (column - row) % 5
+
+            extra_rows[row] = extra_rows.get(row, 0) + 1
+            extra_columns[column] = extra_columns.get(column, 0) + 1
+            extra_colours[colour] = extra_colours.get(colour, 0) + 1
+            if self.__row_counts[row] + extra_rows[row] == 5:
+                bonus += ROW_BONUS
+            if self.__column_counts[column] + extra_columns[column] == 5:
+                bonus += COLUMN_BONUS
+            if self.__colour_counts[colour] + extra_colours[colour] == 5:
+                bonus += COLOUR_BONUS
+
+        return bonus
+
+    def __count_tile(self, row: int, column: int) -> int:
+        """
+        Adds a newly placed tile to the row, column and colour counts
+        Returns the end of game bonus this tile completes
+        """
+        colour = (column - row) % 5  # Blue runs down the diagonal of the wall
+        self.__row_counts[row] += 1
+        self.__column_counts[column] += 1
+        self.__colour_counts[colour] += 1
+
+        bonus = 0
+        if self.__row_counts[row] == 5:
+            bonus += ROW_BONUS
+        if self.__column_counts[column] == 5:
+            bonus += COLUMN_BONUS
+        if self.__colour_counts[colour] == 5:
+            bonus += COLOUR_BONUS
+        return bonus
+
+    def _is_position_free(self, tile_type: str, line: str) -> bool:
+        """
+        Returns True if the position of a colour on a line of the wall is free.
+        A quicker form of get_possible_moves, for callers that have already checked their inputs
+        """
+        row = _ROWS[line]
+        return not self._occupied >> (row * 5 + WALL_POSITIONS[tile_type][line]) & 1
+
+    def _preview_score(self, tile_type: str, line: str) -> int:
+        """
+        This method returns the score that placing a tile of this colour on the line would make,
+        exactly as _score_move would award it, without changing the wall
+        """
+        row = _ROWS[line]
+        column = WALL_POSITIONS[tile_type][line]
+        if self._occupied >> (row * 5 + column) & 1:
+            raise RuntimeError(
+                f"{tile_type} - Invalid move, position already occupied on wall"
+            )
+
+        return self._score_position(
+            row, column, self._occupied | 1 << (row * 5 + column)
+        )
+
     def _check_line_string(self, line: str) -> None:
         """
         This method checks if the line string is in the correct format
@@ -133,19 +280,32 @@ class Wall:
         self,
         tile: ColourTile,
         line: str,
+        validate: bool = True,
     ) -> int:
         """
         This method returns the score made from the placing
         of a single tile onto the wall
         """
-        self._check_line_string(line)  # Check that line is a valid input.
+        if validate:
+            self._check_line_string(line)  # Check that line is a valid input.
 
+        return self._score_position(
+            _ROWS[line], tile.wall_position(line), self._occupied
+        )
+
+    @staticmethod
+    def _score_position(row: int, column: int, occupied: int) -> int:
+        """
+        This method returns the score of the tile at (row, column) of a wall,
+        given the occupancy mask of the wall with that tile in place.
+        It is the support method for _score_move() and _preview_score()
+        """
         return_score = 0  # what is returned at the end
         basic_score = 1  # Starting from 1, as a tile on it's own scores 1
 
         # Get the horizontal and vertical sweep scores from the helper methods
-        horizontal_sweep_score = self._score_move_horizontal(tile, line)
-        vertical_sweep_score = self._vertical_sweep_score(tile, line)
+        horizontal_sweep_score = Wall._horizontal_sweep_score(row, column, occupied)
+        vertical_sweep_score = Wall._vertical_sweep_score(row, column, occupied)
 
         if horizontal_sweep_score and vertical_sweep_score == 1:
             # This is a tile on it's own, return just basic_score
@@ -162,59 +322,81 @@ class Wall:
 
         return return_score
 
-    def _score_move_horizontal(self, tile: ColourTile, line: str) -> int:
+    @staticmethod
+    def _horizontal_sweep_score(row: int, column: int, occupied: int) -> int:
         """
         This method returns the "horizontal sweep" score made from the placing
         of a single tile onto the wall.
-        It is a support method for _score_move()
+        It is a support method for _score_position()
         """
         horizontal_sweep_score: int = 0
-        wall = self.__player_wall
-        wall_line = wall[line]
-        wall_position = tile.wall_position(line)
         # Check Horizontal
         # I have to be careful here, in left/rightmost position as I cannot search outside the bounds of the wall
-        for i in range(wall_position, 5):
-            if wall_line[i] is not None:
+        for i in range(column, 5):
+            if occupied >> (row * 5 + i) & 1:
                 horizontal_sweep_score += 1
             else:
                 break
         return horizontal_sweep_score
 
-    def _vertical_sweep_score(self, tile: ColourTile, line: str) -> int:
+    @staticmethod
+    def _vertical_sweep_score(row: int, column: int, occupied: int) -> int:
         """
         This method returns the "vertical sweep" score made from the placing
         of a single tile onto the wall.
-        It is a support method for _score_move()
+        It is a support method for _score_position()
         """
         vertical_sweep_score: int = 0
-        wall = self.__player_wall
-        wall_position = tile.wall_position(line)
-
-        vertical_dict = {
-            "line1": 0,
-            "line2": 1,
-            "line3": 2,
-            "line4": 3,
-            "line5": 4,
-        }
 
         # Check Vertical
         # I have to be careful here, in top/bottom as I cannot search outside the bounds of the wall
-        for i in range(vertical_dict[line], 5):
-            if wall["line" + str(i + 1)][wall_position] is not None:
+        for i in range(row, 5):
+            if occupied >> (i * 5 + column) & 1:
                 vertical_sweep_score += 1
             else:
                 break
 
-        for i in range(vertical_dict[line], 0, -1):
-            # Note the max function here, as I cannot search outside the bounds of the wall
-            if wall["line" + str(max(i, 1))][wall_position] is not None:
+        for i in range(row - 1, -1, -1):
+            if occupied >> (i * 5 + column) & 1:
                 vertical_sweep_score += 1
             else:
                 break
         return vertical_sweep_score
 
+    STATE_SIZE = 4  # The occupancy mask, the colour of each position is fixed
+
+    # Protected, used by Game to pack the state of a game
+    def _export_state(self) -> bytes:
+        """
+        This method returns the state of the wall as bytes
+        """
+        return self._occupied.to_bytes(self.STATE_SIZE, "little")
+
+    # Protected, used by Game to restore a packed game
+    def _import_state(self, state: bytes) -> None:
+        """
+        This method restores the wall from the bytes of _export_state, in place.
+        The counts and bonus are rebuilt from the tiles
+        """
+        self._reinitialise()
+        occupied = int.from_bytes(state[: self.STATE_SIZE], "little")
+        for line, row in _ROWS.items():
+            for column in range(5):
+                if occupied >> (row * 5 + column) & 1:
+                    colour = TILE_COLOURS[(column - row) % 5]
+                    self.__player_wall[line][column] = ColourTile(colour)
+                    self.__end_game_bonus += self.__count_tile(row, column)
+        self._occupied = occupied
+
+    def __getstate__(self) -> dict[str, Any]:
+        """
+        The cached view is left out when the wall is copied or pickled
+        (MappingProxyType can not be pickled). It is rebuilt on demand
+        """
+        state = self.__dict__.copy()
+        state["_cached_view"] = None
+        return state
+
     def __str__(self) -> str:
         """
         This method returns a detailed string representation of the game
@@ -0,0 +1,54 @@
+import random
+
+import pytest
+
+from azul_backend.actions import (
+    ACTION_COUNT,
+    ACTION_TABLE,
+    decode_action,
+    decode_moves,
+    encode_move,
+    encode_moves,
+)
+from azul_backend.game import Game
+
+
+def test_every_action_round_trips():
+    assert len(ACTION_TABLE) == ACTION_COUNT
+    for action_id in range(ACTION_COUNT):
+        assert encode_move(decode_action(action_id)) == action_id
+
+
+@pytest.mark.parametrize("players", [2, 3, 4])
+def test_legal_actions_match_legal_moves(players):
+    game = Game(seed=5, players=players)
+    rng = random.Random(5)
+    while not game.is_game_over:
+        moves = game.legal_moves()
+        assert game.legal_actions() == tuple(encode_move(move) for move in moves)
+        game.play_move(rng.choice(moves))
+
+
+def test_moves_pack_two_bytes_each():
+    action_ids = tuple(range(ACTION_COUNT))
+    data = encode_moves(action_ids)
+    assert len(data) == 2 * len(action_ids)
+    assert decode_moves(data) == action_ids
+    assert decode_moves(encode_moves(())) == ()
+    with pytest.raises(ValueError):
+        encode_moves([ACTION_COUNT])
+    with pytest.raises(ValueError):
+        decode_moves(data[:-1])
+
+
+@pytest.mark.parametrize("bad", [-1, ACTION_COUNT, "3", 2.0])
+def test_invalid_action_ids(bad):
+    with pytest.raises(ValueError):
+        decode_action(bad)
+
+
+def test_invalid_moves():
+    with pytest.raises(ValueError):
+        encode_move((10, "blue", "line1"))
+    with pytest.raises(ValueError):
+        encode_move((1, "green", "line1"))
@@ -0,0 +1,77 @@
+import asyncio
+import json
+import os
+import sys
+
+from azul_backend.agents import GreedyAgent, PipeAgent, RandomAgent, SocketAgent, play_game
+from azul_backend.game import Game
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# An agent that takes far too long over its first request, and answers every other straight away
+_SLOW_FIRST_MOVE = f"""
+import json, sys, time
+sys.path.insert(0, {_ROOT!r})
+from azul_backend.game import Game
+for line in sys.stdin:
+    request = json.loads(line)
+    if request["id"] == 1:
+        time.sleep(30)
+    game = Game.unpack_state(bytes.fromhex(request["state"]))
+    print(json.dumps({{"id": request["id"], "move": list(game.legal_moves()[0])}}), flush=True)
+"""
+
+
+def test_play_game_with_four_agents():
+    agents = (RandomAgent(seed=1), GreedyAgent(), RandomAgent(seed=2), GreedyAgent())
+    game = asyncio.run(play_game(agents, seed=3))
+    assert game.is_game_over and game.show_number_of_players() == 4
+    assert all(agent.timeouts == agent.failures == 0 for agent in agents)
+
+
+def test_pipe_agent_is_restarted_after_a_timeout():
+    async def scenario():
+        agent = await PipeAgent.start(sys.executable, "-c", _SLOW_FIRST_MOVE, time_limit=2.0)
+        try:
+            game = Game(5)
+            first = await agent.choose_move(game, time_limit=0.5)
+            assert agent.timeouts == 1 and first in game.legal_moves()
+            second = await agent.choose_move(game)
+            assert agent.timeouts == 1 and agent.failures == 0
+            assert second == game.legal_moves()[0]
+        finally:
+            await agent.close()
+
+    asyncio.run(scenario())
+
+
+def test_socket_agent_connects_again_after_a_timeout():
+    connections = []
+
+    async def serve(reader, writer):
+        connections.append(writer)
+        while line := await reader.readline():
+            if len(connections) == 1:
+                continue  # The first connection never answers
+            request = json.loads(line)
+            game = Game.unpack_state(bytes.fromhex(request["state"]))
+            reply = {"id": request["id"], "move": list(game.legal_moves()[0])}
+            writer.write((json.dumps(reply) + "\n").encode())
+            await writer.drain()
+
+    async def scenario():
+        server = await asyncio.start_server(serve, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        agent = await SocketAgent.connect("127.0.0.1", port, time_limit=2.0)
+        try:
+            game = Game(6)
+            await agent.choose_move(game, time_limit=0.2)
+            assert agent.timeouts == 1
+            assert await agent.choose_move(game) == game.legal_moves()[0]
+            assert agent.timeouts == 1 and len(connections) == 2
+        finally:
+            await agent.close()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(scenario())
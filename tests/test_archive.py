@@ -0,0 +1,96 @@
+import random
+
+import pytest
+
+from azul_backend.archive import COLUMNS, GameArchive
+from azul_backend.game import Game
+
+
+def _finished_game(seed, players=2):
+    rng = random.Random(seed)
+    game = Game(seed, players=players)
+    while not game.is_game_over:
+        game.play_move(rng.choice(game.legal_moves()))
+    return game
+
+
+@pytest.fixture(scope="module")
+def games():
+    return [_finished_game(seed) for seed in range(12)]
+
+
+def _expected(summaries, **filters):
+    def matches(summary, column, value):
+        low, high = value if isinstance(value, tuple) else (value, value)
+        return (low is None or summary[column] >= low) and (high is None or summary[column] <= high)
+
+    return tuple(
+        game_id
+        for game_id, summary in enumerate(summaries)
+        if all(matches(summary, column, value) for column, value in filters.items())
+    )
+
+
+def test_add_and_read_back(tmp_path, games):
+    with GameArchive(str(tmp_path)) as archive:
+        for game in games:
+            archive.add(game)
+        assert len(archive) == len(games)
+        for game_id, game in enumerate(games):
+            summary = archive.summary(game_id)
+            assert set(summary) == set(COLUMNS)
+            assert summary["player1_score"] == game.show_score(1)
+            assert summary["player2_score"] == game.show_score(2)
+            assert archive.record(game_id).moves == game.show_move_history()
+            assert archive.replay(game_id).verify()
+
+
+@pytest.mark.parametrize("build_after", [0, 7, 12])
+def test_queries_match_a_scan(tmp_path, games, build_after):
+    with GameArchive(str(tmp_path)) as archive:
+        for game_id, game in enumerate(games):
+            if game_id == build_after:
+                archive.build_indexes()
+            archive.add(game)
+        summaries = [archive.summary(game_id) for game_id in range(len(games))]
+
+        for filters in (
+            {},
+            {"winner": 1},
+            {"winner": 2, "rounds_played": (None, 6)},
+            {"player1_floor_penalty": (-20, -5), "player2_score": (10, None)},
+        ):
+            assert archive.query(**filters) == _expected(summaries, **filters)
+
+
+def test_games_of_more_players(tmp_path):
+    games = [_finished_game(seed, players) for seed, players in enumerate((3, 4, 2, 4))]
+    with GameArchive(str(tmp_path)) as archive:
+        for game in games:
+            archive.add(game)
+        archive.build_indexes()
+        assert archive.query(players=4) == (1, 3)
+        for game_id, game in enumerate(games):
+            players = game.show_number_of_players()
+            summary = archive.summary(game_id)
+            scores = [game.show_score(player) for player in range(1, players + 1)]
+            recorded = [summary[f"player{player}_score"] for player in range(1, 5)]
+            assert recorded == scores + [0] * (4 - players)
+            if scores.count(max(scores)) == 1:
+                assert summary["winner"] == scores.index(max(scores)) + 1
+            assert archive.replay(game_id).verify()
+
+
+def test_reopened_archive(tmp_path, games):
+    with GameArchive(str(tmp_path)) as archive:
+        archive.add(games[0])
+        archive.build_indexes()
+    with GameArchive(str(tmp_path)) as archive:
+        assert len(archive) == 1
+        assert archive.query(winner=archive.summary(0)["winner"]) == (0,)
+
+
+def test_unknown_column(tmp_path):
+    with GameArchive(str(tmp_path)) as archive:
+        with pytest.raises(ValueError):
+            archive.query(player5_score=1)
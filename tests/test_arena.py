@@ -0,0 +1,133 @@
+import pickle
+import random
+import threading
+
+import pytest
+
+from azul_backend.arena import StateArena
+from azul_backend.game import Game
+from azul_backend.ismcts import InformationSetMCTS
+
+
+def _midgame(players, seed=7, moves=9):
+    rng = random.Random(seed)
+    game = Game(seed=seed, players=players)
+    for _ in range(moves):
+        game.play_move(rng.choice(game.legal_moves()))
+    return game
+
+
+@pytest.mark.parametrize("players", [2, 3, 4])
+def test_store_and_load(players):
+    game = _midgame(players)
+    with StateArena(2, players=players) as arena:
+        assert arena.players == players
+        slot = arena.allocate()
+        arena.store(slot, game)
+        assert arena.load(slot).pack_state() == game.pack_state()
+
+        other = StateArena.attach(arena.name)
+        assert other.players == players
+        assert other.load(slot).pack_state() == game.pack_state()
+        other.close()
+
+
+def test_store_rejects_other_player_counts():
+    with StateArena(1) as arena:
+        slot = arena.allocate()
+        with pytest.raises(ValueError, match="2 player games"):
+            arena.store(slot, _midgame(3))
+
+
+def test_invalid_player_count():
+    with pytest.raises(ValueError):
+        StateArena(1, players=5)
+
+
+def test_allocate_and_free():
+    with StateArena(2) as arena:
+        first, second = arena.allocate(), arena.allocate()
+        assert len(arena) == 2
+        with pytest.raises(RuntimeError):
+            arena.allocate()
+        arena.free(first)
+        assert arena.allocate() == first
+        assert second != first
+
+
+def test_slots_can_not_be_freed_twice():
+    with StateArena(3) as arena:
+        slot = arena.allocate()
+        arena.free(slot)
+        with pytest.raises(ValueError):
+            arena.free(slot)
+        with pytest.raises(ValueError):
+            arena.free(2)  # Never allocated
+        assert len(arena) == 0
+        assert sorted(arena.allocate() for _ in range(3)) == [0, 1, 2]
+
+
+def test_pickled_arena_shares_slots_but_not_the_allocator():
+    game = _midgame(2)
+    with StateArena(2) as arena:
+        slot = arena.allocate()
+        copy = pickle.loads(pickle.dumps(arena))
+        copy.store(slot, game)
+        assert arena.load(slot).pack_state() == game.pack_state()
+        with pytest.raises(RuntimeError):
+            copy.allocate()
+        with pytest.raises(RuntimeError):
+            copy.free(slot)
+        copy.close()
+
+
+def test_attached_with_the_lock_can_allocate():
+    lock = threading.Lock()
+    with StateArena(2, lock=lock) as arena:
+        other = StateArena.attach(arena.name, lock=lock)
+        first = other.allocate()
+        assert arena.allocate() != first
+        arena.free(first)
+        assert len(other) == 1
+        other.close()
+
+
+def test_view_writes_through_and_load_in_place():
+    game = _midgame(2)
+    with StateArena(1) as arena:
+        slot = arena.allocate()
+        view = arena.view(slot)
+        view[:] = game.pack_state()
+        view.release()
+        target = Game(seed=1)
+        assert arena.load(slot, target) is target
+        assert target.pack_state() == game.pack_state()
+        trusted = arena.load(slot, validate=False)
+        assert not trusted.show_validate() and arena.load(slot).show_validate()
+
+
+def test_parallel_search_three_players():
+    game = _midgame(3)
+    with InformationSetMCTS(iterations=40, workers=2, seed=1, max_rollout_moves=10) as searcher:
+        assert searcher.choose_move(game) in game.legal_moves()
+
+
+def test_searcher_reuses_its_workers():
+    with InformationSetMCTS(iterations=20, workers=2, seed=4, max_rollout_moves=5) as searcher:
+        for players in (2, 3, 2):
+            game = _midgame(players)
+            assert searcher.choose_move(game) in game.legal_moves()
+    # Closed searchers start their workers again when needed
+    game = _midgame(2)
+    assert searcher.choose_move(game) in game.legal_moves()
+    searcher.close()
+
+
+def test_parallel_search_is_reproducible():
+    game = _midgame(2, seed=9)
+    results = []
+    for _ in range(2):
+        with InformationSetMCTS(iterations=30, workers=2, seed=6, max_rollout_moves=8) as searcher:
+            results.append(dict(searcher.search(game)))
+            results.append(dict(searcher.search(game)))
+    assert results[0] == results[2] and results[1] == results[3]
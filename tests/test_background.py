@@ -0,0 +1,137 @@
+import random
+import time
+
+import pytest
+
+from azul_backend import background
+from azul_backend.background import BackgroundSearch, likely_moves
+from azul_backend.game import Game
+from azul_backend.ismcts import SearchTree
+
+
+def _wait(search, keys, timeout=30.0):
+    """Polls until every search of keys has finished, returns what was polled"""
+    finished = []
+    deadline = time.monotonic() + timeout
+    while not set(keys) <= {key for key, _ in finished}:
+        assert time.monotonic() < deadline, "The searches did not finish"
+        finished += search.poll()
+        time.sleep(0.01)
+    return finished
+
+
+def test_likely_moves_are_ranked_by_preview():
+    game = Game(seed=1)
+    rng = random.Random(1)
+    for _ in range(6):
+        game.play_move(rng.choice(game.legal_moves()))
+    state = game.pack_state()
+
+    moves = likely_moves(game, 5)
+    assert len(moves) == 5
+    assert set(moves) <= set(game.legal_moves())
+    assert game.pack_state() == state  # Ranking does not play the moves
+
+    def value(move):
+        preview = game.preview(move)
+        return (preview["wall_score"] + preview["floor_penalty"], preview["tiles_to_line"])
+
+    best = max(value(move) for move in game.legal_moves())
+    assert value(moves[0]) == best
+    assert [value(move) for move in moves] == sorted(map(value, moves), reverse=True)
+    assert len(likely_moves(game, 10_000)) == len(game.legal_moves())
+
+
+def test_tree_grown_in_chunks_matches_one_search():
+    game = Game(seed=2)
+    whole = SearchTree(game, seed=5)
+    whole.grow(120)
+    chunked = SearchTree(game, seed=5)
+    for _ in range(4):
+        chunked.grow(30)
+
+    assert chunked.iterations == whole.iterations == 120
+    assert chunked.statistics() == whole.statistics()
+    assert sum(visits for visits, _ in chunked.statistics().values()) == 120
+
+
+def test_search_finishes_and_keeps_no_trees():
+    game = Game(seed=3)
+    with BackgroundSearch(iterations=60, chunk=20, processes=False, seed=1) as search:
+        key = search.start(game)
+        assert key == game.pack_state()
+        ((finished, move),) = _wait(search, [key])
+        assert finished == key
+        assert move in game.legal_moves()
+        assert search.result(key) == move
+        assert search.start(game) == key  # Already searched, not searched again
+        assert search.poll() == []
+    assert not background._trees
+
+
+def test_a_chunk_goes_on_growing_the_same_tree(monkeypatch):
+    grown = []
+    search_chunk = background._search_chunk
+
+    def spy(owner, state, iterations, seed, exploration, last, forget):
+        statistics = search_chunk(owner, state, iterations, seed, exploration, last, forget)
+        grown.append(sum(visits for visits, _ in statistics.values()))
+        return statistics
+
+    monkeypatch.setattr(background, "_search_chunk", spy)
+    with BackgroundSearch(iterations=50, chunk=10, processes=False, seed=2) as search:
+        _wait(search, [search.start(Game(seed=4))])
+    # Each chunk returns the statistics of the whole search so far
+    assert grown == [10, 20, 30, 40, 50]
+
+
+def test_cancelled_searches_are_dropped():
+    game = Game(seed=5)
+    positions = []
+    for move in likely_moves(game, 3):
+        position = Game.unpack_state(game.pack_state())
+        position.play_move(move)
+        positions.append(position)
+
+    with BackgroundSearch(iterations=400, chunk=10, processes=False, seed=3) as search:
+        keys = [search.start(position) for position in positions]
+        wanted = search.start(game, priority=1)
+        search.cancel(keep=[wanted])
+        _wait(search, [wanted])
+        assert all(search.result(key) is None for key in keys)
+        # The trees of the cancelled searches go with the next chunk
+        assert not any(key in keys for _, key in background._trees)
+
+        search.clear()
+        assert search.result(wanted) is None
+    assert not background._trees
+
+
+def test_single_move_and_closed():
+    game = Game(seed=6)
+    rng = random.Random(6)
+    while len(game.legal_moves()) != 1:
+        game.play_move(rng.choice(game.legal_moves()))
+
+    search = BackgroundSearch(processes=False)
+    key = search.start(game)
+    # Nothing to search, the result is there straight away
+    assert search.result(key) == game.legal_moves()[0]
+    assert search.poll() == [(key, game.legal_moves()[0])]
+    search.close()
+    with pytest.raises(RuntimeError):
+        search.start(game)
+
+
+@pytest.mark.parametrize("iterations, chunk", [(0, 10), (10, 0), (1.5, 10)])
+def test_invalid_arguments(iterations, chunk):
+    with pytest.raises(ValueError):
+        BackgroundSearch(iterations, chunk, processes=False)
+
+
+def test_search_in_a_worker_process():
+    game = Game(seed=7)
+    with BackgroundSearch(iterations=40, chunk=20, seed=4) as search:
+        key = search.start(game)
+        ((_, move),) = _wait(search, [key])
+    assert move in game.legal_moves()
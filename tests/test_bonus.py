@@ -0,0 +1,80 @@
+import copy
+import random
+
+import pytest
+
+from azul_backend.game import Game
+from azul_backend.states import GameEvent
+from azul_backend.tiles import ColourTile, TILE_COLOURS
+from azul_backend.wall import Wall
+
+_LINES = ("line1", "line2", "line3", "line4", "line5")
+
+
+def _recount(wall):
+    """The end of game bonus of a wall, counted from scratch"""
+    grid = [[tile is not None for tile in wall[line]] for line in _LINES]
+    rows = sum(all(row) for row in grid)
+    columns = sum(all(row[column] for row in grid) for column in range(5))
+    colours = {}
+    for line in _LINES:
+        for tile in wall[line]:
+            if tile is not None:
+                colours[tile.get_tile_type()] = colours.get(tile.get_tile_type(), 0) + 1
+    return 2 * rows + 7 * columns + 10 * sum(count == 5 for count in colours.values())
+
+
+@pytest.mark.parametrize("players, seed", [(2, 1), (2, 2), (3, 3), (4, 4)])
+def test_incremental_bonus_matches_a_recount(players, seed):
+    rng = random.Random(seed)
+    game = Game(seed=seed, players=players)
+    bonuses = {}
+    game.add_listener(
+        lambda event, details: event == GameEvent.GAME_OVER and bonuses.update(details)
+    )
+    while not game.is_game_over:
+        for player in range(1, players + 1):
+            assert game.show_end_game_bonus(player) == _recount(game.show_wall(player))
+        game.play_move(rng.choice(game.legal_moves()))
+
+    for player in range(1, players + 1):
+        assert game.show_end_game_bonus(player) == _recount(game.show_wall(player))
+        assert bonuses[f"player{player}_bonus"] == _recount(game.show_wall(player))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_projected_bonus_matches_placing_the_tiles(seed):
+    rng = random.Random(seed)
+    wall = Wall()
+    for _ in range(rng.randrange(25)):
+        line, colour = rng.choice(_LINES), rng.choice(TILE_COLOURS)
+        if colour in wall.get_possible_moves(line):
+            wall.move_tile_to_wall(ColourTile(colour), line)
+
+    for _ in range(20):
+        placements = [
+            (rng.choice(TILE_COLOURS), line) for line in rng.sample(_LINES, rng.randrange(6))
+        ]
+        before = wall.end_game_bonus
+        projected = wall.projected_end_game_bonus(placements)
+        assert wall.end_game_bonus == before  # The wall is not changed
+
+        placed = copy.deepcopy(wall)
+        for colour, line in placements:
+            if colour in placed.get_possible_moves(line):
+                placed.move_tile_to_wall(ColourTile(colour), line)
+        assert projected == placed.end_game_bonus == _recount(placed.show_wall())
+
+
+def test_projected_bonus_is_the_bonus_after_the_round():
+    rng = random.Random(6)
+    game = Game(seed=6)
+    while not game.is_game_over:
+        rounds_played = game.rounds_played
+        mover = game.show_current_player()
+        projected = {player: game.show_projected_bonus(player) for player in (1, 2)}
+        game.play_move(rng.choice(game.legal_moves()))
+        if game.rounds_played != rounds_played or game.is_game_over:
+            # The last move of the round only changes the lines of the player who made it
+            other = 3 - mover
+            assert game.show_end_game_bonus(other) == projected[other]
@@ -0,0 +1,65 @@
+import random
+
+import pytest
+
+from azul_backend.actions import encode_move
+from azul_backend.canonical import (
+    canonical_key,
+    canonical_move,
+    canonical_position,
+    factory_order,
+    original_move,
+)
+from azul_backend.game import Game
+
+
+def _midgame(players, seed, moves):
+    rng = random.Random(seed)
+    game = Game(seed, players=players)
+    for _ in range(moves):
+        game.play_move(rng.choice(game.legal_moves()))
+    return game
+
+
+@pytest.mark.parametrize("players", [2, 3, 4])
+@pytest.mark.parametrize("moves", [0, 3, 7])
+def test_moves_round_trip(players, moves):
+    game = _midgame(players, seed=players * 10 + moves, moves=moves)
+    order = factory_order(game)
+    assert sorted(order) == list(range(1, game.show_number_of_factories() + 1))
+    for move in game.legal_moves():
+        canonical = canonical_move(game, move)
+        assert original_move(game, canonical) == move
+        assert original_move(game, encode_move(canonical)) == move
+        assert canonical_move(game, encode_move(move)) == canonical
+
+
+def test_canonical_factories_are_sorted():
+    game = Game(3)
+    for move in game.legal_moves():
+        factory_number, tile_type, _ = canonical_move(game, move)
+        if factory_number:
+            tiles = game.show_factory(factory_order(game)[factory_number - 1])
+            assert tile_type in [tile.get_tile_type() for tile in tiles]
+
+
+@pytest.mark.parametrize("players", [2, 3, 4])
+def test_position_size(players):
+    game = _midgame(players, seed=1, moves=2)
+    assert len(canonical_position(game)) == Game.POSITION_SIZES[players]
+    assert len(canonical_position(game, perspective=True)) == Game.POSITION_SIZES[players]
+
+
+def test_equal_positions_share_a_key():
+    game = _midgame(2, seed=5, moves=4)
+    copy = Game.unpack_state(game.pack_state())
+    assert canonical_key(game) == canonical_key(copy)
+    # The hidden bag order is left out, so a determinization has the same key
+    assert canonical_key(game.determinize(random.Random(1))) == canonical_key(game)
+
+
+def test_perspective_puts_the_player_to_move_first():
+    game = _midgame(3, seed=2, moves=1)
+    assert game.show_current_player() == 2
+    assert canonical_position(game, perspective=True) != canonical_position(game)
+    assert canonical_position(game, perspective=True)[1] == Game.PLAYER_1
@@ -0,0 +1,105 @@
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from azul_backend.evaluation import (  # noqa: E402
+    PLAYER_WIDTH,
+    STATE_WIDTH,
+    STATE_WIDTHS,
+    BatchEvaluator,
+    encode_packed,
+    encode_position,
+    evaluate_encoded,
+    greedy_move,
+)
+from azul_backend.game import Game  # noqa: E402
+from azul_backend.tiles import TILE_COLOURS  # noqa: E402
+
+_LINES = ("line1", "line2", "line3", "line4", "line5")
+
+
+def _positions(count, seed=0, players=2, moves=20):
+    rng = random.Random(seed)
+    games = []
+    for number in range(count):
+        game = Game(number, players=players)
+        for _ in range(rng.randrange(moves)):
+            if game.is_game_over:
+                break
+            game.play_move(rng.choice(game.legal_moves()))
+        games.append(game)
+    return games
+
+
+def _encode_from_views(game):
+    """The encoding worked out one position at a time from the show methods"""
+    row = [game.show_current_player()]
+    for player in range(1, game.show_number_of_players() + 1):
+        wall = game.show_wall(player)
+        row += [tile is not None for line in _LINES for tile in wall[line]]
+        pattern_lines = game.show_pattern_lines(player)
+        tiles = [[tile for tile in pattern_lines[line] if tile is not None] for line in _LINES]
+        row += [len(line) for line in tiles]
+        row += [TILE_COLOURS.index(line[0].get_tile_type()) + 1 if line else 0 for line in tiles]
+        row.append(sum(tile is not None for tile in game.show_floor(player)))
+        row.append(game.show_score(player))
+    return row
+
+
+def test_encode_position():
+    game = Game(1)
+    encoded = encode_position(game)
+    assert encoded.shape == (STATE_WIDTH,)
+    assert encoded[0] == Game.PLAYER_1
+    assert encode_position(Game(1, players=4)).shape == (STATE_WIDTHS[4],)
+
+
+@pytest.mark.parametrize("players", [2, 3, 4])
+def test_packed_batch_matches_the_show_methods(players):
+    games = _positions(30, seed=players, players=players, moves=200)
+    encoded = encode_packed([game.pack_position() for game in games], players)
+    assert encoded.shape == (len(games), 1 + players * PLAYER_WIDTH)
+    for game, row in zip(games, encoded):
+        assert row.tolist() == _encode_from_views(game)
+
+
+def test_encode_packed_checks_the_size():
+    with pytest.raises(ValueError):
+        encode_packed([Game(1, players=3).pack_position()], 2)
+
+
+def test_batch_matches_single_positions():
+    games = _positions(8)
+    batch = evaluate_encoded(np.stack([encode_position(game) for game in games]))
+    for game, row in zip(games, batch):
+        assert evaluate_encoded(encode_position(game)[None, :])[0] == pytest.approx(row)
+
+
+def test_submitted_positions_match_evaluate():
+    games = _positions(6, seed=1)
+    with BatchEvaluator(max_batch=4) as evaluator:
+        futures = [evaluator.submit(game) for game in games]
+        expected = evaluator.evaluate(games)
+        for future, row in zip(futures, expected):
+            assert future.result(timeout=5) == pytest.approx(tuple(row))
+
+
+def test_mixed_player_counts_are_scored_apart():
+    games = _positions(3, seed=2) + _positions(3, seed=2, players=3)
+    with BatchEvaluator(max_delay=0.05) as evaluator:
+        futures = [evaluator.submit(game) for game in games]
+        for future, game in zip(futures, games):
+            value = future.result(timeout=5)
+            assert len(value) == game.show_number_of_players()
+            assert value == pytest.approx(tuple(evaluator.evaluate([game])[0]))
+        with pytest.raises(ValueError):
+            evaluator.evaluate(games)
+
+
+@pytest.mark.parametrize("players", [2, 3, 4])
+def test_greedy_move_is_legal(players):
+    game = Game(5, players=players)
+    with BatchEvaluator() as evaluator:
+        assert greedy_move(game, evaluator, random.Random(0)) in game.legal_moves()
@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+from azul_backend.game import Game
+from azul_backend.states import GameState
+
+
+def _play(game, rng, moves):
+    for _ in range(moves):
+        if game.is_game_over:
+            break
+        game.play_move(rng.choice(game.legal_moves()))
+
+
+@pytest.mark.parametrize("players", [2, 3, 4])
+@pytest.mark.parametrize("moves", [0, 5, 40, 1000])
+def test_pack_unpack_round_trip(players, moves):
+    game = Game(seed=moves, players=players)
+    _play(game, random.Random(moves), moves)
+
+    state = game.pack_state()
+    assert len(state) == Game.STATE_SIZES[players]
+    copy = Game.unpack_state(state, game.show_move_history())
+    assert copy.pack_state() == state
+    assert copy.pack_position() == game.pack_position()
+    assert copy.show_move_history() == game.show_move_history()
+    assert copy.legal_moves() == game.legal_moves()
+    assert repr(copy) == repr(game)
+
+    # The bag order is part of the state, so both games play on identically
+    rng = random.Random(1)
+    while not game.is_game_over:
+        move = rng.choice(game.legal_moves())
+        game.play_move(move)
+        copy.play_move(move)
+        assert copy.pack_state() == game.pack_state()
+    assert copy.show_game_state() == GameState.GAMEOVER
+
+
+@pytest.mark.parametrize("players", [2, 3, 4])
+def test_load_state_in_place(players):
+    source = Game(seed=7, players=players)
+    _play(source, random.Random(7), 12)
+    target = Game(seed=99, players=players)
+    _play(target, random.Random(99), 30)
+
+    target.load_state(source.pack_state())
+    assert target.pack_state() == source.pack_state()
+    assert len(target.pack_position()) == Game.POSITION_SIZES[players]
+
+
+def test_state_of_another_player_count_is_rejected():
+    with pytest.raises(ValueError):
+        Game(players=2).load_state(Game(players=3).pack_state())
+    with pytest.raises(ValueError):
+        Game.unpack_state(Game().pack_state()[:-1])
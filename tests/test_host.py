@@ -0,0 +1,45 @@
+import asyncio
+
+from azul_backend.game import Game
+from azul_backend.host import GameHost
+
+
+def _run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_new_game_and_move():
+    async def scenario():
+        host = GameHost()
+        owned = set()
+        reply = await host.handle({"id": 1, "op": "new", "seed": 4}, owned)
+        assert reply["id"] == 1 and "error" not in reply
+        assert owned == {reply["game"]}
+        assert reply["opponent_moves"] == [] and not reply["over"]
+
+        game = Game.unpack_state(bytes.fromhex(reply["state"]))
+        move = list(game.legal_moves()[0])
+        reply = await host.handle({"id": 2, "op": "move", "game": reply["game"], "move": move}, owned)
+        assert "error" not in reply
+        assert len(reply["opponent_moves"]) == 1
+
+    _run(scenario())
+
+
+def test_connection_can_not_play_in_other_games():
+    async def scenario():
+        host = GameHost()
+        first, second = set(), set()
+        reply = await host.handle({"id": 1, "op": "new", "seed": 4}, first)
+        game_id = reply["game"]
+        move = {"id": 2, "op": "move", "game": game_id, "move": [1, "blue", "line1"]}
+        reply = await host.handle(move, second)
+        assert reply["error"] == f"{game_id} - No such game"
+        assert host.stats()["moves"] == 0
+
+    _run(scenario())
+
+
+def test_unknown_op():
+    reply = _run(GameHost().handle({"id": 9, "op": "resign"}))
+    assert reply == {"id": 9, "error": "resign - Unknown op"}
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import random
+
+import pytest
+
+from azul_backend.host import GameHost
+from azul_backend.loadgen import LoadReport, parse_think_time, run_load
+
+
+@pytest.mark.parametrize(
+    "spec, low, high",
+    [("0.25", 0.25, 0.25), ("fixed:2", 2, 2), ("uniform:1:3", 1, 3), ("exp:0.5", 0, None),
+     ("lognormal:1:0.5", 0, None)],
+)
+def test_think_times(spec, low, high):
+    draw = parse_think_time(spec)
+    rng = random.Random(1)
+    times = [draw(rng) for _ in range(2000)]
+    assert min(times) >= low
+    if high is not None:
+        assert max(times) <= high
+    # Drawn from the generator passed in, so reproducible
+    again = random.Random(1)
+    assert [draw(again) for _ in range(3)] == times[:3]
+
+
+def test_think_time_means():
+    rng = random.Random(2)
+    exp = parse_think_time("exp:0.5")
+    assert abs(sum(exp(rng) for _ in range(20000)) / 20000 - 0.5) < 0.02
+    lognormal = parse_think_time("lognormal:2:0.3")
+    times = sorted(lognormal(rng) for _ in range(20001))
+    assert abs(times[10000] - 2) < 0.05  # The median
+
+
+@pytest.mark.parametrize(
+    "spec", ["", "fast", "-1", "fixed:1:2", "uniform:1", "exp:0", "lognormal:0:1", "uniform:a:b",
+             "gamma:1"],
+)
+def test_invalid_think_times(spec):
+    with pytest.raises(ValueError):
+        parse_think_time(spec)
+
+
+def test_report():
+    report = LoadReport()
+    for milliseconds in range(1, 101):
+        report.request("move", milliseconds / 1000)
+    report.request("new", 0.002)
+    report.error("timeout")
+    report.error("timeout")
+    report.error("protocol")
+    report.game_finished()
+    report.sample({"connections": 1, "games": 1, "moves": 5, "rss": 2**20})
+
+    summary = report.summary()
+    assert summary["requests"] == 101 and report.count("move") == 100
+    assert report.count("stats") == 0
+    assert summary["games_finished"] == 1
+    assert summary["errors"] == {"timeout": 2, "protocol": 1}
+    assert summary["error_rate"] == round(3 / 104, 5)
+    latency = summary["latency_ms"]["move"]
+    assert latency["max"] == 100.0
+    assert abs(latency["mean"] - 50.5) < 1e-6
+    assert abs(latency["p50"] - 50) <= 2
+    assert summary["host"][0]["rss"] == 2**20
+    json.dumps(summary)  # Serialisable
+
+    text = report.format()
+    assert "1 games" in text and "host peak memory: 1.0 MiB" in text
+
+
+def test_load_against_a_host():
+    async def scenario():
+        host = GameHost()
+        port = await host.start(port=0)
+        try:
+            return await run_load(
+                port=port, clients=3, games=2, think_time="0", policy="greedy", ramp=0.0,
+                interval=0.05, seed=1,
+            )
+        finally:
+            await host.close()
+
+    summary = asyncio.run(scenario()).summary()
+    assert summary["games_finished"] == 6
+    assert summary["errors"] == {}
+    assert summary["latency_ms"].keys() == {"new", "move"}
+
+
+def test_malformed_replies_are_protocol_errors():
+    async def reply(reader, writer):
+        while line := await reader.readline():
+            request = json.loads(line)
+            if request["op"] == "stats":
+                answer = {"id": request["id"], "connections": 0, "games": 0, "rss": 0}
+                writer.write((json.dumps(answer) + "\n").encode())
+            elif request["op"] == "new":
+                writer.write(b"{not json\n")
+            await writer.drain()
+        writer.close()
+
+    async def scenario():
+        server = await asyncio.start_server(reply, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await run_load(
+                port=port, clients=2, games=2, think_time="0", ramp=0.0, interval=0.05
+            )
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    summary = asyncio.run(scenario()).summary()
+    # Every game is abandoned, no client is
+    assert summary["errors"] == {"protocol": 4}
+    assert summary["games_finished"] == 0
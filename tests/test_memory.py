@@ -0,0 +1,81 @@
+import json
+import random
+import sys
+
+import pytest
+
+from azul_backend import memory
+from azul_backend.game import Game
+from azul_backend.tiles import TILE_COLOURS
+
+
+def test_deep_size_counts_each_object_once():
+    item = [1000, 2000, 3000]
+    assert memory.deep_size(item) == sys.getsizeof(item) + sum(map(sys.getsizeof, item))
+    pair = [item, item]
+    assert memory.deep_size(pair) == sys.getsizeof(pair) + memory.deep_size(item)
+    # Shared by every game, not part of any
+    assert memory.deep_size(TILE_COLOURS) == 0
+    assert memory.deep_size(Game) == 0
+
+
+@pytest.mark.parametrize("stage", memory.STAGES)
+def test_components_add_up_to_the_game(stage):
+    game = Game(1)
+    memory.STAGES[stage](game, random.Random(1))
+    sizes = memory.component_sizes(game)
+    assert set(sizes) == {
+        "tiles", "TileBag", "Factory", "Wall", "PatternLines", "Floor", "Game", "total"
+    }
+    assert all(sizes[name] > 0 for name in ("Wall", "PatternLines", "Floor", "Game"))
+    assert sizes["total"] == sum(size for name, size in sizes.items() if name != "total")
+    assert sizes["total"] == memory.deep_size(game)
+
+
+def test_more_players_hold_more_boards():
+    two, four = memory.component_sizes(Game(1)), memory.component_sizes(Game(1, players=4))
+    # Objects the boards share (e.g empty tuples) are only counted once
+    for component in ("Wall", "PatternLines", "Floor"):
+        assert 1.8 * two[component] < four[component] <= 2 * two[component]
+
+
+def test_retained_per_game():
+    retained, modules = memory.retained_per_game("mid_round", games=20)
+    assert retained > 0
+    assert {"game.py", "wall.py", "patternlines.py"} <= set(modules)
+    assert "memory.py" not in modules  # The list of games held is not the games' memory
+    assert list(modules.values()) == sorted(modules.values(), reverse=True)
+    with pytest.raises(KeyError):
+        memory.retained_per_game("no_such_stage", games=1)
+
+
+def test_compare_with_baseline():
+    report = {"new_game": {"retained": 110}, "game_over": {"retained": 200}}
+    baseline = {"stages": {"new_game": 100, "game_over": 150, "removed_stage": 10}}
+    assert memory.compare_with_baseline(report, baseline) == [
+        "game_over: 200 bytes per game, baseline 150"
+    ]
+    assert memory.compare_with_baseline(report, baseline, tolerance=0.5) == []
+    assert memory.compare_with_baseline(report, {}) == []
+
+
+def test_baseline_round_trip(tmp_path, capsys):
+    path = tmp_path / "baseline.json"
+    path.write_text(json.dumps({"other": {"kept": True}}))
+    assert memory.main(["--games", "5", "--update-baseline", str(path)]) == 0
+    baselines = json.loads(path.read_text())
+    assert baselines["other"] == {"kept": True}
+    assert set(baselines["memory"]["stages"]) == set(memory.STAGES)
+    assert "Retained bytes per game" in capsys.readouterr().out
+
+    # Within the tolerance of its own figures
+    assert memory.main(["--games", "5", "--baseline", str(path)]) == 0
+    assert "Within the baseline" in capsys.readouterr().out
+
+    baselines["memory"]["stages"]["game_over"] = 1
+    path.write_text(json.dumps(baselines))
+    assert memory.main(["--games", "5", "--baseline", str(path)]) == 1
+    assert "game_over:" in capsys.readouterr().out
+
+    assert memory.main(["--games", "5", "--baseline", str(tmp_path / "missing.json")]) == 0
+    assert "No memory baseline" in capsys.readouterr().out
@@ -0,0 +1,104 @@
+import math
+import pickle
+import random
+
+import pytest
+
+from azul_backend.game import Game
+from azul_backend.metrics import GameMetrics, LatencyHistogram, merged
+
+
+def _values(seed, count=2000):
+    rng = random.Random(seed)
+    return [int(rng.lognormvariate(10, 1.5)) for _ in range(count)]
+
+
+def test_quantiles_within_bucket_width():
+    histogram = LatencyHistogram()
+    values = sorted(_values(1))
+    for value in values:
+        histogram.record(value)
+    assert histogram.count == len(values)
+    assert histogram.total == sum(values) and histogram.max == values[-1]
+    for q in (0.5, 0.9, 0.99):
+        exact = values[int(q * (len(values) - 1))]
+        assert histogram.quantile(q) == pytest.approx(exact, rel=2**-5)
+    assert histogram.quantile(1) == values[-1]
+    assert math.isnan(LatencyHistogram().quantile(0.5))
+
+
+def test_small_values_are_exact():
+    histogram = LatencyHistogram()
+    for value in range(10):
+        histogram.record(value)
+    assert histogram.quantile(0) == 0
+    assert histogram.quantile(1) == 9
+
+
+def test_merge_matches_one_histogram():
+    whole, first, second = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+    for i, value in enumerate(_values(2)):
+        whole.record(value)
+        (first if i % 3 else second).record(value)
+    first.merge(second)
+    assert (first.count, first.total, first.max) == (whole.count, whole.total, whole.max)
+    for q in (0, 0.25, 0.5, 0.75, 0.99, 1):
+        assert first.quantile(q) == whole.quantile(q)
+    for power in range(10, 30):
+        assert first.count_at_most(2**power) == whole.count_at_most(2**power)
+
+
+def test_merge_needs_same_settings():
+    with pytest.raises(ValueError):
+        LatencyHistogram(5).merge(LatencyHistogram(6))
+    with pytest.raises(ValueError):
+        LatencyHistogram().count_at_most(1000)
+
+
+def test_count_at_most_is_exact():
+    histogram = LatencyHistogram()
+    # Values on the bounds, and either side of them, are counted as Prometheus le buckets count
+    values = _values(3) + [2**power + step for power in range(3, 20) for step in (-1, 0, 1)]
+    for value in values:
+        histogram.record(value)
+    for power in range(0, 22):
+        assert histogram.count_at_most(2**power) == sum(value <= 2**power for value in values)
+    assert histogram.count_at_most(2**50) == histogram.count
+
+
+def test_bucket_bounds_are_inclusive():
+    histogram = LatencyHistogram()
+    histogram.record(2**20)
+    assert histogram.count_at_most(2**20) == 1
+    assert histogram.count_at_most(2**19) == 0
+    histogram.record(2**20 + 1)
+    assert histogram.count_at_most(2**20) == 1
+    # Every value is still recorded to within the bucket width
+    assert histogram.quantile(1) == pytest.approx(2**20 + 1, rel=2**-5)
+
+
+def test_game_metrics_can_not_merge_into_themselves():
+    metrics = GameMetrics()
+    with pytest.raises(ValueError):
+        metrics.merge(metrics)
+
+
+def test_game_metrics_merge_and_render():
+    parts = []
+    for seed in (1, 2):
+        metrics = GameMetrics()
+        game = Game(seed)
+        metrics.attach(game)
+        rng = random.Random(seed)
+        while not game.is_game_over:
+            game.play_move(rng.choice(game.legal_moves()))
+        metrics.detach(game)
+        parts.append(pickle.loads(pickle.dumps(metrics)))
+
+    total = merged(parts)
+    assert total.histogram("make_factory_offer").count == sum(
+        part.histogram("make_factory_offer").count for part in parts
+    )
+    text = total.render()
+    assert 'azul_engine_call_seconds_count{call="round_transition"}' in text
+    assert "azul_bag_refills_total" in text
@@ -0,0 +1,71 @@
+from collections import deque
+
+import pytest
+
+from azul_backend.patternlines import PatternLines
+from azul_backend.tiles import ColourTile, P1Tile
+
+
+def _tiles(colour, count):
+    return deque(ColourTile(colour) for _ in range(count))
+
+
+def _codes(lines):
+    return {
+        line: [tile and tile.get_tile_type() for tile in tiles]
+        for line, tiles in lines.show_pattern_lines().items()
+    }
+
+
+def test_place_and_overflow():
+    lines = PatternLines()
+    left = lines.place_on_patternlines(_tiles("red", 3) + deque([P1Tile()]), "line2")
+    assert len(left) == 2 and any(isinstance(tile, P1Tile) for tile in left)
+    assert lines.show_line_fill("line2") == ("red", 2)
+    assert lines.is_patternline_complete("line2")
+    assert lines.get_possible_moves("line2") == ()
+    with pytest.raises(ValueError):
+        lines.place_on_patternlines(_tiles("red", 1), "line2")
+
+
+def test_partly_filled_line_takes_its_colour_only():
+    lines = PatternLines()
+    lines.place_on_patternlines(_tiles("blue", 2), "line4")
+    assert lines.get_possible_moves("line4") == ("blue",)
+    assert not lines.is_patternline_complete("line4")
+    with pytest.raises(ValueError):
+        lines.place_on_patternlines(_tiles("black", 1), "line4")
+    lines.place_on_patternlines(_tiles("blue", 2), "line4")
+    assert lines.show_line_fill("line4") == ("blue", 4)
+
+
+def test_tiling_and_cleaning():
+    lines = PatternLines()
+    lines.place_on_patternlines(_tiles("white", 3), "line3")
+    tile = lines.select_tile_for_wall("line3")
+    assert tile.get_tile_type() == "white"
+    assert lines.is_patternline_complete("line3")
+    assert lines.select_tile_for_wall("line1") is None
+
+    lines.clean_pattern_lines()
+    assert lines.show_line_fill("line3") == ("", 0)
+    assert len(lines.get_possible_moves("line3")) == 5
+
+
+def test_export_import_round_trip():
+    lines = PatternLines()
+    lines.place_on_patternlines(_tiles("yellow", 1), "line1")
+    lines.place_on_patternlines(_tiles("red", 2), "line3")
+    lines.place_on_patternlines(_tiles("black", 5), "line5")
+    lines.select_tile_for_wall("line5")  # Tiled, not yet cleaned
+
+    state = lines._export_state()
+    assert len(state) == PatternLines.STATE_SIZE
+    restored = PatternLines()
+    restored._import_state(state)
+    assert restored._export_state() == state
+    assert _codes(restored) == _codes(lines)
+    for line in ("line1", "line2", "line3", "line4", "line5"):
+        assert restored.show_line_fill(line) == lines.show_line_fill(line)
+        assert restored.is_patternline_complete(line) == lines.is_patternline_complete(line)
+        assert restored.get_possible_moves(line) == lines.get_possible_moves(line)
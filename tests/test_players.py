@@ -0,0 +1,85 @@
+import copy
+import random
+
+import pytest
+
+from azul_backend.actions import encode_move
+from azul_backend.game import Game
+from azul_backend.ismcts import InformationSetMCTS
+from azul_backend.states import GameEvent
+
+
+@pytest.mark.parametrize("players, factories", [(2, 5), (3, 7), (4, 9)])
+def test_full_game(players, factories):
+    game = Game(seed=players, players=players)
+    assert game.show_number_of_players() == players
+    assert game.show_number_of_factories() == factories
+
+    events = []
+    game.add_listener(lambda event, details: events.append((event, details)))
+    rng = random.Random(players)
+    movers = []
+    while not game.is_game_over:
+        movers.append(game.show_current_player())
+        game.play_move(rng.choice(game.legal_moves()))
+
+    assert set(movers) == set(range(1, players + 1))
+    round_ends = [details for event, details in events if event is GameEvent.ROUND_END]
+    assert len(round_ends) == game.rounds_played + 1  # The last round is not followed by another
+    assert all(details["players"] == players for details in round_ends)
+    (game_over,) = [details for event, details in events if event is GameEvent.GAME_OVER]
+    assert game_over["players"] == players
+    for player in range(1, players + 1):
+        assert game_over[f"player{player}_score"] == game.show_score(player)
+    # Within a round, play passes from each player to the next
+    moves = [details for event, details in events if event is GameEvent.MOVE]
+    for before, after in zip(moves, moves[1:]):
+        if before["round"] == after["round"]:
+            assert after["player"] == before["player"] % players + 1
+
+
+@pytest.mark.parametrize("players", [3, 4])
+def test_apply_moves_and_preview_match_play_move(players):
+    game = Game(seed=11, players=players)
+    moves = []
+    game.add_listener(
+        lambda event, details: moves.append(details) if event is GameEvent.MOVE else None
+    )
+    rng = random.Random(11)
+    while not game.is_game_over:
+        move = rng.choice(game.legal_moves())
+        preview = game.preview(move)
+        other = copy.deepcopy(game)
+        (changes,) = other.apply_moves([encode_move(move)])
+        game.play_move(move)
+
+        assert other.pack_state() == game.pack_state()
+        assert len(changes) == players
+        for key in ("tiles_to_line", "floor_tiles", "takes_p1_tile"):
+            assert preview[key] == moves[-1][key]
+
+
+@pytest.mark.parametrize("players", [3, 4])
+def test_reset_and_determinize_keep_the_players(players):
+    game = Game(seed=2, players=players)
+    game.play_move(game.legal_moves()[0])
+    clone = game.determinize(random.Random(0))
+    assert clone.show_number_of_players() == players
+    assert clone.pack_position() == game.pack_position()
+
+    game.reset(2)
+    assert game.pack_state() == Game(seed=2, players=players).pack_state()
+
+
+def test_invalid_players():
+    for players in (1, 5):
+        with pytest.raises(ValueError):
+            Game(players=players)
+    with pytest.raises(ValueError):
+        Game(players=3).show_score(4)
+
+
+def test_search_four_players():
+    game = Game(seed=4, players=4)
+    searcher = InformationSetMCTS(iterations=30, seed=0, max_rollout_moves=20)
+    assert searcher.choose_move(game) in game.legal_moves()
@@ -0,0 +1,55 @@
+import pytest
+
+from azul_backend.game import Game
+from azul_backend.pool import GamePool
+
+
+def test_released_game_is_reused_as_new():
+    pool = GamePool()
+    game = pool.acquire(5)
+    game.play_move(game.legal_moves()[0])
+    pool.release(game)
+    assert len(pool) == 1
+
+    reused = pool.acquire(5)
+    assert reused is game
+    assert reused.pack_state() == Game(5).pack_state()
+
+
+def test_games_are_of_the_kind_of_the_pool():
+    pool = GamePool(players=4, validate=False)
+    with pool.game(1) as game:
+        assert game.show_number_of_players() == 4
+        assert not game.show_validate()
+    with pool.game(1) as game:
+        assert game.show_number_of_players() == 4
+
+
+@pytest.mark.parametrize(
+    "game", [Game(1, players=4), Game(1, validate=False)], ids=["players", "validate"]
+)
+def test_release_refuses_other_kinds(game):
+    pool = GamePool()
+    with pytest.raises(ValueError):
+        pool.release(game)
+    assert len(pool) == 0
+
+
+def test_release_removes_listeners():
+    pool = GamePool()
+    events = []
+    game = pool.acquire(2)
+    game.add_listener(lambda event, details: events.append(event))
+    game.add_span_listener(lambda name, details: events.append(name))
+    pool.release(game)
+
+    game = pool.acquire(2)
+    game.play_move(game.legal_moves()[0])
+    assert events == []
+
+
+def test_full_pool_keeps_max_size():
+    pool = GamePool(max_size=1)
+    pool.release(Game(1))
+    pool.release(Game(2))
+    assert len(pool) == 1
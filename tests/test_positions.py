@@ -0,0 +1,125 @@
+import random
+
+import pytest
+
+from azul_backend.actions import decode_action, encode_move
+from azul_backend.canonical import canonical_move
+from azul_backend.game import Game
+from azul_backend.positions import PositionDB
+from azul_backend.replay import GameRecord
+
+
+def _high_move(game):
+    # A move whose canonical action id does not fit in one byte
+    for move in game.legal_moves():
+        if encode_move(canonical_move(game, move)) > 0xFF:
+            return move
+    raise AssertionError("No move with a large action id")
+
+
+def test_update_and_lookup_four_players(tmp_path):
+    game = Game(seed=3, players=4)
+    move = _high_move(game)
+    with PositionDB(str(tmp_path / "db")) as db:
+        db.update(game, 5, move)
+        db.update(game, -2, move)
+        entry = db.lookup(game)
+        assert entry["visits"] == 2
+        assert entry["wins"] == 1 and entry["losses"] == 1
+        assert entry["moves"] == ((move, 2, 1.5),)
+        assert db.best_move(game) == move
+
+
+def test_empty_slots_are_not_moves(tmp_path):
+    game = Game(seed=1)
+    with PositionDB(str(tmp_path / "db")) as db:
+        db.update(game, 0)
+        assert db.lookup(game)["moves"] == ()
+        assert db.best_move(game) is None
+
+
+def test_old_log_is_rejected(tmp_path):
+    directory = tmp_path / "db"
+    PositionDB(str(directory)).close()
+    with open(directory / "log.0", "r+b") as log:
+        log.write(b"AZPLOG01")
+    with pytest.raises(ValueError):
+        PositionDB(str(directory))
+
+
+@pytest.mark.parametrize("players", [2, 3, 4])
+def test_add_game_margins_against_the_best_opponent(tmp_path, players):
+    rng = random.Random(players)
+    game = Game(seed=12, players=players)
+    while not game.is_game_over:
+        game.play_move(rng.choice(game.legal_moves()))
+    scores = [game.show_score(player) for player in range(1, players + 1)]
+
+    with PositionDB(str(tmp_path / "db")) as db:
+        assert db.add_game(GameRecord.from_game(game)) > 0
+        start = db.lookup(Game(seed=12, players=players))
+        assert start["visits"] == 1
+        assert start["mean_margin"] == scores[0] - max(scores[1:])
+        assert start["moves"][0][0] == decode_action(game.show_move_history()[0])
+
+
+def _finished_games(count, players=2):
+    games = []
+    for seed in range(count):
+        rng = random.Random(seed)
+        game = Game(seed=seed, players=players)
+        while not game.is_game_over:
+            game.play_move(rng.choice(game.legal_moves()))
+        games.append(game)
+    return games
+
+
+def test_update_lookup_and_seen(tmp_path):
+    game = Game(seed=2)
+    move = game.legal_moves()[0]
+    with PositionDB(str(tmp_path / "db")) as db:
+        assert db.lookup(game) is None and not db.seen(game)
+        db.update(game, 3, move)
+        db.update(game, 0, move)
+        entry = db.lookup(game)
+        assert (entry["visits"], entry["wins"], entry["draws"], entry["losses"]) == (2, 1, 1, 0)
+        assert entry["mean_margin"] == 1.5
+        assert db.seen(game) and len(db) == 1
+        assert db.best_move(game, min_visits=3) is None
+
+
+def test_many_games_grow_the_index_and_survive_compaction(tmp_path):
+    games = _finished_games(10)
+    directory = str(tmp_path / "db")
+    with PositionDB(directory) as db:
+        new = sum(db.add_game(GameRecord.from_game(game)) for game in games)
+        assert len(db) == new > 1024 * 0.6  # More than the first index can hold
+        before = {seed: db.lookup(Game(seed=seed)) for seed in range(3)}
+        db.compact()
+        assert len(db) == new
+        assert {seed: db.lookup(Game(seed=seed)) for seed in range(3)} == before
+    with PositionDB(directory) as db:
+        assert len(db) == new
+        assert db.lookup(Game(seed=0)) == before[0]
+
+
+def test_reader_sees_the_writer(tmp_path):
+    directory = str(tmp_path / "db")
+    game = Game(seed=4)
+    with PositionDB(directory) as writer, PositionDB(directory, readonly=True) as reader:
+        writer.update(game, 1)
+        reader.refresh()
+        assert reader.lookup(game)["visits"] == 1
+        with pytest.raises(RuntimeError):
+            reader.update(game, 1)
+        writer.compact()
+        reader.refresh()
+        assert reader.lookup(game)["visits"] == 1
+
+
+def test_add_game_needs_a_finished_game(tmp_path):
+    game = Game(seed=1)
+    game.play_move(game.legal_moves()[0])
+    with PositionDB(str(tmp_path / "db")) as db:
+        with pytest.raises(ValueError):
+            db.add_game(GameRecord.from_game(game))
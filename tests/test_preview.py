@@ -0,0 +1,88 @@
+import copy
+import random
+
+import pytest
+
+from azul_backend.floor import Floor
+from azul_backend.game import Game
+from azul_backend.states import GameEvent
+from azul_backend.tiles import ColourTile
+
+_CAPACITY = {"line1": 1, "line2": 2, "line3": 3, "line4": 4, "line5": 5}
+
+
+def _positions(count, seed):
+    rng = random.Random(seed)
+    game = Game(seed=seed)
+    positions = []
+    while not game.is_game_over and len(positions) < count:
+        positions.append(copy.deepcopy(game))
+        game.play_move(rng.choice(game.legal_moves()))
+    return positions
+
+
+def _played(game, move):
+    """The MOVE event of a move played on a copy of the game"""
+    played = copy.deepcopy(game)
+    events = []
+    played.add_listener(lambda event, details: events.append((event, details)))
+    played.play_move(move)
+    return next(details for event, details in events if event == GameEvent.MOVE)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_preview_matches_play_move(seed):
+    for game in _positions(40, seed):
+        player = game.show_current_player()
+        floor_before = sum(tile is not None for tile in game.show_floor(player))
+        for move in game.legal_moves():
+            state = game.pack_state()
+            preview = game.preview(move)
+            assert game.pack_state() == state  # No side effects
+
+            details = _played(game, move)
+            assert preview["tiles_to_line"] == details["tiles_to_line"]
+            assert preview["floor_tiles"] == details["floor_tiles"]
+            assert preview["takes_p1_tile"] == details["takes_p1_tile"]
+            floor_after = min(floor_before + details["floor_tiles"], 7)
+            assert preview["floor_penalty"] == (
+                Floor.CUMULATIVE_PENALTY[floor_after] - Floor.CUMULATIVE_PENALTY[floor_before]
+            )
+
+            _, tile_type, line = move
+            if line is None:
+                assert not preview["completes_line"] and preview["wall_score"] == 0
+                continue
+            count = sum(tile is not None for tile in game.show_pattern_lines(player)[line])
+            completes = count + details["tiles_to_line"] == _CAPACITY[line]
+            assert preview["completes_line"] == completes
+            if completes:
+                wall = copy.deepcopy(game)._Game__walls[player - 1]
+                assert preview["wall_score"] == wall.move_tile_to_wall(
+                    ColourTile(tile_type), line, True
+                )
+            else:
+                assert preview["wall_score"] == 0
+
+
+def test_preview_by_action_id():
+    game = Game(seed=4)
+    for move, action_id in zip(game.legal_moves(), game.legal_actions()):
+        assert game.preview(action_id) == game.preview(move)
+
+
+def test_preview_rejects_illegal_moves():
+    game = Game(seed=4)
+    factory_number, tile_type, _ = game.legal_moves()[0]
+    missing = next(
+        colour
+        for colour in ("blue", "yellow", "red", "black", "white")
+        if all(tile.get_tile_type() != colour for tile in game.show_factory(factory_number))
+    )
+    with pytest.raises(ValueError):
+        game.preview((factory_number, missing, "line1"))
+    with pytest.raises(ValueError):
+        game.preview((factory_number, tile_type, None))  # The tiles fit on a line
+    game.make_factory_offer(factory_number, tile_type)
+    with pytest.raises(RuntimeError):
+        game.preview((0, tile_type, "line1"))
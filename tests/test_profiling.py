@@ -0,0 +1,83 @@
+import sys
+import threading
+import time
+
+import pytest
+
+from azul_backend import profiling
+from azul_backend.profiling import WORKLOADS, SamplingProfiler, profile_workload
+
+
+@pytest.mark.parametrize("name", WORKLOADS)
+def test_workloads_play_whole_games(name):
+    workload = WORKLOADS[name]
+    workload_input = workload.prepare(3, 1)
+    workload.run(workload_input)
+    if name != "replay":
+        games = [item[0] if isinstance(item, tuple) else item for item in workload_input]
+        assert len(games) == 3 and all(game.is_game_over for game in games)
+
+
+def test_workloads_are_reproducible():
+    first, second = (WORKLOADS["random_playouts"].prepare(2, 5) for _ in range(2))
+    profiling.random_playouts(first)
+    profiling.random_playouts(second)
+    assert [game.pack_state() for game, _ in first] == [game.pack_state() for game, _ in second]
+
+
+def _busy(seconds):
+    end = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < end:
+        total += sum(range(100))
+    return total
+
+
+def test_sampling_profiler_sees_the_thread():
+    switch_interval = sys.getswitchinterval()
+    with SamplingProfiler(0.001) as sampler:
+        _busy(0.2)
+        with pytest.raises(RuntimeError):
+            sampler.start()
+    assert sys.getswitchinterval() == switch_interval
+    assert sampler.samples > 10
+
+    lines = sampler.collapsed().splitlines()
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) == sampler.samples
+    assert any("test_profiling.py:_busy" in line for line in lines)
+    functions, modules = sampler.hotspots()
+    assert sum(count for _, count in functions) == sampler.samples
+    assert [count for _, count in modules] == sorted((count for _, count in modules), reverse=True)
+
+
+def test_sampling_another_thread():
+    ready = threading.Event()
+    worker = threading.Thread(target=lambda: (ready.set(), _busy(0.2)))
+    worker.start()
+    ready.wait()
+    with SamplingProfiler(0.001, thread_id=worker.ident) as sampler:
+        worker.join()
+    assert any(stack.startswith("threading.py") for stack in sampler.collapsed().splitlines())
+
+
+def test_profile_workload_writes_the_reports(tmp_path):
+    report = profile_workload("random_playouts", games=2, out=str(tmp_path), top=5)
+    assert "random_playouts: cProfile" in report and "random_playouts: sampling" in report
+    assert "Own time by module" in report and "game.py" in report
+    assert {path.name for path in tmp_path.iterdir()} == {
+        "random_playouts.pstats",
+        "random_playouts.cprofile.txt",
+        "random_playouts.collapsed",
+        "random_playouts.sampling.txt",
+    }
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        profile_workload("no_such_workload")
+    with pytest.raises(ValueError):
+        profile_workload("replay", profiler="perf")
+    with pytest.raises(ValueError):
+        SamplingProfiler(0)
+    with pytest.raises(SystemExit):
+        profiling.main(["no_such_workload"])
@@ -0,0 +1,109 @@
+import itertools
+import random
+from collections import Counter
+from fractions import Fraction
+
+import pytest
+
+from azul_backend.game import Game
+from azul_backend.refills import (
+    FRESH_BAG,
+    _cumulative_weights,
+    _hypergeometric,
+    REFILL_SIZE,
+    clear_refill_cache,
+    expected_refill,
+    refill_outcomes,
+    refill_size,
+    sample_refills,
+)
+
+
+def test_outcomes_match_every_ordered_draw():
+    # Every order of drawing 4 tiles from a small bag is equally likely
+    bag = (2, 1, 3, 0, 2)
+    tiles = [colour for colour, count in enumerate(bag) for _ in range(count)]
+    counts = Counter(
+        tuple(draw.count(colour) for colour in range(5))
+        for draw in itertools.permutations(tiles, 4)
+    )
+    total = sum(counts.values())
+    assert dict(refill_outcomes(bag, draw=4)) == {
+        outcome: Fraction(count, total) for outcome, count in counts.items()
+    }
+
+
+def test_two_player_defaults():
+    outcomes = refill_outcomes(FRESH_BAG)
+    assert REFILL_SIZE == refill_size() == 20
+    assert sum(probability for _, probability in outcomes) == 1
+    assert expected_refill(FRESH_BAG) == (Fraction(4),) * 5
+
+
+def test_sampled_frequencies_follow_the_distribution():
+    bag = (3, 2, 0, 1, 0)
+    samples = Counter(sample_refills(bag, 20000, draw=3, rng=random.Random(1)))
+    for outcome, probability in refill_outcomes(bag, draw=3):
+        assert samples[outcome] / 20000 == pytest.approx(float(probability), abs=0.02)
+
+
+@pytest.mark.parametrize(
+    "bag, draw",
+    [((1, 2, 3, 4), 4), ((1, 2, 3, 4, -1), 4), ((1, 2, 3, 4, 5), 101), ((20,) * 5, -1)],
+)
+def test_invalid_arguments(bag, draw):
+    with pytest.raises(ValueError):
+        refill_outcomes(bag, draw=draw)
+
+
+def test_cache_can_be_cleared():
+    first = refill_outcomes((4, 4, 4, 4, 4))
+    sample_refills((4, 4, 4, 4, 4))
+    clear_refill_cache()
+    assert _hypergeometric.cache_info().currsize == 0
+    assert _cumulative_weights.cache_info().currsize == 0
+    assert refill_outcomes((4, 4, 4, 4, 4)) == first
+
+
+@pytest.mark.parametrize("players", [2, 3, 4])
+def test_refill_size_matches_the_factories(players):
+    game = Game(1, players=players)
+    tiles = sum(
+        len(game.show_factory(number))
+        for number in range(1, game.show_number_of_factories() + 1)
+    )
+    assert refill_size(players) == tiles
+
+
+@pytest.mark.parametrize("players", [2, 3, 4])
+def test_full_refill_distribution(players):
+    bag = (8, 9, 10, 11, 12)
+    outcomes = refill_outcomes(bag, players=players)
+    assert sum(probability for _, probability in outcomes) == 1
+    assert all(sum(outcome) == refill_size(players) for outcome, _ in outcomes)
+
+
+def test_expected_refill_of_an_even_bag():
+    assert expected_refill((8,) * 5, players=4) == (Fraction(36, 5),) * 5
+    assert expected_refill(FRESH_BAG, draw=4) == (Fraction(4, 5),) * 5
+
+
+def test_refill_past_the_end_of_the_bag():
+    bag = (1, 0, 2, 0, 0)
+    outcomes = refill_outcomes(bag, players=3)
+    assert sum(probability for _, probability in outcomes) == 1
+    assert all(
+        drawn >= left for outcome, _ in outcomes for drawn, left in zip(outcome, bag)
+    )
+
+
+def test_samples_are_reproducible():
+    bag = (5, 5, 5, 5, 5)
+    first = sample_refills(bag, 10, rng=random.Random(2), players=3)
+    assert first == sample_refills(bag, 10, rng=random.Random(2), players=3)
+    assert all(sum(outcome) == 28 for outcome in first)
+
+
+def test_invalid_player_count():
+    with pytest.raises(ValueError):
+        refill_size(5)
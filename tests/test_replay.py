@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+from azul_backend.actions import encode_move
+from azul_backend.game import Game
+from azul_backend.replay import GameRecord, Keyframes, Replay
+
+
+def _finished_game(seed):
+    rng = random.Random(seed)
+    game = Game(seed)
+    while not game.is_game_over:
+        game.play_move(rng.choice(game.legal_moves()))
+    return game
+
+
+@pytest.fixture(scope="module")
+def record():
+    return GameRecord.from_game(_finished_game(11))
+
+
+def test_record_round_trip(record):
+    data = record.to_bytes()
+    assert GameRecord.from_bytes(data) == record
+    assert len(GameRecord.from_bytes(data)) == len(record)
+
+
+def test_verify(record):
+    assert Replay(record).verify()
+
+
+def test_verify_fails_on_wrong_checksum(record):
+    tampered = GameRecord(record.seed, record.moves, bytes(8))
+    assert not Replay(tampered).verify()
+
+
+def test_verify_fails_on_changed_move(record):
+    game = Replay(record).state_at(0)
+    moves = list(record.moves)
+    moves[0] = next(
+        encode_move(move) for move in game.legal_moves() if encode_move(move) != moves[0]
+    )
+    assert not Replay(GameRecord(record.seed, tuple(moves), record.checksum)).verify()
+
+
+def test_verify_fails_on_move_after_game_over(record):
+    extra = GameRecord(record.seed, record.moves + (record.moves[-1],), record.checksum)
+    assert not Replay(extra).verify()
+
+
+def test_record_of_unfinished_game():
+    game = Game(4)
+    for _ in range(7):
+        game.play_move(game.legal_moves()[0])
+    record = GameRecord.from_game(game)
+    assert len(record) == 7
+    assert Replay(record).state_at(7).pack_state() == game.pack_state()
+
+
+def test_seek_matches_state_at(record):
+    keyframes = Keyframes.from_record(record)
+    assert Keyframes.from_bytes(keyframes.to_bytes()).to_bytes() == keyframes.to_bytes()
+    replay = Replay(record, keyframes)
+    for move_number in (0, 1, len(record) // 2, len(record) - 1, len(record)):
+        assert (
+            replay.seek(move_number).pack_state()
+            == replay.state_at(move_number).pack_state()
+        )
+
+
+@pytest.mark.parametrize("players", [3, 4])
+def test_records_of_more_players(players):
+    rng = random.Random(players)
+    game = Game(9, players=players)
+    while not game.is_game_over:
+        game.play_move(rng.choice(game.legal_moves()))
+    record = GameRecord.from_game(game)
+    assert record.players == players
+    assert GameRecord.from_bytes(record.to_bytes()) == record
+    replay = Replay(record, Keyframes.from_bytes(Keyframes.from_record(record).to_bytes()))
+    assert replay.verify()
+    assert replay.seek(len(record)).pack_state() == game.pack_state()
+    with pytest.raises(ValueError):
+        Replay(GameRecord(record.seed, record.moves, record.checksum), replay.keyframes)
@@ -0,0 +1,84 @@
+import random
+
+import pytest
+
+from azul_backend.background import likely_moves
+from azul_backend.game import Game
+from azul_backend.scheduler import FALLBACK, MoveScheduler
+
+
+def _position(seed, moves=0):
+    game = Game(seed=seed)
+    rng = random.Random(seed)
+    for _ in range(moves):
+        game.play_move(rng.choice(game.legal_moves()))
+    return game
+
+
+def test_searched_when_there_is_time():
+    game = _position(1)
+    with MoveScheduler(workers=1, budgets=(30,), initial_rate=1e6, seed=1) as scheduler:
+        move = scheduler.submit("a", game.pack_state(), 30.0).result(timeout=30)
+        assert move in game.legal_moves()
+        assert scheduler.served()[30] == 1
+        assert scheduler.served()[FALLBACK] == 0
+        assert len(scheduler) == 0
+        assert scheduler.rate != 1e6  # Measured from the search
+
+
+def test_fallback_when_no_budget_fits():
+    game = _position(2, 3)
+    # 10**6 iterations at 1000 a second would take far longer than the time limit
+    with MoveScheduler(workers=1, budgets=(10**6,), initial_rate=1000.0) as scheduler:
+        move = scheduler.submit("a", game.pack_state(), 1.0).result(timeout=5)
+        assert move == likely_moves(game, 1)[0]
+        assert scheduler.served() == {10**6: 0, FALLBACK: 1}
+
+
+def test_earliest_deadline_first():
+    games = [_position(seed) for seed in (3, 4, 5)]
+    finished = []
+    futures = []
+    with MoveScheduler(workers=1, budgets=(100,), initial_rate=1e6, seed=2) as scheduler:
+        # The first is searched at once, the worker is busy while the others queue
+        for game_id, game, time_limit in zip("xle", games, (30.0, 90.0, 60.0)):
+            future = scheduler.submit(game_id, game.pack_state(), time_limit)
+            future.add_done_callback(lambda _, game_id=game_id: finished.append(game_id))
+            futures.append(future)
+        for future in futures:
+            future.result(timeout=30)
+    assert finished == ["x", "e", "l"]
+    assert sum(scheduler.served().values()) == 3
+
+
+def test_single_move_is_answered_straight_away():
+    game = _position(6)
+    rng = random.Random(6)
+    while len(game.legal_moves()) != 1:
+        game.play_move(rng.choice(game.legal_moves()))
+    with MoveScheduler(workers=1) as scheduler:
+        future = scheduler.submit("a", game.pack_state(), 10.0)
+        assert future.done()
+        assert future.result() == game.legal_moves()[0]
+
+
+def test_game_over_and_closed():
+    game = _position(7)
+    rng = random.Random(7)
+    while not game.is_game_over:
+        game.play_move(rng.choice(game.legal_moves()))
+    scheduler = MoveScheduler(workers=1)
+    with pytest.raises(ValueError):
+        scheduler.submit("a", game.pack_state(), 10.0)
+    scheduler.close()
+    with pytest.raises(RuntimeError):
+        scheduler.submit("a", _position(8).pack_state(), 10.0)
+
+
+@pytest.mark.parametrize(
+    "arguments",
+    [{"workers": 0}, {"budgets": ()}, {"budgets": (100, 0)}, {"margin": -1}, {"initial_rate": 0}],
+)
+def test_invalid_arguments(arguments):
+    with pytest.raises(ValueError):
+        MoveScheduler(**arguments)
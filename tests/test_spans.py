@@ -0,0 +1,56 @@
+import random
+
+from azul_backend.game import Game
+
+
+def _first_move(game):
+    return next(move for move in game.legal_moves() if move[2] is not None)
+
+
+def test_keyword_calls_without_span_listeners():
+    game = Game(1)
+    factory_number, tile_type, line = _first_move(game)
+    game.make_factory_offer(factory_number=factory_number, tile_type=tile_type)
+    game.place_on_patternlines(line=line)
+    assert game.moves_this_game == 1
+
+
+def test_keyword_calls_are_reported_in_order():
+    game = Game(1)
+    spans = []
+    game.add_span_listener(lambda name, details: spans.append((name, details["args"])))
+    factory_number, tile_type, line = _first_move(game)
+    game.make_factory_offer(tile_type=tile_type, factory_number=factory_number)
+    game.place_on_patternlines(line=line)
+    assert spans == [
+        ("make_factory_offer", (factory_number, tile_type)),
+        ("place_on_patternlines", (line,)),
+    ]
+
+
+def test_engine_calls_are_only_wrapped_while_listened_to():
+    game = Game(2)
+    listener = lambda name, details: None
+    game.add_span_listener(listener)
+    game.add_span_listener(listener)
+    assert "make_factory_offer" in vars(game)
+    assert "make_factory_offer" not in vars(game.determinize())
+    game.remove_span_listener(listener)
+    assert "make_factory_offer" in vars(game)
+    game.remove_span_listener(listener)
+    assert "make_factory_offer" not in vars(game)
+
+
+def test_nested_calls_report_their_depth():
+    rng = random.Random(3)
+    game = Game(3)
+    spans = []
+    game.add_span_listener(lambda name, details: spans.append((name, details["depth"])))
+    while game.rounds_played == 0:
+        game.play_move(rng.choice(game.legal_moves()))
+    depths = dict(spans)  # The last span of each name
+    assert depths["wall_tiling"] >= 1
+    assert depths["score_penalty"] == depths["prepare_next_round"] == depths["wall_tiling"] + 1
+    assert spans.index(("prepare_next_round", depths["prepare_next_round"])) < spans.index(
+        ("wall_tiling", depths["wall_tiling"])
+    )
@@ -0,0 +1,203 @@
+import gc
+import math
+import random
+
+import pytest
+
+from azul_backend.game import Game
+from azul_backend.states import GameEvent
+from azul_backend.stats import (
+    ColourPicks,
+    FloorPenalties,
+    QuantileSketch,
+    Reducer,
+    ScoreByRound,
+    StatsCollector,
+    WallFillOrder,
+)
+
+
+def _play(game, seed):
+    rng = random.Random(seed)
+    while not game.is_game_over:
+        game.play_move(rng.choice(game.legal_moves()))
+
+
+def test_sketch_quantiles_within_accuracy():
+    sketch = QuantileSketch(0.01)
+    values = list(range(1, 1001))
+    for value in values:
+        sketch.add(value)
+    assert sketch.count == 1000 and sketch.min == 1 and sketch.max == 1000
+    for q in (0.05, 0.5, 0.95):
+        exact = values[int(q * 999)]
+        assert sketch.quantile(q) == pytest.approx(exact, rel=0.01)
+
+
+def test_sketch_merge_matches_one_sketch():
+    rng = random.Random(3)
+    values = [rng.uniform(-50, 50) for _ in range(500)]
+    whole, first, second = QuantileSketch(), QuantileSketch(), QuantileSketch()
+    for i, value in enumerate(values):
+        whole.add(value)
+        (first if i % 2 else second).add(value)
+    first.merge(second)
+    assert first.count == whole.count
+    assert first.mean == pytest.approx(whole.mean)
+    assert dict(first.percentiles()) == dict(whole.percentiles())
+
+
+def test_sketch_merge_needs_same_accuracy():
+    with pytest.raises(ValueError):
+        QuantileSketch(0.01).merge(QuantileSketch(0.02))
+    assert math.isnan(QuantileSketch().quantile(0.5))
+
+
+def test_colour_picks_counts_colour_tiles_only():
+    game = Game(21)
+    picks = ColourPicks()
+    picks.attach(game)
+    rng = random.Random(21)
+    taken = 0
+    while not game.is_game_over:
+        move = rng.choice(game.legal_moves())
+        taken += sum(
+            tile.get_tile_type() == move[1] for tile in game.show_factory(move[0])
+        )
+        game.play_move(move)
+    assert sum(picks.report()["tiles"].values()) == taken
+
+
+def test_merge_all_keeps_reducer_settings():
+    collectors = []
+    for seed in (1, 2):
+        collector = StatsCollector(
+            {"floor": FloorPenalties(0.05), "scores": ScoreByRound(0.05)}
+        )
+        game = Game(seed)
+        collector.attach(game)
+        _play(game, seed)
+        collectors.append(collector)
+
+    merged = StatsCollector.merge_all(collectors)
+    assert merged.report()["games"] == 2
+    assert merged.report()["floor"]["per_game"] == pytest.approx(
+        StatsCollector.merge_all(reversed(collectors)).report()["floor"]["per_game"]
+    )
+    # The collectors passed in are unchanged
+    assert collectors[0].report()["games"] == 1
+
+
+def test_default_collector_over_four_players():
+    game = Game(8, players=4)
+    collector = StatsCollector()
+    collector.attach(game)
+    _play(game, 8)
+    report = collector.report()
+    assert report["games"] == 1
+    assert report["score_by_round"]["rounds"][0]["count"] == 4
+
+
+def test_reducers_must_implement_the_abstract_methods():
+    class Incomplete(Reducer):
+        def update(self, event, details):
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def _reports(collector):
+    report = collector.report()
+    return (
+        report["wall_fill_order"]["fills"],
+        report["wall_fill_order"]["mean_order"],
+        report["floor_penalties"]["round_histogram"],
+        report["floor_penalties"]["per_game"],
+        report["floor_penalties"]["mean_per_game"],
+    )
+
+
+def test_interleaved_games_are_kept_apart():
+    seeds = (3, 4, 5)
+    together = StatsCollector()
+    games = [Game(seed) for seed in seeds]
+    rngs = [random.Random(seed) for seed in seeds]
+    for game in games:
+        together.attach(game)
+    # One move of each game in turn, so their events interleave
+    while not all(game.is_game_over for game in games):
+        for game, rng in zip(games, rngs):
+            if not game.is_game_over:
+                game.play_move(rng.choice(game.legal_moves()))
+
+    apart = []
+    for seed in seeds:
+        collector = StatsCollector()
+        game = Game(seed)
+        collector.attach(game)
+        _play(game, seed)
+        apart.append(collector)
+
+    assert _reports(together) == _reports(StatsCollector.merge_all(apart))
+    assert together.report()["games"] == 3
+    assert not together._reducers["floor_penalties"]._game_totals
+
+
+def test_wall_fill_order_counts_each_wall():
+    game = Game(6, players=3)
+    orders = {player: [] for player in (1, 2, 3)}
+    game.add_listener(
+        lambda event, details: event is GameEvent.WALL_TILE
+        and orders[details["player"]].append(details["order"])
+    )
+    fill_order = WallFillOrder()
+    fill_order.attach(game)
+    _play(game, 6)
+    for player, placed in orders.items():
+        on_wall = sum(tile is not None for line in game.show_wall(player).values() for tile in line)
+        assert placed == list(range(on_wall))
+    assert sum(map(sum, fill_order.report()["fills"])) == sum(map(len, orders.values()))
+
+
+def test_reset_and_abandoned_games_are_dropped():
+    penalties = FloorPenalties()
+    game = Game(7)
+    penalties.attach(game)
+    rng = random.Random(7)
+    while game.rounds_played < 2:
+        game.play_move(rng.choice(game.legal_moves()))
+    assert list(penalties._game_totals) == [game.game_id]
+
+    # A reset game starts its totals again
+    game.reset(8)
+    _play(game, 8)
+    alone = FloorPenalties()
+    fresh = Game(8)
+    alone.attach(fresh)
+    _play(fresh, 8)
+    assert penalties.report()["per_game"] == alone.report()["per_game"]
+    assert not penalties._game_totals
+
+    # A game dropped before its end is forgotten
+    abandoned = Game(9)
+    penalties.attach(abandoned)
+    while abandoned.rounds_played < 1:
+        abandoned.play_move(rng.choice(abandoned.legal_moves()))
+    assert penalties._game_totals
+    del abandoned
+    gc.collect()
+    assert not penalties._game_totals
+
+
+def test_copies_have_their_own_game_id():
+    game = Game(10)
+    events = []
+    game.add_listener(lambda event, details: events.append(details["game"]))
+    game.play_move(game.legal_moves()[0])
+    assert set(events) == {game.game_id}
+    copy = game.determinize()
+    assert copy.game_id != game.game_id
+    assert Game.unpack_state(game.pack_state()).game_id != game.game_id
+    game.reset()
+    assert game.game_id == events[0]
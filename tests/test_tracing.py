@@ -0,0 +1,73 @@
+import json
+import random
+
+import pytest
+
+from azul_backend.game import Game
+from azul_backend.tracing import Tracer, state_hash
+
+
+def _events(path):
+    with open(path) as trace_file:
+        return [json.loads(line) for line in trace_file]
+
+
+def test_every_call_of_a_traced_game_is_written(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    rng = random.Random(0)
+    game = Game(5)
+    with Tracer(str(path), sample_rate=1, interval=60) as tracer:
+        assert tracer.attach(game)
+        assert not tracer.attach(game)
+        while not game.is_game_over:
+            game.play_move(rng.choice(game.legal_moves()))
+        final_hash = state_hash(game)
+
+    events = _events(path)
+    assert events[0]["span"] == "game"
+    assert events[0]["seed"] == 5
+    assert [event["seq"] for event in events] == list(range(len(events)))
+    assert all(event["error"] is None for event in events[1:])
+    assert events[-1]["state_hash"] == final_hash
+
+
+def test_detached_game_is_not_traced(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    rng = random.Random(1)
+    game = Game(6)
+    with Tracer(str(path), sample_rate=1, interval=60) as tracer:
+        tracer.attach(game)
+        tracer.detach(game)
+        for _ in range(5):
+            game.play_move(rng.choice(game.legal_moves()))
+
+    assert [event["span"] for event in _events(path)] == ["game"]
+
+
+def test_sampling_is_decided_by_the_seed(tmp_path):
+    with Tracer(str(tmp_path / "trace.jsonl"), sample_rate=7, interval=60) as tracer:
+        picks = [tracer.sampled(Game(seed)) for seed in range(200)]
+        assert picks == [tracer.sampled(Game(seed)) for seed in range(200)]
+        assert 0 < sum(picks) < 200
+
+
+def test_full_buffer_drops_the_oldest_events(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    rng = random.Random(2)
+    game = Game(7)
+    with Tracer(str(path), sample_rate=1, capacity=4, interval=60) as tracer:
+        tracer.attach(game)
+        for _ in range(5):
+            game.play_move(rng.choice(game.legal_moves()))
+        assert tracer.dropped > 0
+
+    events = _events(path)
+    assert len(events) == 4
+    assert events[0]["seq"] > 0
+
+
+def test_closed_tracer_rejects_games(tmp_path):
+    tracer = Tracer(str(tmp_path / "trace.jsonl"), sample_rate=1)
+    tracer.close()
+    with pytest.raises(RuntimeError):
+        tracer.attach(Game(0))
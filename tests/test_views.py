@@ -0,0 +1,78 @@
+import pickle
+import random
+
+import pytest
+
+from azul_backend.game import Game
+
+
+def _views(game):
+    players = range(1, game.show_number_of_players() + 1)
+    return (
+        [game.show_factory(number) for number in range(game.show_number_of_factories() + 1)],
+        [game.show_pattern_lines(player) for player in players],
+        [game.show_wall(player) for player in players],
+        [game.show_floor(player) for player in players],
+    )
+
+
+def _rebuilt(game):
+    """A game restored from the packed state, whose views have never been built"""
+    return Game.unpack_state(game.pack_state())
+
+
+def _types(tiles):
+    return tuple(None if tile is None else tile.get_tile_type() for tile in tiles)
+
+
+def _plain(views):
+    """The views as tile types, to compare views that are different objects"""
+    factories, pattern_lines, walls, floors = views
+    return (
+        [_types(factory) for factory in factories],
+        [{line: _types(tiles) for line, tiles in board.items()} for board in pattern_lines],
+        [{line: _types(tiles) for line, tiles in board.items()} for board in walls],
+        [_types(floor) for floor in floors],
+    )
+
+
+@pytest.mark.parametrize("players", [2, 3])
+def test_views_follow_every_change(players):
+    rng = random.Random(players)
+    game = Game(seed=8, players=players)
+    while not game.is_game_over:
+        before = _views(game)
+        assert _plain(before) == _plain(_views(_rebuilt(game)))
+        game.play_move(rng.choice(game.legal_moves()))
+        assert _plain(_views(game)) == _plain(_views(_rebuilt(game)))
+
+
+def test_unchanged_views_are_reused():
+    game = Game(seed=3)
+    first = _views(game)
+    second = _views(game)
+    for kind_first, kind_second in zip(first, second):
+        assert all(a is b for a, b in zip(kind_first, kind_second))
+
+
+def test_views_handed_out_do_not_change():
+    game = Game(seed=4)
+    factory_number, tile_type, line = next(
+        move for move in game.legal_moves() if move[0] > 0 and move[2] is not None
+    )
+    factory = game.show_factory(factory_number)
+    pattern_lines = game.show_pattern_lines(Game.PLAYER_1)
+    game.play_move((factory_number, tile_type, line))
+
+    assert len(factory) == 4 and game.show_factory(factory_number) == ()
+    assert all(tile is None for tile in pattern_lines[line])
+    assert game.show_pattern_lines(Game.PLAYER_1) is not pattern_lines
+    assert any(tile is not None for tile in game.show_pattern_lines(Game.PLAYER_1)[line])
+
+
+def test_games_with_built_views_can_be_copied():
+    game = Game(seed=5)
+    _views(game)
+    clone = pickle.loads(pickle.dumps(game))
+    assert _plain(_views(clone)) == _plain(_views(game))
+    assert _plain(_views(game.determinize(random.Random(1))))[1:] == _plain(_views(game))[1:]